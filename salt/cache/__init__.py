@@ -5,10 +5,12 @@ Loader mechanism for caching data, with data expiration, etc.
 """
 
 import logging
+import sys
 import time
 
 import salt.config
 import salt.loader
+import salt.payload
 import salt.syspaths
 from salt.utils.odict import OrderedDict
 
@@ -256,41 +258,169 @@ class Cache:
         fun = f"{self.driver}.contains"
         return self.modules[fun](bank, key, **self._kwargs)
 
+    def fetch_many(self, items):
+        """
+        Fetch several keys at once using the specified module
+
+        Drivers providing a ``fetch_many`` function retrieve all the keys in
+        as few backend roundtrips as possible, others fall back to one
+        ``fetch`` per key.
+
+        :param items:
+            An iterable of ``(bank, key)`` tuples.
+
+        :return:
+            A dict mapping each ``(bank, key)`` tuple to the data fetched from
+            the cache, or an empty dict if the given path or key not found.
+
+        :raises SaltCacheError:
+            Raises an exception if cache driver detected an error accessing data
+            in the cache backend (auth, permissions, etc).
+        """
+        items = list(dict.fromkeys(items))
+        if not items:
+            return {}
+        fun = f"{self.driver}.fetch_many"
+        if fun in self.modules:
+            return self.modules[fun](items, **self._kwargs)
+        fun = f"{self.driver}.fetch"
+        return {
+            (bank, key): self.modules[fun](bank, key, **self._kwargs)
+            for bank, key in items
+        }
+
+    def store_many(self, items):
+        """
+        Store several keys at once using the specified module
+
+        Drivers providing a ``store_many`` function write all the keys in as
+        few backend roundtrips as possible, others fall back to one ``store``
+        per key.
+
+        :param items:
+            A dict mapping ``(bank, key)`` tuples to the data to store.
+
+        :raises SaltCacheError:
+            Raises an exception if cache driver detected an error accessing data
+            in the cache backend (auth, permissions, etc).
+        """
+        if not items:
+            return
+        fun = f"{self.driver}.store_many"
+        if fun in self.modules:
+            return self.modules[fun](items, **self._kwargs)
+        fun = f"{self.driver}.store"
+        for (bank, key), data in items.items():
+            self.modules[fun](bank, key, data, **self._kwargs)
+
+    def list_with_data(self, bank, key):
+        """
+        Fetch the given key from every sub-bank of the specified bank, e.g.
+        the ``data`` key of each ``minions/<minion_id>`` bank.
+
+        :param bank:
+            The name of the location inside the cache holding the sub-banks.
+
+        :param key:
+            The name of the key to fetch from each sub-bank.
+
+        :return:
+            A dict mapping the name of each sub-bank to the data fetched from
+            the cache, or an empty dict if the sub-bank does not hold the key.
+
+        :raises SaltCacheError:
+            Raises an exception if cache driver detected an error accessing data
+            in the cache backend (auth, permissions, etc).
+        """
+        fun = f"{self.driver}.list_with_data"
+        if fun in self.modules:
+            return self.modules[fun](bank, key, **self._kwargs)
+        entries = self.list(bank)
+        data = self.fetch_many((f"{bank}/{entry}", key) for entry in entries)
+        return {entry: data[(f"{bank}/{entry}", key)] for entry in entries}
+
+
+class MemCacheStorage(OrderedDict):
+    """
+    LRU storage of the MemCache items of one cache backend, keeping track of
+    their size and of the hit/miss/eviction counters.
+
+    Items are stored as ``{(bank, key): [atime, data]}``, the least recently
+    used first.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set(self, item, record, size=0):
+        self.discard(item)
+        self[item] = record
+        if size:
+            self.sizes[item] = size
+            self.bytes += size
+
+    def discard(self, item):
+        if self.pop(item, None) is not None:
+            self.bytes -= self.sizes.pop(item, 0)
+
+    def evict(self):
+        item, _ = self.popitem(last=False)
+        self.bytes -= self.sizes.pop(item, 0)
+        self.evictions += 1
+
+    def expire(self, expire, now):
+        for item, record in list(self.items()):
+            if record[0] + expire >= now:
+                break
+            self.discard(item)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "items": len(self),
+            "bytes": self.bytes,
+        }
+
 
 class MemCache(Cache):
     """
-    Short-lived in-memory cache store keeping values on time and/or size (count)
-    basis.
+    Short-lived in-memory cache store keeping values on time and/or size (count
+    and bytes) basis, evicting the least recently used values first.
     """
 
-    # {<storage_id>: odict({<key>: [atime, data], ...}), ...}
+    # {<storage_id>: MemCacheStorage({<key>: [atime, data], ...}), ...}
     data = {}
 
     def __init__(self, opts, **kwargs):
         super().__init__(opts, **kwargs)
         self.expire = opts.get("memcache_expire_seconds", 10)
         self.max = opts.get("memcache_max_items", 1024)
+        self.max_bytes = opts.get("memcache_max_bytes", 0)
+        self.negative_expire = opts.get("memcache_negative_expire_seconds")
+        if self.negative_expire is None:
+            self.negative_expire = self.expire
         self.cleanup = opts.get("memcache_full_cleanup", False)
         self.debug = opts.get("memcache_debug", False)
-        if self.debug:
-            self.call = 0
-            self.hit = 0
         self._storage = None
 
     @classmethod
     def __cleanup(cls, expire):
         now = time.time()
         for storage in cls.data.values():
-            for key, data in list(storage.items()):
-                if data[0] + expire < now:
-                    del storage[key]
-                else:
-                    break
+            storage.expire(expire, now)
 
     def _get_storage_id(self):
-        fun = f"{self.driver}.storage_id"
+        fun = f"{self.driver}.get_storage_id"
         if fun in self.modules:
-            return self.modules[fun](self.kwargs)
+            return self.modules[fun](self._kwargs)
         else:
             return self.driver
 
@@ -299,55 +429,115 @@ class MemCache(Cache):
         if self._storage is None:
             storage_id = self._get_storage_id()
             if storage_id not in MemCache.data:
-                MemCache.data[storage_id] = OrderedDict()
+                MemCache.data[storage_id] = MemCacheStorage()
             self._storage = MemCache.data[storage_id]
         return self._storage
 
+    @property
+    def call(self):
+        return self.storage.hits + self.storage.misses
+
+    @property
+    def hit(self):
+        return self.storage.hits
+
+    def stats(self):
+        """
+        Return the hit, miss and eviction counters of the cache storage along
+        with its current count of items and size in bytes
+        """
+        return self.storage.stats()
+
+    def _get(self, item, now):
+        storage = self.storage
+        record = storage.get(item)
+        if record is not None:
+            expire = self.negative_expire if record[1] == {} else self.expire
+            if record[0] + expire >= now:
+                storage.hits += 1
+                if self.debug:
+                    log.debug(
+                        "MemCache stats (call/hit/rate): %s/%s/%s",
+                        self.call,
+                        self.hit,
+                        float(self.hit) / self.call,
+                    )
+                # update atime and return
+                record[0] = now
+                storage.move_to_end(item)
+                return record
+        storage.misses += 1
+        return None
+
+    def _set(self, item, data, negative=False):
+        storage = self.storage
+        if negative and not self.negative_expire:
+            storage.discard(item)
+            return
+        size = 0
+        if self.max_bytes:
+            try:
+                size = len(salt.payload.dumps(data))
+            except Exception:  # pylint: disable=broad-except
+                size = sys.getsizeof(data)
+            if size > self.max_bytes:
+                storage.discard(item)
+                return
+        storage.set(item, [time.time(), data], size)
+        if len(storage) > self.max or (
+            self.max_bytes and storage.bytes > self.max_bytes
+        ):
+            if self.cleanup:
+                MemCache.__cleanup(self.expire)
+            while len(storage) > self.max or (
+                self.max_bytes and storage.bytes > self.max_bytes
+            ):
+                storage.evict()
+
     def fetch(self, bank, key):
-        if self.debug:
-            self.call += 1
-        now = time.time()
-        record = self.storage.pop((bank, key), None)
-        # Have a cached value for the key
-        if record is not None and record[0] + self.expire >= now:
-            if self.debug:
-                self.hit += 1
-                log.debug(
-                    "MemCache stats (call/hit/rate): %s/%s/%s",
-                    self.call,
-                    self.hit,
-                    float(self.hit) / self.call,
-                )
-            # update atime and return
-            record[0] = now
-            self.storage[(bank, key)] = record
+        record = self._get((bank, key), time.time())
+        if record is not None:
             return record[1]
 
         # Have no value for the key or value is expired
         data = super().fetch(bank, key)
-        if len(self.storage) >= self.max:
-            if self.cleanup:
-                MemCache.__cleanup(self.expire)
-            if len(self.storage) >= self.max:
-                self.storage.popitem(last=False)
-        self.storage[(bank, key)] = [now, data]
+        self._set((bank, key), data, negative=data == {})
         return data
 
+    def fetch_many(self, items):
+        ret = {}
+        missing = []
+        now = time.time()
+        for item in dict.fromkeys(items):
+            record = self._get(item, now)
+            if record is not None:
+                ret[item] = record[1]
+            else:
+                missing.append(item)
+        if missing:
+            fetched = super().fetch_many(missing)
+            for item in missing:
+                self._set(item, fetched[item], negative=fetched[item] == {})
+                ret[item] = fetched[item]
+        return ret
+
     def store(self, bank, key, data):
-        self.storage.pop((bank, key), None)
+        self.storage.discard((bank, key))
         super().store(bank, key, data)
-        if len(self.storage) >= self.max:
-            if self.cleanup:
-                MemCache.__cleanup(self.expire)
-            if len(self.storage) >= self.max:
-                self.storage.popitem(last=False)
-        self.storage[(bank, key)] = [time.time(), data]
+        self._set((bank, key), data)
+
+    def store_many(self, items):
+        for item in items:
+            self.storage.discard(item)
+        super().store_many(items)
+        for item, data in items.items():
+            self._set(item, data)
 
     def flush(self, bank, key=None):
         if key is None:
             for bank_, key_ in tuple(self.storage):
-                if bank == bank_:
-                    self.storage.pop((bank_, key_))
+                if bank_ == bank or bank_.startswith(f"{bank}/"):
+                    self.storage.discard((bank_, key_))
         else:
-            self.storage.pop((bank, key), None)
+            self.storage.discard((bank, key))
         super().flush(bank, key)
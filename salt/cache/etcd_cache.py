@@ -166,6 +166,65 @@ def fetch(bank, key):
         raise SaltCacheError(f"There was an error reading the key, {etcd_key}: {exc}")
 
 
+def fetch_many(items):
+    """
+    Fetch several key values, reading each bank holding more than one of the
+    requested keys recursively in a single request.
+    """
+    _init_client()
+    banks = {}
+    for bank, key in items:
+        banks.setdefault(bank, []).append(key)
+    ret = {}
+    for bank, keys in banks.items():
+        if len(keys) == 1:
+            ret[(bank, keys[0])] = fetch(bank, keys[0])
+            continue
+        etcd_key = f"{path_prefix}/{bank}"
+        values = {}
+        try:
+            for leaf in client.read(etcd_key, recursive=True).leaves:
+                if not leaf.dir:
+                    values[leaf.key] = leaf.value
+        except etcd.EtcdKeyNotFound:
+            pass
+        except Exception as exc:  # pylint: disable=broad-except
+            raise SaltCacheError(
+                f"There was an error reading the key, {etcd_key}: {exc}"
+            )
+        for key in keys:
+            value = values.get(f"{etcd_key}/{key}")
+            ret[(bank, key)] = (
+                {} if value is None else salt.payload.loads(base64.b64decode(value))
+            )
+    return ret
+
+
+def list_with_data(bank, key):
+    """
+    Fetch the given key from every sub-bank of the specified bank, reading
+    the bank recursively in a single request.
+    """
+    _init_client()
+    etcd_key = f"{path_prefix}/{bank}"
+    try:
+        leaves = [
+            leaf
+            for leaf in client.read(etcd_key, recursive=True).leaves
+            if not leaf.dir and leaf.key.endswith(f"/{key}")
+        ]
+    except etcd.EtcdKeyNotFound:
+        return {}
+    except Exception as exc:  # pylint: disable=broad-except
+        raise SaltCacheError(f"There was an error reading the key, {etcd_key}: {exc}")
+    ret = {}
+    for leaf in leaves:
+        entry = leaf.key[len(etcd_key) + 1 : -len(key) - 1]
+        if entry and "/" not in entry:
+            ret[entry] = salt.payload.loads(base64.b64decode(leaf.value))
+    return ret
+
+
 def flush(bank, key=None):
     """
     Remove the key from the cache bank with all the key content.
@@ -8,14 +8,40 @@ require any configuration.
 
 Expiration values can be set in the relevant config file (``/etc/salt/master`` for
 the master, ``/etc/salt/cloud`` for Salt Cloud, etc).
+
+.. versionchanged:: 3008.0
+
+    Cache files larger than ``cache.localfs.mmap_min_size`` bytes are
+    memory-mapped instead of read, and the data decoded from the cache files
+    can be kept in memory to be reused while the files do not change, up to
+    ``cache.localfs.decode_cache_size`` bytes of cache files per process.
+
+    Repeated fetches of an unchanged key return the same object, so only the
+    keys matching one of the ``cache.localfs.decode_cache_match`` glob
+    patterns, matched against ``<bank>/<key>``, are kept. They must be keys
+    whose data is never modified by the code fetching them, like the grains
+    and pillar of the minions used for targeting:
+
+    .. code-block:: yaml
+
+        cache.localfs.mmap_min_size: 65536
+        cache.localfs.decode_cache_size: 67108864
+        cache.localfs.decode_cache_match:
+          - minions/*/data
+
+    The decode cache is disabled by default.
 """
 
 import errno
+import fnmatch
 import logging
+import mmap
 import os
 import os.path
 import shutil
 import tempfile
+import threading
+from collections import OrderedDict
 
 import salt.payload
 import salt.utils.atomicfile
@@ -26,6 +52,13 @@ log = logging.getLogger(__name__)
 
 __func_alias__ = {"list_": "list"}
 
+_MMAP_MIN_SIZE = 65536
+
+# {<key_file>: ((st_ino, st_size, st_mtime_ns), data)}, the least recently used first
+_DECODE_CACHE = OrderedDict()
+_DECODE_CACHE_LOCK = threading.Lock()
+_decode_cache_bytes = 0
+
 
 def __cachedir(kwargs=None):
     if kwargs and "cachedir" in kwargs:
@@ -33,6 +66,63 @@ def __cachedir(kwargs=None):
     return __opts__.get("cachedir", salt.syspaths.CACHE_DIR)
 
 
+def _decode_cache_size(bank, key):
+    """
+    Return the size of the decode cache if the data of the given key may be
+    kept in it, 0 otherwise
+    """
+    max_size = __opts__.get("cache.localfs.decode_cache_size", 0)
+    if not max_size:
+        return 0
+    name = f"{bank}/{key}"
+    for pattern in __opts__.get("cache.localfs.decode_cache_match") or ():
+        if fnmatch.fnmatch(name, pattern):
+            return max_size
+    return 0
+
+
+def _read(key_file, bank, key):
+    """
+    Read and decode a cache file, reusing the data decoded on the previous
+    read if the file is unchanged since and the key is in the decode cache.
+    """
+    global _decode_cache_bytes
+    max_size = _decode_cache_size(bank, key)
+    if max_size:
+        # The cache files are replaced on store, a new inode means new data
+        stat = os.stat(key_file)
+        ident = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with _DECODE_CACHE_LOCK:
+            cached = _DECODE_CACHE.get(key_file)
+            if cached is not None and cached[0] == ident:
+                _DECODE_CACHE.move_to_end(key_file)
+                return cached[1]
+
+    with salt.utils.files.fopen(key_file, "rb") as fh_:
+        stat = os.fstat(fh_.fileno())
+        # An empty file can not be mapped, it fails to decode like before
+        if stat.st_size and stat.st_size >= __opts__.get(
+            "cache.localfs.mmap_min_size", _MMAP_MIN_SIZE
+        ):
+            with mmap.mmap(fh_.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                data = salt.payload.loads(buf, encoding="utf-8")
+        else:
+            data = salt.payload.loads(fh_.read(), encoding="utf-8")
+
+    if max_size and stat.st_size <= max_size:
+        ident = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with _DECODE_CACHE_LOCK:
+            cached = _DECODE_CACHE.pop(key_file, None)
+            if cached is not None:
+                _decode_cache_bytes -= cached[0][1]
+            _DECODE_CACHE[key_file] = (ident, data)
+            _decode_cache_bytes += stat.st_size
+            while _decode_cache_bytes > max_size:
+                _, (old_ident, _) = _DECODE_CACHE.popitem(last=False)
+                _decode_cache_bytes -= old_ident[1]
+    return data
+
+
 def init_kwargs(kwargs):
     return {"cachedir": __cachedir(kwargs)}
 
@@ -83,17 +173,69 @@ def fetch(bank, key, cachedir):
         log.debug('Cache file "%s" does not exist', key_file)
         return {}
     try:
-        with salt.utils.files.fopen(key_file, "rb") as fh_:
-            if inkey:
-                return salt.payload.load(fh_)[key]
-            else:
-                return salt.payload.load(fh_)
+        if inkey:
+            return _read(key_file, bank, key)[key]
+        else:
+            return _read(key_file, bank, key)
     except OSError as exc:
         raise SaltCacheError(
             f'There was an error reading the cache file "{key_file}": {exc}'
         )
 
 
+def fetch_many(items, cachedir):
+    """
+    Fetch information from several files.
+    """
+    ret = {}
+    for bank, key in items:
+        key_file = os.path.join(cachedir, os.path.normpath(bank), f"{key}.p")
+        try:
+            ret[(bank, key)] = _read(key_file, bank, key)
+        except FileNotFoundError:
+            # Missing key, or the key is stored inside the bank file
+            ret[(bank, key)] = fetch(bank, key, cachedir)
+        except OSError as exc:
+            raise SaltCacheError(
+                f'There was an error reading the cache file "{key_file}": {exc}'
+            )
+    return ret
+
+
+def store_many(items, cachedir):
+    """
+    Store information in several files.
+    """
+    for (bank, key), data in items.items():
+        store(bank, key, data, cachedir)
+
+
+def list_with_data(bank, key, cachedir):
+    """
+    Fetch the given key from every sub-bank of the specified bank.
+    """
+    base = os.path.join(cachedir, os.path.normpath(bank))
+    try:
+        with os.scandir(base) as it:
+            entries = [entry.name for entry in it if entry.is_dir()]
+    except FileNotFoundError:
+        return {}
+    except OSError as exc:
+        raise SaltCacheError(f'There was an error accessing directory "{base}": {exc}')
+    ret = {}
+    for entry in entries:
+        key_file = os.path.join(base, entry, f"{key}.p")
+        try:
+            ret[entry] = _read(key_file, f"{bank}/{entry}", key)
+        except FileNotFoundError:
+            ret[entry] = {}
+        except OSError as exc:
+            raise SaltCacheError(
+                f'There was an error reading the cache file "{key_file}": {exc}'
+            )
+    return ret
+
+
 def updated(bank, key, cachedir):
     """
     Return the epoch of the mtime for this cache file
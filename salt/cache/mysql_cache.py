@@ -89,6 +89,8 @@ except ImportError:
 _DEFAULT_DATABASE_NAME = "salt_cache"
 _DEFAULT_CACHE_TABLE_NAME = "cache"
 _RECONNECT_INTERVAL_SEC = 0.050
+# Maximum number of rows read or written by a single bulk query
+_BULK_CHUNK_SIZE = 500
 
 log = logging.getLogger(__name__)
 
@@ -297,6 +299,69 @@ def fetch(bank, key):
     return salt.payload.loads(r[0])
 
 
+def store_many(items):
+    """
+    Store several key values, using one query per chunk of keys.
+    """
+    _init_client()
+    items = list(items.items())
+    for idx in range(0, len(items), _BULK_CHUNK_SIZE):
+        chunk = items[idx : idx + _BULK_CHUNK_SIZE]
+        query = "REPLACE INTO {} (bank, etcd_key, data) values{}".format(
+            __context__["mysql_table_name"], ",".join(["(%s,%s,%s)"] * len(chunk))
+        )
+        args = []
+        for (bank, key), data in chunk:
+            args.extend((bank, key, salt.payload.dumps(data)))
+        cur, _ = run_query(__context__.get("mysql_client"), query, args=tuple(args))
+        cur.close()
+
+
+def fetch_many(items):
+    """
+    Fetch several key values, using one query per chunk of keys.
+    """
+    _init_client()
+    items = list(items)
+    ret = {item: {} for item in items}
+    for idx in range(0, len(items), _BULK_CHUNK_SIZE):
+        chunk = items[idx : idx + _BULK_CHUNK_SIZE]
+        query = "SELECT bank, etcd_key, data FROM {} WHERE {}".format(
+            __context__["mysql_table_name"],
+            " OR ".join(["(bank=%s AND etcd_key=%s)"] * len(chunk)),
+        )
+        args = tuple(value for item in chunk for value in item)
+        cur, _ = run_query(__context__.get("mysql_client"), query, args=args)
+        for bank, key, data in cur.fetchall():
+            if (bank, key) in ret:
+                ret[(bank, key)] = salt.payload.loads(data)
+        cur.close()
+    return ret
+
+
+def list_with_data(bank, key):
+    """
+    Fetch the given key from every sub-bank of the specified bank with a
+    single query.
+    """
+    _init_client()
+    prefix = f"{bank}/"
+    query = "SELECT bank, data FROM {} WHERE bank LIKE %s AND etcd_key=%s".format(
+        __context__["mysql_table_name"]
+    )
+    pattern = "".join(f"\\{char}" if char in "%_\\" else char for char in prefix)
+    cur, _ = run_query(
+        __context__.get("mysql_client"), query, args=(f"{pattern}%", key)
+    )
+    ret = {}
+    for entry, data in cur.fetchall():
+        entry = entry[len(prefix) :]
+        if entry and "/" not in entry:
+            ret[entry] = salt.payload.loads(data)
+    cur.close()
+    return ret
+
+
 def flush(bank, key=None):
     """
     Remove the key from the cache bank with all the key content.
@@ -422,6 +422,83 @@ def fetch(bank, key):
     return salt.payload.loads(redis_value)
 
 
+def fetch_many(items):
+    """
+    Fetch several keys from the Redis cache with a single MGET.
+    """
+    redis_server = _get_redis_server()
+    redis_keys = [_get_key_redis_key(bank, key) for bank, key in items]
+    try:
+        redis_values = redis_server.mget(redis_keys)
+    except (RedisConnectionError, RedisResponseError) as rerr:
+        mesg = "Cannot fetch the Redis cache keys {rkeys}: {rerr}".format(
+            rkeys=redis_keys, rerr=rerr
+        )
+        log.error(mesg)
+        raise SaltCacheError(mesg)
+    return {
+        item: {} if redis_value is None else salt.payload.loads(redis_value)
+        for item, redis_value in zip(items, redis_values)
+    }
+
+
+def store_many(items):
+    """
+    Store several keys in the Redis cache, using a single pipeline.
+    """
+    redis_server = _get_redis_server()
+    redis_pipe = redis_server.pipeline()
+    # localfs cache truncates the timestamp to int only. We'll do the same.
+    timestamp = salt.payload.dumps(int(time.time()))
+    try:
+        for bank in {bank for bank, _ in items}:
+            _build_bank_hier(bank, redis_pipe)
+        for (bank, key), data in items.items():
+            redis_pipe.set(_get_key_redis_key(bank, key), salt.payload.dumps(data))
+            redis_pipe.sadd(_get_bank_keys_redis_key(bank), key)
+            redis_pipe.set(_get_timestamp_key(bank=bank, key=key), timestamp)
+        log.debug("Setting the value for %d keys", len(items))
+        redis_pipe.execute()
+    except (RedisConnectionError, RedisResponseError) as rerr:
+        mesg = "Cannot set the Redis cache keys: {rerr}".format(rerr=rerr)
+        log.error(mesg)
+        raise SaltCacheError(mesg)
+
+
+def list_with_data(bank, key):
+    """
+    Fetch the given key from every sub-bank of the specified bank, scanning
+    for the matching Redis keys and reading them with a single MGET.
+    """
+    redis_server = _get_redis_server()
+    prefix = _get_key_redis_key(bank, "")
+    suffix = "/" + salt.utils.stringutils.to_str(key)
+    pattern = (
+        "".join(f"\\{char}" if char in "*?[]\\" else char for char in prefix)
+        + f"*{suffix}"
+    )
+    try:
+        entries = {}
+        for redis_key in redis_server.scan_iter(match=pattern):
+            redis_key = salt.utils.stringutils.to_str(redis_key)
+            entry = redis_key[len(prefix) : -len(suffix)]
+            if entry and "/" not in entry:
+                entries[entry] = redis_key
+        if not entries:
+            return {}
+        redis_values = redis_server.mget(list(entries.values()))
+    except (RedisConnectionError, RedisResponseError) as rerr:
+        mesg = "Cannot list the Redis cache bank {rbank}: {rerr}".format(
+            rbank=bank, rerr=rerr
+        )
+        log.error(mesg)
+        raise SaltCacheError(mesg)
+    return {
+        entry: {} if redis_value is None else salt.payload.loads(redis_value)
+        for entry, redis_value in zip(entries, redis_values)
+    }
+
+
 def flush(bank, key=None):
     """
     Remove the key from the cache bank with all the key content. If no key is specified, remove
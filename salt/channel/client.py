@@ -167,12 +167,16 @@ class AsyncReqChannel:
     def ttype(self):
         return self.transport.ttype
 
-    def _package_load(self, load):
-        return {
+    def _package_load(self, load, cmd=None):
+        ret = {
             "enc": self.crypt,
             "load": load,
             "version": 2,
         }
+        if cmd:
+            # Lets the master queue the encrypted load in the lane of its cmd
+            ret["cmd"] = cmd
+        return ret
 
     @tornado.gen.coroutine
     def _send_with_retry(self, load, tries, timeout):
@@ -210,7 +214,7 @@ class AsyncReqChannel:
         if not self.auth.authenticated:
             yield self.auth.authenticate()
         ret = yield self._send_with_retry(
-            self._package_load(self.auth.crypticle.dumps(load)),
+            self._package_load(self.auth.crypticle.dumps(load), load.get("cmd")),
             tries,
             timeout,
         )
@@ -219,7 +223,7 @@ class AsyncReqChannel:
             # Reauth in the case our key is deleted on the master side.
             yield self.auth.authenticate()
             ret = yield self._send_with_retry(
-                self._package_load(self.auth.crypticle.dumps(load)),
+                self._package_load(self.auth.crypticle.dumps(load), load.get("cmd")),
                 tries,
                 timeout,
             )
@@ -267,14 +271,16 @@ class AsyncReqChannel:
         :param int timeout: The number of seconds on a response before failing
         """
         nonce = uuid.uuid4().hex
+        cmd = None
         if load and isinstance(load, dict):
             load["nonce"] = nonce
+            cmd = load.get("cmd")
 
         @tornado.gen.coroutine
         def _do_transfer():
             # Yield control to the caller. When send() completes, resume by populating data with the Future.result
             data = yield self.transport.send(
-                self._package_load(self.auth.crypticle.dumps(load)),
+                self._package_load(self.auth.crypticle.dumps(load), cmd),
                 timeout=timeout,
             )
             # we may not have always data
@@ -22,6 +22,7 @@ import salt.transport.frame
 import salt.utils.channel
 import salt.utils.event
 import salt.utils.files
+import salt.utils.metrics
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.stringutils
@@ -124,6 +125,13 @@ class ReqServerChannel:
 
     @tornado.gen.coroutine
     def handle_message(self, payload):
+        metrics = salt.utils.metrics.registry()
+        if (
+            metrics is not None
+            and isinstance(payload, dict)
+            and isinstance(payload.get("load"), bytes)
+        ):
+            metrics.observe("salt_master_request_bytes", len(payload["load"]))
         try:
             payload = self._decode_payload(payload)
         except Exception as exc:  # pylint: disable=broad-except
@@ -168,6 +176,8 @@ class ReqServerChannel:
         # intercept the "_auth" commands, since the main daemon shouldn't know
         # anything about our key auth
         if payload["enc"] == "clear" and payload.get("load", {}).get("cmd") == "_auth":
+            if metrics is not None:
+                metrics.inc("salt_master_auth_total")
             raise tornado.gen.Return(self._auth(payload["load"], sign_messages))
 
         nonce = None
@@ -188,7 +198,10 @@ class ReqServerChannel:
         if req_fun == "send_clear":
             raise tornado.gen.Return(ret)
         elif req_fun == "send":
-            raise tornado.gen.Return(self.crypticle.dumps(ret, nonce))
+            ret = self.crypticle.dumps(ret, nonce)
+            if metrics is not None:
+                metrics.observe("salt_master_response_bytes", len(ret))
+            raise tornado.gen.Return(ret)
         elif req_fun == "send_private":
             raise tornado.gen.Return(
                 self._encrypt_private(
@@ -719,6 +732,18 @@ class ReqServerChannel:
             return self._clear_signed(ret)
         return ret
 
+    def stop_accepting(self):
+        """
+        Stop receiving new requests, the worker is about to exit
+        """
+        self.transport.stop_accepting()
+
+    def drained(self):
+        """
+        Return True once no more requests will be received
+        """
+        return self.transport.drained()
+
     def close(self):
         self.transport.close()
         if self.event is not None:
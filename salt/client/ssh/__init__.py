@@ -753,7 +753,7 @@ class SSH(MultiprocessingStateMixin):
         }
 
         # save load to the master job cache
-        if self.opts["master_job_cache"] == "local_cache":
+        if self.opts["master_job_cache"] in ("local_cache", "sqlite_cache"):
             self.returners["{}.save_load".format(self.opts["master_job_cache"])](
                 jid, job_load, minions=self.targets.keys()
             )
@@ -843,7 +843,7 @@ class SSH(MultiprocessingStateMixin):
         try:
             if isinstance(jid, bytes):
                 jid = jid.decode("utf-8")
-            if self.opts["master_job_cache"] == "local_cache":
+            if self.opts["master_job_cache"] in ("local_cache", "sqlite_cache"):
                 self.returners["{}.save_load".format(self.opts["master_job_cache"])](
                     jid, job_load, minions=self.targets.keys()
                 )
@@ -169,6 +169,15 @@ VALID_OPTS = immutabletypes.freeze(
         # what commands the master is processing and what the rates are of the executions
         "master_stats": bool,
         "master_stats_event_iter": int,
+        # Collect the master worker metrics and serve them in the Prometheus
+        # text exposition format
+        "master_metrics": bool,
+        # The time in seconds between two flushes of the worker metrics
+        "master_metrics_interval": int,
+        # The local address and port, or the unix socket, serving the metrics
+        "master_metrics_address": str,
+        "master_metrics_port": int,
+        "master_metrics_socket": (type(None), str),
         # The key fingerprint of the higher-level master for the syndic to verify it is talking to the
         # intended master
         "syndic_finger": str,
@@ -242,6 +251,19 @@ VALID_OPTS = immutabletypes.freeze(
         # Allows a user to provide an alternate name for top.sls
         "state_top": str,
         "state_top_saltenv": (type(None), str),
+        # Look the minion id, glob, list and grain targets of the top files up
+        # in an index instead of calling the matchers for each of them
+        "top_match_index": bool,
+        # Reuse the last compiled highstate when the files it was rendered from,
+        # the pillar, the grains and the options it depends on did not change
+        "state_compile_cache": bool,
+        # The grains a compiled highstate depends on, all of them if None
+        "state_compile_cache_grains": (type(None), list),
+        # The count of states run at once by the state runs, the states are run
+        # one at a time if lower than 2
+        "state_concurrency": int,
+        # Whether the concurrent states are run in threads or processes
+        "state_concurrency_mode": str,
         # States to run when a minion starts up
         "startup_states": str,
         # List of startup states
@@ -320,6 +342,26 @@ VALID_OPTS = immutabletypes.freeze(
         "ipv6": (type(None), bool),
         # The chunk size to use when streaming files with the file server
         "file_buffer_size": int,
+        # The largest chunk size the minions may ask the file server for
+        "file_buffer_max_size": int,
+        # The chunk size the file client asks the file server for, 0 to use the
+        # file_buffer_size of the file server
+        "file_client_chunk_size": int,
+        # The count of files the file client downloads at once when caching
+        # several files
+        "file_client_concurrency": int,
+        # The seconds the file client keeps the manifests of the files on the
+        # master, 0 to ask the master for the hash of each file
+        "file_client_manifest_ttl": int,
+        # The minimum size of the cached copy of a file for the file client to
+        # only download the blocks which changed, 0 to always download files
+        # whole
+        "file_client_delta_min_size": int,
+        # The size of the blocks compared by the file client
+        "file_client_delta_block_size": int,
+        # The size in bytes of the cache of compressed file chunks of each
+        # master worker
+        "fileserver_chunk_cache_size": int,
         # The TCP port on which minion events should be published if ipc_mode is TCP
         "tcp_pub_port": int,
         # The TCP port on which minion events should be pulled if ipc_mode is TCP
@@ -507,6 +549,21 @@ VALID_OPTS = immutabletypes.freeze(
         # The number of MWorker processes for a master to startup. This number needs to scale up as
         # the number of connected minions increases.
         "worker_threads": int,
+        # Scale the count of MWorker processes between worker_threads_min and
+        # worker_threads_max depending on their load
+        "worker_threads_autoscale": bool,
+        "worker_threads_min": int,
+        "worker_threads_max": int,
+        # The busy ratio of the MWorker processes the autoscaling aims for
+        "worker_threads_target_busy": float,
+        # Add a MWorker process while the mean request duration exceeds this
+        # many seconds, 0 disables it
+        "worker_threads_max_latency": (int, float),
+        "worker_threads_scale_interval": int,
+        "worker_threads_scale_down_delay": int,
+        "worker_threads_drain_timeout": int,
+        # Queue the requests by cmd into lanes with their own workers and weight
+        "request_lanes": dict,
         # The port for the master to listen to returns on. The minion needs to connect to this port
         # to send returns.
         "ret_port": int,
@@ -515,6 +572,10 @@ VALID_OPTS = immutabletypes.freeze(
         "keep_jobs": int,
         # The number of seconds to keep jobs around in the job cache on the master
         "keep_jobs_seconds": int,
+        # Length in seconds of the time buckets the local job cache records jobs in
+        "job_cache_bucket_seconds": int,
+        # Maximum number of jobs removed from the local job cache per cleanup
+        "job_cache_clean_budget": int,
         # If the returner supports `clean_old_jobs`, then at cleanup time,
         # archive the job data before deleting it.
         "archive_jobs": bool,
@@ -610,6 +671,15 @@ VALID_OPTS = immutabletypes.freeze(
         "minionfs_blacklist": list,
         # Specify a list of external pillar systems to use
         "ext_pillar": list,
+        # Render the external pillar systems concurrently in a pool of threads
+        "ext_pillar_parallel": bool,
+        "ext_pillar_parallel_workers": int,
+        # The external pillar systems which wait for the previous ones to be
+        # rendered when ext_pillar_parallel is enabled
+        "ext_pillar_sequential": list,
+        # Cache the data of the external pillar systems, per ext_pillar, for
+        # a TTL and by minion, grains or globally
+        "ext_pillar_cache": dict,
         # Reserved for future use to version the pillar structure
         "pillar_version": int,
         # Whether or not a copy of the master opts dict should be rendered into minion pillars
@@ -620,6 +690,16 @@ VALID_OPTS = immutabletypes.freeze(
         "pillar_cache_ttl": int,
         # Pillar cache backend. Defaults to `disk` which stores caches in the master cache
         "pillar_cache_backend": str,
+        # Compile a cached pillar again when the files, external pillars, grains
+        # or options it was compiled from change
+        "pillar_cache_track_deps": bool,
+        # Coalesce the concurrent compilations of the same pillar by the master
+        # workers and share the result for pillar_coalesce_ttl seconds
+        "pillar_coalesce": bool,
+        "pillar_coalesce_ttl": int,
+        # How long a master worker waits for the same pillar to be compiled by
+        # another one before compiling it itself
+        "pillar_coalesce_wait": int,
         # Cache the GPG data to avoid having to pass through the gpg renderer
         "gpg_cache": bool,
         # GPG data cache TTL, in seconds. Has no effect unless `gpg_cache` is True
@@ -667,6 +747,14 @@ VALID_OPTS = immutabletypes.freeze(
         "fileserver_backend": list,
         "fileserver_followsymlinks": bool,
         "fileserver_ignoresymlinks": bool,
+        # Keep the file lists of the roots fileserver backend current with an
+        # index updated by the FileserverUpdate process
+        "fileserver_roots_index": bool,
+        # Interval in seconds at which the watched roots are scanned again
+        "fileserver_roots_index_rescan": int,
+        # Keep the hashes of the files of the roots fileserver backend in an
+        # index shared by the master workers
+        "fileserver_hash_index": bool,
         "fileserver_verify_config": bool,
         # Optionally apply '*' permissions to any user. By default '*' is a fallback case that is
         # applied only if the user didn't matched by other matchers.
@@ -709,6 +797,12 @@ VALID_OPTS = immutabletypes.freeze(
         # cachedir under the name of the minion and used to predetermine what minions are expected to
         # reply from executions.
         "minion_data_cache": bool,
+        # Keep an in-memory inverted index of the minion data cache for targeting
+        "minion_data_index": bool,
+        # Interval in seconds between full rebuilds of the minion data index
+        "minion_data_index_rebuild_interval": int,
+        # Memoize compound target results until minion keys or minion data change
+        "compound_target_cache": bool,
         # The number of seconds between AES key rotations on the master
         "publish_session": int,
         # Defines a salt reactor. See https://docs.saltproject.io/en/latest/topics/reactor/
@@ -787,6 +881,8 @@ VALID_OPTS = immutabletypes.freeze(
         "jinja_lstrip_blocks": bool,
         # If this is set to True the first newline after a Jinja block is removed
         "jinja_trim_blocks": bool,
+        # Keep the compiled Jinja templates in memory and in the cachedir
+        "jinja_bytecode_cache": bool,
         # Cache minion ID to file
         "minion_id_caching": bool,
         # Always generate minion id in lowercase.
@@ -900,6 +996,11 @@ VALID_OPTS = immutabletypes.freeze(
         "memcache_expire_seconds": int,
         # Set a memcache limit in items (bank + key) per cache storage (driver + driver_opts).
         "memcache_max_items": int,
+        # Set a memcache limit in bytes per cache storage, 0 means no limit.
+        "memcache_max_bytes": int,
+        # Expiration time of the missing keys in memcache, 0 disables caching
+        # them. Defaults to memcache_expire_seconds.
+        "memcache_negative_expire_seconds": (type(None), int),
         # Each time a cache storage got full cleanup all the expired items not just the oldest one.
         "memcache_full_cleanup": bool,
         # Enable collecting the memcache stats and log it on `debug` log level.
@@ -1048,6 +1149,7 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "renderer": "jinja|yaml",
         "renderer_whitelist": [],
         "renderer_blacklist": [],
+        "jinja_bytecode_cache": False,
         "random_startup_delay": 0,
         "failhard": False,
         "autoload_dynamic_modules": True,
@@ -1073,6 +1175,11 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "extension_modules": os.path.join(salt.syspaths.CACHE_DIR, "minion", "extmods"),
         "state_top": "top.sls",
         "state_top_saltenv": None,
+        "top_match_index": False,
+        "state_compile_cache": False,
+        "state_compile_cache_grains": None,
+        "state_concurrency": 1,
+        "state_concurrency_mode": "thread",
         "startup_states": "",
         "sls_list": [],
         "start_event_grains": [],
@@ -1177,6 +1284,12 @@ DEFAULT_MINION_OPTS = immutabletypes.freeze(
         "ipc_write_buffer": _DFLT_IPC_WBUFFER,
         "ipv6": None,
         "file_buffer_size": 262144,
+        "file_buffer_max_size": 16777216,
+        "file_client_chunk_size": 0,
+        "file_client_concurrency": 1,
+        "file_client_manifest_ttl": 0,
+        "file_client_delta_min_size": 0,
+        "file_client_delta_block_size": 65536,
         "tcp_pub_port": 4510,
         "tcp_pull_port": 4511,
         "tcp_authentication_retries": 5,
@@ -1323,12 +1436,23 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "auth_mode": 1,
         "user": _MASTER_USER,
         "worker_threads": 5,
+        "worker_threads_autoscale": False,
+        "worker_threads_min": 2,
+        "worker_threads_max": 32,
+        "worker_threads_target_busy": 0.6,
+        "worker_threads_max_latency": 0,
+        "worker_threads_scale_interval": 5,
+        "worker_threads_scale_down_delay": 60,
+        "worker_threads_drain_timeout": 60,
+        "request_lanes": {},
         "sock_dir": os.path.join(salt.syspaths.SOCK_DIR, "master"),
         "sock_pool_size": 1,
         "ret_port": 4506,
         "timeout": 5,
         "keep_jobs": 24,
         "keep_jobs_seconds": 86400,
+        "job_cache_bucket_seconds": 3600,
+        "job_cache_clean_budget": 10000,
         "archive_jobs": False,
         "root_dir": salt.syspaths.ROOT_DIR,
         "pki_dir": os.path.join(salt.syspaths.LIB_STATE_DIR, "pki", "master"),
@@ -1423,11 +1547,20 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "max_event_size": 1048576,
         "master_stats": False,
         "master_stats_event_iter": 60,
+        "master_metrics": False,
+        "master_metrics_interval": 5,
+        "master_metrics_address": "127.0.0.1",
+        "master_metrics_port": 9616,
+        "master_metrics_socket": None,
         "minionfs_env": "base",
         "minionfs_mountpoint": "",
         "minionfs_whitelist": [],
         "minionfs_blacklist": [],
         "ext_pillar": [],
+        "ext_pillar_parallel": False,
+        "ext_pillar_parallel_workers": 4,
+        "ext_pillar_sequential": [],
+        "ext_pillar_cache": {},
         "pillar_version": 2,
         "pillar_opts": False,
         "pillar_safe_render_error": True,
@@ -1437,6 +1570,10 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "pillar_cache": False,
         "pillar_cache_ttl": 3600,
         "pillar_cache_backend": "disk",
+        "pillar_cache_track_deps": False,
+        "pillar_coalesce": False,
+        "pillar_coalesce_ttl": 10,
+        "pillar_coalesce_wait": 30,
         "gpg_cache": False,
         "gpg_cache_ttl": 86400,
         "gpg_cache_backend": "disk",
@@ -1467,11 +1604,16 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "file_recv": False,
         "file_recv_max_size": 100,
         "file_buffer_size": 1048576,
+        "file_buffer_max_size": 16777216,
+        "fileserver_chunk_cache_size": 0,
         "file_ignore_regex": [],
         "file_ignore_glob": [],
         "fileserver_backend": ["roots"],
         "fileserver_followsymlinks": True,
         "fileserver_ignoresymlinks": False,
+        "fileserver_roots_index": False,
+        "fileserver_roots_index_rescan": 3600,
+        "fileserver_hash_index": False,
         "fileserver_verify_config": True,
         "max_open_files": 100000,
         "hash_type": DEFAULT_HASH_TYPE,
@@ -1485,6 +1627,7 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "failhard": False,
         "state_top": "top.sls",
         "state_top_saltenv": None,
+        "top_match_index": False,
         "master_tops": {},
         "master_tops_first": False,
         "order_masters": False,
@@ -1493,6 +1636,9 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "master_job_cache": "local_cache",
         "job_cache_store_endtime": False,
         "minion_data_cache": True,
+        "minion_data_index": False,
+        "minion_data_index_rebuild_interval": 3600,
+        "compound_target_cache": False,
         "enforce_mine_cache": False,
         "ipc_mode": _DFLT_IPC_MODE,
         "ipc_write_buffer": _DFLT_IPC_WBUFFER,
@@ -1582,6 +1728,7 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "jinja_sls_env": {},
         "jinja_lstrip_blocks": False,
         "jinja_trim_blocks": False,
+        "jinja_bytecode_cache": False,
         "tcp_keepalive": True,
         "tcp_keepalive_idle": 300,
         "tcp_keepalive_cnt": -1,
@@ -1626,6 +1773,8 @@ DEFAULT_MASTER_OPTS = immutabletypes.freeze(
         "cache": "localfs",
         "memcache_expire_seconds": 0,
         "memcache_max_items": 1024,
+        "memcache_max_bytes": 0,
+        "memcache_negative_expire_seconds": None,
         "memcache_full_cleanup": False,
         "memcache_debug": False,
         "thin_extra_mods": "",
@@ -437,6 +437,9 @@ class RemoteFuncs:
         self._serve_file = fs_.serve_file
         self._file_find = fs_._find_file
         self._file_hash = fs_.file_hash
+        self._file_hashes = fs_.file_hashes
+        self._file_manifest = fs_.file_manifest
+        self._file_blocks = fs_.file_blocks
         self._file_list = fs_.file_list
         self._file_list_emptydirs = fs_.file_list_emptydirs
         self._dir_list = fs_.dir_list
@@ -602,8 +605,11 @@ class RemoteFuncs:
         _res = checker.check_minions(load["tgt"], match_type, greedy=False)
         minions = _res["minions"]
         minion_side_acl = {}  # Cache minion-side ACL
+        mines = self.cache.fetch_many(
+            (f"minions/{minion}", "mine") for minion in minions
+        )
         for minion in minions:
-            mine_data = self.cache.fetch(f"minions/{minion}", "mine")
+            mine_data = mines[(f"minions/{minion}", "mine")]
             if not isinstance(mine_data, dict):
                 continue
             for function in functions_allowed:
@@ -773,6 +779,7 @@ class RemoteFuncs:
                 "data",
                 {"grains": load["grains"], "pillar": data},
             )
+            salt.utils.minions.minion_data_updated(self.opts, load["id"])
             if self.opts.get("minion_data_cache_events") is True:
                 self.event.fire_event(
                     {"comment": "Minion data cache refresh"},
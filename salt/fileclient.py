@@ -2,12 +2,15 @@
 Classes that manage file clients
 """
 
+import concurrent.futures
 import contextlib
 import errno
 import ftplib  # nosec
+import hashlib
 import http.server
 import logging
 import os
+import queue
 import shutil
 import string
 import time
@@ -23,6 +26,8 @@ import salt.fileserver
 import salt.loader
 import salt.payload
 import salt.utils.atomicfile
+import salt.utils.blockdelta
+import salt.utils.compression
 import salt.utils.data
 import salt.utils.files
 import salt.utils.gzip_util
@@ -77,6 +82,22 @@ def decode_dict_keys_to_str(src):
     return output
 
 
+def _common_dir(paths):
+    """
+    Return the deepest directory, ending with a slash, holding all the given
+    relative paths, or an empty string
+    """
+    dirs = [path.split("/")[:-1] for path in paths]
+    if not dirs:
+        return ""
+    common = []
+    for parts in zip(*dirs):
+        if any(part != parts[0] for part in parts[1:]):
+            break
+        common.append(parts[0])
+    return "".join(part + "/" for part in common)
+
+
 class Client:
     """
     Base class for Salt file interactions
@@ -99,6 +120,10 @@ class Client:
     def __getstate__(self):
         return {"opts": self.opts}
 
+    @staticmethod
+    def _list_digest(files):
+        return hashlib.sha256("\0".join(sorted(files or ())).encode()).hexdigest()
+
     def _check_proto(self, path):
         """
         Make sure that this path is intended for the salt master and trim it
@@ -200,23 +225,26 @@ class Client:
         Download a list of files stored on the master and put them in the
         minion file cache
         """
-        ret = []
         if isinstance(paths, str):
             paths = paths.split(",")
-        for path in paths:
-            ret.append(self.cache_file(path, saltenv, cachedir=cachedir))
-        return ret
+        return self._cache_many(paths, saltenv, cachedir)
 
     def cache_master(self, saltenv="base", cachedir=None):
         """
         Download and cache all files on a master in a specified environment
         """
-        ret = []
-        for path in self.file_list(saltenv):
-            ret.append(
-                self.cache_file(salt.utils.url.create(path), saltenv, cachedir=cachedir)
-            )
-        return ret
+        return self._cache_many(
+            [salt.utils.url.create(path) for path in self.file_list(saltenv)],
+            saltenv,
+            cachedir,
+        )
+
+    def _cache_many(self, paths, saltenv="base", cachedir=None):
+        """
+        Cache the given files, one after the other, and return the results of
+        cache_file in the same order
+        """
+        return [self.cache_file(path, saltenv, cachedir=cachedir) for path in paths]
 
     def cache_dir(
         self,
@@ -242,17 +270,15 @@ class Client:
         log.info("Caching directory '%s' for environment '%s'", path, saltenv)
         # go through the list of all files finding ones that are in
         # the target directory and caching them
+        paths = []
         for fn_ in self.file_list(saltenv):
             fn_ = salt.utils.data.decode(fn_)
             if fn_.strip() and fn_.startswith(path):
                 if salt.utils.stringutils.check_include_exclude(
                     fn_, include_pat, exclude_pat
                 ):
-                    fn_ = self.cache_file(
-                        salt.utils.url.create(fn_), saltenv, cachedir=cachedir
-                    )
-                    if fn_:
-                        ret.append(fn_)
+                    paths.append(salt.utils.url.create(fn_))
+        ret.extend(fn_ for fn_ in self._cache_many(paths, saltenv, cachedir) if fn_)
 
         if include_empty:
             # Break up the path into a list containing the bottom-level
@@ -925,6 +951,43 @@ class PillarClient(Client):
     Used by pillar to handle fileclient requests
     """
 
+    def __init__(self, opts):
+        super().__init__(opts)
+        # The lookups made since track_deps() was called
+        self.deps = None
+
+    def track_deps(self):
+        """
+        Record the files looked up and the directories listed from now on, so
+        that the pillar cache can tell when a compiled pillar is outdated.
+
+        ``deps["files"]`` maps ``(<saltenv>, <path>)`` to ``[<found path>,
+        <mtime_ns>, <size>]`` and ``deps["lists"]`` maps ``(<saltenv>,
+        <prefix>)`` to a digest of the listed files.
+        """
+        self.deps = {"files": {}, "lists": {}}
+
+    def lookup(self, path, saltenv="base"):
+        """
+        Return ``[<found path>, <mtime_ns>, <size>]`` for a file of the
+        pillar_roots, the found path being empty if there is no such file
+        """
+        for root in self.opts["pillar_roots"].get(saltenv, []):
+            full = os.path.join(root, path)
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            if not os.path.isdir(full):
+                return [full, stat.st_mtime_ns, stat.st_size]
+        return ["", 0, 0]
+
+    def list_digest(self, saltenv="base", prefix=""):
+        """
+        Return a digest of the files under ``prefix``
+        """
+        return self._list_digest(self.file_list(saltenv, prefix))
+
     def _find_file(self, path, saltenv="base"):
         """
         Locate the file path
@@ -934,6 +997,12 @@ class PillarClient(Client):
         if salt.utils.url.is_escaped(path):
             # The path arguments are escaped
             path = salt.utils.url.unescape(path)
+        if self.deps is not None:
+            found = self.deps["files"][(saltenv, path)] = self.lookup(path, saltenv)
+            if found[0]:
+                fnd["path"] = found[0]
+                fnd["rel"] = path
+            return fnd
         for root in self.opts["pillar_roots"].get(saltenv, []):
             full = os.path.join(root, path)
             if os.path.isfile(full):
@@ -975,6 +1044,8 @@ class PillarClient(Client):
                 for fname in files:
                     relpath = os.path.relpath(os.path.join(root, fname), path)
                     ret.append(salt.utils.data.decode(relpath))
+        if self.deps is not None:
+            self.deps["lists"][(saltenv, prefix)] = self._list_digest(ret)
         return ret
 
     def file_list_emptydirs(self, saltenv="base", prefix=""):
@@ -1131,6 +1202,29 @@ class RemoteClient(Client):
             self.auth = self.channel.auth
         else:
             self.auth = ""
+        # The files fetched since track_deps() was called
+        self.deps = None
+        # {(<saltenv>, <prefix>): (<expiry>, <manifest>)}
+        self._manifests = {}
+
+    def track_deps(self):
+        """
+        Record the files fetched, the directories listed and the environments
+        listed from now on, so that the highstate compile cache can tell when a
+        compiled highstate is outdated.
+
+        ``deps["files"]`` maps ``(<saltenv>, <path>)`` to the hash of the file
+        returned by the master, ``deps["lists"]`` maps ``(<saltenv>,
+        <prefix>)`` to a digest of the listed files and ``deps["envs"]`` holds
+        the environments.
+        """
+        self.deps = {"files": {}, "lists": {}, "envs": None}
+
+    def list_digest(self, saltenv="base", prefix=""):
+        """
+        Return a digest of the files under ``prefix`` on the master
+        """
+        return self._list_digest(self.file_list(saltenv, prefix))
 
     def _refresh_channel(self):
         """
@@ -1167,6 +1261,119 @@ class RemoteClient(Client):
         if channel is not None:
             channel.close()
 
+    def _worker_client(self):
+        """
+        Return a copy of this client with its own channel, to download files
+        next to this one
+        """
+        # Not copy.copy(), which would run __init__ again, see __setstate__
+        worker = object.__new__(self.__class__)
+        worker.__dict__.update(self.__dict__)
+        worker.channel = self._worker_channel()
+        return worker
+
+    def _worker_channel(self):
+        """
+        Return the channel of a worker client
+        """
+        return salt.channel.client.ReqChannel.factory(self.opts)
+
+    def _file_client_concurrency(self):
+        """
+        Return the count of files to download at once
+        """
+        try:
+            return int(self.opts.get("file_client_concurrency", 1) or 1)
+        except (TypeError, ValueError):
+            log.warning(
+                "Invalid file_client_concurrency %r, downloading the files one "
+                "at a time",
+                self.opts["file_client_concurrency"],
+            )
+            return 1
+
+    def _cache_many(self, paths, saltenv="base", cachedir=None):
+        """
+        Cache the given files and return the results of cache_file in the
+        same order.
+
+        With ``file_client_concurrency`` above 1, the hashes of the files on
+        the master are fetched in one request per saltenv, the files already
+        cached with the same hash are skipped, and up to
+        ``file_client_concurrency`` of the other files are downloaded at once,
+        each worker over its own channel.
+        """
+        concurrency = self._file_client_concurrency()
+        if concurrency <= 1 or len(paths) <= 1:
+            return super()._cache_many(paths, saltenv, cachedir)
+        ret = [None] * len(paths)
+        # {<saltenv>: [(<index>, <path>)]}
+        by_env = {}
+        for ind, url in enumerate(paths):
+            if not url.startswith("salt://"):
+                ret[ind] = self.cache_file(url, saltenv, cachedir=cachedir)
+                continue
+            path, senv = salt.utils.url.parse(url)
+            by_env.setdefault(senv or saltenv, []).append((ind, path))
+
+        fetches = []
+        for env, entries in by_env.items():
+            hashes = self.hash_files([path for _, path in entries], env)
+            for ind, path in entries:
+                hash_server = hashes.get(path, "")
+                if self.deps is not None:
+                    # Keyed by URL like in get_file
+                    self.deps["files"][(env, salt.utils.url.create(path))] = hash_server
+                if not hash_server:
+                    log.debug("Could not find file '%s' in saltenv '%s'", path, env)
+                    ret[ind] = False
+                    continue
+                with self._cache_loc(path, env, cachedir=cachedir) as dest:
+                    if (
+                        os.path.isfile(dest)
+                        and self.hash_file(dest, env) == hash_server
+                    ):
+                        ret[ind] = dest
+                        continue
+                fetches.append((ind, path, env, dest, hash_server))
+        if not fetches:
+            return ret
+
+        workers = queue.SimpleQueue()
+        clients = []
+
+        def _fetch(path, env, dest, hash_server):
+            try:
+                worker = workers.get_nowait()
+            except queue.Empty:
+                worker = self._worker_client()
+                clients.append(worker)
+            url = salt.utils.url.create(path)
+            try:
+                if os.path.isfile(dest) and worker._fetch_delta(
+                    url, dest, env, hash_server
+                ):
+                    return dest
+                return worker._fetch_file(url, "", True, env, cachedir=cachedir)
+            finally:
+                workers.put(worker)
+
+        log.debug("Downloading %d files, %d at a time", len(fetches), concurrency)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(concurrency, len(fetches)),
+                thread_name_prefix="FileClient",
+            ) as pool:
+                futures = [
+                    (ind, pool.submit(_fetch, *fetch)) for ind, *fetch in fetches
+                ]
+                for ind, future in futures:
+                    ret[ind] = future.result()
+        finally:
+            for worker in clients:
+                worker.destroy()
+        return ret
+
     def get_file(
         self, path, dest="", makedirs=False, saltenv="base", gzip=None, cachedir=None
     ):
@@ -1180,10 +1387,10 @@ class RemoteClient(Client):
         if senv:
             saltenv = senv
 
-        if not salt.utils.platform.is_windows():
-            hash_server, stat_server = self.hash_and_stat_file(path, saltenv)
-        else:
-            hash_server = self.hash_file(path, saltenv)
+        hash_server = self.hash_file(path, saltenv)
+
+        if self.deps is not None:
+            self.deps["files"][(saltenv, path)] = hash_server
 
         # Check if file exists on server, before creating files and
         # directories
@@ -1224,14 +1431,136 @@ class RemoteClient(Client):
         )
 
         if dest2check and os.path.isfile(dest2check):
-            if not salt.utils.platform.is_windows():
-                hash_local, stat_local = self.hash_and_stat_file(dest2check, saltenv)
-            else:
-                hash_local = self.hash_file(dest2check, saltenv)
-
+            hash_local = self.hash_file(dest2check, saltenv)
             if hash_local == hash_server:
                 return dest2check
+            if self._fetch_delta(path, dest2check, saltenv, hash_server, gzip):
+                return dest2check
+
+        return self._fetch_file(path, dest, makedirs, saltenv, gzip, cachedir)
+
+    @staticmethod
+    def _decode_chunk(data):
+        """
+        Return the content of a chunk served by the master, uncompressed
+        """
+        if data.get("codec", None):
+            data = salt.utils.compression.uncompress(
+                data["data"], salt.utils.stringutils.to_str(data["codec"])
+            )
+        elif data.get("gzip", None):
+            data = salt.utils.gzip_util.uncompress(data["data"])
+        else:
+            data = data["data"]
+        if isinstance(data, str):
+            data = data.encode()
+        return data
+
+    def _fetch_delta(self, path, dest, saltenv, hash_server, gzip=None):
+        """
+        Update the copy of a file at ``dest`` to the content with the hash
+        ``hash_server``, only downloading the blocks of the file which are not
+        in the copy. Return whether the copy was updated.
+        """
+        min_size = self.opts.get("file_client_delta_min_size", 0)
+        if not min_size or not hash_server:
+            return False
+        try:
+            if os.path.getsize(dest) < min_size:
+                return False
+        except OSError:
+            return False
+        path = self._check_proto(path)
+        load = {
+            "path": path,
+            "saltenv": saltenv,
+            "block_size": self.opts.get("file_client_delta_block_size", 65536),
+            "cmd": "_file_blocks",
+        }
+        sigs = self._channel_send(load, raw=True)
+        if not isinstance(sigs, dict) or not sigs:
+            return False
+        # The strong checksums are left as bytes
+        sigs = decode_dict_keys_to_str(sigs)
+        try:
+            if salt.utils.stringutils.to_str(sigs["hsum"]) != hash_server["hsum"]:
+                # The file changed since it was hashed
+                return False
+            found = salt.utils.blockdelta.match_blocks(dest, sigs)
+            block_size = sigs["block_size"]
+            count = len(sigs["strong"])
+            if len(found) < salt.utils.blockdelta.MIN_MATCHED * count:
+                log.debug(
+                    "Only %d of the %d blocks of '%s' in saltenv '%s' are in "
+                    "the cached copy, downloading it whole",
+                    len(found),
+                    count,
+                    path,
+                    saltenv,
+                )
+                return False
+            log.debug(
+                "Fetching %d of the %d blocks of '%s' in saltenv '%s'",
+                count - len(found),
+                count,
+                path,
+                saltenv,
+            )
+            load = {"path": path, "saltenv": saltenv, "cmd": "_serve_file"}
+            if gzip:
+                load["gzip"] = int(gzip)
+                load["codecs"] = salt.utils.compression.available_codecs()
+            hasher = hashlib.new(salt.utils.stringutils.to_str(sigs["hash_type"]))
+            with salt.utils.files.fopen(
+                dest, "rb"
+            ) as local, salt.utils.atomicfile.atomic_open(dest, "wb") as fn_:
+                ind = 0
+                while ind < count:
+                    if ind in found:
+                        local.seek(found[ind])
+                        data = local.read(
+                            min(block_size, sigs["size"] - ind * block_size)
+                        )
+                        hasher.update(data)
+                        fn_.write(data)
+                        ind += 1
+                        continue
+                    start = ind * block_size
+                    while ind < count and ind not in found:
+                        ind += 1
+                    end = min(ind * block_size, sigs["size"])
+                    while start < end:
+                        load["loc"] = start
+                        load["chunk_size"] = end - start
+                        data = self._decode_chunk(
+                            decode_dict_keys_to_str(self._channel_send(load, raw=True))
+                        )
+                        if not data:
+                            raise ValueError(f"Truncated chunk at {start}")
+                        data = data[: end - start]
+                        hasher.update(data)
+                        fn_.write(data)
+                        start += len(data)
+                if hasher.hexdigest() != hash_server["hsum"]:
+                    raise ValueError("Hash mismatch")
+        except (KeyError, TypeError, ValueError, OSError) as exc:
+            log.warning(
+                "Unable to update '%s' from the blocks of '%s', downloading it "
+                "whole: %s",
+                dest,
+                path,
+                exc,
+            )
+            return False
+        log.info("Fetching file from saltenv '%s', ** done ** '%s'", saltenv, path)
+        return True
 
+    def _fetch_file(
+        self, path, dest="", makedirs=False, saltenv="base", gzip=None, cachedir=None
+    ):
+        """
+        Download a file from the salt-master, chunk by chunk
+        """
         log.debug(
             "Fetching file from saltenv '%s', ** attempting ** '%s'", saltenv, path
         )
@@ -1242,6 +1571,9 @@ class RemoteClient(Client):
         if gzip:
             gzip = int(gzip)
             load["gzip"] = gzip
+            load["codecs"] = salt.utils.compression.available_codecs()
+        if self.opts.get("file_client_chunk_size"):
+            load["chunk_size"] = self.opts["file_client_chunk_size"]
 
         fn_ = None
         if dest:
@@ -1316,12 +1648,7 @@ class RemoteClient(Client):
                         if os.path.isdir(dest):
                             salt.utils.files.rm_rf(dest)
                         fn_ = salt.utils.atomicfile.atomic_open(dest, "wb+")
-                if data.get("gzip", None):
-                    data = salt.utils.gzip_util.uncompress(data["data"])
-                else:
-                    data = data["data"]
-                if isinstance(data, str):
-                    data = data.encode()
+                data = self._decode_chunk(data)
                 fn_.write(data)
             except (TypeError, KeyError) as exc:
                 try:
@@ -1364,9 +1691,12 @@ class RemoteClient(Client):
         List the files on the master
         """
         load = {"saltenv": saltenv, "prefix": prefix, "cmd": "_file_list"}
-        return self._channel_send(
+        ret = self._channel_send(
             load,
         )
+        if self.deps is not None:
+            self.deps["lists"][(saltenv, prefix)] = self._list_digest(ret)
+        return ret
 
     def file_list_emptydirs(self, saltenv="base", prefix=""):
         """
@@ -1413,6 +1743,11 @@ class RemoteClient(Client):
                 ret["hsum"] = salt.utils.hashutils.get_hash(path, form=hash_type)
                 ret["hash_type"] = hash_type
                 return ret
+        entry = self._manifest_entry(path, saltenv)
+        if entry is not None:
+            if not entry:
+                return ""
+            return {"hsum": entry["hsum"], "hash_type": entry["hash_type"]}
         load = {"path": path, "saltenv": saltenv, "cmd": "_file_hash"}
         return self._channel_send(
             load,
@@ -1452,6 +1787,112 @@ class RemoteClient(Client):
             stat_result = None
         return hash_result, stat_result
 
+    def file_manifest(self, saltenv="base", prefix=""):
+        """
+        Return the hashes, sizes and modes of the files under ``prefix`` on
+        the salt master file server, by path, in one compressed reply. Return
+        None if the master does not serve manifests.
+        """
+        load = {
+            "saltenv": saltenv,
+            "prefix": prefix,
+            "codecs": salt.utils.compression.available_codecs(),
+            "cmd": "_file_manifest",
+        }
+        ret = self._channel_send(load, raw=True)
+        if not isinstance(ret, dict):
+            return None
+        ret = decode_dict_keys_to_str(ret)
+        try:
+            return salt.payload.loads(
+                salt.utils.compression.uncompress(
+                    ret["data"], salt.utils.stringutils.to_str(ret["codec"])
+                )
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            log.warning(
+                "Invalid manifest of '%s' in saltenv '%s': %s", prefix, saltenv, exc
+            )
+            return None
+
+    def _manifest(self, saltenv, prefix):
+        """
+        Return the manifest of the files under ``prefix``, fetched at most
+        once every ``file_client_manifest_ttl`` seconds, or None if disabled
+        or not served by the master
+        """
+        ttl = self.opts.get("file_client_manifest_ttl", 0)
+        if not ttl:
+            return None
+        now = time.monotonic()
+        try:
+            expiry, manifest = self._manifests[(saltenv, prefix)]
+            if expiry > now:
+                return manifest
+        except KeyError:
+            pass
+        manifest = self.file_manifest(saltenv, prefix)
+        self._manifests[(saltenv, prefix)] = (now + ttl, manifest)
+        return manifest
+
+    def _manifest_entry(self, path, saltenv):
+        """
+        Return the manifest entry of a file, an empty dict if the file is not
+        on the master, or None if no manifest is available. The file is looked
+        up in the manifests fetched for its saltenv, or else in the manifest of
+        its top directory.
+        """
+        if not self.opts.get("file_client_manifest_ttl", 0):
+            return None
+        now = time.monotonic()
+        for (env, prefix), (expiry, manifest) in list(self._manifests.items()):
+            if (
+                env == saltenv
+                and expiry > now
+                and manifest is not None
+                and path.startswith(prefix)
+            ):
+                return manifest.get(path, {})
+        if "/" not in path:
+            # Files at the root of the saltenv are looked up one by one
+            return None
+        manifest = self._manifest(saltenv, path.split("/", 1)[0] + "/")
+        if manifest is None:
+            return None
+        return manifest.get(path, {})
+
+    def hash_files(self, paths, saltenv="base"):
+        """
+        Return the hashes of files on the salt master file server, by path,
+        in one request. The paths are relative to the saltenv and the files
+        not found map to an empty string.
+        """
+        paths = list(paths)
+        manifest = self._manifest(saltenv, _common_dir(paths))
+        if manifest is not None:
+            return {
+                path: (
+                    {
+                        "hsum": manifest[path]["hsum"],
+                        "hash_type": manifest[path]["hash_type"],
+                    }
+                    if path in manifest
+                    else ""
+                )
+                for path in paths
+            }
+        load = {"paths": paths, "saltenv": saltenv, "cmd": "_file_hashes"}
+        ret = self._channel_send(
+            load,
+        )
+        if not isinstance(ret, dict):
+            # The master does not know _file_hashes, ask for each file
+            ret = {
+                path: self.hash_file(salt.utils.url.create(path), saltenv)
+                for path in paths
+            }
+        return ret
+
     def list_env(self, saltenv="base"):
         """
         Return a list of the files in the file server's specified environment
@@ -1466,9 +1907,12 @@ class RemoteClient(Client):
         Return a list of available environments
         """
         load = {"cmd": "_file_envs"}
-        return self._channel_send(
+        ret = self._channel_send(
             load,
         )
+        if self.deps is not None:
+            self.deps["envs"] = ret
+        return ret
 
     def master_opts(self):
         """
@@ -1508,6 +1952,15 @@ class FSClient(RemoteClient):
         self._closing = False
         self.channel = salt.fileserver.FSChan(opts)
         self.auth = DumbAuth()
+        self.deps = None
+        self._manifests = {}
+
+    def _worker_channel(self):
+        """
+        Share the channel with the worker clients, the local file server being
+        safe to use from several threads
+        """
+        return self.channel
 
 
 # Provide backward compatibility for anyone directly using LocalClient (but no
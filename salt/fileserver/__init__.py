@@ -2,6 +2,7 @@
 File server pluggable modules and generic backend functions
 """
 
+import collections
 import errno
 import fnmatch
 import logging
@@ -11,6 +12,8 @@ import time
 from collections.abc import Sequence
 
 import salt.loader
+import salt.payload
+import salt.utils.compression
 import salt.utils.data
 import salt.utils.files
 import salt.utils.path
@@ -238,6 +241,95 @@ def diff_mtime_map(map1, map2):
     return False
 
 
+class ChunkCache:
+    """
+    The compressed file chunks most recently served, up to a total size in
+    bytes
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.chunks = collections.OrderedDict()
+
+    def get(self, key):
+        try:
+            self.chunks.move_to_end(key)
+        except KeyError:
+            return None
+        return self.chunks[key]
+
+    def set(self, key, data):
+        if len(data) > self.max_size:
+            return
+        self.chunks[key] = data
+        self.size += len(data)
+        while self.size > self.max_size:
+            self.size -= len(self.chunks.popitem(last=False)[1])
+
+
+_CHUNK_CACHES = {}
+
+
+def _read(fp_, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fp_.fileno(), size, offset)
+    fp_.seek(offset)
+    return fp_.read(size)
+
+
+def read_chunk(opts, path, load):
+    """
+    Read the chunk of a file requested by a ``_serve_file`` load, and compress
+    it if asked to. Return the chunk along with the codec and the level it is
+    compressed with, or None and None.
+
+    The minions may ask for chunks of up to :conf_master:`file_buffer_max_size`
+    bytes, and offer the codecs they support along with the ``gzip`` level,
+    see :py:mod:`salt.utils.compression`. The compressed chunks are kept in
+    memory, up to :conf_master:`fileserver_chunk_cache_size` bytes, as long as
+    the size, the mtime and the inode of the file do not change.
+    """
+    size = opts["file_buffer_size"]
+    if load.get("chunk_size"):
+        size = max(
+            1, min(int(load["chunk_size"]), opts.get("file_buffer_max_size", size))
+        )
+    codec = level = None
+    if load.get("gzip"):
+        level = int(load["gzip"])
+        codec = salt.utils.compression.negotiate(load.get("codecs") or ["gzip"])
+    cache = None
+    cache_size = opts.get("fileserver_chunk_cache_size", 0)
+    if codec and cache_size:
+        cache = _CHUNK_CACHES.get(cache_size)
+        if cache is None:
+            cache = _CHUNK_CACHES[cache_size] = ChunkCache(cache_size)
+    with salt.utils.files.fopen(path, "rb") as fp_:
+        if cache is not None:
+            path_stat = os.fstat(fp_.fileno())
+            key = (
+                path,
+                path_stat.st_size,
+                path_stat.st_mtime_ns,
+                path_stat.st_ino,
+                load["loc"],
+                size,
+                codec,
+                level,
+            )
+            data = cache.get(key)
+            if data is not None:
+                return data, codec, level
+        data = _read(fp_, size, load["loc"])
+    if not data or not codec:
+        return data, None, None
+    data = salt.utils.compression.compress(data, codec, level)
+    if cache is not None:
+        cache.set(key, data)
+    return data, codec, level
+
+
 def reap_fileserver_cache_dir(cache_base, find_func):
     """
     Remove unused cache items assuming the cache directory follows a directory
@@ -625,6 +717,27 @@ class Fileserver:
             return self.servers[fstr](load, fnd)
         return ret
 
+    def file_blocks(self, load):
+        """
+        Return the signatures of the blocks of a file
+        """
+        if "env" in load:
+            # "env" is not supported; Use "saltenv".
+            load.pop("env")
+
+        if "path" not in load or "saltenv" not in load:
+            return {}
+        if not isinstance(load["saltenv"], str):
+            load["saltenv"] = str(load["saltenv"])
+
+        fnd = self.find_file(load["path"], load["saltenv"])
+        if not fnd.get("back"):
+            return {}
+        fstr = "{}.file_blocks".format(fnd["back"])
+        if fstr in self.servers:
+            return self.servers[fstr](load, fnd)
+        return {}
+
     def __file_hash_and_stat(self, load):
         """
         Common code for hashing and stating files
@@ -667,6 +780,62 @@ class Fileserver:
         except (IndexError, TypeError):
             return "", None
 
+    def file_hashes(self, load):
+        """
+        Return the hashes of the given files, by path, the files not found
+        mapping to an empty string
+        """
+        if "env" in load:
+            # "env" is not supported; Use "saltenv".
+            load.pop("env")
+
+        if "paths" not in load or "saltenv" not in load:
+            return {}
+        return {
+            path: self.file_hash({"path": path, "saltenv": load["saltenv"]})
+            for path in load["paths"]
+        }
+
+    def file_manifest(self, load):
+        """
+        Return the hashes, sizes and modes of the files under a prefix, by
+        path, serialized and compressed with the first of the offered codecs
+        supported by this host
+        """
+        if "env" in load:
+            # "env" is not supported; Use "saltenv".
+            load.pop("env")
+
+        if "saltenv" not in load:
+            return {}
+        saltenv = str(load["saltenv"])
+        files = {}
+        for path in self.file_list(
+            {"saltenv": saltenv, "prefix": load.get("prefix", "")}
+        ):
+            fnd = self.find_file(path, saltenv)
+            if not fnd.get("back"):
+                continue
+            fstr = "{}.file_hash".format(fnd["back"])
+            if fstr not in self.servers:
+                continue
+            hash_ret = self.servers[fstr]({"path": path, "saltenv": saltenv}, fnd)
+            if not hash_ret:
+                continue
+            entry = {"hsum": hash_ret["hsum"], "hash_type": hash_ret["hash_type"]}
+            stat_result = fnd.get("stat")
+            if stat_result:
+                entry["mode"] = stat_result[0]
+                entry["size"] = stat_result[6]
+            files[path] = entry
+        codec = salt.utils.compression.negotiate(load.get("codecs"))
+        return {
+            "codec": codec,
+            "data": salt.utils.compression.compress(
+                salt.payload.dumps(files), codec, 6
+            ),
+        }
+
     def clear_file_list_cache(self, load):
         """
         Deletes the file_lists cache files
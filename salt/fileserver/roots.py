@@ -15,17 +15,20 @@ Fileserver environments are defined using the :conf_master:`file_roots`
 configuration option.
 """
 
+import copy
 import errno
 import logging
 import os
+import stat
 
 import salt.fileserver
+import salt.utils.blockdelta
 import salt.utils.event
 import salt.utils.files
-import salt.utils.gzip_util
+import salt.utils.hashindex
 import salt.utils.hashutils
 import salt.utils.path
-import salt.utils.platform
+import salt.utils.rootsindex
 import salt.utils.stringutils
 import salt.utils.verify
 import salt.utils.versions
@@ -118,6 +121,24 @@ def envs():
     return sorted(__opts__["file_roots"])
 
 
+def _in_file_roots(saltenv, fpath):
+    """
+    Return whether a file is under one of the file_roots of a saltenv
+    """
+    actual_saltenv = saltenv
+    if saltenv not in __opts__["file_roots"]:
+        if "__env__" not in __opts__["file_roots"]:
+            return False
+        log.debug("salt environment '%s' maps to __env__ file_roots directory", saltenv)
+        saltenv = "__env__"
+    for root in __opts__["file_roots"][saltenv]:
+        if saltenv == "__env__":
+            root = root.replace("__env__", actual_saltenv)
+        if salt.utils.verify.clean_path(root, fpath, subdir=True):
+            return True
+    return False
+
+
 def serve_file(load, fnd):
     """
     Return a chunk from a file based on the data received
@@ -132,38 +153,56 @@ def serve_file(load, fnd):
     if not fnd["path"]:
         return ret
     ret["dest"] = fnd["rel"]
-    gzip = load.get("gzip", None)
     fpath = os.path.normpath(fnd["path"])
 
-    actual_saltenv = saltenv = load["saltenv"]
-    if saltenv not in __opts__["file_roots"]:
-        if "__env__" in __opts__["file_roots"]:
-            log.debug(
-                "salt environment '%s' maps to __env__ file_roots directory", saltenv
-            )
-            saltenv = "__env__"
-        else:
-            return fnd
-    file_in_root = False
-    for root in __opts__["file_roots"][saltenv]:
-        if saltenv == "__env__":
-            root = root.replace("__env__", actual_saltenv)
-        # Refuse to serve file that is not under the root.
-        if salt.utils.verify.clean_path(root, fpath, subdir=True):
-            file_in_root = True
-    if not file_in_root:
+    if (
+        load["saltenv"] not in __opts__["file_roots"]
+        and "__env__" not in __opts__["file_roots"]
+    ):
+        return fnd
+    # Refuse to serve file that is not under the root.
+    if not _in_file_roots(load["saltenv"], fpath):
         return ret
 
-    with salt.utils.files.fopen(fpath, "rb") as fp_:
-        fp_.seek(load["loc"])
-        data = fp_.read(__opts__["file_buffer_size"])
-        if gzip and data:
-            data = salt.utils.gzip_util.compress(data, gzip)
-            ret["gzip"] = gzip
-        ret["data"] = data
+    data, codec, level = salt.fileserver.read_chunk(__opts__, fpath, load)
+    if codec:
+        ret["codec"] = codec
+        if codec == "gzip":
+            ret["gzip"] = level
+    ret["data"] = data
     return ret
 
 
+def file_blocks(load, fnd):
+    """
+    Return the signatures of the blocks of a file, see
+    :py:mod:`salt.utils.blockdelta`
+    """
+    if "env" in load:
+        # "env" is not supported; Use "saltenv".
+        load.pop("env")
+
+    if "path" not in load or "saltenv" not in load or not fnd["path"]:
+        return {}
+    fpath = os.path.normpath(fnd["path"])
+    if not _in_file_roots(load["saltenv"], fpath):
+        return {}
+    hash_ret = file_hash(load, fnd)
+    if not hash_ret:
+        return {}
+    try:
+        block_size = int(load.get("block_size") or __opts__["file_buffer_size"])
+    except (TypeError, ValueError):
+        block_size = __opts__["file_buffer_size"]
+    block_size = min(
+        max(block_size, salt.utils.blockdelta.MIN_BLOCK_SIZE),
+        __opts__.get("file_buffer_max_size", block_size),
+    )
+    return salt.utils.blockdelta.get_signatures(
+        __opts__, fpath, hash_ret["hsum"], hash_ret["hash_type"], block_size
+    )
+
+
 def update():
     """
     When we are asked to update (regular interval) lets reap the cache
@@ -181,7 +220,24 @@ def update():
     data = {"changed": False, "files": {"changed": []}, "backend": "roots"}
 
     # generate the new map
-    new_mtime_map = salt.fileserver.generate_mtime_map(__opts__, __opts__["file_roots"])
+    index = salt.utils.rootsindex.get_index(__opts__)
+    if index is not None:
+        # The static saltenvs are indexed, only the __env__ roots are walked
+        new_mtime_map = index.mtime_map()
+        new_mtime_map.update(
+            salt.fileserver.generate_mtime_map(
+                __opts__,
+                {
+                    saltenv: paths
+                    for saltenv, paths in __opts__["file_roots"].items()
+                    if saltenv not in index.saltenvs
+                },
+            )
+        )
+    else:
+        new_mtime_map = salt.fileserver.generate_mtime_map(
+            __opts__, __opts__["file_roots"]
+        )
 
     old_mtime_map = {}
     # if you have an old map, load that
@@ -204,6 +260,11 @@ def update():
     except (OSError, UnicodeDecodeError):
         pass
 
+    hash_index = salt.utils.hashindex.get_hash_index(__opts__)
+    if hash_index is not None:
+        # Hash the files which changed, for the master workers to look up
+        hash_index.refresh(new_mtime_map)
+
     # compare the maps, set changed to the return value
     data["changed"] = salt.fileserver.diff_mtime_map(old_mtime_map, new_mtime_map)
 
@@ -254,12 +315,25 @@ def file_hash(load, fnd):
     ret = {}
 
     # if the file doesn't exist, we can't get a hash
-    if not path or not os.path.isfile(path):
+    if not path:
+        return ret
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return ret
+    if not stat.S_ISREG(path_stat.st_mode):
         return ret
 
     # set the hash_type as it is determined by config-- so mechanism won't change that
     ret["hash_type"] = __opts__["hash_type"]
 
+    hash_index = salt.utils.hashindex.get_hash_index(__opts__)
+    if hash_index is not None:
+        hsum = hash_index.lookup(path, path_stat)
+        if hsum is not None:
+            ret["hsum"] = hsum
+            return ret
+
     # check if the hash is cached
     # cache file's contents should be "hash:mtime"
     cache_path = os.path.join(
@@ -288,6 +362,8 @@ def file_hash(load, fnd):
                 if str(os.path.getmtime(path)) == mtime:
                     # check if mtime changed
                     ret["hsum"] = hsum
+                    if hash_index is not None:
+                        hash_index.add(path, path_stat, hsum)
                     return ret
         except OSError:  # Can't use Python select() because we need Windows support
             log.debug("Fileserver encountered lock when reading cache file. Retrying.")
@@ -316,6 +392,8 @@ def file_hash(load, fnd):
     cache_object = "{}:{}".format(ret["hsum"], os.path.getmtime(path))
     with salt.utils.files.flopen(cache_path, "w") as fp_:
         fp_.write(cache_object)
+    if hash_index is not None:
+        hash_index.add(path, path_stat, ret["hsum"])
     return ret
 
 
@@ -338,6 +416,11 @@ def _file_lists(load, form):
         else:
             return []
 
+    if saltenv != "__env__" and __opts__.get("fileserver_roots_index", False):
+        file_lists = salt.utils.rootsindex.get_file_lists(__opts__, saltenv)
+        if file_lists is not None:
+            return copy.copy(file_lists.get(form, []))
+
     list_cachedir = os.path.join(__opts__["cachedir"], "file_lists", "roots")
     if not os.path.isdir(list_cachedir):
         try:
@@ -345,10 +428,7 @@ def _file_lists(load, form):
         except OSError:
             log.critical("Unable to make cachedir %s", list_cachedir)
             return []
-    list_cache = os.path.join(
-        list_cachedir,
-        f"{salt.utils.files.safe_filename_leaf(actual_saltenv)}.p",
-    )
+    list_cache = salt.utils.rootsindex.list_cache_path(__opts__, actual_saltenv)
     w_lock = os.path.join(
         list_cachedir,
         f".{salt.utils.files.safe_filename_leaf(actual_saltenv)}.w",
@@ -365,69 +445,18 @@ def _file_lists(load, form):
             """
             Add the files to the target set
             """
-
-            def _translate_sep(path):
-                """
-                Translate path separators for Windows masterless minions
-                """
-                return path.replace("\\", "/") if os.path.sep == "\\" else path
-
             for item in items:
-                abs_path = os.path.join(parent_dir, item)
-                log.trace("roots: Processing %s", abs_path)
-                is_link = salt.utils.path.islink(abs_path)
-                log.trace(
-                    "roots: %s is %sa link", abs_path, "not " if not is_link else ""
+                listed = salt.utils.rootsindex.list_item(
+                    __opts__, fs_root, parent_dir, item
                 )
-                if is_link and __opts__["fileserver_ignoresymlinks"]:
-                    continue
-                rel_path = _translate_sep(os.path.relpath(abs_path, fs_root))
-                log.trace("roots: %s relative path is %s", abs_path, rel_path)
-                if salt.fileserver.is_file_ignored(__opts__, rel_path):
+                if listed is None:
                     continue
+                rel_path, empty, link_dest = listed
                 tgt.add(rel_path)
-                if os.path.isdir(abs_path):
-                    try:
-                        if not os.listdir(abs_path):
-                            ret["empty_dirs"].add(rel_path)
-                    except OSError:
-                        log.debug("Unable to list dir: %s", abs_path)
-                if is_link:
-                    link_dest = salt.utils.path.readlink(abs_path)
-                    log.trace(
-                        "roots: %s symlink destination is %s", abs_path, link_dest
-                    )
-                    if salt.utils.platform.is_windows() and link_dest.startswith(
-                        "\\\\"
-                    ):
-                        # Symlink points to a network path. Since you can't
-                        # join UNC and non-UNC paths, just assume the original
-                        # path.
-                        log.trace(
-                            "roots: %s is a UNC path, using %s instead",
-                            link_dest,
-                            abs_path,
-                        )
-                        link_dest = abs_path
-                    if link_dest.startswith(".."):
-                        joined = os.path.join(abs_path, link_dest)
-                    else:
-                        joined = os.path.join(os.path.dirname(abs_path), link_dest)
-                    rel_dest = _translate_sep(
-                        os.path.relpath(
-                            os.path.realpath(os.path.normpath(joined)),
-                            os.path.realpath(fs_root),
-                        )
-                    )
-                    log.trace("roots: %s relative path is %s", abs_path, rel_dest)
-                    if not rel_dest.startswith(".."):
-                        # Only count the link if it does not point
-                        # outside of the root dir of the fileserver
-                        # (i.e. the "path" variable)
-                        ret["links"][rel_path] = link_dest
-                    else:
-                        if not __opts__["fileserver_followsymlinks"]:
-                            ret["links"][rel_path] = link_dest
+                if empty:
+                    ret["empty_dirs"].add(rel_path)
+                if link_dest is not None:
+                    ret["links"][rel_path] = link_dest
 
         for path in __opts__["file_roots"][saltenv]:
             if saltenv == "__env__":
@@ -24,6 +24,7 @@ import salt.utils.files
 import salt.utils.json
 import salt.utils.kinds
 import salt.utils.master
+import salt.utils.minions
 import salt.utils.sdb
 import salt.utils.stringutils
 import salt.utils.user
@@ -466,6 +467,7 @@ class Key:
                 for minion in clist:
                     if minion not in minions and minion not in preserve_minions:
                         cache.flush(f"{self.ACC}/{minion}")
+                        salt.utils.minions.minion_data_updated(self.opts, minion)
 
     def check_master(self):
         """
@@ -8,6 +8,7 @@ import collections
 import copy
 import ctypes
 import logging
+import math
 import multiprocessing
 import os
 import re
@@ -46,7 +47,9 @@ import salt.utils.gitfs
 import salt.utils.gzip_util
 import salt.utils.jid
 import salt.utils.job
+import salt.utils.lanes
 import salt.utils.master
+import salt.utils.metrics
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.process
@@ -696,6 +699,17 @@ class Master(SMaster):
         if not self.opts["fileserver_backend"]:
             errors.append("No fileserver backends are configured")
 
+        if self.opts.get("request_lanes"):
+            try:
+                salt.utils.lanes.parse_lanes(self.opts)
+            except salt.exceptions.SaltConfigurationError as exc:
+                critical_errors.append(f"{exc}")
+            if self.opts["transport"] != "zeromq":
+                log.warning(
+                    "request_lanes is only supported by the zeromq transport, "
+                    "ignoring it"
+                )
+
         # Check to see if we need to create a pillar cache dir
         if self.opts["pillar_cache"] and not os.path.isdir(
             os.path.join(self.opts["cachedir"], "pillar_cache")
@@ -904,6 +918,12 @@ class Master(SMaster):
                 FileserverUpdate, args=(self.opts,), name="FileServerUpdate"
             )
 
+            if self.opts["master_metrics"]:
+                log.info("Creating master metrics server process")
+                self.process_manager.add_process(
+                    MetricsServer, args=(self.opts,), name="MetricsServer"
+                )
+
             # Fire up SSDP discovery publisher
             if self.opts["discovery"]:
                 if salt.utils.ssdp.SSDPDiscoveryServer.is_available():
@@ -1003,6 +1023,217 @@ class EventMonitor(salt.utils.process.SignalHandlingProcess):
             io_loop.start()
 
 
+class MetricsServer(salt.utils.process.SignalHandlingProcess):
+    """
+    Serve the metrics of the master workers in the Prometheus text exposition
+    format, over HTTP on a local address or on a unix socket.
+    """
+
+    def __init__(self, opts, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+
+    def render(self):
+        """
+        Merge the latest metrics snapshots of the master processes
+        """
+        max_age = max(60, 10 * self.opts["master_metrics_interval"])
+        snapshots = salt.utils.metrics.load_snapshots(
+            salt.utils.metrics.metrics_dir(self.opts), max_age
+        )
+        return salt.utils.metrics.render(salt.utils.metrics.merge(snapshots))
+
+    def run(self):
+        import tornado.httpserver
+        import tornado.netutil
+        import tornado.web
+
+        server = self
+
+        class MetricsHandler(
+            tornado.web.RequestHandler
+        ):  # pylint: disable=abstract-method
+            def get(self):  # pylint: disable=arguments-differ
+                self.set_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.write(server.render())
+
+        application = tornado.web.Application([(r"/metrics", MetricsHandler)])
+        io_loop = tornado.ioloop.IOLoop()
+        http_server = tornado.httpserver.HTTPServer(application)
+        if self.opts["master_metrics_socket"]:
+            log.info("Serving master metrics on %s", self.opts["master_metrics_socket"])
+            http_server.add_socket(
+                tornado.netutil.bind_unix_socket(
+                    self.opts["master_metrics_socket"], mode=0o600
+                )
+            )
+        else:
+            log.info(
+                "Serving master metrics on %s:%s",
+                self.opts["master_metrics_address"],
+                self.opts["master_metrics_port"],
+            )
+            http_server.listen(
+                self.opts["master_metrics_port"],
+                address=self.opts["master_metrics_address"],
+            )
+        io_loop.start()
+
+
+class MWorkerPool(salt.utils.process.ProcessManager):
+    """
+    Process manager scaling the count of MWorker processes between
+    ``worker_threads_min`` and ``worker_threads_max`` to keep their busy
+    ratio around ``worker_threads_target_busy``.
+
+    Each worker owns a slot of a shared array where it reports when its
+    current request started, its total busy time and its count of handled
+    requests. A worker is removed by setting the drain flag of its slot, the
+    worker then stops receiving requests and exits once done with the ones it
+    received.
+    """
+
+    # busy since, busy seconds, requests, drain deadline
+    SLOT_SIZE = 4
+
+    def __init__(self, opts, worker_args, **kwargs):
+        super().__init__(**kwargs)
+        self.opts = opts
+        self.worker_args = worker_args
+        self.min_workers = max(1, opts["worker_threads_min"])
+        self.max_workers = max(self.min_workers, opts["worker_threads_max"])
+        self.target_busy = opts["worker_threads_target_busy"]
+        self.max_latency = opts["worker_threads_max_latency"]
+        self.scale_down_delay = opts["worker_threads_scale_down_delay"]
+        self.drain_timeout = opts["worker_threads_drain_timeout"]
+        self.check_interval = opts["worker_threads_scale_interval"]
+        self.state = multiprocessing.Array(
+            ctypes.c_double, self.max_workers * self.SLOT_SIZE, lock=False
+        )
+        # {<slot>: (<busy seconds>, <requests>)} at the last check
+        self._samples = {}
+        self._last_check = None
+        self._low_since = None
+
+    def workers(self):
+        """
+        Return the running, not draining, workers as ``{<slot>: <pid>}``
+        """
+        return {
+            p_map["kwargs"]["pool_slot"]: pid
+            for pid, p_map in self._process_map.items()
+            if "pool_slot" in p_map["kwargs"] and not p_map.get("retired")
+        }
+
+    def start_workers(self, count=None):
+        """
+        Start ``count`` more workers, the initial ``worker_threads`` ones by
+        default
+        """
+        if count is None:
+            count = min(
+                max(int(self.opts["worker_threads"]), self.min_workers),
+                self.max_workers,
+            )
+        # Slots of draining workers are not reused before they exit
+        used = {
+            p_map["kwargs"]["pool_slot"]
+            for p_map in self._process_map.values()
+            if "pool_slot" in p_map["kwargs"]
+        }
+        for slot in range(self.max_workers):
+            if count <= 0:
+                break
+            if slot in used:
+                continue
+            offset = slot * self.SLOT_SIZE
+            self.state[offset : offset + self.SLOT_SIZE] = [0.0] * self.SLOT_SIZE
+            self._samples.pop(slot, None)
+            self.add_process(
+                MWorker,
+                args=self.worker_args,
+                kwargs={"pool_state": self.state, "pool_slot": slot},
+                name=f"MWorker-{slot}",
+            )
+            count -= 1
+
+    def drain_worker(self, workers):
+        """
+        Ask the idlest worker with the highest slot to exit once done with its
+        current request
+        """
+        slot = max(
+            workers, key=lambda slot: (self.state[slot * self.SLOT_SIZE] == 0, slot)
+        )
+        pid = workers[slot]
+        log.info("Draining master worker MWorker-%s (%s)", slot, pid)
+        self.state[slot * self.SLOT_SIZE + 3] = time.time() + self.drain_timeout
+        self.retire_process(pid)
+
+    def check_children(self):
+        super().check_children()
+        if self._restart_processes is True:
+            self.scale()
+
+    def scale(self, now=None):
+        """
+        Compare the busy time of the workers since the last check to the
+        target and start or drain workers accordingly
+        """
+        if now is None:
+            now = time.time()
+        # Kill the draining workers which did not exit in time
+        for pid, p_map in self._process_map.items():
+            if p_map.get("retired") and "pool_slot" in p_map["kwargs"]:
+                deadline = self.state[p_map["kwargs"]["pool_slot"] * self.SLOT_SIZE + 3]
+                if deadline and now > deadline and p_map["Process"].is_alive():
+                    log.warning("Killing master worker %s, drain timed out", pid)
+                    p_map["Process"].terminate()
+
+        workers = self.workers()
+        busy = requests = 0
+        for slot in workers:
+            offset = slot * self.SLOT_SIZE
+            busy_since, busy_total, handled = self.state[offset : offset + 3]
+            if busy_since:
+                busy_total += max(0, now - busy_since)
+            last_busy, last_handled = self._samples.get(slot, (busy_total, handled))
+            busy += max(0, busy_total - last_busy)
+            requests += max(0, handled - last_handled)
+            self._samples[slot] = (busy_total, handled)
+        for slot in set(self._samples) - set(workers):
+            del self._samples[slot]
+        if self._last_check is None or now <= self._last_check:
+            self._last_check = now
+            return
+        elapsed = now - self._last_check
+        self._last_check = now
+
+        count = len(workers)
+        desired = math.ceil(busy / elapsed / self.target_busy)
+        if self.max_latency and requests and busy / requests > self.max_latency:
+            desired = max(desired, count + 1)
+        desired = min(max(desired, self.min_workers), self.max_workers)
+        if desired > count:
+            log.info(
+                "Scaling master workers up from %d to %d (busy %.2f)",
+                count,
+                desired,
+                busy / elapsed,
+            )
+            self._low_since = None
+            self.start_workers(desired - count)
+        elif desired < count:
+            if self._low_since is None:
+                self._low_since = now
+            elif now - self._low_since >= self.scale_down_delay:
+                self.drain_worker(workers)
+        else:
+            self._low_since = None
+
+
 class ReqServer(salt.utils.process.SignalHandlingProcess):
     """
     Starts up the master request server, minions send results to this
@@ -1049,9 +1280,14 @@ class ReqServer(salt.utils.process.SignalHandlingProcess):
                 pass
 
         # Wait for kill should be less then parent's ProcessManager.
-        self.process_manager = salt.utils.process.ProcessManager(
-            name="ReqServer_ProcessManager", wait_for_kill=1
-        )
+        if self.opts["worker_threads_autoscale"]:
+            self.process_manager = MWorkerPool(
+                self.opts, None, name="ReqServer_ProcessManager", wait_for_kill=1
+            )
+        else:
+            self.process_manager = salt.utils.process.ProcessManager(
+                name="ReqServer_ProcessManager", wait_for_kill=1
+            )
 
         req_channels = []
         for transport, opts in iter_transport_opts(self.opts):
@@ -1070,13 +1306,32 @@ class ReqServer(salt.utils.process.SignalHandlingProcess):
         # manager. We don't want the processes being started to inherit those
         # signal handlers
         with salt.utils.process.default_signals(signal.SIGINT, signal.SIGTERM):
-            for ind in range(int(self.opts["worker_threads"])):
-                name = f"MWorker-{ind}"
-                self.process_manager.add_process(
-                    MWorker,
-                    args=(self.opts, self.master_key, self.key, req_channels),
-                    name=name,
+            if isinstance(self.process_manager, MWorkerPool):
+                self.process_manager.worker_args = (
+                    self.opts,
+                    self.master_key,
+                    self.key,
+                    req_channels,
                 )
+                self.process_manager.start_workers()
+            else:
+                for ind in range(int(self.opts["worker_threads"])):
+                    name = f"MWorker-{ind}"
+                    self.process_manager.add_process(
+                        MWorker,
+                        args=(self.opts, self.master_key, self.key, req_channels),
+                        name=name,
+                    )
+            if salt.utils.lanes.enabled(self.opts):
+                # The workers reserved to a lane
+                for name, lane in salt.utils.lanes.worker_names(self.opts).items():
+                    if lane is None:
+                        continue
+                    self.process_manager.add_process(
+                        MWorker,
+                        args=(self.opts, self.master_key, self.key, req_channels),
+                        name=name,
+                    )
         self.process_manager.run()
 
     def run(self):
@@ -1104,13 +1359,17 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
     salt master.
     """
 
-    def __init__(self, opts, mkey, key, req_channels, **kwargs):
+    def __init__(
+        self, opts, mkey, key, req_channels, pool_state=None, pool_slot=None, **kwargs
+    ):
         """
         Create a salt master worker process
 
         :param dict opts: The salt options
         :param dict mkey: The user running the salt master and the AES key
         :param dict key: The user running the salt master and the RSA key
+        :param pool_state: The shared state of the MWorkerPool, if any
+        :param int pool_slot: The slot of this worker in the pool state
 
         :rtype: MWorker
         :return: Master worker
@@ -1118,12 +1377,18 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         super().__init__(**kwargs)
         self.opts = opts
         self.req_channels = req_channels
+        self.pool_state = pool_state
+        self.pool_slot = pool_slot
 
         self.mkey = mkey
         self.key = key
         self.k_mtime = 0
         self.stats = collections.defaultdict(lambda: {"mean": 0, "runs": 0})
         self.stat_clock = time.time()
+        self.metrics = None
+        # The count of requests being handled
+        self.in_progress = 0
+        self.draining = False
 
     # We need __setstate__ and __getstate__ to also pickle 'SMaster.secrets'.
     # Otherwise, 'SMaster.secrets' won't be copied over to the spawned process
@@ -1166,11 +1431,42 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
             req_channel.post_fork(
                 self._handle_payload, io_loop=self.io_loop
             )  # TODO: cleaner? Maybe lazily?
+        if self.metrics is not None:
+            tornado.ioloop.PeriodicCallback(
+                self.metrics.flush, self.opts["master_metrics_interval"] * 1000
+            ).start()
+        if self.pool_state is not None:
+            tornado.ioloop.PeriodicCallback(self._check_drain, 1000).start()
         try:
             self.io_loop.start()
         except (KeyboardInterrupt, SystemExit):
             # Tornado knows what to do
             pass
+        if self.pool_state is not None:
+            for req_channel in self.req_channels:
+                req_channel.close()
+
+    def _check_drain(self):
+        """
+        Once the worker pool asked this worker to exit, stop receiving new
+        requests, then stop serving them once the ones already received are
+        handled
+        """
+        offset = self.pool_slot * MWorkerPool.SLOT_SIZE
+        if not self.pool_state[offset + 3]:
+            return
+        if not self.draining:
+            log.info("%s draining", self.name)
+            self.draining = True
+            for req_channel in self.req_channels:
+                req_channel.stop_accepting()
+            return
+        if self.in_progress or self.pool_state[offset]:
+            return
+        if not all(req_channel.drained() for req_channel in self.req_channels):
+            return
+        log.info("%s drained, exiting", self.name)
+        self.io_loop.stop()
 
     async def _handle_payload(self, payload):
         """
@@ -1195,10 +1491,44 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         """
         key = payload["enc"]
         load = payload["load"]
-        if key == "clear":
-            ret = await self._handle_clear(load)
-        else:
-            ret = self._handle_aes(load)
+        if self.metrics is None and self.pool_state is None:
+            if key == "clear":
+                ret = await self._handle_clear(load)
+            else:
+                ret = self._handle_aes(load)
+            return ret
+
+        start = time.time()
+        cmd = load.get("cmd")
+        funcs = self.clear_funcs if key == "clear" else self.aes_funcs
+        if cmd not in funcs.expose_methods:
+            cmd = "unknown"
+        if self.pool_state is not None:
+            offset = self.pool_slot * MWorkerPool.SLOT_SIZE
+            self.pool_state[offset] = start
+        self.in_progress += 1
+        try:
+            if key == "clear":
+                ret = await self._handle_clear(load)
+            else:
+                ret = self._handle_aes(load)
+        except Exception:  # pylint: disable=broad-except
+            if self.metrics is not None:
+                self.metrics.inc("salt_master_request_errors_total", cmd=cmd)
+            raise
+        finally:
+            self.in_progress -= 1
+            duration = time.time() - start
+            if self.pool_state is not None:
+                self.pool_state[offset + 1] += duration
+                self.pool_state[offset + 2] += 1
+                self.pool_state[offset] = 0
+            if self.metrics is not None:
+                self.metrics.inc("salt_master_requests_total", cmd=cmd, enc=key)
+                self.metrics.observe(
+                    "salt_master_request_duration_seconds", duration, cmd=cmd
+                )
+                self.metrics.inc("salt_master_worker_busy_seconds_total", duration)
         return ret
 
     def _post_stats(self, start, cmd):
@@ -1314,6 +1644,11 @@ class MWorker(salt.utils.process.SignalHandlingProcess):
         )
         self.clear_funcs.connect()
         self.aes_funcs = AESFuncs(self.opts)
+        self.metrics = salt.utils.metrics.init_registry(self.opts, self.name)
+        if self.pool_state is not None:
+            # A request may have been in progress when the previous worker of
+            # this slot died
+            self.pool_state[self.pool_slot * MWorkerPool.SLOT_SIZE] = 0
         salt.utils.crypt.reinit_crypto()
         self.__bind()
 
@@ -1369,6 +1704,9 @@ class AESFuncs(TransportMethods):
         "_file_find",
         "_file_hash",
         "_file_hash_and_stat",
+        "_file_hashes",
+        "_file_manifest",
+        "_file_blocks",
         "_file_list",
         "_file_list_emptydirs",
         "_dir_list",
@@ -1398,6 +1736,10 @@ class AESFuncs(TransportMethods):
         )
         self.__setup_fileserver()
         self.masterapi = salt.daemons.masterapi.RemoteFuncs(opts)
+        if self.opts.get("pillar_coalesce", False):
+            self.pillar_flight = salt.utils.master.PillarFlight(self.opts)
+        else:
+            self.pillar_flight = None
         if "cluster_id" in self.opts and self.opts["cluster_id"]:
             self.pki_dir = self.opts["cluster_pki_dir"]
         else:
@@ -1415,6 +1757,9 @@ class AESFuncs(TransportMethods):
         self._file_find = self.fs_._find_file
         self._file_hash = self.fs_.file_hash
         self._file_hash_and_stat = self.fs_.file_hash_and_stat
+        self._file_hashes = self.fs_.file_hashes
+        self._file_manifest = self.fs_.file_manifest
+        self._file_blocks = self.fs_.file_blocks
         self._file_list = self.fs_.file_list
         self._file_list_emptydirs = self.fs_.file_list_emptydirs
         self._dir_list = self.fs_.dir_list
@@ -1766,25 +2111,38 @@ class AESFuncs(TransportMethods):
             return False
         load["grains"]["id"] = load["id"]
 
-        pillar = salt.pillar.get_pillar(
-            self.opts,
-            load["grains"],
-            load["id"],
-            load.get("saltenv", load.get("env")),
-            ext=load.get("ext"),
-            pillar_override=load.get("pillar_override", {}),
-            pillarenv=load.get("pillarenv"),
-            extra_minion_data=load.get("extra_minion_data"),
-            clean_cache=load.get("clean_cache"),
-        )
-        data = pillar.compile_pillar()
+        def compile_pillar():
+            pillar = salt.pillar.get_pillar(
+                self.opts,
+                load["grains"],
+                load["id"],
+                load.get("saltenv", load.get("env")),
+                ext=load.get("ext"),
+                pillar_override=load.get("pillar_override", {}),
+                pillarenv=load.get("pillarenv"),
+                extra_minion_data=load.get("extra_minion_data"),
+                clean_cache=load.get("clean_cache"),
+            )
+            return pillar.compile_pillar()
+
+        shared = False
+        if self.pillar_flight is not None:
+            data, shared = self.pillar_flight.get(
+                salt.utils.master.PillarFlight.key(load),
+                compile_pillar,
+                refresh=bool(load.get("clean_cache")),
+            )
+        else:
+            data = compile_pillar()
         self.fs_.update_opts()
-        if self.opts.get("minion_data_cache", False):
+        # The worker which compiled a shared pillar already cached it
+        if self.opts.get("minion_data_cache", False) and not shared:
             self.masterapi.cache.store(
                 "minions/{}".format(load["id"]),
                 "data",
                 {"grains": load["grains"], "pillar": data},
             )
+            salt.utils.minions.minion_data_updated(self.opts, load["id"])
             if self.opts.get("minion_data_cache_events") is True:
                 self.event.fire_event(
                     {"Minion data cache refresh": load["id"]},
@@ -3,8 +3,10 @@ Render the pillar data
 """
 
 import collections
+import concurrent.futures
 import copy
 import fnmatch
+import hashlib
 import logging
 import os
 import sys
@@ -13,6 +15,7 @@ import traceback
 
 import tornado.gen
 
+import salt.cache
 import salt.channel.client
 import salt.fileclient
 import salt.loader
@@ -22,8 +25,11 @@ import salt.utils.cache
 import salt.utils.crypt
 import salt.utils.data
 import salt.utils.dictupdate
+import salt.utils.json
+import salt.utils.metrics
+import salt.utils.topmatch
 import salt.utils.url
-from salt.exceptions import SaltClientError
+from salt.exceptions import SaltCacheError, SaltClientError
 from salt.template import compile_template
 
 # Even though dictupdate is imported, invoking salt.utils.dictupdate.merge here
@@ -398,6 +404,98 @@ class RemotePillar(RemotePillarMixin):
     # pylint: enable=W1701
 
 
+def _ext_pillar_cache_conf(opts):
+    """
+    Return the ``ext_pillar_cache`` option as
+    ``{<ext_pillar>: (<ttl>, <scope>, <grains>)}``, leaving out the malformed
+    entries
+    """
+    ret = {}
+    conf = opts.get("ext_pillar_cache") or {}
+    if not isinstance(conf, dict):
+        log.error("The ext_pillar_cache option must be a dict")
+        return ret
+    for key, source in conf.items():
+        if not isinstance(source, dict):
+            source = {"ttl": source}
+        scope = source.get("key", "minion")
+        grains = source.get("grains") or []
+        try:
+            ttl = int(source.get("ttl", 0))
+        except (TypeError, ValueError):
+            ttl = 0
+        if ttl <= 0 or scope not in ("minion", "grains", "global"):
+            log.error(
+                "ext_pillar_cache: the cache of ext_pillar '%s' needs a positive "
+                "ttl and a key among minion, grains and global",
+                key,
+            )
+            continue
+        if scope == "grains" and not isinstance(grains, list):
+            log.error(
+                "ext_pillar_cache: the grains of ext_pillar '%s' must be a list", key
+            )
+            continue
+        ret[key] = (ttl, scope, grains)
+    return ret
+
+
+# The master options a cached pillar depends on
+PILLAR_CACHE_DEP_OPTS = (
+    "decrypt_pillar",
+    "exclude_ext_pillar",
+    "ext_pillar",
+    "ext_pillar_first",
+    "nodegroups",
+    "pillar_includes_override_sls",
+    "pillar_merge_lists",
+    "pillar_opts",
+    "pillar_roots",
+    "pillar_source_merging_strategy",
+    "pillarenv_from_saltenv",
+    "renderer",
+    "state_top",
+    "top_file_merging_strategy",
+)
+
+# The master options the loader of the external pillar fingerprints depends on
+PILLAR_LOADER_OPTS = PILLAR_CACHE_DEP_OPTS + (
+    "cachedir",
+    "extension_modules",
+    "module_dirs",
+)
+
+# The count of external pillar loaders kept in memory
+MAX_EXT_PILLAR_LOADERS = 8
+
+_EXT_PILLAR_LOADERS = collections.OrderedDict()
+
+
+def _ext_pillar_loader(opts, pillarenv):
+    """
+    Return the loader of the external pillars for the given options, reusing
+    the one of this process if these options did not change
+    """
+    digest = hashlib.sha256(
+        salt.utils.json.dumps(
+            [pillarenv, {opt: opts.get(opt) for opt in PILLAR_LOADER_OPTS}],
+            sort_keys=True,
+            default=repr,
+        ).encode()
+    ).hexdigest()
+    try:
+        _EXT_PILLAR_LOADERS.move_to_end(digest)
+        return _EXT_PILLAR_LOADERS[digest]
+    except KeyError:
+        pass
+    loader = _EXT_PILLAR_LOADERS[digest] = salt.loader.pillars(
+        dict(opts, pillarenv=pillarenv), {}
+    )
+    while len(_EXT_PILLAR_LOADERS) > MAX_EXT_PILLAR_LOADERS:
+        _EXT_PILLAR_LOADERS.popitem(last=False)
+    return loader
+
+
 class PillarCache:
     """
     Return a cached pillar if it exists, otherwise cache it.
@@ -440,6 +538,9 @@ class PillarCache:
         self.pillarenv = pillarenv
         self.clean_cache = clean_cache
         self.extra_minion_data = extra_minion_data
+        self.track_deps = self.opts.get("pillar_cache_track_deps", False)
+        # The dependencies of the last pillar fetched
+        self.deps = None
 
         if saltenv is None:
             self.saltenv = "base"
@@ -467,6 +568,9 @@ class PillarCache:
         a new pillar.
         """
         log.debug("Pillar cache getting external pillar with ext: %s", self.ext)
+        if self.track_deps:
+            # Before compiling, a change made meanwhile invalidates the pillar
+            ext_fingerprints = self._ext_fingerprints()
         fresh_pillar = Pillar(
             self.opts,
             self.grains,
@@ -478,7 +582,109 @@ class PillarCache:
             pillarenv=self.pillarenv,
             extra_minion_data=self.extra_minion_data,
         )
-        return fresh_pillar.compile_pillar()
+        if not self.track_deps or not hasattr(fresh_pillar.client, "track_deps"):
+            self.deps = None
+            return fresh_pillar.compile_pillar()
+        fresh_pillar.client.track_deps()
+        data = fresh_pillar.compile_pillar()
+        self.deps = {
+            "inputs": self._inputs_digest(),
+            "roots": fresh_pillar.opts["pillar_roots"],
+            "files": [
+                [saltenv, path] + found
+                for (saltenv, path), found in fresh_pillar.client.deps["files"].items()
+            ],
+            "lists": [
+                [saltenv, prefix, digest]
+                for (saltenv, prefix), digest in fresh_pillar.client.deps[
+                    "lists"
+                ].items()
+            ],
+            "ext": ext_fingerprints,
+        }
+        return data
+
+    def _inputs_digest(self):
+        """
+        Return a digest of the request and master options the pillar depends on
+        """
+        data = [
+            self.grains,
+            self.saltenv,
+            self.pillar_override,
+            self.extra_minion_data,
+            {opt: self.opts.get(opt) for opt in PILLAR_CACHE_DEP_OPTS},
+        ]
+        return hashlib.sha256(
+            salt.utils.json.dumps(data, sort_keys=True, default=repr).encode()
+        ).hexdigest()
+
+    def _ext_fingerprints(self):
+        """
+        Return the fingerprints of the external pillars, as returned by the
+        optional ``fingerprint`` function of their module, or None if one of
+        them does not provide it
+        """
+        runs = list(self.opts.get("ext_pillar") or [])
+        if self.ext:
+            runs.append(self.ext)
+        if not runs:
+            return []
+        loader = _ext_pillar_loader(self.opts, self.pillarenv)
+        ret = []
+        for run in runs:
+            if not isinstance(run, dict):
+                return None
+            for key, val in run.items():
+                if key in self.opts.get("exclude_ext_pillar", []):
+                    continue
+                func = loader._dict.get(f"{key}.fingerprint")
+                if func is None:
+                    return None
+                try:
+                    if isinstance(val, dict):
+                        fingerprint = func(self.minion_id, **val)
+                    elif isinstance(val, list):
+                        fingerprint = func(self.minion_id, *val)
+                    else:
+                        fingerprint = func(self.minion_id, val)
+                except Exception as exc:  # pylint: disable=broad-except
+                    log.debug("Unable to fingerprint ext_pillar %s: %s", key, exc)
+                    return None
+                if fingerprint is None:
+                    return None
+                ret.append([key, fingerprint])
+        return ret
+
+    def deps_changed(self, deps):
+        """
+        Return True if one of the inputs of a cached pillar changed
+        """
+        if not deps:
+            return True
+        if deps["inputs"] != self._inputs_digest():
+            log.debug("Pillar cache: request or configuration changed")
+            return True
+        client = salt.fileclient.PillarClient(
+            dict(self.opts, pillar_roots=deps["roots"])
+        )
+        for saltenv, path, *found in deps["files"]:
+            if client.lookup(path, saltenv) != found:
+                log.debug("Pillar cache: %s changed in %s", path, saltenv)
+                return True
+        for saltenv, prefix, digest in deps["lists"]:
+            if client.list_digest(saltenv, prefix) != digest:
+                log.debug("Pillar cache: files under '%s' changed", prefix)
+                return True
+        # Without fingerprints, the external pillars are only refreshed once
+        # the pillar_cache_ttl expires
+        if deps["ext"] is not None and self._ext_fingerprints() != deps["ext"]:
+            log.debug("Pillar cache: external pillar changed")
+            return True
+        return False
+
+    def _deps_key(self):
+        return f"{self.minion_id}:deps"
 
     def clear_pillar(self):
         """
@@ -502,6 +708,8 @@ class PillarCache:
             cache_dict = self.cache._dict
 
         log.debug("Scanning cache: %s", cache_dict)
+        if self.track_deps:
+            return self._compile_tracked_pillar()
         # Check the cache!
         if self.minion_id in self.cache:  # Keyed by minion_id
             # TODO Compare grains, etc?
@@ -535,6 +743,36 @@ class PillarCache:
             log.debug("Current pillar cache: %s", cache_dict)  # FIXME hack!
             return fresh_pillar
 
+    def _compile_tracked_pillar(self):
+        """
+        Return the cached pillar unless one of its dependencies changed
+        """
+        minion_cache = {}
+        deps_cache = {}
+        if self.minion_id in self.cache and self._deps_key() in self.cache:
+            minion_cache = self.cache[self.minion_id]
+            deps_cache = self.cache[self._deps_key()]
+            if self.pillarenv in minion_cache and not self.deps_changed(
+                deps_cache.get(str(self.pillarenv))
+            ):
+                log.debug(
+                    "Pillar cache hit for minion %s and pillarenv %s",
+                    self.minion_id,
+                    self.pillarenv,
+                )
+                return minion_cache[self.pillarenv]
+        log.debug(
+            "Pillar cache miss for minion %s and pillarenv %s",
+            self.minion_id,
+            self.pillarenv,
+        )
+        fresh_pillar = self.fetch_pillar()
+        minion_cache[self.pillarenv] = fresh_pillar
+        deps_cache[str(self.pillarenv)] = self.deps
+        self.cache[self._deps_key()] = deps_cache
+        self.cache[self.minion_id] = minion_cache
+        return fresh_pillar
+
 
 class Pillar:
     """
@@ -602,6 +840,12 @@ class Pillar:
             self.merge_strategy = opts["pillar_source_merging_strategy"]
 
         self.ext_pillars = salt.loader.pillars(ext_pillar_opts, self.functions)
+        # [(<ext_pillar>, <seconds>)] of the last ext_pillar() call
+        self.ext_pillar_timings = []
+        self.ext_pillar_cache_conf = _ext_pillar_cache_conf(self.opts)
+        self.ext_pillar_cache = None
+        if self.ext_pillar_cache_conf:
+            self.ext_pillar_cache = salt.cache.factory(self.opts)
         self.ignored_pillars = {}
         self.pillar_override = pillar_override or {}
         if not isinstance(self.pillar_override, dict):
@@ -877,16 +1121,20 @@ class Pillar:
         matches = {}
         if reload:
             self.matchers = salt.loader.matchers(self.opts)
+        indexed = salt.utils.topmatch.lookup(self.opts, top)
         for saltenv, body in top.items():
             if self.opts["pillarenv"]:
                 if saltenv != self.opts["pillarenv"]:
                     continue
             for match, data in body.items():
-                if self.matchers["confirm_top.confirm_top"](
-                    match,
-                    data,
-                    self.opts.get("nodegroups", {}),
-                ):
+                matched = indexed.get((saltenv, match))
+                if matched is None:
+                    matched = self.matchers["confirm_top.confirm_top"](
+                        match,
+                        data,
+                        self.opts.get("nodegroups", {}),
+                    )
+                if matched:
                     if saltenv not in matches:
                         matches[saltenv] = env_matches = []
                     else:
@@ -1159,12 +1407,156 @@ class Pillar:
                 ext = self.ext_pillars[key](self.minion_id, pillar, val)
         return ext
 
+    def _ext_pillar_cache_key(self, val, scope, grains):
+        """
+        Return the key of the data of an external pillar in its cache bank
+        """
+        if scope == "global":
+            scope_data = None
+        elif scope == "grains":
+            scope_data = {
+                grain: salt.utils.data.traverse_dict_and_list(
+                    self.opts.get("grains", {}), grain
+                )
+                for grain in grains
+            }
+        else:
+            scope_data = [self.minion_id, self.extra_minion_data]
+        data = [scope, scope_data, val, self.saltenv, self.opts.get("pillarenv")]
+        return hashlib.sha256(
+            salt.utils.json.dumps(data, sort_keys=True, default=repr).encode()
+        ).hexdigest()
+
+    def _cached_external_pillar_data(self, pillar, val, key):
+        """
+        Return the data of an external pillar from the ``ext_pillar_cache``,
+        rendering and caching it if it is missing or expired
+        """
+        ttl, scope, grains = self.ext_pillar_cache_conf[key]
+        bank = f"ext_pillar/{key}"
+        cache_key = self._ext_pillar_cache_key(val, scope, grains)
+        try:
+            cached = self.ext_pillar_cache.fetch(bank, cache_key)
+        except SaltCacheError as exc:
+            log.warning("Unable to read the cache of ext_pillar '%s': %s", key, exc)
+            cached = None
+        if isinstance(cached, dict) and 0 <= time.time() - cached.get("time", 0) < ttl:
+            log.debug("Using the cached data of ext_pillar '%s'", key)
+            return copy.deepcopy(cached.get("data"))
+        ext = self._external_pillar_data(pillar, val, key)
+        try:
+            self.ext_pillar_cache.store(
+                bank, cache_key, {"time": time.time(), "data": ext}
+            )
+        except SaltCacheError as exc:
+            log.warning("Unable to cache the data of ext_pillar '%s': %s", key, exc)
+        return ext
+
+    def _run_ext_pillar(self, pillar, val, key, errors):
+        """
+        Run an external pillar, recording its exception in ``errors``
+        """
+        try:
+            if key in self.ext_pillar_cache_conf:
+                return self._cached_external_pillar_data(pillar, val, key)
+            return self._external_pillar_data(pillar, val, key)
+        except Exception as exc:  # pylint: disable=broad-except
+            errors.append(
+                "Failed to load ext_pillar {}: {}".format(
+                    key,
+                    exc,
+                )
+            )
+            log.error(
+                "Exception caught loading ext_pillar '%s':\n%s",
+                key,
+                "".join(traceback.format_tb(sys.exc_info()[2])),
+            )
+        return None
+
+    def _ext_pillar_timing(self, key, elapsed):
+        """
+        Report the time spent rendering an external pillar
+        """
+        self.ext_pillar_timings.append((key, elapsed))
+        log.debug("ext_pillar '%s' rendered in %.3f seconds", key, elapsed)
+        registry = salt.utils.metrics.registry()
+        if registry is not None:
+            registry.observe("salt_master_ext_pillar_seconds", elapsed, source=key)
+
+    def _parallel_ext_pillar(self, pillar, errors):
+        """
+        Render the external pillars in a thread pool.
+
+        Consecutive external pillars run concurrently, each of them getting a
+        copy of the pillar compiled before them. The ones listed in
+        ``ext_pillar_sequential`` wait for the previous ones and run alone, so
+        that they get the pillar data of all of them. The results are merged in
+        the configured order.
+        """
+        sequential = set(self.opts.get("ext_pillar_sequential") or ())
+        exclude = self.opts.get("exclude_ext_pillar", [])
+        batches = [[]]
+        for run in self.opts["ext_pillar"]:
+            if not isinstance(run, dict):
+                errors.append('The "ext_pillar" option is malformed')
+                log.critical(errors[-1])
+                return {}, errors
+            if next(iter(run.keys())) in exclude:
+                continue
+            for key, val in run.items():
+                if key not in self.ext_pillars:
+                    log.critical(
+                        "Specified ext_pillar interface %s is unavailable", key
+                    )
+                    continue
+                if key in sequential:
+                    batches.append([(key, val)])
+                    batches.append([])
+                else:
+                    batches[-1].append((key, val))
+
+        def _run(key, val, snapshot):
+            start = time.monotonic()
+            source_errors = []
+            ext = self._run_ext_pillar(snapshot, val, key, source_errors)
+            return ext, source_errors, time.monotonic() - start
+
+        workers = max(1, int(self.opts.get("ext_pillar_parallel_workers", 4)))
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ext_pillar"
+        ) as executor:
+            for batch in batches:
+                if not batch:
+                    continue
+                if len(batch) == 1:
+                    results = [_run(batch[0][0], batch[0][1], pillar)]
+                else:
+                    futures = [
+                        executor.submit(_run, key, val, copy.deepcopy(pillar))
+                        for key, val in batch
+                    ]
+                    results = [future.result() for future in futures]
+                for (key, _), (ext, source_errors, elapsed) in zip(batch, results):
+                    errors.extend(source_errors)
+                    self._ext_pillar_timing(key, elapsed)
+                    if ext:
+                        pillar = merge(
+                            pillar,
+                            ext,
+                            self.merge_strategy,
+                            self.opts.get("renderer", "yaml"),
+                            self.opts.get("pillar_merge_lists", False),
+                        )
+        return pillar, errors
+
     def ext_pillar(self, pillar, errors=None):
         """
         Render the external pillar data
         """
         if errors is None:
             errors = []
+        self.ext_pillar_timings = []
         try:
             # Make sure that on-demand git_pillar is fetched before we try to
             # compile the pillar data. git_pillar will fetch a remote when
@@ -1202,6 +1594,9 @@ class Pillar:
                 self.opts.get("pillar_merge_lists", False),
             )
 
+        if self.opts.get("ext_pillar_parallel", False):
+            return self._parallel_ext_pillar(pillar, errors)
+
         for run in self.opts["ext_pillar"]:
             if not isinstance(run, dict):
                 errors.append('The "ext_pillar" option is malformed')
@@ -1215,20 +1610,9 @@ class Pillar:
                         "Specified ext_pillar interface %s is unavailable", key
                     )
                     continue
-                try:
-                    ext = self._external_pillar_data(pillar, val, key)
-                except Exception as exc:  # pylint: disable=broad-except
-                    errors.append(
-                        "Failed to load ext_pillar {}: {}".format(
-                            key,
-                            exc,
-                        )
-                    )
-                    log.error(
-                        "Exception caught loading ext_pillar '%s':\n%s",
-                        key,
-                        "".join(traceback.format_tb(sys.exc_info()[2])),
-                    )
+                start = time.monotonic()
+                ext = self._run_ext_pillar(pillar, val, key, errors)
+                self._ext_pillar_timing(key, time.monotonic() - start)
             if ext:
                 pillar = merge(
                     pillar,
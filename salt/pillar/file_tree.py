@@ -143,6 +143,7 @@ will result in the following pillar tree for minion with ID ``test-host``:
 """
 
 import fnmatch
+import hashlib
 import logging
 import os
 
@@ -261,6 +262,81 @@ def _construct_pillar(
     return pillar
 
 
+def _root_dirs(root_dir):
+    """
+    Return the directories the given ``root_dir`` refers to
+    """
+    if not root_dir:
+        log.error("file_tree: no root_dir specified")
+        return []
+
+    if os.path.isabs(root_dir):
+        return [root_dir]
+
+    pillarenv = __opts__["pillarenv"]
+    if pillarenv is None:
+        log.error("file_tree: root_dir is relative but pillarenv is not set")
+        return []
+    log.debug("file_tree: pillarenv = %s", pillarenv)
+
+    env_roots = __opts__["pillar_roots"].get(pillarenv, None)
+    if env_roots is None:
+        log.error(
+            "file_tree: root_dir is relative but no pillar_roots are specified "
+            " for pillarenv %s",
+            pillarenv,
+        )
+        return []
+
+    env_dirs = []
+    for env_root in env_roots:
+        env_dir = os.path.normpath(os.path.join(env_root, root_dir))
+        # don't redundantly load consecutively, but preserve any expected precedence
+        if env_dir not in env_dirs or env_dir != env_dirs[-1]:
+            env_dirs.append(env_dir)
+    return env_dirs
+
+
+def fingerprint(minion_id, root_dir=None, follow_dir_links=False, **kwargs):
+    """
+    Return a digest of the nodegroups of the minion and of the names, sizes
+    and modification times of the files its pillar is built from. Used by
+    :conf_master:`pillar_cache_track_deps` to tell when the pillar changed.
+
+    .. versionadded:: 3008.0
+    """
+    digest = hashlib.sha256()
+    for root in _root_dirs(root_dir):
+        dirs = [os.path.join(root, "hosts", minion_id)]
+        nodegroups_dir = os.path.join(root, "nodegroups")
+        if os.path.isdir(nodegroups_dir) and __opts__.get("nodegroups"):
+            ckminions = salt.utils.minions.CkMinions(__opts__)
+            for nodegroup in sorted(os.listdir(nodegroups_dir)):
+                if nodegroup not in __opts__["nodegroups"]:
+                    continue
+                match = ckminions.check_minions(
+                    __opts__["nodegroups"][nodegroup], "compound"
+                )["minions"]
+                if minion_id in match:
+                    dirs.append(os.path.join(nodegroups_dir, str(nodegroup)))
+        for top_dir in dirs:
+            digest.update(f"{top_dir}\n".encode())
+            for dirpath, dirnames, filenames in salt.utils.path.os_walk(
+                top_dir, followlinks=follow_dir_links
+            ):
+                dirnames.sort()
+                for file_name in sorted(filenames):
+                    file_path = os.path.join(dirpath, file_name)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    digest.update(
+                        f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode()
+                    )
+    return digest.hexdigest()
+
+
 def ext_pillar(
     minion_id,
     pillar,
@@ -402,38 +478,8 @@ def ext_pillar(
     # Not used
     del pillar
 
-    if not root_dir:
-        log.error("file_tree: no root_dir specified")
-        return {}
-
-    if not os.path.isabs(root_dir):
-        pillarenv = __opts__["pillarenv"]
-        if pillarenv is None:
-            log.error("file_tree: root_dir is relative but pillarenv is not set")
-            return {}
-        log.debug("file_tree: pillarenv = %s", pillarenv)
-
-        env_roots = __opts__["pillar_roots"].get(pillarenv, None)
-        if env_roots is None:
-            log.error(
-                "file_tree: root_dir is relative but no pillar_roots are specified "
-                " for pillarenv %s",
-                pillarenv,
-            )
-            return {}
-
-        env_dirs = []
-        for env_root in env_roots:
-            env_dir = os.path.normpath(os.path.join(env_root, root_dir))
-            # don't redundantly load consecutively, but preserve any expected precedence
-            if env_dir not in env_dirs or env_dir != env_dirs[-1]:
-                env_dirs.append(env_dir)
-        dirs = env_dirs
-    else:
-        dirs = [root_dir]
-
     result_pillar = {}
-    for root in dirs:
+    for root in _root_dirs(root_dir):
         dir_pillar = _ext_pillar(
             minion_id,
             root,
@@ -37,6 +37,8 @@ RETURN_P = "return.p"
 OUT_P = "out.p"
 # endtime is the end time for a job, not stored as msgpack
 ENDTIME = "endtime"
+# marks a job cache whose jobs have all been recorded in time buckets
+BUCKETS_COMPLETE = ".complete"
 
 
 def _job_dir():
@@ -46,6 +48,31 @@ def _job_dir():
     return os.path.join(__opts__["cachedir"], "jobs")
 
 
+def _bucket_dir():
+    """
+    Return the directory holding the time buckets of the jobs cache
+    """
+    return os.path.join(__opts__["cachedir"], "job_buckets")
+
+
+def _register_job(jid, created=None):
+    """
+    Record a new jid dir in the time bucket it was created in, so that
+    clean_old_jobs can expire whole buckets without walking the job cache
+    """
+    bucket_seconds = __opts__.get("job_cache_bucket_seconds", 3600)
+    if created is None:
+        created = time.time()
+    bucket = int(created // bucket_seconds * bucket_seconds)
+    bucket_dir = _bucket_dir()
+    try:
+        os.makedirs(bucket_dir, exist_ok=True)
+        with salt.utils.files.fopen(os.path.join(bucket_dir, str(bucket)), "a") as fh_:
+            fh_.write(f"{jid}\n")
+    except OSError as exc:
+        log.warning("Could not record job %s in the job cache buckets: %s", jid, exc)
+
+
 def _walk_through(job_dir):
     """
     Walk though the jid dir and look for jobs
@@ -108,6 +135,8 @@ def prep_jid(nocache=False, passed_jid=None, recurse_count=0):
             time.sleep(0.1)
             if passed_jid is None:
                 return prep_jid(nocache=nocache, recurse_count=recurse_count + 1)
+        else:
+            _register_job(jid)
 
     try:
         with salt.utils.files.fopen(os.path.join(jid_dir, "jid"), "wb+") as fn_:
@@ -140,6 +169,8 @@ def returner(load):
 
     hn_dir = os.path.join(jid_dir, load["id"])
 
+    if not os.path.isdir(jid_dir):
+        _register_job(load["jid"])
     try:
         os.makedirs(hn_dir)
     except OSError as err:
@@ -197,6 +228,7 @@ def save_load(jid, clear_load, minions=None, recurse_count=0):
     try:
         if not os.path.exists(jid_dir):
             os.makedirs(jid_dir)
+            _register_job(jid)
     except OSError as exc:
         if exc.errno == errno.EEXIST:
             # rarely, the directory can be already concurrently created between
@@ -246,6 +278,7 @@ def save_minions(jid, minions, syndic_id=None):
     try:
         if not os.path.exists(jid_dir):
             os.makedirs(jid_dir)
+            _register_job(jid)
     except OSError as exc:
         if exc.errno == errno.EEXIST:
             # rarely, the directory can be already concurrently created between
@@ -409,9 +442,126 @@ def _remove_job_dir(job_path):
     return True
 
 
+def _clean_old_jobs_walk(jid_root, keep_jobs_seconds, budget):
+    """
+    Walk the whole job cache, remove the old jobs and record the other ones
+    in their time buckets. Returns the number of removed jid dirs, or
+    ``None`` if the removal budget has been exhausted.
+    """
+    removed = 0
+
+    # Keep track of any empty t_path dirs that need to be removed later
+    dirs_to_remove = set()
+
+    for top in os.listdir(jid_root):
+        t_path = os.path.join(jid_root, top)
+
+        if not os.path.exists(t_path):
+            continue
+
+        # Check if there are any stray/empty JID t_path dirs
+        t_path_dirs = os.listdir(t_path)
+        if not t_path_dirs and t_path not in dirs_to_remove:
+            dirs_to_remove.add(t_path)
+            continue
+
+        for final in t_path_dirs:
+            if budget and removed >= budget:
+                return None
+            f_path = os.path.join(t_path, final)
+            jid_file = os.path.join(f_path, "jid")
+            if not os.path.isfile(jid_file) and os.path.exists(f_path):
+                # No jid file means corrupted cache entry, scrub it
+                # by removing the entire f_path directory
+                _remove_job_dir(f_path)
+                removed += 1
+            elif os.path.isfile(jid_file):
+                jid_ctime = os.stat(jid_file).st_ctime
+                seconds_difference = time.time() - jid_ctime
+                if seconds_difference > keep_jobs_seconds and os.path.exists(t_path):
+                    # Remove the entire f_path from the original JID dir
+                    _remove_job_dir(f_path)
+                    removed += 1
+                else:
+                    # Record the kept job in its time bucket, for the bucket
+                    # cleaner to remove it once it expires
+                    try:
+                        with salt.utils.files.fopen(jid_file, "r") as fh_:
+                            jid = fh_.read().strip()
+                    except OSError:
+                        jid = None
+                    if jid:
+                        _register_job(jid, created=jid_ctime)
+
+    # Remove empty JID dirs from job cache, if they're old enough.
+    # JID dirs may be empty either from a previous cache-clean with the bug
+    # Listed in #29286 still present, or the JID dir was only recently made
+    # And the jid file hasn't been created yet.
+    if dirs_to_remove:
+        for t_path in dirs_to_remove:
+            # Checking the time again prevents a possible race condition where
+            # t_path JID dirs were created, but not yet populated by a jid file.
+            t_path_ctime = os.stat(t_path).st_ctime
+            seconds_difference = time.time() - t_path_ctime
+            if seconds_difference > keep_jobs_seconds:
+                _remove_job_dir(t_path)
+    return removed
+
+
+def _clean_old_buckets(bucket_dir, keep_jobs_seconds, budget):
+    """
+    Remove the jobs of the time buckets which are entirely older than
+    ``keep_jobs_seconds``. Returns the number of removed jid dirs.
+    """
+    bucket_seconds = __opts__.get("job_cache_bucket_seconds", 3600)
+    now = time.time()
+    removed = 0
+    buckets = sorted(int(name) for name in os.listdir(bucket_dir) if name.isdigit())
+    for bucket in buckets:
+        if bucket + bucket_seconds > now - keep_jobs_seconds:
+            # Buckets are sorted, every following bucket is more recent
+            break
+        bucket_path = os.path.join(bucket_dir, str(bucket))
+        with salt.utils.files.fopen(bucket_path, "r") as fh_:
+            jids = list(dict.fromkeys(fh_.read().split()))
+        remaining = []
+        for idx, jid in enumerate(jids):
+            if budget and removed >= budget:
+                remaining = jids[idx:]
+                break
+            jid_dir = salt.utils.jid.jid_dir(jid, _job_dir(), __opts__["hash_type"])
+            try:
+                jid_ctime = os.stat(os.path.join(jid_dir, "jid")).st_ctime
+            except OSError:
+                jid_ctime = None
+            if jid_ctime is not None and now - jid_ctime <= keep_jobs_seconds:
+                # The jid has been reused since, keep it for a later bucket
+                _register_job(jid, created=jid_ctime)
+                continue
+            if os.path.isdir(jid_dir) and _remove_job_dir(jid_dir):
+                removed += 1
+                try:
+                    # Drop the hash prefix dir once its last job is gone
+                    os.rmdir(os.path.dirname(jid_dir))
+                except OSError:
+                    pass
+        if remaining:
+            with salt.utils.atomicfile.atomic_open(bucket_path, "w") as fh_:
+                fh_.write("".join(f"{jid}\n" for jid in remaining))
+            break
+        os.remove(bucket_path)
+    return removed
+
+
 def clean_old_jobs():
     """
     Clean out the old jobs from the job cache
+
+    New jobs are recorded in time buckets of ``job_cache_bucket_seconds``, so
+    only the buckets older than ``keep_jobs_seconds`` need to be looked at.
+    The whole job cache is only walked until the jobs created before the
+    buckets were introduced are gone. At most ``job_cache_clean_budget`` jobs
+    are removed per call, the remaining ones are removed by the next calls.
     """
     keep_jobs_seconds = salt.utils.job.get_keep_jobs_seconds(__opts__)
     if keep_jobs_seconds != 0:
@@ -420,49 +570,24 @@ def clean_old_jobs():
         if not os.path.exists(jid_root):
             return
 
-        # Keep track of any empty t_path dirs that need to be removed later
-        dirs_to_remove = set()
-
-        for top in os.listdir(jid_root):
-            t_path = os.path.join(jid_root, top)
-
-            if not os.path.exists(t_path):
-                continue
-
-            # Check if there are any stray/empty JID t_path dirs
-            t_path_dirs = os.listdir(t_path)
-            if not t_path_dirs and t_path not in dirs_to_remove:
-                dirs_to_remove.add(t_path)
-                continue
+        budget = __opts__.get("job_cache_clean_budget", 10000)
+        bucket_dir = _bucket_dir()
+        complete = os.path.join(bucket_dir, BUCKETS_COMPLETE)
+        if not os.path.exists(complete):
+            # Make sure every job created from now on lands in a bucket
+            # before walking the jobs created before
+            os.makedirs(bucket_dir, exist_ok=True)
+            removed = _clean_old_jobs_walk(jid_root, keep_jobs_seconds, budget)
+            if removed is None:
+                return
+            with salt.utils.files.fopen(complete, "w"):
+                pass
+            if budget:
+                budget -= removed
+                if budget <= 0:
+                    return
 
-            for final in t_path_dirs:
-                f_path = os.path.join(t_path, final)
-                jid_file = os.path.join(f_path, "jid")
-                if not os.path.isfile(jid_file) and os.path.exists(f_path):
-                    # No jid file means corrupted cache entry, scrub it
-                    # by removing the entire f_path directory
-                    _remove_job_dir(f_path)
-                elif os.path.isfile(jid_file):
-                    jid_ctime = os.stat(jid_file).st_ctime
-                    seconds_difference = time.time() - jid_ctime
-                    if seconds_difference > keep_jobs_seconds and os.path.exists(
-                        t_path
-                    ):
-                        # Remove the entire f_path from the original JID dir
-                        _remove_job_dir(f_path)
-
-        # Remove empty JID dirs from job cache, if they're old enough.
-        # JID dirs may be empty either from a previous cache-clean with the bug
-        # Listed in #29286 still present, or the JID dir was only recently made
-        # And the jid file hasn't been created yet.
-        if dirs_to_remove:
-            for t_path in dirs_to_remove:
-                # Checking the time again prevents a possible race condition where
-                # t_path JID dirs were created, but not yet populated by a jid file.
-                t_path_ctime = os.stat(t_path).st_ctime
-                seconds_difference = time.time() - t_path_ctime
-                if seconds_difference > keep_jobs_seconds:
-                    _remove_job_dir(t_path)
+        _clean_old_buckets(bucket_dir, keep_jobs_seconds, budget)
 
 
 def update_endtime(jid, time):
@@ -475,6 +600,7 @@ def update_endtime(jid, time):
     try:
         if not os.path.exists(jid_dir):
             os.makedirs(jid_dir)
+            _register_job(jid)
         with salt.utils.files.fopen(os.path.join(jid_dir, ENDTIME), "w") as etfile:
             etfile.write(salt.utils.stringutils.to_str(time))
     except OSError as exc:
@@ -0,0 +1,431 @@
+"""
+Use an indexed SQLite database on the master as the master job cache.
+
+.. versionadded:: 3008.0
+
+This returner implements the same job cache API as the default
+:mod:`local_cache <salt.returners.local_cache>` returner, but keeps the job
+loads, targeted minion lists, returns and end times in a single embedded
+database instead of a hashed directory tree. It also keeps the register of
+Thorium when set as its ``register_returner``. Listing jobs, looking up a job
+and cleaning old jobs become indexed queries instead of walking and
+deserializing every job in the cache, which keeps ``jobs.list_jobs``,
+``jobs.lookup_jid`` and the master maintenance loop fast on masters holding
+millions of returns.
+
+The database runs in WAL mode, so the master worker processes writing
+returns do not block the processes reading the job cache.
+
+:maintainer:    SaltStack
+:maturity:      New
+:depends:       None
+:platform:      all
+
+To use this returner as the master job cache, set the following in the master
+config:
+
+.. code-block:: yaml
+
+    master_job_cache: sqlite_cache
+
+The following optional settings are available:
+
+.. code-block:: yaml
+
+    # Path of the database, defaults to <cachedir>/jobs.db
+    master_job_cache.sqlite.database: /var/cache/salt/master/jobs.db
+    # Seconds to wait for a concurrent writer to release the database
+    master_job_cache.sqlite.timeout: 30
+    # Maximum number of jobs removed in one transaction by clean_old_jobs
+    master_job_cache.sqlite.clean_batch_size: 1000
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import salt.exceptions
+import salt.payload
+import salt.utils.jid
+import salt.utils.job
+import salt.utils.minions
+
+log = logging.getLogger(__name__)
+
+__virtualname__ = "sqlite_cache"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jids (
+    jid TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    fun TEXT,
+    load BLOB,
+    endtime TEXT,
+    nocache INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jids_created ON jids (created);
+CREATE INDEX IF NOT EXISTS jids_fun ON jids (fun, jid);
+CREATE TABLE IF NOT EXISTS minions (
+    jid TEXT NOT NULL,
+    syndic_id TEXT NOT NULL DEFAULT '',
+    minions BLOB NOT NULL,
+    PRIMARY KEY (jid, syndic_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS returns (
+    jid TEXT NOT NULL,
+    id TEXT NOT NULL,
+    ret BLOB NOT NULL,
+    out BLOB,
+    PRIMARY KEY (jid, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS register (
+    name TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+# {(<pid>, <thread id>, <database path>): sqlite3.Connection}
+_CONNECTIONS = {}
+_LOCK = threading.Lock()
+
+
+def __virtual__():
+    return __virtualname__
+
+
+def _db_path():
+    """
+    Return the path of the job cache database
+    """
+    return __opts__.get("master_job_cache.sqlite.database") or os.path.join(
+        __opts__["cachedir"], "jobs.db"
+    )
+
+
+def _connect():
+    """
+    Return the connection of the current process and thread, connections are
+    not shared with forked processes
+    """
+    path = _db_path()
+    key = (os.getpid(), threading.get_ident(), path)
+    with _LOCK:
+        conn = _CONNECTIONS.get(key)
+        if conn is not None:
+            return conn
+        for stale in [k for k in _CONNECTIONS if k[0] != key[0]]:
+            # Inherited over a fork, never use nor close it here
+            _CONNECTIONS.pop(stale)
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        try:
+            conn = sqlite3.connect(
+                path,
+                timeout=__opts__.get("master_job_cache.sqlite.timeout", 30),
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+        except sqlite3.Error as exc:
+            raise salt.exceptions.SaltCacheError(
+                f"Unable to open the job cache database {path}: {exc}"
+            )
+        _CONNECTIONS[key] = conn
+        return conn
+
+
+@contextlib.contextmanager
+def _transaction():
+    """
+    Run the enclosed statements in a single immediate transaction
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def prep_jid(nocache=False, passed_jid=None, recurse_count=0):
+    """
+    Return a job id and register it in the job cache.
+
+    This is the function responsible for making sure jids don't collide (unless
+    it is passed a jid).
+    """
+    if recurse_count >= 5:
+        err = f"prep_jid could not store a jid after {recurse_count} tries."
+        log.error(err)
+        raise salt.exceptions.SaltCacheError(err)
+    if passed_jid is None:  # this can be a None or an empty string.
+        jid = salt.utils.jid.gen_jid(__opts__)
+    else:
+        jid = passed_jid
+
+    with _transaction() as conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO jids (jid, created, nocache) VALUES (?, ?, ?)",
+            (jid, time.time(), int(bool(nocache))),
+        )
+        inserted = cur.rowcount == 1
+        if not inserted and passed_jid is not None and nocache:
+            conn.execute("UPDATE jids SET nocache = 1 WHERE jid = ?", (jid,))
+    if not inserted and passed_jid is None:
+        # Someone else is using this jid
+        return prep_jid(nocache=nocache, recurse_count=recurse_count + 1)
+    return jid
+
+
+def returner(load):
+    """
+    Return data to the job cache
+    """
+    # if a minion is returning a standalone job, get a jobid
+    if load["jid"] == "req":
+        load["jid"] = prep_jid(nocache=load.get("nocache", False))
+
+    ret = salt.payload.dumps(
+        {key: load[key] for key in ["return", "retcode", "success"] if key in load}
+    )
+    out = salt.payload.dumps(load["out"]) if "out" in load else None
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT nocache FROM jids WHERE jid = ?", (load["jid"],)
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO jids (jid, created) VALUES (?, ?)",
+                (load["jid"], time.time()),
+            )
+        elif row[0]:
+            return
+        try:
+            conn.execute(
+                "INSERT INTO returns (jid, id, ret, out) VALUES (?, ?, ?, ?)",
+                (load["jid"], load["id"], ret, out),
+            )
+        except sqlite3.IntegrityError:
+            # Minion has already returned this jid and it should be dropped
+            log.error(
+                "An extra return was detected from minion %s, please verify "
+                "the minion, this could be a replay attack",
+                load["id"],
+            )
+            return False
+
+
+def save_load(jid, clear_load, minions=None):
+    """
+    Save the load to the specified jid
+
+    minions argument is to provide a pre-computed list of matched minions for
+    the job, for cases when this function can't compute that list itself (such
+    as for salt-ssh)
+    """
+    # Multi-function jobs have a list of functions, only index single ones
+    fun = clear_load.get("fun")
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO jids (jid, created, fun, load) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (jid) DO UPDATE SET fun = excluded.fun, load = excluded.load",
+            (
+                jid,
+                time.time(),
+                fun if isinstance(fun, str) else None,
+                salt.payload.dumps(clear_load),
+            ),
+        )
+
+    # if you have a tgt, save that for the UI etc
+    if "tgt" in clear_load and clear_load["tgt"] != "":
+        if minions is None:
+            ckminions = salt.utils.minions.CkMinions(__opts__)
+            # Retrieve the minions list
+            _res = ckminions.check_minions(
+                clear_load["tgt"], clear_load.get("tgt_type", "glob")
+            )
+            minions = _res["minions"]
+        # save the minions to a cache so we can see in the UI
+        save_minions(jid, minions)
+
+
+def save_minions(jid, minions, syndic_id=None):
+    """
+    Save/update the list of minions for a given job
+    """
+    # Ensure we have a list for Python 3 compatibility
+    minions = list(minions)
+
+    log.debug(
+        "Adding minions for job %s%s: %s",
+        jid,
+        f" from syndic master '{syndic_id}'" if syndic_id else "",
+        minions,
+    )
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO jids (jid, created) VALUES (?, ?)",
+            (jid, time.time()),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO minions (jid, syndic_id, minions) "
+            "VALUES (?, ?, ?)",
+            (jid, syndic_id or "", salt.payload.dumps(minions)),
+        )
+
+
+def get_load(jid):
+    """
+    Return the load data that marks a specified jid
+    """
+    conn = _connect()
+    row = conn.execute("SELECT load FROM jids WHERE jid = ?", (jid,)).fetchone()
+    if row is None or row[0] is None:
+        return {}
+    ret = salt.payload.loads(row[0]) or {}
+    all_minions = set()
+    for (minions,) in conn.execute("SELECT minions FROM minions WHERE jid = ?", (jid,)):
+        all_minions.update(salt.payload.loads(minions))
+    if all_minions:
+        ret["Minions"] = sorted(all_minions)
+    return ret
+
+
+def get_jid(jid):
+    """
+    Return the information returned when the specified job id was executed
+    """
+    ret = {}
+    for minion_id, ret_data, out in _connect().execute(
+        "SELECT id, ret, out FROM returns WHERE jid = ?", (jid,)
+    ):
+        ret_data = salt.payload.loads(ret_data)
+        if not isinstance(ret_data, dict) or "return" not in ret_data:
+            ret_data = {"return": ret_data}
+        if out is not None:
+            ret_data["out"] = salt.payload.loads(out)
+        ret[minion_id] = ret_data
+    return ret
+
+
+def get_jids():
+    """
+    Return a dict mapping all job ids to job information
+    """
+    ret = {}
+    for jid, load, endtime in _connect().execute(
+        "SELECT jid, load, endtime FROM jids WHERE load IS NOT NULL"
+    ):
+        ret[jid] = salt.utils.jid.format_jid_instance(jid, salt.payload.loads(load))
+        if __opts__.get("job_cache_store_endtime") and endtime:
+            ret[jid]["EndTime"] = endtime
+    return ret
+
+
+def get_jids_filter(count, filter_find_job=True):
+    """
+    Return a list of all jobs information filtered by the given criteria.
+    :param int count: show not more than the count of most recent jobs
+    :param bool filter_find_jobs: filter out 'saltutil.find_job' jobs
+    """
+    sql = "SELECT jid, load FROM jids WHERE load IS NOT NULL"
+    if filter_find_job:
+        sql += " AND fun IS NOT 'saltutil.find_job'"
+    sql += " ORDER BY jid DESC LIMIT ?"
+    ret = [
+        salt.utils.jid.format_jid_instance_ext(jid, salt.payload.loads(load))
+        for jid, load in _connect().execute(sql, (count,))
+    ]
+    ret.reverse()
+    return ret
+
+
+def clean_old_jobs():
+    """
+    Clean out the old jobs from the job cache
+    """
+    keep_jobs_seconds = salt.utils.job.get_keep_jobs_seconds(__opts__)
+    if keep_jobs_seconds == 0:
+        return
+    cutoff = time.time() - keep_jobs_seconds
+    batch_size = __opts__.get("master_job_cache.sqlite.clean_batch_size", 1000)
+    removed = 0
+    while True:
+        # Delete in small transactions so writers are never blocked for long
+        with _transaction() as conn:
+            jids = [
+                (row[0],)
+                for row in conn.execute(
+                    "SELECT jid FROM jids WHERE created < ? LIMIT ?",
+                    (cutoff, batch_size),
+                )
+            ]
+            conn.executemany("DELETE FROM returns WHERE jid = ?", jids)
+            conn.executemany("DELETE FROM minions WHERE jid = ?", jids)
+            conn.executemany("DELETE FROM jids WHERE jid = ?", jids)
+        removed += len(jids)
+        if len(jids) < batch_size:
+            break
+    if removed:
+        log.debug("Removed %d old jobs from the job cache", removed)
+
+
+def update_endtime(jid, endtime):
+    """
+    Update (or store) the end time for a given job
+
+    Endtime is stored as a plain text string
+    """
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO jids (jid, created, endtime) VALUES (?, ?, ?) "
+            "ON CONFLICT (jid) DO UPDATE SET endtime = excluded.endtime",
+            (jid, time.time(), str(endtime)),
+        )
+
+
+def get_endtime(jid):
+    """
+    Retrieve the stored endtime for a given job
+
+    Returns False if no endtime is present
+    """
+    row = (
+        _connect().execute("SELECT endtime FROM jids WHERE jid = ?", (jid,)).fetchone()
+    )
+    if row is None or row[0] is None:
+        return False
+    return row[0]
+
+
+def save_reg(data):
+    """
+    Save the register of Thorium
+    """
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO register (name, data) VALUES (?, ?)",
+            ("register", salt.payload.dumps(data)),
+        )
+
+
+def load_reg():
+    """
+    Load the register of Thorium, empty if it was never saved
+    """
+    row = (
+        _connect()
+        .execute("SELECT data FROM register WHERE name = ?", ("register",))
+        .fetchone()
+    )
+    if row is None:
+        return {}
+    return salt.payload.loads(row[0])
@@ -11,16 +11,21 @@ The data sent to the state calls is as follows:
       }
 """
 
+import collections.abc
+import concurrent.futures
 import copy
 import datetime
 import fnmatch
+import hashlib
 import importlib
 import inspect
 import logging
 import os
+import queue
 import random
 import re
 import site
+import threading
 import time
 import traceback
 
@@ -31,6 +36,7 @@ import salt.minion
 import salt.pillar
 import salt.syspaths as syspaths
 import salt.utils.args
+import salt.utils.atomicfile
 import salt.utils.crypt
 import salt.utils.data
 import salt.utils.decorators.state
@@ -39,15 +45,24 @@ import salt.utils.event
 import salt.utils.files
 import salt.utils.hashutils
 import salt.utils.immutabletypes as immutabletypes
+import salt.utils.json
 import salt.utils.msgpack
 import salt.utils.platform
 import salt.utils.process
+import salt.utils.requisite
+import salt.utils.topmatch
 import salt.utils.url
 import salt.utils.verify
 
 # Explicit late import to avoid circular import. DO NOT MOVE THIS.
 import salt.utils.yamlloader as yamlloader
-from salt.exceptions import CommandExecutionError, SaltRenderError, SaltReqTimeoutError
+import salt.version
+from salt.exceptions import (
+    CommandExecutionError,
+    SaltDeserializationError,
+    SaltRenderError,
+    SaltReqTimeoutError,
+)
 from salt.serializers.msgpack import deserialize as msgpack_deserialize
 from salt.serializers.msgpack import serialize as msgpack_serialize
 from salt.template import compile_template, compile_template_str
@@ -127,6 +142,27 @@ STATE_INTERNAL_KEYWORDS = STATE_REQUISITE_KEYWORDS.union(
     STATE_REQUISITE_IN_KEYWORDS
 ).union(STATE_RUNTIME_KEYWORDS)
 
+# The minion options a compiled highstate depends on
+STATE_COMPILE_CACHE_DEP_OPTS = (
+    "default_top",
+    "env_order",
+    "file_roots",
+    "hash_type",
+    "id",
+    "jinja_env",
+    "jinja_sls_env",
+    "lock_saltenv",
+    "master_tops_first",
+    "pillarenv",
+    "renderer",
+    "renderer_blacklist",
+    "renderer_whitelist",
+    "saltenv",
+    "state_top",
+    "state_top_saltenv",
+    "top_file_merging_strategy",
+)
+
 
 class HashableOrderedDict(OrderedDict):
     def __hash__(self):
@@ -744,6 +780,71 @@ class Compiler:
         return high
 
 
+class ConcurrentContext(collections.abc.MutableMapping):
+    """
+    The ``__context__`` of a worker running concurrent states in a thread.
+
+    It is shared with the states instance which started the worker and its
+    other workers, so that the values cached or invalidated by a state, like
+    the ``pkg.list_pkgs`` cache, are seen by all of them. The keys only
+    relevant to the state being run, like the ``runas`` user, are kept per
+    worker. So is the ``retcode``, a state must not see the one of a state
+    run concurrently, but it is also written to the shared context.
+    """
+
+    LOCAL_KEYS = frozenset(("fileclient", "runas", "runas_password", "retcode"))
+    WRITE_THROUGH_KEYS = frozenset(("retcode",))
+
+    def __init__(self, shared, lock):
+        self.shared = shared
+        self.lock = lock
+        self.local = {}
+
+    def __getitem__(self, key):
+        if key in self.LOCAL_KEYS:
+            return self.local[key]
+        with self.lock:
+            return self.shared[key]
+
+    def __setitem__(self, key, value):
+        if key in self.LOCAL_KEYS:
+            self.local[key] = value
+            if key not in self.WRITE_THROUGH_KEYS:
+                return
+        with self.lock:
+            self.shared[key] = value
+
+    def __delitem__(self, key):
+        if key in self.LOCAL_KEYS:
+            del self.local[key]
+            if key in self.WRITE_THROUGH_KEYS:
+                with self.lock:
+                    self.shared.pop(key, None)
+            return
+        with self.lock:
+            del self.shared[key]
+
+    def __iter__(self):
+        with self.lock:
+            keys = [key for key in self.shared if key not in self.LOCAL_KEYS]
+        return iter(keys + list(self.local))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def setdefault(self, key, default=None):
+        if key in self.LOCAL_KEYS:
+            return super().setdefault(key, default)
+        with self.lock:
+            return self.shared.setdefault(key, default)
+
+    def pop(self, key, *default):
+        if key in self.LOCAL_KEYS:
+            return super().pop(key, *default)
+        with self.lock:
+            return self.shared.pop(key, *default)
+
+
 class State:
     """
     Class used to execute salt states
@@ -816,6 +917,12 @@ class State:
         self.active = set()
         self.mod_init = set()
         self.pre = {}
+        # The requisite graph of the chunks being run and its cycles
+        self.requisite_graph = None
+        self.requisite_cycles = {}
+        # The events of the states run by a concurrent worker are fired by
+        # the state run dispatching them
+        self._defer_events = False
         self.__run_num = 0
         self.jid = jid
         self.instance_id = str(id(self))
@@ -1385,17 +1492,25 @@ class State:
             self.module_refresh()
             return
 
+        if self._changes_refresh_modules(data):
+            self.module_refresh()
+
+    @staticmethod
+    def _changes_refresh_modules(data):
+        """
+        Return True if the changes made by the state may add modules, if the
+        state is a file or a package. If the file function is managed check to
+        see if the file is a possible module type, e.g. a python, pyx, or .so.
+        """
         if data["state"] == "file":
             if data["fun"] == "managed":
-                if data["name"].endswith((".py", ".pyx", ".pyo", ".pyc", ".so")):
-                    self.module_refresh()
+                return data["name"].endswith((".py", ".pyx", ".pyo", ".pyc", ".so"))
             elif data["fun"] == "recurse":
-                self.module_refresh()
+                return True
             elif data["fun"] == "symlink":
-                if "bin" in data["name"]:
-                    self.module_refresh()
-        elif data["state"] in ("pkg", "ports", "pip"):
-            self.module_refresh()
+                return "bin" in data["name"]
+            return False
+        return data["state"] in ("pkg", "ports", "pip")
 
     def verify_data(self, data):
         """
@@ -2734,20 +2849,31 @@ class State:
                         chunks.remove(low)
                         break
         running = {}
-        for low in chunks:
-            if "__FAILHARD__" in running:
-                running.pop("__FAILHARD__")
-                return running
-            tag = _gen_tag(low)
-            if tag not in running:
-                # Check if this low chunk is paused
-                action = self.check_pause(low)
-                if action == "kill":
-                    break
-                running = self.call_chunk(low, running, chunks)
-                if self.check_failhard(low, running):
+        previous = self.requisite_graph, self.requisite_cycles
+        self._build_requisite_graph(chunks)
+        try:
+            concurrency = self._state_concurrency()
+            if concurrency > 1 and self.requisite_graph is not None:
+                running, failhard = self._call_chunks_concurrent(chunks, concurrency)
+                if failhard:
                     return running
-            self.active = set()
+            else:
+                for low in chunks:
+                    if "__FAILHARD__" in running:
+                        running.pop("__FAILHARD__")
+                        return running
+                    tag = _gen_tag(low)
+                    if tag not in running:
+                        # Check if this low chunk is paused
+                        action = self.check_pause(low)
+                        if action == "kill":
+                            break
+                        running = self.call_chunk(low, running, chunks)
+                        if self.check_failhard(low, running):
+                            return running
+                    self.active = set()
+        finally:
+            self.requisite_graph, self.requisite_cycles = previous
         while True:
             if self.reconcile_procs(running):
                 break
@@ -2755,6 +2881,403 @@ class State:
         ret = dict(list(disabled.items()) + list(running.items()))
         return ret
 
+    def _state_concurrency(self):
+        """
+        Return the count of states to run at once
+        """
+        try:
+            return int(self.opts.get("state_concurrency", 1) or 1)
+        except (TypeError, ValueError):
+            log.warning(
+                "Invalid state_concurrency %r, running the states one at a time",
+                self.opts["state_concurrency"],
+            )
+            return 1
+
+    def _call_chunks_concurrent(self, chunks, concurrency):
+        """
+        Run up to ``concurrency`` chunks at once, in threads or processes.
+
+        The chunks are started in order, as soon as the states they have
+        requisites on have run, and the ones of a lower order are done if
+        either of them is an order barrier. The chunks which can not run next
+        to other states, such as the ones with a ``prereq``, aggregated or
+        possibly refreshing the modules, run alone in this process.
+
+        Return the running dict and whether failhard stopped the run.
+        """
+        mode = self.opts.get("state_concurrency_mode", "thread")
+        if mode not in ("thread", "process"):
+            log.warning(
+                "Invalid state_concurrency_mode %r, running the states in threads",
+                mode,
+            )
+            mode = "thread"
+        auto_order = self.opts.get("state_auto_order", True)
+        agg_opt = self.functions["config.option"]("state_aggregate")
+        running = {}
+        # {<tag>: (<low>, <future or process>)}
+        inflight = {}
+        pool = workers = None
+        if mode == "thread":
+            pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=concurrency, thread_name_prefix="ConcurrentState"
+            )
+            workers = queue.SimpleQueue()
+            self._concurrent_context_lock = threading.RLock()
+        pos = 0
+        paused = -1
+        stopped = failhard = False
+        try:
+            while inflight or (pos < len(chunks) and not stopped):
+                for low in self._reap_concurrent(inflight, running, chunks):
+                    if self.check_failhard(low, running):
+                        stopped = failhard = True
+                if "__FAILHARD__" in running:
+                    running.pop("__FAILHARD__")
+                    stopped = failhard = True
+                if stopped or pos >= len(chunks):
+                    self._wait_concurrent(inflight, running)
+                    continue
+                low = chunks[pos]
+                tag = _gen_tag(low)
+                if tag in running or tag in inflight:
+                    pos += 1
+                    continue
+                if paused != pos:
+                    # Check if this low chunk is paused
+                    paused = pos
+                    if self.check_pause(low) == "kill":
+                        stopped = True
+                        continue
+                ready = self._concurrent_ready(low, running, inflight, auto_order)
+                if ready is None or self._concurrent_exclusive(low, agg_opt):
+                    if inflight:
+                        self._wait_concurrent(inflight, running)
+                        continue
+                    functions = self.functions
+                    running = self.call_chunk(low, running, chunks)
+                    self.active = set()
+                    pos += 1
+                    if self.check_failhard(low, running):
+                        stopped = failhard = True
+                    if self.functions is not functions and workers is not None:
+                        # The modules were refreshed, the idle workers are
+                        # replaced by new ones loading them again
+                        self._destroy_concurrent_workers(workers)
+                    continue
+                if not ready or len(inflight) >= concurrency:
+                    self._wait_concurrent(inflight, running)
+                    continue
+                snapshot = {
+                    rtag: ret for rtag, ret in running.items() if "proc" not in ret
+                }
+                if pool is not None:
+                    handle = pool.submit(
+                        self._call_chunk_worker, workers, low, snapshot, chunks
+                    )
+                else:
+                    handle = self._call_chunk_process(low, snapshot, chunks)
+                inflight[tag] = (low, handle)
+                pos += 1
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+                self._destroy_concurrent_workers(workers)
+        return running, failhard
+
+    def _concurrent_ready(self, low, running, inflight, auto_order):
+        """
+        Return True if the chunk can be started, False if it has to wait for
+        the states being run, or None if it has requisites on states which
+        were not started yet.
+        """
+        tag = _gen_tag(low)
+        ready = True
+        for target in self.requisite_graph.requisites(
+            low, salt.utils.requisite.RUN_REQUISITES
+        ):
+            target_tag = _gen_tag(target)
+            if target_tag == tag:
+                continue
+            if target_tag in inflight:
+                ready = False
+            elif target_tag not in running:
+                return None
+            elif "proc" in running[target_tag]:
+                ready = False
+        if not ready:
+            return False
+        barrier = salt.utils.requisite.is_order_barrier(low, auto_order)
+        for other, _ in inflight.values():
+            if other["order"] < low["order"] and (
+                barrier or salt.utils.requisite.is_order_barrier(other, auto_order)
+            ):
+                return False
+        return True
+
+    def _concurrent_exclusive(self, low, agg_opt):
+        """
+        Return True if the chunk has to run alone, in this process
+        """
+        if _gen_tag(low) in self.requisite_cycles:
+            return True
+        for key in (
+            "parallel",
+            "prereq",
+            "prerequired",
+            "__prereq__",
+            "reload_modules",
+            "reload_grains",
+            "reload_pillar",
+            "force_reload_modules",
+        ):
+            if low.get(key):
+                return True
+        agg_opt = low.get("aggregate", agg_opt)
+        if agg_opt is True or (isinstance(agg_opt, list) and low["state"] in agg_opt):
+            return True
+        try:
+            return self._changes_refresh_modules(low)
+        except (AttributeError, KeyError, TypeError):
+            return True
+
+    def _wait_concurrent(self, inflight, running):
+        """
+        Wait for a concurrent state to be done. The states run in processes
+        and the parallel states are polled.
+        """
+        futures = [
+            handle
+            for _, handle in inflight.values()
+            if isinstance(handle, concurrent.futures.Future)
+        ]
+        procs = any("proc" in ret for ret in running.values())
+        if futures and len(futures) == len(inflight) and not procs:
+            concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+        elif futures:
+            concurrent.futures.wait(
+                futures, timeout=0.01, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+        else:
+            time.sleep(0.01)
+        if procs:
+            self.reconcile_procs(running)
+
+    def _reap_concurrent(self, inflight, running, chunks):
+        """
+        Add the results of the concurrent states which are done to the running
+        dict, numbering them and firing their events, and return their chunks
+        """
+        done = []
+        for tag, (low, handle) in list(inflight.items()):
+            if isinstance(handle, concurrent.futures.Future):
+                if not handle.done():
+                    continue
+                inflight.pop(tag)
+                new = handle.result()
+            else:
+                if handle.is_alive():
+                    continue
+                inflight.pop(tag)
+                new = self._load_concurrent_result(low)
+            for new_tag, ret in new.items():
+                if isinstance(ret, dict):
+                    ret["__run_num__"] = self.__run_num
+                    self.__run_num += 1
+                running[new_tag] = ret
+            if tag in running:
+                self.event(running[tag], len(chunks), fire_event=low.get("fire_event"))
+            done.append(low)
+        return done
+
+    def _call_chunk_isolated(self, low, running, chunks):
+        """
+        Call a chunk whose requisites have run, on a worker of a concurrent
+        state run, and return the running entries it added
+        """
+        before = set(running)
+        self.active = set()
+        running = self.call_chunk(low, running, chunks)
+        return {tag: ret for tag, ret in running.items() if tag not in before}
+
+    def _concurrent_init_kwargs(self):
+        """
+        The arguments of the states instances running the concurrent states,
+        reusing the pillar of this one
+        """
+        init_kwargs = dict(self._init_kwargs)
+        init_kwargs.update(
+            opts=copy.copy(self.opts),
+            pillar_override=None,
+            pillar_enc=None,
+            initial_pillar=self.opts["pillar"],
+            context=None,
+        )
+        return init_kwargs
+
+    def _call_chunk_worker(self, workers, low, running, chunks):
+        """
+        Call a chunk in a thread, on an idle worker states instance. The
+        workers have their own loaders, the globals injected in the state
+        modules differ for each state, but share the ``__context__`` of this
+        instance.
+        """
+        try:
+            worker = workers.get_nowait()
+        except queue.Empty:
+            init_kwargs = self._concurrent_init_kwargs()
+            init_kwargs["context"] = ConcurrentContext(
+                self.state_con, self._concurrent_context_lock
+            )
+            worker = self.__class__(**init_kwargs)
+            worker._defer_events = True
+            worker.inject_globals = self.inject_globals
+        try:
+            worker.requisite_graph = self.requisite_graph
+            worker.requisite_cycles = self.requisite_cycles
+            return worker._call_chunk_isolated(low, running, chunks)
+        finally:
+            workers.put(worker)
+
+    @staticmethod
+    def _destroy_concurrent_workers(workers):
+        while True:
+            try:
+                workers.get_nowait().file_client.destroy()
+            except queue.Empty:
+                break
+
+    def _concurrent_result_path(self, low):
+        return os.path.join(
+            self.opts["cachedir"],
+            str(self.jid),
+            "concurrent_{}".format(salt.utils.hashutils.sha1_digest(_gen_tag(low))),
+        )
+
+    def _call_chunk_process(self, low, running, chunks):
+        """
+        Start a process calling a chunk
+        """
+        if salt.utils.platform.spawning_platform():
+            instance = None
+        else:
+            instance = self
+        proc = salt.utils.process.Process(
+            target=self._call_chunk_process_target,
+            args=(instance, self._concurrent_init_kwargs(), low, running, chunks),
+            name="ConcurrentState({})".format(low["__id__"]),
+        )
+        proc.start()
+        return proc
+
+    @classmethod
+    def _call_chunk_process_target(cls, instance, init_kwargs, low, running, chunks):
+        """
+        The target function of the processes calling the concurrent states
+        """
+        if instance is None:
+            instance = cls(**init_kwargs)
+        instance._defer_events = True
+        tag = _gen_tag(low)
+        context = dict(instance.state_con)
+        try:
+            ret = instance._call_chunk_isolated(low, running, chunks)
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug(
+                "An exception occurred in this state: %s",
+                exc,
+                exc_info_on_loglevel=logging.DEBUG,
+            )
+            trb = traceback.format_exc()
+            ret = {
+                tag: {
+                    "result": False,
+                    "name": low.get("name"),
+                    "changes": {},
+                    "comment": f"An exception occurred in this state: {trb}",
+                    "__sls__": low.get("__sls__"),
+                    "__id__": low.get("__id__"),
+                }
+            }
+        # The parent drops the context values this process changed, like the
+        # caches invalidated by the state, it cannot receive them
+        changed = [
+            key
+            for key, val in instance.state_con.items()
+            if key not in ConcurrentContext.LOCAL_KEYS
+            and (key not in context or context[key] is not val)
+        ]
+        changed.extend(
+            key
+            for key in context
+            if key not in ConcurrentContext.LOCAL_KEYS and key not in instance.state_con
+        )
+        result = {
+            "running": ret,
+            "changed": [key for key in changed if isinstance(key, str)],
+        }
+        if "retcode" in instance.state_con:
+            result["retcode"] = instance.state_con["retcode"]
+        tfile = instance._concurrent_result_path(low)
+        os.makedirs(os.path.dirname(tfile), exist_ok=True)
+        with salt.utils.files.fopen(tfile, "wb+") as fp_:
+            fp_.write(msgpack_serialize(result))
+
+    def _load_concurrent_result(self, low):
+        """
+        Load the running entries added by a concurrent state process, and
+        drop the context values it changed
+        """
+        tfile = self._concurrent_result_path(low)
+        try:
+            with salt.utils.files.fopen(tfile, "rb") as fp_:
+                result = msgpack_deserialize(fp_.read())
+            os.remove(tfile)
+            for key in result.get("changed", ()):
+                self.state_con.pop(key, None)
+            if "retcode" in result:
+                self.state_con["retcode"] = result["retcode"]
+            return result["running"]
+        except (OSError, SaltDeserializationError):
+            return {
+                _gen_tag(low): {
+                    "result": False,
+                    "comment": "Concurrent state process failed to return",
+                    "name": low.get("name"),
+                    "changes": {},
+                    "__sls__": low.get("__sls__"),
+                    "__id__": low.get("__id__"),
+                }
+            }
+
+    def _build_requisite_graph(self, chunks):
+        """
+        Index the requisites of the chunks about to run and report their
+        cycles, the states which are part of one fail without being run
+        """
+        disabled_reqs = self.opts.get("disabled_requisites", [])
+        if not isinstance(disabled_reqs, list):
+            disabled_reqs = [disabled_reqs]
+        self.requisite_graph = salt.utils.requisite.RequisiteGraph.build(
+            chunks, disabled_reqs
+        )
+        self.requisite_cycles = {}
+        if self.requisite_graph is None:
+            return
+        for cycle in self.requisite_graph.cycles():
+            tags = [_gen_tag(chunk) for chunk in cycle]
+            comment = "Recursive requisite found between the states: {}".format(
+                ", ".join(
+                    "{}.{}".format(chunk["__sls__"], chunk["__id__"]) for chunk in cycle
+                )
+            )
+            log.error(comment)
+            for tag in tags:
+                self.requisite_cycles[tag] = comment
+
     def check_failhard(self, low, running):
         """
         Check if the low data chunk should send a failhard signal
@@ -2852,6 +3375,15 @@ class State:
                     retset.add(False)
         return False not in retset
 
+    def _find_requisite(self, chunks, req_key, req_val):
+        """
+        Return the candidate chunks for a requisite from the requisite graph,
+        or None if all the chunks have to be scanned
+        """
+        if self.requisite_graph is None or self.requisite_graph.chunks is not chunks:
+            return None
+        return self.requisite_graph.find(req_key, req_val)
+
     def check_requisite(self, low, running, chunks, pre=False):
         """
         Look into the running data to check the status of all requisite
@@ -2929,7 +3461,8 @@ class State:
                     req_val = req[req_key]
                     if req_val is None:
                         continue
-                    for chunk in chunks:
+                    indexed = self._find_requisite(chunks, req_key, req_val)
+                    for chunk in chunks if indexed is None else indexed:
                         if req_key == "sls":
                             # Allow requisite tracking of entire sls files
                             if fnmatch.fnmatch(
@@ -3082,6 +3615,8 @@ class State:
         chunk is evaluated an event will be set up to the master with the
         results.
         """
+        if self._defer_events:
+            return
         if not self.opts.get("local") and (
             self.opts.get("state_events", True) or fire_event
         ):
@@ -3121,6 +3656,22 @@ class State:
         Check if a chunk has any requires, execute the requires and then
         the chunk
         """
+        tag = _gen_tag(low)
+        if tag in self.requisite_cycles and self.requisite_graph.chunks is chunks:
+            start_time, duration = _calculate_fake_duration()
+            running[tag] = {
+                "changes": {},
+                "result": False,
+                "duration": duration,
+                "start_time": start_time,
+                "comment": self.requisite_cycles[tag],
+                "__run_num__": self.__run_num,
+            }
+            for key in ("__sls__", "__id__", "name"):
+                running[tag][key] = low.get(key)
+            self.__run_num += 1
+            self.event(running[tag], len(chunks), fire_event=low.get("fire_event"))
+            return running
         low = self._mod_aggregate(low, running, chunks)
         self._mod_init(low)
         tag = _gen_tag(low)
@@ -3156,7 +3707,10 @@ class State:
                     found = False
                     req_key = next(iter(req))
                     req_val = req[req_key]
-                    for chunk in chunks:
+                    indexed = None
+                    if req_val is not None:
+                        indexed = self._find_requisite(chunks, req_key, req_val)
+                    for chunk in chunks if indexed is None else indexed:
                         if req_val is None:
                             continue
                         if req_key == "sls":
@@ -4257,6 +4811,7 @@ class BaseHighState:
         {'saltenv': ['state1', 'state2', ...]}
         """
         matches = DefaultOrderedDict(HashableOrderedDict)
+        indexed = salt.utils.topmatch.lookup(self.opts, top)
         # pylint: disable=cell-var-from-loop
         for saltenv, body in top.items():
             if self.opts["saltenv"]:
@@ -4264,10 +4819,14 @@ class BaseHighState:
                     continue
             for match, data in body.items():
 
-                def _filter_matches(_match, _data, _opts):
+                def _filter_matches(_match, _data, _opts, _matched=None):
                     if isinstance(_data, str):
                         _data = [_data]
-                    if self.matchers["confirm_top.confirm_top"](_match, _data, _opts):
+                    if _matched is None:
+                        _matched = self.matchers["confirm_top.confirm_top"](
+                            _match, _data, _opts
+                        )
+                    if _matched:
                         if saltenv not in matches:
                             matches[saltenv] = []
                         for item in _data:
@@ -4285,7 +4844,12 @@ class BaseHighState:
                                     matches[env_key] = []
                                 matches[env_key].append(inc_sls)
 
-                _filter_matches(match, data, self.opts["nodegroups"])
+                _filter_matches(
+                    match,
+                    data,
+                    self.opts["nodegroups"],
+                    indexed.get((saltenv, match)),
+                )
         ext_matches = self._master_tops()
         for saltenv in ext_matches:
             top_file_matches = matches.get(saltenv, [])
@@ -4792,6 +5356,101 @@ class BaseHighState:
         except ValueError:
             errors.append(f"Error when rendering state with contents: {state}")
 
+    def _compile_cache_inputs(self, whitelist=None):
+        """
+        Return a digest of the inputs of the highstate compilation other than
+        the files, for the ``state_compile_cache``
+        """
+        grains = self.opts.get("grains", {})
+        if self.opts.get("state_compile_cache_grains") is not None:
+            grains = {
+                grain: salt.utils.data.traverse_dict_and_list(grains, grain)
+                for grain in self.opts["state_compile_cache_grains"]
+            }
+        data = [
+            salt.version.__version__,
+            grains,
+            self.state.opts.get("pillar", {}),
+            whitelist,
+            {opt: self.opts.get(opt) for opt in STATE_COMPILE_CACHE_DEP_OPTS},
+            self._master_tops(),
+        ]
+        return hashlib.sha256(
+            salt.utils.json.dumps(data, sort_keys=True, default=repr).encode()
+        ).hexdigest()
+
+    def _compile_cache_path(self):
+        return os.path.join(self.opts["cachedir"], "highstate_compile.cache.p")
+
+    def _load_compiled_highstate(self, inputs):
+        """
+        Return the ``(<matches>, <high>)`` of the last highstate compiled from
+        the same inputs, or None if it is not cached or one of the files it was
+        rendered from changed on the master
+        """
+        try:
+            with salt.utils.files.fopen(self._compile_cache_path(), "rb") as fp_:
+                cached = salt.payload.load(fp_)
+        except (OSError, SaltDeserializationError):
+            return None
+        if not isinstance(cached, dict) or cached.get("inputs") != inputs:
+            return None
+        try:
+            if cached["envs"] is not None and self.client.envs() != cached["envs"]:
+                return None
+            for saltenv, prefix, digest in cached["lists"]:
+                if self.client.list_digest(saltenv, prefix) != digest:
+                    return None
+            for saltenv, path, hash_server in cached["files"]:
+                if self.client.hash_file(path, saltenv) != hash_server:
+                    log.debug(
+                        "The compiled highstate is outdated, %s changed in saltenv "
+                        "'%s'",
+                        path,
+                        saltenv,
+                    )
+                    return None
+        except (KeyError, TypeError, ValueError):
+            return None
+        return cached["matches"], cached["high"]
+
+    def _store_compiled_highstate(self, inputs, matches, high):
+        """
+        Cache the compiled highstate along with the files it was rendered from
+        """
+        deps = self.client.deps
+        if not deps:
+            return
+        try:
+            data = salt.payload.dumps(
+                {
+                    "inputs": inputs,
+                    "envs": deps["envs"],
+                    "lists": [
+                        [saltenv, prefix, digest]
+                        for (saltenv, prefix), digest in deps["lists"].items()
+                    ],
+                    "files": [
+                        [saltenv, path, hash_server]
+                        for (saltenv, path), hash_server in deps["files"].items()
+                    ],
+                    "matches": dict(matches),
+                    "high": high,
+                }
+            )
+        except TypeError:
+            # Can't serialize pydsl
+            return
+        cfn = self._compile_cache_path()
+        tmpfn = f"{cfn}.{os.getpid()}.tmp"
+        try:
+            with salt.utils.files.set_umask(0o077):
+                with salt.utils.files.fopen(tmpfn, "w+b") as fp_:
+                    fp_.write(data)
+            salt.utils.atomicfile.atomic_rename(tmpfn, cfn)
+        except OSError as exc:
+            log.error("Unable to write the compiled highstate cache %s: %s", cfn, exc)
+
     def _check_pillar(self, force=False):
         """
         Check the pillar for errors, refuse to run the state if there are
@@ -4852,40 +5511,64 @@ class BaseHighState:
                     return self.state.call_high(high, orchestration_jid)
         # File exists so continue
         err = []
-        try:
-            top = self.get_top()
-        except SaltRenderError as err:
-            ret[tag_name]["comment"] = "Unable to render top file: "
-            ret[tag_name]["comment"] += str(err.error)
-            return ret
-        except Exception:  # pylint: disable=broad-except
-            trb = traceback.format_exc()
-            err.append(trb)
-            return err
-        err += self.verify_tops(top)
-        matches = self.top_matches(top)
-        if not matches:
-            msg = (
-                "No Top file or master_tops data matches found. Please see "
-                "master log for details."
-            )
-            ret[tag_name]["comment"] = msg
-            return ret
-        matches = self.matches_whitelist(matches, whitelist)
-        self.load_dynamic(matches)
-        if not self._check_pillar(force):
-            err += ["Pillar failed to render with the following messages:"]
-            err += self.state.opts["pillar"]["_errors"]
-        else:
-            high, errors = self.render_highstate(matches)
-            if exclude:
-                if isinstance(exclude, str):
-                    exclude = exclude.split(",")
-                if "__exclude__" in high:
-                    high["__exclude__"].extend(exclude)
+        high = None
+        inputs = None
+        if self.opts.get("state_compile_cache", False) and isinstance(
+            self.client, salt.fileclient.RemoteClient
+        ):
+            inputs = self._compile_cache_inputs(whitelist)
+            cached = self._load_compiled_highstate(inputs)
+            if cached is not None and self._check_pillar(force):
+                matches, high = cached
+                self.load_dynamic(matches)
+                if self.opts[
+                    "autoload_dynamic_modules"
+                ] and inputs != self._compile_cache_inputs(whitelist):
+                    # The synced modules changed the grains or the pillar
+                    high = None
                 else:
-                    high["__exclude__"] = exclude
-            err += errors
+                    log.debug("Using the cached compiled highstate")
+            if high is None:
+                self.client.track_deps()
+        if high is None:
+            try:
+                top = self.get_top()
+            except SaltRenderError as err:
+                ret[tag_name]["comment"] = "Unable to render top file: "
+                ret[tag_name]["comment"] += str(err.error)
+                return ret
+            except Exception:  # pylint: disable=broad-except
+                trb = traceback.format_exc()
+                err.append(trb)
+                return err
+            err += self.verify_tops(top)
+            matches = self.top_matches(top)
+            if not matches:
+                msg = (
+                    "No Top file or master_tops data matches found. Please see "
+                    "master log for details."
+                )
+                ret[tag_name]["comment"] = msg
+                return ret
+            matches = self.matches_whitelist(matches, whitelist)
+            self.load_dynamic(matches)
+            if not self._check_pillar(force):
+                err += ["Pillar failed to render with the following messages:"]
+                err += self.state.opts["pillar"]["_errors"]
+            else:
+                high, errors = self.render_highstate(matches)
+                if inputs is not None:
+                    if not err and not errors:
+                        self._store_compiled_highstate(inputs, matches, high)
+                    self.client.deps = None
+                err += errors
+        if high is not None and exclude:
+            if isinstance(exclude, str):
+                exclude = exclude.split(",")
+            if "__exclude__" in high:
+                high["__exclude__"].extend(exclude)
+            else:
+                high["__exclude__"] = exclude
         if err:
             return err
         if not high:
@@ -343,6 +343,18 @@ class DaemonizedRequestServer(RequestServer):
         """
         raise NotImplementedError
 
+    def stop_accepting(self):
+        """
+        Stop handing new requests to this worker, it is about to exit
+        """
+
+    def drained(self):
+        """
+        Return True once no more requests will be received after
+        ``stop_accepting`` was called
+        """
+        return True
+
 
 class PublishServer:
     """
@@ -7,10 +7,12 @@ import asyncio.exceptions
 import errno
 import hashlib
 import logging
+import multiprocessing
 import os
 import signal
 import sys
 import threading
+import time
 from random import randint
 
 import tornado
@@ -26,6 +28,8 @@ import zmq.eventloop.zmqstream
 import salt.payload
 import salt.transport.base
 import salt.utils.files
+import salt.utils.lanes
+import salt.utils.metrics
 import salt.utils.process
 import salt.utils.stringutils
 import salt.utils.zeromq
@@ -408,6 +412,10 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
     def __init__(self, opts):  # pylint: disable=W0231
         self.opts = opts
         self._closing = False
+        self._lanes = False
+        self._draining = False
+        self._drained = False
+        self._available_at = 0
         self._monitor = None
         self._w_monitor = None
         self.tasks = set()
@@ -428,7 +436,14 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
             self.clients.setsockopt(zmq.IPV4ONLY, 0)
         self.clients.setsockopt(zmq.BACKLOG, self.opts.get("zmq_backlog", 1000))
         self._start_zmq_monitor()
-        self.workers = context.socket(zmq.DEALER)
+        lanes = salt.utils.lanes.enabled(self.opts)
+        if lanes:
+            # Route each request to an idle worker chosen by the lanes scheduler
+            self.workers = context.socket(zmq.ROUTER)
+            self.workers.setsockopt(zmq.ROUTER_MANDATORY, 1)
+            self.workers.setsockopt(zmq.ROUTER_HANDOVER, 1)
+        else:
+            self.workers = context.socket(zmq.DEALER)
         self.workers.setsockopt(zmq.LINGER, -1)
 
         if self.opts["mworker_queue_niceness"] and not salt.utils.platform.is_windows():
@@ -455,6 +470,11 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         if self.opts.get("ipc_mode", "") != "tcp":
             os.chmod(os.path.join(self.opts["sock_dir"], "workers.ipc"), 0o600)
 
+        if lanes:
+            self._lanes_device()
+            context.term()
+            return
+
         while True:
             if self.clients.closed or self.workers.closed:
                 break
@@ -468,6 +488,83 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
                 break
         context.term()
 
+    def _lanes_device(self):
+        """
+        Queue the requests of the clients by lane and hand them out to the
+        workers as they become idle
+        """
+        lanes = salt.utils.lanes.parse_lanes(self.opts)
+        metrics = salt.utils.metrics.init_registry(self.opts, "MWorkerQueue")
+        scheduler = salt.utils.lanes.LaneScheduler(
+            lanes, salt.utils.lanes.worker_names(self.opts, lanes), metrics=metrics
+        )
+        log.info("Scheduling the master requests through lanes %s", list(lanes))
+        poller = zmq.Poller()
+        poller.register(self.clients, zmq.POLLIN)
+        poller.register(self.workers, zmq.POLLIN)
+        flush_interval = self.opts.get("master_metrics_interval", 5)
+        next_flush = time.time() + flush_interval
+        while not (self.clients.closed or self.workers.closed):
+            try:
+                events = dict(poller.poll(1000))
+                if self.workers in events:
+                    # [<worker>, <client>, b"", <reply>] or [<worker>, <control>]
+                    frames = self.workers.recv_multipart()
+                    if len(frames) == 2:
+                        self._lanes_control(scheduler, *frames)
+                    else:
+                        scheduler.done(frames[0])
+                        self.clients.send_multipart(frames[1:])
+                if self.clients in events:
+                    # [<client>, b"", <request>]
+                    frames = self.clients.recv_multipart()
+                    scheduler.submit(frames, salt.utils.lanes.classify(frames[-1]))
+                self._lanes_dispatch(scheduler)
+                if metrics is not None and time.time() >= next_flush:
+                    scheduler.update_metrics()
+                    metrics.flush()
+                    next_flush = time.time() + flush_interval
+            except zmq.ZMQError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                raise
+            except (KeyboardInterrupt, SystemExit):
+                break
+
+    def _lanes_dispatch(self, scheduler):
+        """
+        Send the queued requests to the idle workers. The requests sent to a
+        worker which exited are dispatched again right away.
+        """
+        unreachable = True
+        while unreachable:
+            unreachable = False
+            for worker, frames in scheduler.dispatch():
+                try:
+                    self.workers.send_multipart([worker] + frames)
+                except zmq.ZMQError as exc:
+                    if exc.errno != errno.EHOSTUNREACH:
+                        raise
+                    scheduler.unreachable(worker)
+                    unreachable = True
+
+    def _lanes_control(self, scheduler, worker, control):
+        """
+        Handle a control message of a worker
+        """
+        if control == salt.utils.lanes.READY:
+            scheduler.ready(worker)
+        elif control == salt.utils.lanes.AVAILABLE:
+            scheduler.available(worker)
+        elif control == salt.utils.lanes.DRAIN:
+            scheduler.drain(worker)
+            # No request is sent to the worker after this reply
+            try:
+                self.workers.send_multipart([worker, salt.utils.lanes.DRAIN])
+            except zmq.ZMQError as exc:
+                if exc.errno != errno.EHOSTUNREACH:
+                    raise
+
     def close(self):
         """
         Cleanly shutdown the router socket
@@ -532,7 +629,18 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         """
         # context = zmq.Context(1)
         self.context = zmq.asyncio.Context(1)
-        self._socket = self.context.socket(zmq.REP)
+        self._lanes = salt.utils.lanes.enabled(self.opts)
+        if self._lanes:
+            # The lanes scheduler routes the requests to the workers by their
+            # name. A REP socket can not be connected to a ROUTER, the worker
+            # keeps the envelope of the request itself instead.
+            self._socket = self.context.socket(zmq.DEALER)
+            self._socket.setsockopt(
+                zmq.ROUTING_ID,
+                salt.utils.stringutils.to_bytes(multiprocessing.current_process().name),
+            )
+        else:
+            self._socket = self.context.socket(zmq.REP)
         # Linger -1 means we'll never discard messages.
         self._socket.setsockopt(zmq.LINGER, -1)
         self._start_zmq_monitor()
@@ -554,6 +662,11 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
         self.message_handler = message_handler
 
         async def callback():
+            if self._lanes:
+                self._available_at = (
+                    time.monotonic() + salt.utils.lanes.AVAILABLE_INTERVAL
+                )
+                await self._socket.send_multipart([salt.utils.lanes.READY])
             task = asyncio.create_task(self.request_handler())
             task.add_done_callback(self.tasks.discard)
             self.tasks.add(task)
@@ -563,15 +676,59 @@ class RequestServer(salt.transport.base.DaemonizedRequestServer):
     async def request_handler(self):
         while not self._event.is_set():
             try:
+                if self._lanes:
+                    # [<client>, b"", <request>]
+                    frames = await asyncio.wait_for(self._socket.recv_multipart(), 0.3)
+                    if frames == [salt.utils.lanes.DRAIN]:
+                        self._drained = True
+                        continue
+                    reply = await self.handle_message(None, frames[-1])
+                    await self._socket.send_multipart(
+                        frames[:-1] + [self.encode_payload(reply)]
+                    )
+                    continue
                 request = await asyncio.wait_for(self._socket.recv(), 0.3)
                 reply = await self.handle_message(None, request)
                 await self._socket.send(self.encode_payload(reply))
             except asyncio.exceptions.TimeoutError:
+                if self._lanes and not self._draining:
+                    await self._announce_available()
                 continue
             except Exception as exc:  # pylint: disable=broad-except
                 log.error("Exception in request handler", exc_info=True)
                 break
 
+    async def _announce_available(self):
+        """
+        Tell the lanes scheduler this worker is idle from time to time, in
+        case it started after this worker or did not receive its READY
+        """
+        now = time.monotonic()
+        if now < self._available_at:
+            return
+        self._available_at = now + salt.utils.lanes.AVAILABLE_INTERVAL
+        await self._socket.send_multipart([salt.utils.lanes.AVAILABLE])
+
+    def stop_accepting(self):
+        """
+        Ask the lanes scheduler to stop sending requests to this worker, see
+        :py:meth:`drained`
+        """
+        if not self._lanes:
+            # The queue device can not be asked, the requests it already
+            # queued for this worker are lost when it exits
+            self._drained = True
+            return
+        self._draining = True
+        self._socket.send_multipart([salt.utils.lanes.DRAIN])
+
+    def drained(self):
+        """
+        Return True once no more requests will be received after
+        :py:meth:`stop_accepting`
+        """
+        return self._drained
+
     async def handle_message(self, stream, payload):
         try:
             payload = self.decode_payload(payload)
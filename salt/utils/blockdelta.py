@@ -0,0 +1,234 @@
+"""
+Block signatures of files, to download only the blocks of a file which changed.
+
+The master splits a file in blocks of a fixed size and returns the weak and the
+strong checksums of each block, see :py:func:`get_signatures`. The minion rolls
+the weak checksum over its cached copy of the file to find the blocks it
+already has, at any offset, see :py:func:`match_blocks`, and only downloads the
+other ones. The weak checksum is Adler-32, which can be rolled one byte at a
+time, the strong checksum the first bytes of the SHA-256 digest of the block.
+
+Rolling the weak checksum is done in Python one byte at a time, which is slow.
+Once :py:data:`MAX_UNMATCHED_BLOCKS` blocks worth of bytes were rolled without
+finding a block, the rest of the copy is only compared block by block, at the
+offsets aligned on the block size: the blocks which only moved are not found
+there anymore. The minion then downloads the file whole if less than
+:py:data:`MIN_MATCHED` of its blocks were found.
+
+The signatures are cached by the master per file hash and block size, under
+``<cachedir>/file_blocks``.
+
+.. versionadded:: 3008.0
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import zlib
+
+import salt.payload
+import salt.utils.atomicfile
+import salt.utils.files
+
+log = logging.getLogger(__name__)
+
+# The size of the strong checksums, in bytes
+STRONG_SIZE = 16
+MIN_BLOCK_SIZE = 1024
+# The count of signatures kept in the cache of the master
+MAX_CACHED = 256
+# The count of blocks worth of bytes rolled without a match before only
+# comparing the aligned blocks
+MAX_UNMATCHED_BLOCKS = 4
+# The share of the blocks to find for the file not to be downloaded whole
+MIN_MATCHED = 0.1
+_ADLER_MOD = 65521
+
+
+def weak_checksum(data):
+    """
+    Return the weak checksum of a block
+    """
+    return zlib.adler32(data)
+
+
+def strong_checksum(data):
+    """
+    Return the strong checksum of a block
+    """
+    return hashlib.sha256(data).digest()[:STRONG_SIZE]
+
+
+def roll(weak, out_byte, in_byte, block_size):
+    """
+    Return the weak checksum of a block moved forward by one byte, given the
+    byte leaving the block and the byte entering it
+    """
+    sum_a = (weak & 0xFFFF) - out_byte + in_byte
+    sum_b = (weak >> 16) - block_size * out_byte + sum_a - 1
+    return (sum_b % _ADLER_MOD) << 16 | sum_a % _ADLER_MOD
+
+
+def signatures(path, block_size, hash_type):
+    """
+    Return the signatures of the blocks of a file, along with the hash of the
+    whole file, computed in the same pass
+    """
+    weak = []
+    strong = []
+    hasher = hashlib.new(hash_type)
+    size = 0
+    with salt.utils.files.fopen(path, "rb") as fp_:
+        while True:
+            block = fp_.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+            weak.append(weak_checksum(block))
+            strong.append(strong_checksum(block))
+            size += len(block)
+    return {
+        "hsum": hasher.hexdigest(),
+        "hash_type": hash_type,
+        "size": size,
+        "block_size": block_size,
+        "weak": weak,
+        "strong": strong,
+    }
+
+
+def _cache_path(opts, hash_type, hsum, block_size):
+    return os.path.join(
+        opts["cachedir"], "file_blocks", hash_type, f"{hsum}.{block_size}.p"
+    )
+
+
+def _prune(cache_dir):
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.is_file()]
+    except OSError:
+        return
+    if len(entries) <= MAX_CACHED:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[: len(entries) - MAX_CACHED]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def get_signatures(opts, path, hsum, hash_type, block_size):
+    """
+    Return the signatures of the blocks of a file whose hash is ``hsum``,
+    from the cache if they were computed before. The ``hsum`` of the
+    signatures returned is the one of the content they were computed from,
+    which differs from the given one if the file changed since it was hashed.
+    """
+    cache_path = _cache_path(opts, hash_type, hsum, block_size)
+    try:
+        with salt.utils.files.fopen(cache_path, "rb") as fp_:
+            return salt.payload.loads(fp_.read())
+    except OSError:
+        pass
+    except Exception as exc:  # pylint: disable=broad-except
+        log.debug("Unable to load the block signatures %s: %s", cache_path, exc)
+    ret = signatures(path, block_size, hash_type)
+    cache_path = _cache_path(opts, hash_type, ret["hsum"], block_size)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with salt.utils.atomicfile.atomic_open(cache_path, "wb") as fp_:
+            fp_.write(salt.payload.dumps(ret))
+    except OSError as exc:
+        log.debug("Unable to cache the block signatures of %s: %s", path, exc)
+    else:
+        _prune(os.path.dirname(cache_path))
+    return ret
+
+
+def _match_aligned_blocks(buf, pos, length, sigs, by_weak, found):
+    """
+    Add the blocks found in ``buf`` at the offsets aligned on the block size,
+    from ``pos``
+    """
+    block_size = sigs["block_size"]
+    pos = -(-pos // block_size) * block_size
+    while pos + block_size <= length:
+        data = buf[pos : pos + block_size]
+        candidates = by_weak.get(weak_checksum(data))
+        if candidates:
+            strong = strong_checksum(data)
+            for ind in candidates:
+                if sigs["strong"][ind] == strong:
+                    found.setdefault(ind, pos)
+        pos += block_size
+
+
+def match_blocks(path, sigs, max_unmatched=None):
+    """
+    Return the offsets in a local file of the blocks it shares with the file
+    described by ``sigs``, by block index.
+
+    After ``max_unmatched`` bytes rolled without finding a block,
+    :py:data:`MAX_UNMATCHED_BLOCKS` blocks by default, only the blocks aligned
+    on the block size are compared.
+    """
+    block_size = sigs["block_size"]
+    full_blocks = sigs["size"] // block_size
+    if max_unmatched is None:
+        max_unmatched = MAX_UNMATCHED_BLOCKS * block_size
+    by_weak = {}
+    for ind in range(full_blocks):
+        by_weak.setdefault(sigs["weak"][ind], []).append(ind)
+    found = {}
+    with salt.utils.files.fopen(path, "rb") as fp_:
+        length = os.fstat(fp_.fileno()).st_size
+        if not length:
+            return found
+        with mmap.mmap(fp_.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            pos = 0
+            weak = None
+            unmatched = 0
+            while pos + block_size <= length and len(found) < full_blocks:
+                if weak is None:
+                    weak = weak_checksum(buf[pos : pos + block_size])
+                candidates = by_weak.get(weak)
+                if candidates:
+                    strong = strong_checksum(buf[pos : pos + block_size])
+                    matched = False
+                    for ind in candidates:
+                        if sigs["strong"][ind] == strong:
+                            found.setdefault(ind, pos)
+                            matched = True
+                    if matched:
+                        pos += block_size
+                        weak = None
+                        unmatched = 0
+                        continue
+                unmatched += 1
+                if unmatched > max_unmatched:
+                    log.debug(
+                        "No block of %s found in %d bytes, only comparing the "
+                        "aligned blocks from offset %d",
+                        path,
+                        max_unmatched,
+                        pos,
+                    )
+                    _match_aligned_blocks(buf, pos, length, sigs, by_weak, found)
+                    break
+                if pos + block_size < length:
+                    weak = roll(weak, buf[pos], buf[pos + block_size], block_size)
+                pos += 1
+            tail = sigs["size"] - full_blocks * block_size
+            if tail:
+                # The last block is shorter, look for it where it would be if
+                # the file only grew or shrank at its end
+                for pos in (full_blocks * block_size, length - tail):
+                    if pos < 0 or pos + tail > length:
+                        continue
+                    data = buf[pos : pos + tail]
+                    if strong_checksum(data) == sigs["strong"][full_blocks]:
+                        found[full_blocks] = pos
+                        break
+    return found
@@ -0,0 +1,77 @@
+"""
+Compression codecs of the file chunks served by the fileserver.
+
+The minions asking for compressed chunks offer the codecs they support, in
+their order of preference, and the master picks the first one it supports.
+``gzip`` is always available, ``zstd`` and ``lz4`` only when the `zstandard`_
+and `lz4`_ libraries are installed.
+
+.. _`zstandard`: https://pypi.org/project/zstandard/
+.. _`lz4`: https://pypi.org/project/lz4/
+
+.. versionadded:: 3008.0
+"""
+
+import salt.utils.gzip_util
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+try:
+    import lz4.frame
+
+    HAS_LZ4 = True
+except ImportError:
+    HAS_LZ4 = False
+
+# The codecs, fastest first
+CODECS = ("zstd", "lz4", "gzip")
+
+
+def available_codecs():
+    """
+    Return the codecs supported by this host, in the order of preference
+    """
+    supported = {"zstd": HAS_ZSTD, "lz4": HAS_LZ4, "gzip": True}
+    return [codec for codec in CODECS if supported[codec]]
+
+
+def negotiate(offered):
+    """
+    Return the first of the offered codecs supported by this host, falling back
+    to ``gzip``
+    """
+    available = available_codecs()
+    for codec in offered or ():
+        if isinstance(codec, bytes):
+            codec = codec.decode()
+        if codec in available:
+            return codec
+    return "gzip"
+
+
+def compress(data, codec, level):
+    """
+    Return the data compressed with the given codec. The ``gzip`` compression
+    level, from 1 to 9, is used as is by the other codecs.
+    """
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == "lz4":
+        return lz4.frame.compress(data, compression_level=level)
+    return salt.utils.gzip_util.compress(data, level)
+
+
+def uncompress(data, codec):
+    """
+    Return the data compressed with the given codec, uncompressed
+    """
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "lz4":
+        return lz4.frame.decompress(data)
+    return salt.utils.gzip_util.uncompress(data)
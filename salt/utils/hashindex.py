@@ -0,0 +1,147 @@
+"""
+Index of the hashes of the files served by the fileserver.
+
+Each hash is recorded along with the size, the mtime in nanoseconds and the
+inode of the file when it was hashed, and is only returned while the file
+still has them. With :conf_master:`fileserver_hash_index`, the
+``FileserverUpdate`` process hashes the files of the ``file_roots`` which
+changed at each update of the ``roots`` backend, and writes the index to a
+snapshot on disk. The MWorkers load the snapshot when it was written, so that
+looking a hash up only costs a ``stat`` of the file, and the index survives the
+restarts of the master.
+
+.. versionadded:: 3008.0
+"""
+
+import logging
+import os
+import threading
+
+import salt.payload
+import salt.utils.atomicfile
+import salt.utils.data
+import salt.utils.files
+import salt.utils.hashutils
+
+log = logging.getLogger(__name__)
+
+_HASH_INDEXES = {}
+
+
+def _stat_key(path_stat):
+    return path_stat.st_size, path_stat.st_mtime_ns, path_stat.st_ino
+
+
+def get_hash_index(opts):
+    """
+    Return the hash index of the process for the ``hash_type`` of the master,
+    or None if :conf_master:`fileserver_hash_index` is disabled
+    """
+    if not opts.get("fileserver_hash_index", False):
+        return None
+    snapshot = os.path.join(
+        opts["cachedir"], "roots", "hash_index.{}.p".format(opts["hash_type"])
+    )
+    try:
+        return _HASH_INDEXES[snapshot]
+    except KeyError:
+        return _HASH_INDEXES.setdefault(
+            snapshot, HashIndex(opts["hash_type"], snapshot)
+        )
+
+
+class HashIndex:
+    """
+    The hashes of files, by absolute path
+    """
+
+    def __init__(self, hash_type, snapshot):
+        self.hash_type = hash_type
+        self.snapshot = snapshot
+        self.files = {}
+        self._snapshot_key = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load the snapshot if it was written since it was last loaded
+        """
+        try:
+            snapshot_key = _stat_key(os.stat(self.snapshot))
+        except OSError:
+            return
+        if snapshot_key == self._snapshot_key:
+            return
+        try:
+            with salt.utils.files.fopen(self.snapshot, "rb") as fp_:
+                data = salt.utils.data.decode(salt.payload.load(fp_))
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug("Unable to load the hash index %s: %s", self.snapshot, exc)
+            return
+        if data.get("hash_type") != self.hash_type:
+            return
+        with self._lock:
+            self.files = {path: tuple(entry) for path, entry in data["files"].items()}
+            self._snapshot_key = snapshot_key
+
+    def dump(self):
+        """
+        Write the index to its snapshot
+        """
+        os.makedirs(os.path.dirname(self.snapshot), exist_ok=True)
+        with self._lock:
+            data = {"hash_type": self.hash_type, "files": dict(self.files)}
+        with salt.utils.atomicfile.atomic_open(self.snapshot, "wb") as fp_:
+            fp_.write(salt.payload.dumps(data))
+        try:
+            self._snapshot_key = _stat_key(os.stat(self.snapshot))
+        except OSError:
+            pass
+
+    def lookup(self, path, path_stat):
+        """
+        Return the hash of a file, given its stat result, or None if it is not
+        indexed or changed since it was hashed
+        """
+        self.load()
+        entry = self.files.get(path)
+        if entry is not None and entry[:3] == _stat_key(path_stat):
+            return entry[3]
+        return None
+
+    def add(self, path, path_stat, hsum):
+        """
+        Record the hash of a file, given its stat result before it was hashed
+        """
+        with self._lock:
+            self.files[path] = _stat_key(path_stat) + (hsum,)
+
+    def refresh(self, paths):
+        """
+        Hash the given files which changed since they were indexed, drop the
+        other files from the index and write the snapshot if anything changed.
+        Return the number of files hashed.
+        """
+        self.load()
+        hashed = 0
+        files = {}
+        for path in paths:
+            try:
+                path_stat = os.stat(path)
+                entry = self.files.get(path)
+                if entry is None or entry[:3] != _stat_key(path_stat):
+                    entry = _stat_key(path_stat) + (
+                        salt.utils.hashutils.get_hash(path, self.hash_type),
+                    )
+                    hashed += 1
+            except OSError as exc:
+                log.debug("Unable to hash %s: %s", path, exc)
+                continue
+            files[path] = entry
+        changed = hashed or len(files) != len(self.files)
+        with self._lock:
+            self.files = files
+        if changed or not os.path.isfile(self.snapshot):
+            self.dump()
+        log.debug("Hashed %d of the %d indexed files", hashed, len(files))
+        return hashed
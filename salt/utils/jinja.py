@@ -2,12 +2,15 @@
 Jinja loading utils to enable a more powerful backend for jinja templates
 """
 
+import collections
+import hashlib
 import itertools
 import logging
 import os.path
 import pprint
 import re
 import shlex
+import threading
 import time
 import uuid
 import warnings
@@ -18,6 +21,7 @@ from xml.etree.ElementTree import Element, SubElement, tostring
 
 import jinja2
 from jinja2 import BaseLoader, TemplateNotFound, nodes
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
 from jinja2.environment import TemplateModule
 from jinja2.exceptions import TemplateRuntimeError
 from jinja2.ext import Extension
@@ -29,6 +33,7 @@ import salt.utils.json
 import salt.utils.stringutils
 import salt.utils.url
 import salt.utils.yaml
+import salt.version
 from salt.exceptions import TemplateError
 from salt.utils.decorators.jinja import jinja_filter, jinja_global, jinja_test
 from salt.utils.odict import OrderedDict
@@ -42,11 +47,33 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
-__all__ = ["SaltCacheLoader", "SerializerExtension"]
+__all__ = ["SaltBytecodeCache", "SaltCacheLoader", "SerializerExtension"]
 
 GLOBAL_UUID = uuid.UUID("91633EBF-1C86-5E33-935A-28061F4B480E")
 JINJA_VERSION = Version(jinja2.__version__)
 
+# The attributes of a Jinja environment the compiled templates depend on
+_COMPILE_ATTRS = (
+    "block_start_string",
+    "block_end_string",
+    "variable_start_string",
+    "variable_end_string",
+    "comment_start_string",
+    "comment_end_string",
+    "line_statement_prefix",
+    "line_comment_prefix",
+    "trim_blocks",
+    "lstrip_blocks",
+    "newline_sequence",
+    "keep_trailing_newline",
+    "optimized",
+    "autoescape",
+    "finalize",
+)
+
+# {<directory>: <SaltBytecodeCache>}
+_BYTECODE_CACHES = {}
+
 
 class SaltCacheLoader(BaseLoader):
     """
@@ -219,6 +246,127 @@ class SaltCacheLoader(BaseLoader):
         self.destroy()
 
 
+def _compile_attr_key(value):
+    if callable(value):
+        # Functions like the finalizer of the serializer extension are bound
+        # to a new object for each environment
+        return "{}.{}".format(
+            getattr(value, "__module__", None),
+            getattr(value, "__qualname__", type(value).__name__),
+        )
+    return repr(value)
+
+
+class SaltBytecodeCache(FileSystemBytecodeCache):
+    """
+    A Jinja bytecode cache keeping the compiled templates in memory and on
+    disk, so that the templates imported by many SLS files, like the
+    ``map.jinja`` files of the formulas, are compiled once and not on every
+    render.
+
+    The templates are keyed by their name, file name and the options of the
+    environment compiling them, and their source is checked against its
+    hash. The templates rendered from a string without a file name are only
+    kept in memory.
+    """
+
+    def __init__(self, directory, max_memory=512):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as exc:
+            log.warning("Unable to create the Jinja bytecode cache: %s", exc)
+        super().__init__(directory, pattern="__salt_jinja_%s.cache")
+        self.max_memory = max_memory
+        # {(<key>, <checksum>): <code>}
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def environment_key(environment):
+        """
+        Return the options and extensions of an environment the code of its
+        templates depends on
+        """
+        return (
+            salt.version.__version__,
+            type(environment).__name__,
+            tuple(sorted(environment.extensions)),
+            tuple(
+                _compile_attr_key(getattr(environment, attr, None))
+                for attr in _COMPILE_ATTRS
+            ),
+        )
+
+    def get_bucket(self, environment, name, filename, source):
+        key = hashlib.sha256(
+            salt.utils.stringutils.to_bytes(
+                repr((self.environment_key(environment), name, filename))
+            )
+        ).hexdigest()
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        bucket.persistent = filename is not None
+        with self.lock:
+            code = self.memory.get((key, bucket.checksum))
+            if code is not None:
+                self.memory.move_to_end((key, bucket.checksum))
+        if code is not None:
+            bucket.code = code
+        elif bucket.persistent:
+            self.load_bytecode(bucket)
+            if bucket.code is not None:
+                self._remember(bucket)
+        return bucket
+
+    def set_bucket(self, bucket):
+        self._remember(bucket)
+        if bucket.persistent:
+            try:
+                self.dump_bytecode(bucket)
+            except OSError as exc:
+                log.debug("Unable to write the Jinja bytecode cache: %s", exc)
+
+    def _remember(self, bucket):
+        with self.lock:
+            self.memory[(bucket.key, bucket.checksum)] = bucket.code
+            self.memory.move_to_end((bucket.key, bucket.checksum))
+            while len(self.memory) > self.max_memory:
+                self.memory.popitem(last=False)
+
+
+def get_bytecode_cache(opts):
+    """
+    Return the Jinja bytecode cache of the process if ``jinja_bytecode_cache``
+    is enabled, or None
+    """
+    if not opts.get("jinja_bytecode_cache", False) or not opts.get("cachedir"):
+        return None
+    directory = os.path.join(opts["cachedir"], "jinja")
+    try:
+        return _BYTECODE_CACHES[directory]
+    except KeyError:
+        return _BYTECODE_CACHES.setdefault(directory, SaltBytecodeCache(directory))
+
+
+def template_from_string(environment, source, filename=None):
+    """
+    Return the template of the given source, like ``environment.from_string``
+    does, compiled through the bytecode cache of the environment if any.
+
+    The ``filename`` the source was read from only keys the cache, the
+    template is still compiled without a name, like ``from_string`` does.
+    """
+    bcc = environment.bytecode_cache
+    if bcc is None:
+        return environment.from_string(source)
+    bucket = bcc.get_bucket(environment, "<template>", filename, source)
+    if bucket.code is None:
+        bucket.code = environment.compile(source)
+        bcc.set_bucket(bucket)
+    return environment.template_class.from_code(
+        environment, bucket.code, environment.make_globals(None), None
+    )
+
+
 class PrintableDict(OrderedDict):
     """
     Ensures that dict str() and repr() are YAML friendly.
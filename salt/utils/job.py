@@ -125,7 +125,9 @@ def store_job(opts, load, event=None, mminion=None):
         raise KeyError(emsg)
 
     save_load = True
-    if job_cache == "local_cache" and mminion.returners[getfstr](load.get("jid", "")):
+    if job_cache in ("local_cache", "sqlite_cache") and mminion.returners[getfstr](
+        load.get("jid", "")
+    ):
         # The job was saved previously.
         save_load = False
 
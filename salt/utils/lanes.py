@@ -0,0 +1,329 @@
+"""
+Priority lanes for the requests handled by the master workers.
+
+The ``request_lanes`` master option classifies the requests by their ``cmd``
+into lanes. Every lane has its own queue in the ``MWorkerQueue`` process,
+optionally some workers reserved to it, and a weight deciding its share of the
+workers common to all the lanes. The requests whose ``cmd`` belongs to no lane
+go to the ``default`` lane.
+
+.. versionadded:: 3008.0
+"""
+
+import collections
+import logging
+import time
+
+import salt.exceptions
+import salt.payload
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LANE = "default"
+# The control messages of the workers, a worker starting sends READY and sends
+# AVAILABLE again every AVAILABLE_INTERVAL seconds while idle, a worker asked
+# to exit sends DRAIN and gets it back once it won't be sent requests
+READY = b"ready"
+AVAILABLE = b"available"
+DRAIN = b"drain"
+AVAILABLE_INTERVAL = 5
+
+
+class Lane:
+    """
+    A queue of requests sharing the same priority
+    """
+
+    def __init__(self, name, cmds=(), workers=0, weight=1):
+        self.name = name
+        self.cmds = frozenset(cmds)
+        self.workers = workers
+        self.weight = weight
+        # [(<received>, <frames>)]
+        self.queue = collections.deque()
+        # The idle workers reserved to the lane
+        self.idle = collections.deque()
+        # The smooth weighted round robin counter
+        self.current = 0
+        # The count of requests being handled by a worker
+        self.busy = 0
+
+
+def enabled(opts):
+    """
+    Return True if the requests of the master are scheduled through lanes.
+
+    The autoscaled workers are always scheduled, the scheduler only sends a
+    request to an idle worker and stops sending them to a draining worker.
+    """
+    return opts.get("transport") == "zeromq" and bool(
+        opts.get("request_lanes") or opts.get("worker_threads_autoscale")
+    )
+
+
+def parse_lanes(opts):
+    """
+    Return the lanes configured by ``request_lanes`` as ``{<name>: <Lane>}``,
+    the ``default`` lane included
+    """
+    lanes = {}
+    cmds = {}
+    for name, conf in (opts.get("request_lanes") or {}).items():
+        if conf is None:
+            conf = {}
+        if not isinstance(conf, dict):
+            raise salt.exceptions.SaltConfigurationError(
+                f"request_lanes: the configuration of lane '{name}' must be a dict"
+            )
+        try:
+            workers = int(conf.get("workers", 0))
+            weight = int(conf.get("weight", 1))
+        except (TypeError, ValueError):
+            raise salt.exceptions.SaltConfigurationError(
+                f"request_lanes: the workers and weight of lane '{name}' must be "
+                "integers"
+            )
+        if workers < 0 or weight < 1:
+            raise salt.exceptions.SaltConfigurationError(
+                f"request_lanes: lane '{name}' needs a positive weight and workers"
+            )
+        lane = lanes[str(name)] = Lane(
+            str(name), conf.get("cmds") or (), workers=workers, weight=weight
+        )
+        for cmd in lane.cmds:
+            if cmd in cmds:
+                raise salt.exceptions.SaltConfigurationError(
+                    f"request_lanes: '{cmd}' belongs to both lanes '{cmds[cmd]}' "
+                    f"and '{name}'"
+                )
+            cmds[cmd] = name
+    if DEFAULT_LANE not in lanes:
+        lanes[DEFAULT_LANE] = Lane(DEFAULT_LANE)
+    return lanes
+
+
+def worker_names(opts, lanes=None):
+    """
+    Return the names of the master workers as ``{<name>: <lane>}``, the lane
+    being None for the workers common to all the lanes
+    """
+    if lanes is None:
+        lanes = parse_lanes(opts)
+    count = int(opts["worker_threads"])
+    if opts.get("worker_threads_autoscale"):
+        count = max(count, opts["worker_threads_max"])
+    names = {f"MWorker-{ind}": None for ind in range(count)}
+    for lane in lanes.values():
+        for ind in range(lane.workers):
+            names[f"MWorker-{lane.name}-{ind}"] = lane.name
+    return names
+
+
+def classify(payload):
+    """
+    Return the ``cmd`` of a serialized request, None if it is not known.
+
+    The load of the encrypted requests can not be read here, their ``cmd``
+    comes from the hint the minions add to the request envelope.
+    """
+    try:
+        payload = salt.payload.loads(payload)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("enc") == "clear" and isinstance(payload.get("load"), dict):
+        return payload["load"].get("cmd")
+    return payload.get("cmd")
+
+
+class LaneScheduler:
+    """
+    Dispatch the queued requests of the lanes to the idle workers.
+
+    The workers reserved to a lane only handle its requests. The common
+    workers pick the next lane among the ones with queued requests by smooth
+    weighted round robin. A worker is only sent requests once it reported
+    itself ready, and until it can not be reached or is draining: the workers
+    not started yet, like the ones the autoscaler may start later, are never
+    waited for. A worker stays busy until it replies, even to a long request,
+    a warning is logged when it did not reply after ``stale_after`` seconds.
+    Only a new process of the same name reporting itself ready gives up on
+    the request.
+    """
+
+    def __init__(self, lanes, workers, metrics=None, stale_after=300):
+        self.lanes = lanes
+        self.metrics = metrics
+        self.stale_after = stale_after
+        self.routes = {}
+        for cmd_lane in lanes.values():
+            for cmd in cmd_lane.cmds:
+                self.routes[cmd] = cmd_lane
+        self.idle = collections.deque()
+        self.draining = set()
+        # {<worker>: <lane name or None>}
+        self.workers = {}
+        for name, lane in workers.items():
+            worker = name.encode() if isinstance(name, str) else name
+            self.workers[worker] = lane
+        # {<worker>: (<lane>, <sent>, <received>, <frames>)}
+        self.in_flight = {}
+        # The workers in flight already reported as not replying
+        self.stale = set()
+
+    def _idle(self, worker):
+        if worker in self.draining:
+            return
+        lane = self.workers[worker]
+        if lane is None:
+            self.idle.append(worker)
+        else:
+            self.lanes[lane].idle.append(worker)
+
+    def lane(self, cmd):
+        return self.routes.get(cmd, self.lanes[DEFAULT_LANE])
+
+    def submit(self, frames, cmd, now=None):
+        """
+        Queue a request in the lane of its ``cmd``
+        """
+        if now is None:
+            now = time.time()
+        lane = self.lane(cmd)
+        lane.queue.append((now, frames))
+        return lane
+
+    def _pick(self):
+        """
+        Return the next lane served by a common worker
+        """
+        total = 0
+        best = None
+        for lane in self.lanes.values():
+            if not lane.queue:
+                continue
+            lane.current += lane.weight
+            total += lane.weight
+            if best is None or lane.current > best.current:
+                best = lane
+        if best is not None:
+            best.current -= total
+        return best
+
+    def _send(self, worker, lane, now):
+        received, frames = lane.queue.popleft()
+        lane.busy += 1
+        self.in_flight[worker] = (lane, now, received, frames)
+        if self.metrics is not None:
+            self.metrics.inc("salt_master_lane_requests_total", lane=lane.name)
+            self.metrics.observe(
+                "salt_master_lane_wait_seconds", now - received, lane=lane.name
+            )
+        return worker, frames
+
+    def dispatch(self, now=None):
+        """
+        Return the ``(<worker>, <frames>)`` requests to send now
+        """
+        if now is None:
+            now = time.time()
+        self._warn_stale(now)
+        ret = []
+        for lane in self.lanes.values():
+            while lane.queue and lane.idle:
+                ret.append(self._send(lane.idle.popleft(), lane, now))
+        while self.idle:
+            lane = self._pick()
+            if lane is None:
+                break
+            ret.append(self._send(self.idle.popleft(), lane, now))
+        return ret
+
+    def done(self, worker):
+        """
+        The given worker replied, it is idle again
+        """
+        if worker not in self.workers:
+            return
+        flight = self.in_flight.pop(worker, None)
+        if flight is None:
+            # The process which was sent the request was replaced
+            return
+        self.stale.discard(worker)
+        flight[0].busy -= 1
+        self._idle(worker)
+
+    def unreachable(self, worker):
+        """
+        The request sent to the given worker could not be delivered, queue it
+        again at the head of its lane. The worker is not sent requests until it
+        reports itself ready or available again.
+        """
+        lane, _, received, frames = self.in_flight.pop(worker)
+        lane.busy -= 1
+        lane.queue.appendleft((received, frames))
+
+    def _idle_queue(self, worker):
+        lane = self.workers[worker]
+        return self.idle if lane is None else self.lanes[lane].idle
+
+    def drain(self, worker):
+        """
+        The given worker is exiting, stop sending it requests. The request it
+        is handling, if any, is still waited for.
+        """
+        if worker not in self.workers:
+            return
+        self.draining.add(worker)
+        idle = self._idle_queue(worker)
+        if worker in idle:
+            idle.remove(worker)
+
+    def ready(self, worker):
+        """
+        The given worker started, send it requests, even if a worker of the
+        same name was drained before
+        """
+        if worker not in self.workers:
+            return
+        self.draining.discard(worker)
+        flight = self.in_flight.pop(worker, None)
+        if flight is not None:
+            # The previous process of this worker died handling a request
+            log.warning(
+                "Master worker %s restarted, its request was lost", worker.decode()
+            )
+            self.stale.discard(worker)
+            flight[0].busy -= 1
+        self.available(worker)
+
+    def available(self, worker):
+        """
+        The given worker is idle, send it requests if it was not known to be.
+        This recovers the workers which were already running when this
+        scheduler started.
+        """
+        if worker not in self.workers:
+            return
+        if worker not in self.in_flight and worker not in self._idle_queue(worker):
+            self._idle(worker)
+
+    def _warn_stale(self, now):
+        for worker, (_, sent, _, _) in list(self.in_flight.items()):
+            if now - sent > self.stale_after and worker not in self.stale:
+                log.warning(
+                    "Master worker %s did not reply within %s seconds",
+                    worker.decode(),
+                    self.stale_after,
+                )
+                self.stale.add(worker)
+
+    def update_metrics(self):
+        if self.metrics is None:
+            return
+        for lane in self.lanes.values():
+            self.metrics.set(
+                "salt_master_lane_queue_depth", len(lane.queue), lane=lane.name
+            )
+            self.metrics.set("salt_master_lane_busy_workers", lane.busy, lane=lane.name)
@@ -6,9 +6,12 @@
 
 """
 
+import contextlib
+import hashlib
 import logging
 import os
 import signal
+import time
 from threading import Event, Thread
 
 import salt.cache
@@ -18,15 +21,22 @@ import salt.payload
 import salt.pillar
 import salt.utils.atomicfile
 import salt.utils.files
+import salt.utils.json
 import salt.utils.minions
 import salt.utils.platform
 import salt.utils.stringutils
 import salt.utils.verify
-from salt.exceptions import SaltException
+from salt.exceptions import SaltDeserializationError, SaltException
 from salt.utils.cache import CacheCli as cache_cli
 from salt.utils.process import Process
 from salt.utils.zeromq import zmq
 
+try:
+    import fcntl
+except ImportError:
+    # fcntl is not available on windows
+    pass
+
 log = logging.getLogger(__name__)
 
 
@@ -215,12 +225,24 @@ class MasterPillarUtil:
         if not self.opts.get("minion_data_cache", False):
             log.debug("Skipping cached data because minion_data_cache is not enabled.")
             return grains, pillars
-        if not minion_ids:
-            minion_ids = self.cache.list("minions")
-        for minion_id in minion_ids:
+        if minion_ids:
+            minion_ids = [
+                minion_id
+                for minion_id in minion_ids
+                if salt.utils.verify.valid_id(self.opts, minion_id)
+            ]
+            cached = self.cache.fetch_many(
+                (f"minions/{minion_id}", "data") for minion_id in minion_ids
+            )
+            cached = {
+                minion_id: cached[(f"minions/{minion_id}", "data")]
+                for minion_id in minion_ids
+            }
+        else:
+            cached = self.cache.list_with_data("minions", "data")
+        for minion_id, mdata in cached.items():
             if not salt.utils.verify.valid_id(self.opts, minion_id):
                 continue
-            mdata = self.cache.fetch(f"minions/{minion_id}", "data")
             if not isinstance(mdata, dict):
                 log.warning(
                     "cache.fetch should always return a dict. ReturnedType: %s,"
@@ -529,6 +551,8 @@ class MasterPillarUtil:
                     self.cache.store(bank, "data", {"grains": minion_grains})
                 elif clear_grains and minion_pillar:
                     self.cache.store(bank, "data", {"pillar": minion_pillar})
+                if clear_pillar or clear_grains:
+                    salt.utils.minions.minion_data_updated(self.opts, minion_id)
                 if clear_mine:
                     # Delete the whole mine file
                     self.cache.flush(bank, "mine")
@@ -543,6 +567,183 @@ class MasterPillarUtil:
         return True
 
 
+class PillarFlight:
+    """
+    Coalesce the compilations of the same pillar by the master workers.
+
+    A worker compiles a pillar while holding the lock of its key, the workers
+    requesting the same pillar meanwhile wait for the lock and reuse the
+    result, which stays shared for ``pillar_coalesce_ttl`` seconds.
+
+    .. versionadded:: 3008.0
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.path = os.path.join(opts["cachedir"], "pillar_flight")
+        self.ttl = opts["pillar_coalesce_ttl"]
+        self.wait = opts["pillar_coalesce_wait"]
+        self._next_sweep = 0
+
+    @staticmethod
+    def key(load):
+        """
+        Return the key of the pillar requested by a minion
+        """
+        data = [
+            load["id"],
+            load.get("saltenv", load.get("env")),
+            load.get("pillarenv"),
+            load.get("ext"),
+            load.get("pillar_override", {}),
+            load.get("extra_minion_data"),
+            load["grains"],
+        ]
+        return hashlib.sha256(
+            salt.utils.stringutils.to_bytes(
+                salt.utils.json.dumps(data, sort_keys=True, default=repr)
+            )
+        ).hexdigest()
+
+    def _read(self, fname, fresh_after):
+        try:
+            if os.stat(fname).st_mtime < fresh_after:
+                return None
+            with salt.utils.files.fopen(fname, "rb") as fp_:
+                return salt.payload.load(fp_)
+        except (OSError, SaltDeserializationError):
+            return None
+
+    def _write(self, fname, data):
+        tmpfname = f"{fname}.{os.getpid()}.tmp"
+        try:
+            with salt.utils.files.set_umask(0o077):
+                with salt.utils.files.fopen(tmpfname, "w+b") as fp_:
+                    salt.payload.dump(data, fp_)
+            salt.utils.atomicfile.atomic_rename(tmpfname, fname)
+        except OSError as exc:
+            log.warning("Unable to share the compiled pillar: %s", exc)
+
+    def _sweep(self, now):
+        """
+        Remove the expired results
+        """
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + max(60, self.ttl)
+        try:
+            entries = list(os.scandir(self.path))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith(".p"):
+                    if entry.stat().st_mtime < now - self.ttl:
+                        os.remove(entry.path)
+                elif entry.name.endswith(".lock"):
+                    # Left behind by a worker which died while compiling
+                    if entry.stat().st_mtime < now - self.ttl - self.wait:
+                        self._remove_stale_lock(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _remove_stale_lock(lock_file):
+        with salt.utils.files.fopen(lock_file, "a") as fp_:
+            try:
+                fcntl.flock(fp_.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                os.remove(lock_file)
+            finally:
+                fcntl.flock(fp_.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _flock(fp_, deadline):
+        """
+        Lock an open file, waiting until ``deadline`` at most
+        """
+        while True:
+            try:
+                fcntl.flock(fp_.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+    @contextlib.contextmanager
+    def _lock(self, key):
+        """
+        Hold the lock of the given key for up to ``pillar_coalesce_wait``
+        seconds, yield False if it could not be acquired in time. The lock
+        file is removed on release, along with the lock of any waiter.
+        """
+        if not salt.utils.files.is_fcntl_available(check_sunos=True):
+            yield False
+            return
+        lock_file = os.path.join(self.path, f"{key}.lock")
+        deadline = time.monotonic() + self.wait
+        with salt.utils.files.set_umask(0o077):
+            while True:
+                with salt.utils.files.fopen(lock_file, "a") as fp_:
+                    if not self._flock(fp_, deadline):
+                        log.warning(
+                            "Timed out waiting for the compilation of the same "
+                            "pillar by another master worker"
+                        )
+                        yield False
+                        return
+                    try:
+                        current = (
+                            os.fstat(fp_.fileno()).st_ino == os.stat(lock_file).st_ino
+                        )
+                    except OSError:
+                        current = False
+                    if not current:
+                        # The previous holder removed the lock file, lock the
+                        # new one
+                        fcntl.flock(fp_.fileno(), fcntl.LOCK_UN)
+                        continue
+                    try:
+                        yield True
+                    finally:
+                        try:
+                            os.remove(lock_file)
+                        except OSError:
+                            pass
+                        fcntl.flock(fp_.fileno(), fcntl.LOCK_UN)
+                    return
+
+    def get(self, key, compile_pillar, refresh=False):
+        """
+        Return ``(<pillar>, <shared>)``, the pillar being compiled by
+        ``compile_pillar`` unless another worker did it within the TTL or,
+        with ``refresh``, while this one was waiting for it.
+        """
+        start = time.time()
+        fname = os.path.join(self.path, f"{key}.p")
+        fresh_after = start if refresh else start - self.ttl
+        data = self._read(fname, fresh_after)
+        if data is not None:
+            return data, True
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError as exc:
+            log.warning("Unable to create %s: %s", self.path, exc)
+            return compile_pillar(), False
+        with self._lock(key) as locked:
+            if locked:
+                data = self._read(fname, fresh_after)
+                if data is not None:
+                    return data, True
+            data = compile_pillar()
+            self._write(fname, data)
+        self._sweep(time.time())
+        return data, False
+
+
 class CacheTimer(Thread):
     """
     A basic timer class the fires timer-events every second.
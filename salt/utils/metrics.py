@@ -0,0 +1,282 @@
+"""
+Lightweight metrics collection for the Salt master daemons.
+
+Each process records its own counters and histograms into a
+:py:class:`Registry` and periodically flushes a snapshot of it to the metrics
+directory. The ``MetricsServer`` master process merges the snapshots of all
+the processes and serves them in the Prometheus text exposition format.
+
+.. versionadded:: 3008.0
+"""
+
+import bisect
+import logging
+import os
+import time
+
+import salt.exceptions
+import salt.payload
+import salt.utils.atomicfile
+import salt.utils.files
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# {<name>: (<type>, <help>, <buckets>)}
+METRICS = {
+    "salt_master_requests_total": (
+        "counter",
+        "Requests handled by the master workers.",
+        None,
+    ),
+    "salt_master_request_duration_seconds": (
+        "histogram",
+        "Time spent by the master workers handling a request.",
+        LATENCY_BUCKETS,
+    ),
+    "salt_master_request_errors_total": (
+        "counter",
+        "Requests whose handler raised an exception.",
+        None,
+    ),
+    "salt_master_worker_busy_seconds_total": (
+        "counter",
+        "Time spent by each master worker handling requests.",
+        None,
+    ),
+    "salt_master_request_bytes": (
+        "histogram",
+        "Size of the encrypted request payloads.",
+        SIZE_BUCKETS,
+    ),
+    "salt_master_response_bytes": (
+        "histogram",
+        "Size of the encrypted response payloads.",
+        SIZE_BUCKETS,
+    ),
+    "salt_master_auth_total": (
+        "counter",
+        "Minion authentication requests.",
+        None,
+    ),
+    "salt_master_lane_requests_total": (
+        "counter",
+        "Requests dispatched to the master workers, by lane.",
+        None,
+    ),
+    "salt_master_lane_wait_seconds": (
+        "histogram",
+        "Time spent by the requests in the queue of their lane.",
+        LATENCY_BUCKETS,
+    ),
+    "salt_master_lane_queue_depth": (
+        "gauge",
+        "Requests waiting in the queue of each lane.",
+        None,
+    ),
+    "salt_master_lane_busy_workers": (
+        "gauge",
+        "Master workers handling a request of each lane.",
+        None,
+    ),
+    "salt_master_ext_pillar_seconds": (
+        "histogram",
+        "Time spent rendering each external pillar source.",
+        LATENCY_BUCKETS,
+    ),
+    "salt_master_metrics_processes": (
+        "gauge",
+        "Master processes reporting metrics.",
+        None,
+    ),
+}
+
+_REGISTRY = None
+
+
+def metrics_dir(opts):
+    """
+    Return the directory holding the metrics snapshots of the master processes
+    """
+    return os.path.join(opts["sock_dir"], "metrics")
+
+
+def registry():
+    """
+    Return the registry of the current process, or None if the metrics
+    collection is not enabled in this process
+    """
+    return _REGISTRY
+
+
+def init_registry(opts, name):
+    """
+    Create the registry of the current process if ``master_metrics`` is
+    enabled and return it
+    """
+    global _REGISTRY
+    if not opts.get("master_metrics", False):
+        _REGISTRY = None
+    else:
+        _REGISTRY = Registry(name, path=metrics_dir(opts))
+    return _REGISTRY
+
+
+class Registry:
+    """
+    The metrics of one process.
+
+    Series are keyed by their metric name and a sorted tuple of label pairs.
+    Counters hold a float, histograms a list of per bucket counts followed by
+    the count of observations and their sum.
+    """
+
+    def __init__(self, name, path=None):
+        self.name = name
+        self.path = path
+        self.series = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.series[key] = self.series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.series[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(buckets) + 2)
+        idx = bisect.bisect_left(buckets, value)
+        if idx < len(buckets):
+            series[idx] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "time": time.time(),
+            "series": [
+                [name, [list(label) for label in labels], value]
+                for (name, labels), value in self.series.items()
+            ],
+        }
+
+    def flush(self):
+        """
+        Atomically write the snapshot of the registry to the metrics directory
+        """
+        if not self.path:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fname = os.path.join(self.path, f"{self.name}.p")
+            tmpfname = f"{fname}.{os.getpid()}.tmp"
+            with salt.utils.files.fopen(tmpfname, "w+b") as fp_:
+                salt.payload.dump(self.snapshot(), fp_)
+            salt.utils.atomicfile.atomic_rename(tmpfname, fname)
+        except OSError as exc:
+            log.warning("Unable to write the metrics of %s: %s", self.name, exc)
+
+
+def load_snapshots(path, max_age):
+    """
+    Load the metrics snapshots from the given directory, skipping the ones
+    older than ``max_age`` seconds
+    """
+    snapshots = []
+    now = time.time()
+    try:
+        fnames = os.listdir(path)
+    except OSError:
+        return snapshots
+    for fname in fnames:
+        if not fname.endswith(".p"):
+            continue
+        try:
+            with salt.utils.files.fopen(os.path.join(path, fname), "rb") as fp_:
+                snapshot = salt.payload.load(fp_)
+        except (OSError, salt.exceptions.SaltDeserializationError):
+            continue
+        if isinstance(snapshot, dict) and now - snapshot.get("time", 0) <= max_age:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def merge(snapshots, per_process=("salt_master_worker_busy_seconds_total",)):
+    """
+    Sum up the series of the given snapshots. The metrics listed in
+    ``per_process`` get a ``worker`` label holding the name of the process
+    instead of being summed.
+    """
+    series = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("series", ()):
+            labels = tuple(tuple(label) for label in labels)
+            if name in per_process:
+                labels = tuple(sorted(labels + (("worker", snapshot["name"]),)))
+            key = (name, labels)
+            if isinstance(value, list):
+                current = series.get(key)
+                if current is None:
+                    series[key] = list(value)
+                else:
+                    series[key] = [a + b for a, b in zip(current, value)]
+            else:
+                series[key] = series.get(key, 0) + value
+    series[("salt_master_metrics_processes", ())] = len(snapshots)
+    return series
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in labels
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(series):
+    """
+    Render merged series in the Prometheus text exposition format
+    """
+    by_name = {}
+    for (name, labels), value in sorted(series.items()):
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, samples in by_name.items():
+        mtype, mhelp, buckets = METRICS[name]
+        lines.append(f"# HELP {name} {mhelp}")
+        lines.append(f"# TYPE {name} {mtype}")
+        for labels, value in samples:
+            if mtype != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                blabels = labels + (("le", _format_value(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(blabels)} {cumulative}")
+            blabels = labels + (("le", "+Inf"),)
+            lines.append(f"{name}_bucket{_format_labels(blabels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-2]}")
+            lines.append(
+                f"{name}_sum{_format_labels(labels)} {_format_value(float(value[-1]))}"
+            )
+    return "\n".join(lines) + "\n"
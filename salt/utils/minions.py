@@ -7,11 +7,16 @@ import fnmatch
 import logging
 import os
 import re
+import threading
+import time
+from collections import OrderedDict
 
 import salt.cache
 import salt.payload
 import salt.roster
+import salt.syspaths
 import salt.transport
+import salt.utils.args
 import salt.utils.data
 import salt.utils.files
 import salt.utils.network
@@ -196,6 +201,423 @@ def nodegroup_comp(nodegroup, nodegroups, skip=None, first_call=True):
         return ret
 
 
+def _minion_data_index_journal(opts):
+    """
+    Return the path of the journal used to propagate minion data cache
+    updates to every process holding a :py:class:`MinionDataIndex`
+    """
+    return os.path.join(
+        opts.get("cachedir", salt.syspaths.CACHE_DIR), "minion_data_index.journal"
+    )
+
+
+def minion_data_updated(opts, minion_id):
+    """
+    Record that the minion data cache entry of ``minion_id`` has been written
+    or removed. This needs to be called after the cache itself has been
+    updated, every :py:class:`MinionDataIndex` will then re-read the data of
+    the minion the next time it is queried.
+    """
+    if not (
+        opts.get("minion_data_index", False) or opts.get("compound_target_cache", False)
+    ):
+        return
+    journal = _minion_data_index_journal(opts)
+    try:
+        try:
+            if os.stat(journal).st_size >= MinionDataIndex.JOURNAL_MAX_SIZE:
+                # Readers notice the new file and rebuild their index
+                os.remove(journal)
+        except FileNotFoundError:
+            pass
+        with salt.utils.files.fopen(journal, "a") as fp_:
+            fp_.write(f"{minion_id}\n")
+    except OSError as exc:
+        log.error("Unable to update the minion data index journal: %s", exc)
+
+
+class MinionDataIndex:
+    """
+    In-memory inverted index of the grains and pillar stored in the minion
+    data cache.
+
+    The index groups minions by the value they hold for every top level grain
+    and pillar key, so grain and pillar targeting only needs to evaluate each
+    distinct value once instead of fetching the cached data of every minion.
+    Updates of the minion data cache are picked up through a journal of
+    minion ids appended by :py:func:`minion_data_updated`, the whole index is
+    rebuilt from the cache every ``minion_data_index_rebuild_interval``
+    seconds.
+    """
+
+    SEARCH_TYPES = ("grains", "pillar")
+    JOURNAL_MAX_SIZE = 8 * 1024 * 1024
+
+    # {<journal path>: MinionDataIndex}
+    instances = {}
+
+    def __init__(self, opts, cache=None):
+        self.opts = opts
+        self.cache = cache if cache is not None else salt.cache.factory(opts)
+        self.journal = _minion_data_index_journal(opts)
+        self.rebuild_interval = opts.get("minion_data_index_rebuild_interval", 3600)
+        self.built = None
+        self._lock = threading.RLock()
+        self._journal_id = None
+        self._journal_pos = 0
+        # {<minion id>: {<search type>: {<top key>: <fingerprint>}}}
+        self._minions = {}
+        # {<search type>: {<top key>: {<fingerprint>: [<value>, {<minion id>}]}}}
+        self._index = {search_type: {} for search_type in self.SEARCH_TYPES}
+
+    @classmethod
+    def instance(cls, opts, cache=None):
+        """
+        Return the index shared by the current process for the given opts
+        """
+        journal = _minion_data_index_journal(opts)
+        if journal not in cls.instances:
+            cls.instances[journal] = cls(opts, cache)
+        return cls.instances[journal]
+
+    @staticmethod
+    def _fingerprint(value):
+        try:
+            return salt.payload.dumps(value)
+        except Exception:  # pylint: disable=broad-except
+            return repr(value)
+
+    def _add(self, minion_id, mdata):
+        entry = {}
+        for search_type in self.SEARCH_TYPES:
+            data = mdata.get(search_type)
+            entry[search_type] = fingerprints = {}
+            if not isinstance(data, dict):
+                continue
+            index = self._index[search_type]
+            for key, value in data.items():
+                fingerprint = self._fingerprint(value)
+                fingerprints[key] = fingerprint
+                bucket = index.setdefault(key, {})
+                if fingerprint not in bucket:
+                    bucket[fingerprint] = [value, set()]
+                bucket[fingerprint][1].add(minion_id)
+        self._minions[minion_id] = entry
+
+    def _remove(self, minion_id):
+        entry = self._minions.pop(minion_id, None)
+        if entry is None:
+            return
+        for search_type, fingerprints in entry.items():
+            index = self._index[search_type]
+            for key, fingerprint in fingerprints.items():
+                bucket = index[key]
+                bucket[fingerprint][1].discard(minion_id)
+                if not bucket[fingerprint][1]:
+                    del bucket[fingerprint]
+                    if not bucket:
+                        del index[key]
+
+    def _update(self, minion_id):
+        bank = f"minions/{minion_id}"
+        try:
+            mdata = self.cache.fetch(bank, "data")
+            if not mdata and not self.cache.contains(bank):
+                mdata = None
+        except SaltCacheError:
+            mdata = None
+        self._remove(minion_id)
+        if mdata is not None:
+            self._add(minion_id, mdata)
+
+    def _stat_journal(self):
+        try:
+            stat = os.stat(self.journal)
+        except FileNotFoundError:
+            return None, 0
+        return (stat.st_dev, stat.st_ino), stat.st_size
+
+    def rebuild(self):
+        """
+        Rebuild the whole index from the minion data cache
+        """
+        with self._lock:
+            # Updates landing while the cache is scanned are replayed later on
+            self._journal_id, self._journal_pos = self._stat_journal()
+            self._minions = {}
+            self._index = {search_type: {} for search_type in self.SEARCH_TYPES}
+            cached = self.cache.list_with_data("minions", "data")
+            for minion_id, mdata in cached.items():
+                self._add(minion_id, mdata if isinstance(mdata, dict) else {})
+            self.built = time.time()
+            log.debug("Rebuilt minion data index of %d minions", len(self._minions))
+
+    def refresh(self):
+        """
+        Apply the minion data cache updates recorded in the journal since the
+        last refresh, rebuilding the index if needed
+        """
+        with self._lock:
+            if self.built is None or time.time() - self.built >= self.rebuild_interval:
+                self.rebuild()
+                return
+            try:
+                with salt.utils.files.fopen(self.journal, "rb") as fp_:
+                    stat = os.fstat(fp_.fileno())
+                    journal_id = (stat.st_dev, stat.st_ino)
+                    if self._journal_id is None:
+                        # The journal was created after the last rebuild
+                        self._journal_id, self._journal_pos = journal_id, 0
+                    elif (
+                        journal_id != self._journal_id
+                        or stat.st_size < self._journal_pos
+                    ):
+                        # The journal has been rotated, updates might be lost
+                        self.rebuild()
+                        return
+                    fp_.seek(self._journal_pos)
+                    chunk = fp_.read()
+            except FileNotFoundError:
+                if self._journal_id is not None:
+                    self.rebuild()
+                return
+            # Only consume complete lines, a writer could be mid-append
+            chunk = chunk[: chunk.rfind(b"\n") + 1]
+            self._journal_pos += len(chunk)
+            for minion_id in set(salt.utils.stringutils.to_unicode(chunk).split()):
+                self._update(minion_id)
+
+    def minions(self):
+        """
+        Return the set of minion ids holding data in the minion data cache
+        """
+        with self._lock:
+            self.refresh()
+            return set(self._minions)
+
+    def match(
+        self,
+        search_type,
+        expr,
+        delimiter=DEFAULT_TARGET_DELIM,
+        regex_match=False,
+        exact_match=False,
+    ):
+        """
+        Return the set of minion ids whose cached ``search_type`` data matches
+        ``expr`` the same way :py:func:`salt.utils.data.subdict_match` does, or
+        ``None`` if the expression cannot be answered from the index, like when
+        it targets every top level key or one of the keys holding the delimiter.
+        """
+        key = expr.split(delimiter, 1)[0]
+        if key == "*":
+            # Matches against every top level key, needs the full data
+            return None
+        with self._lock:
+            self.refresh()
+            index = self._index[search_type]
+            prefix = key + delimiter
+            if any(isinstance(name, str) and name.startswith(prefix) for name in index):
+                # The top level keys holding the delimiter are tried as well
+                return None
+            bucket = index.get(key)
+            if bucket is None:
+                # Mimic traverse_dict_and_list matching non-string keys
+                try:
+                    loaded_key = salt.utils.args.yamlify_arg(key)
+                    bucket = index.get(loaded_key) if loaded_key != key else None
+                except Exception:  # pylint: disable=broad-except
+                    bucket = None
+                if bucket is not None:
+                    key = loaded_key
+            matched = set()
+            for value, minion_ids in (bucket or {}).values():
+                if salt.utils.data.subdict_match(
+                    {key: value},
+                    expr,
+                    delimiter=delimiter,
+                    regex_match=regex_match,
+                    exact_match=exact_match,
+                ):
+                    matched.update(minion_ids)
+            return matched
+
+
+class CompoundTarget:
+    """
+    A compound target expression compiled into a reusable plan.
+
+    Compiling tokenizes the expression, expands the nodegroups it references
+    and turns it into a python set expression over one named set per target
+    term. Evaluating the plan only resolves the terms against the minions
+    currently known to the master and runs the precompiled set expression.
+    """
+
+    OPERS = ("and", "or", "not", "(", ")")
+
+    def __init__(self, expr, code, terms):
+        self.expr = expr
+        self.code = code
+        # [(<engine>, <pattern>, <delimiter>, <ignore missing>), ...]
+        self.terms = terms
+
+    @classmethod
+    def compile(cls, expr, nodegroups):
+        """
+        Compile ``expr``, returns ``None`` if the expression is invalid
+        """
+        results = []
+        unmatched = []
+        terms = []
+
+        if isinstance(expr, str):
+            words = expr.split()
+        else:
+            # we make a shallow copy in order to not affect the passed in arg
+            words = list(expr)
+
+        def add_term(engine, pattern, delimiter=None, ignore_missing=False):
+            results.append(f"_t{len(terms)}")
+            terms.append((engine, pattern, delimiter, ignore_missing))
+            if unmatched and unmatched[-1] == "-":
+                results.append(")")
+                unmatched.pop()
+
+        while words:
+            word = words.pop(0)
+            target_info = parse_target(word)
+
+            # Easy check first
+            if word in cls.OPERS:
+                if results:
+                    if results[-1] == "(" and word in ("and", "or"):
+                        log.error('Invalid beginning operator after "(": %s', word)
+                        return None
+                    if word == "not":
+                        if not results[-1] in ("&", "|", "("):
+                            results.append("&")
+                        results.append("(")
+                        results.append("_all")
+                        results.append("-")
+                        unmatched.append("-")
+                    elif word == "and":
+                        results.append("&")
+                    elif word == "or":
+                        results.append("|")
+                    elif word == "(":
+                        results.append(word)
+                        unmatched.append(word)
+                    elif word == ")":
+                        if not unmatched or unmatched[-1] != "(":
+                            log.error(
+                                "Invalid compound expr (unexpected "
+                                "right parenthesis): %s",
+                                expr,
+                            )
+                            return None
+                        results.append(word)
+                        unmatched.pop()
+                        if unmatched and unmatched[-1] == "-":
+                            results.append(")")
+                            unmatched.pop()
+                    else:  # Won't get here, unless oper is added
+                        log.error("Unhandled oper in compound expr: %s", expr)
+                        return None
+                else:
+                    # seq start with oper, fail
+                    if word == "not":
+                        results.append("(")
+                        results.append("_all")
+                        results.append("-")
+                        unmatched.append("-")
+                    elif word == "(":
+                        results.append(word)
+                        unmatched.append(word)
+                    else:
+                        log.error("Expression may begin with binary operator: %s", word)
+                        return None
+
+            elif target_info and target_info["engine"]:
+                if "N" == target_info["engine"]:
+                    # if we encounter a node group, just evaluate it in-place
+                    decomposed = nodegroup_comp(target_info["pattern"], nodegroups)
+                    if decomposed:
+                        words = decomposed + words
+                    continue
+
+                delimiter = None
+                if target_info["engine"] in ("G", "P", "I", "J"):
+                    delimiter = target_info["delimiter"] or ":"
+                # ignore missing minions for lists if we exclude them with
+                # a 'not'
+                add_term(
+                    target_info["engine"],
+                    target_info["pattern"],
+                    delimiter,
+                    bool(results and results[-1] == "-"),
+                )
+
+            else:
+                # The match is not explicitly defined, evaluate as a glob
+                add_term(None, word)
+
+        # Add a closing ')' for each item left in unmatched
+        results.extend([")" for item in unmatched])
+
+        results = " ".join(results)
+        log.debug("Compiled compound matching expr %s: %s", expr, results)
+        try:
+            code = compile(results, "<compound target>", "eval")
+        except SyntaxError:
+            log.error("Invalid compound target: %s", expr)
+            return None
+        return cls(expr, code, terms)
+
+    def evaluate(self, ckminions, greedy, pillar_exact=False):
+        """
+        Return the minions matched by the compiled expression
+        """
+        ref = {
+            "G": ckminions._check_grain_minions,
+            "P": ckminions._check_grain_pcre_minions,
+            "I": ckminions._check_pillar_minions,
+            "J": ckminions._check_pillar_pcre_minions,
+            "L": ckminions._check_list_minions,
+            "S": ckminions._check_ipcidr_minions,
+            "E": ckminions._check_pcre_minions,
+            "R": ckminions._all_minions,
+        }
+        if pillar_exact:
+            ref["I"] = ckminions._check_pillar_exact_minions
+            ref["J"] = ckminions._check_pillar_exact_minions
+
+        minions = set(ckminions._pki_minions())
+        log.debug("minions: %s", minions)
+        namespace = {"_all": minions}
+        missing = []
+        for idx, (engine, pattern, delimiter, ignore_missing) in enumerate(self.terms):
+            if engine is None:
+                _results = ckminions._check_glob_minions(pattern, True)
+            else:
+                engine_args = [pattern]
+                if delimiter is not None:
+                    engine_args.append(delimiter)
+                engine_args.append(greedy)
+                if engine == "L":
+                    engine_args.append(ignore_missing)
+                _results = ref[engine](*engine_args)
+                missing.extend(_results["missing"])
+            namespace[f"_t{idx}"] = set(_results["minions"])
+
+        try:
+            # pylint: disable=eval-used
+            minions = list(eval(self.code, {"__builtins__": {}}, namespace))
+            return {"minions": minions, "missing": missing}
+        except Exception:  # pylint: disable=broad-except
+            log.error("Invalid compound target: %s", self.expr)
+            return {"minions": [], "missing": []}
+
+
 class CkMinions:
     """
     Used to check what minions should respond from a target
@@ -206,9 +628,17 @@ class CkMinions:
     class.
     """
 
+    COMPOUND_CACHE_SIZE = 256
+
     def __init__(self, opts):
         self.opts = opts
         self.cache = salt.cache.factory(opts)
+        # {<expr>: CompoundTarget}
+        self._compound_plans = {}
+        # {(<expr>, <greedy>, <pillar_exact>): (<generation>, <minions>, <missing>)}
+        self._compound_results = OrderedDict()
+        # (<accepted keys dir generation>, <minion ids>)
+        self._pki_listing = None
         # TODO: this is actually an *auth* check
         if self.opts.get("transport", "zeromq") in salt.transport.TRANSPORTS:
             self.acc = "minions"
@@ -274,11 +704,18 @@ class CkMinions:
                 with salt.utils.files.fopen(pki_cache_fn, mode="rb") as fn_:
                     return salt.payload.load(fn_)
             else:
-                for fn_ in salt.utils.data.sorted_ignorecase(
-                    os.listdir(os.path.join(self.pki_dir, self.acc))
-                ):
+                accepted = os.path.join(self.pki_dir, self.acc)
+                stat = os.stat(accepted)
+                generation = (stat.st_ino, stat.st_mtime_ns)
+                if self._pki_listing and self._pki_listing[0] == generation:
+                    return list(self._pki_listing[1])
+                for fn_ in salt.utils.data.sorted_ignorecase(os.listdir(accepted)):
                     if not fn_.startswith("."):
                         minions.append(fn_)
+                if time.time() - stat.st_mtime >= 1:
+                    # Only reuse listings which cannot miss a change made in
+                    # the same timestamp tick
+                    self._pki_listing = (generation, tuple(minions))
             return minions
         except OSError as exc:
             log.error(
@@ -297,9 +734,6 @@ class CkMinions:
         """
         cache_enabled = self.opts.get("minion_data_cache", False)
 
-        def list_cached_minions():
-            return self.cache.list("minions")
-
         if greedy:
             minions = []
             for fn_ in salt.utils.data.sorted_ignorecase(
@@ -307,23 +741,46 @@ class CkMinions:
             ):
                 if not fn_.startswith("."):
                     minions.append(fn_)
-        elif cache_enabled:
-            minions = list_cached_minions()
-        else:
+        elif not cache_enabled:
             return {"minions": [], "missing": []}
 
+        if cache_enabled and self.opts.get("minion_data_index", False):
+            index = MinionDataIndex.instance(self.opts, self.cache)
+            matched = index.match(
+                search_type,
+                expr,
+                delimiter=delimiter,
+                regex_match=regex_match,
+                exact_match=exact_match,
+            )
+            if matched is not None:
+                if not greedy:
+                    return {"minions": list(matched), "missing": []}
+                cminions = index.minions()
+                return {
+                    "minions": [
+                        id_ for id_ in minions if id_ in matched or id_ not in cminions
+                    ],
+                    "missing": [],
+                }
+
         if cache_enabled:
             if greedy:
-                cminions = list_cached_minions()
+                cminions = self.cache.list("minions")
+                if not cminions:
+                    return {"minions": minions, "missing": []}
+                minions = set(minions)
+                cminions = [id_ for id_ in cminions if id_ in minions]
+                cached = self.cache.fetch_many(
+                    (f"minions/{id_}", "data") for id_ in cminions
+                )
+                cached = {id_: cached[(f"minions/{id_}", "data")] for id_ in cminions}
             else:
-                cminions = minions
-            if not cminions:
-                return {"minions": minions, "missing": []}
-            minions = set(minions)
-            for id_ in cminions:
-                if greedy and id_ not in minions:
-                    continue
-                mdata = self.cache.fetch(f"minions/{id_}", "data")
+                cached = self.cache.list_with_data("minions", "data")
+                if not cached:
+                    return {"minions": [], "missing": []}
+                minions = set(cached)
+            for id_, mdata in cached.items():
                 if mdata is None:
                     if not greedy:
                         minions.remove(id_)
@@ -476,150 +933,84 @@ class CkMinions:
         if not isinstance(expr, str) and not isinstance(expr, (list, tuple)):
             log.error("Compound target that is neither string, list nor tuple")
             return {"minions": [], "missing": []}
-        minions = set(self._pki_minions())
-        log.debug("minions: %s", minions)
 
-        nodegroups = self.opts.get("nodegroups", {})
-
-        if self.opts.get("minion_data_cache", False):
-            ref = {
-                "G": self._check_grain_minions,
-                "P": self._check_grain_pcre_minions,
-                "I": self._check_pillar_minions,
-                "J": self._check_pillar_pcre_minions,
-                "L": self._check_list_minions,
-                "N": None,  # nodegroups should already be expanded
-                "S": self._check_ipcidr_minions,
-                "E": self._check_pcre_minions,
-                "R": self._all_minions,
-            }
-            if pillar_exact:
-                ref["I"] = self._check_pillar_exact_minions
-                ref["J"] = self._check_pillar_exact_minions
-
-            results = []
-            unmatched = []
-            opers = ["and", "or", "not", "(", ")"]
-            missing = []
-
-            if isinstance(expr, str):
-                words = expr.split()
-            else:
-                # we make a shallow copy in order to not affect the passed in arg
-                words = expr[:]
-
-            while words:
-                word = words.pop(0)
-                target_info = parse_target(word)
-
-                # Easy check first
-                if word in opers:
-                    if results:
-                        if results[-1] == "(" and word in ("and", "or"):
-                            log.error('Invalid beginning operator after "(": %s', word)
-                            return {"minions": [], "missing": []}
-                        if word == "not":
-                            if not results[-1] in ("&", "|", "("):
-                                results.append("&")
-                            results.append("(")
-                            results.append(str(set(minions)))
-                            results.append("-")
-                            unmatched.append("-")
-                        elif word == "and":
-                            results.append("&")
-                        elif word == "or":
-                            results.append("|")
-                        elif word == "(":
-                            results.append(word)
-                            unmatched.append(word)
-                        elif word == ")":
-                            if not unmatched or unmatched[-1] != "(":
-                                log.error(
-                                    "Invalid compound expr (unexpected "
-                                    "right parenthesis): %s",
-                                    expr,
-                                )
-                                return {"minions": [], "missing": []}
-                            results.append(word)
-                            unmatched.pop()
-                            if unmatched and unmatched[-1] == "-":
-                                results.append(")")
-                                unmatched.pop()
-                        else:  # Won't get here, unless oper is added
-                            log.error("Unhandled oper in compound expr: %s", expr)
-                            return {"minions": [], "missing": []}
-                    else:
-                        # seq start with oper, fail
-                        if word == "not":
-                            results.append("(")
-                            results.append(str(set(minions)))
-                            results.append("-")
-                            unmatched.append("-")
-                        elif word == "(":
-                            results.append(word)
-                            unmatched.append(word)
-                        else:
-                            log.error(
-                                "Expression may begin with binary operator: %s", word
-                            )
-                            return {"minions": [], "missing": []}
-
-                elif target_info and target_info["engine"]:
-                    if "N" == target_info["engine"]:
-                        # if we encounter a node group, just evaluate it in-place
-                        decomposed = nodegroup_comp(target_info["pattern"], nodegroups)
-                        if decomposed:
-                            words = decomposed + words
-                        continue
-
-                    engine = ref.get(target_info["engine"])
-                    if not engine:
-                        # If an unknown engine is called at any time, fail out
-                        log.error(
-                            'Unrecognized target engine "%s" for'
-                            ' target expression "%s"',
-                            target_info["engine"],
-                            word,
-                        )
-                        return {"minions": [], "missing": []}
-
-                    engine_args = [target_info["pattern"]]
-                    if target_info["engine"] in ("G", "P", "I", "J"):
-                        engine_args.append(target_info["delimiter"] or ":")
-                    engine_args.append(greedy)
-
-                    # ignore missing minions for lists if we exclude them with
-                    # a 'not'
-                    if "L" == target_info["engine"]:
-                        engine_args.append(results and results[-1] == "-")
-                    _results = engine(*engine_args)
-                    results.append(str(set(_results["minions"])))
-                    missing.extend(_results["missing"])
-                    if unmatched and unmatched[-1] == "-":
-                        results.append(")")
-                        unmatched.pop()
+        if not self.opts.get("minion_data_cache", False):
+            return {"minions": list(self._pki_minions()), "missing": []}
+
+        expr_key = expr if isinstance(expr, str) else tuple(expr)
+        memo_key = (expr_key, bool(greedy), bool(pillar_exact))
+        use_memo = self.opts.get("compound_target_cache", False)
+        if use_memo:
+            generation = self._compound_generation()
+            cached = self._compound_results.get(memo_key)
+            if (
+                generation is not None
+                and cached is not None
+                and cached[0] == generation
+            ):
+                log.debug("Returning memoized compound target result for %s", expr)
+                self._compound_results.move_to_end(memo_key)
+                return {"minions": list(cached[1]), "missing": list(cached[2])}
 
-                else:
-                    # The match is not explicitly defined, evaluate as a glob
-                    _results = self._check_glob_minions(word, True)
-                    results.append(str(set(_results["minions"])))
-                    if unmatched and unmatched[-1] == "-":
-                        results.append(")")
-                        unmatched.pop()
+        plan = self._compile_compound(expr_key)
+        if plan is None:
+            return {"minions": [], "missing": []}
+        ret = plan.evaluate(self, greedy, pillar_exact=pillar_exact)
 
-            # Add a closing ')' for each item left in unmatched
-            results.extend([")" for item in unmatched])
+        if use_memo and generation is not None:
+            self._compound_results[memo_key] = (
+                generation,
+                tuple(ret["minions"]),
+                tuple(ret["missing"]),
+            )
+            self._compound_results.move_to_end(memo_key)
+            while len(self._compound_results) > self.COMPOUND_CACHE_SIZE:
+                self._compound_results.popitem(last=False)
+        return ret
 
-            results = " ".join(results)
-            log.debug("Evaluating final compound matching expr: %s", results)
+    def _compound_generation(self):
+        """
+        Return a token which changes whenever the accepted minion keys or the
+        minion data cache change, or ``None`` if it cannot be relied upon.
+        """
+        paths = [os.path.join(self.pki_dir, self.acc)]
+        if self.opts.get("key_cache"):
+            paths.append(os.path.join(self.pki_dir, self.acc, ".key_cache"))
+        generation = []
+        now = time.time()
+        for path in paths:
             try:
-                minions = list(eval(results))  # pylint: disable=W0123
-                return {"minions": minions, "missing": missing}
-            except Exception:  # pylint: disable=broad-except
-                log.error("Invalid compound target: %s", expr)
-                return {"minions": [], "missing": []}
+                stat = os.stat(path)
+            except OSError:
+                generation.append(None)
+                continue
+            if now - stat.st_mtime < 1:
+                # A change in the same timestamp tick would go unnoticed
+                return None
+            generation.append((stat.st_ino, stat.st_mtime_ns))
+        try:
+            # The journal is only ever appended to or replaced
+            stat = os.stat(_minion_data_index_journal(self.opts))
+            generation.append((stat.st_ino, stat.st_size))
+        except OSError:
+            generation.append(None)
+        return tuple(generation)
 
-        return {"minions": list(minions), "missing": []}
+    def _compile_compound(self, expr):
+        """
+        Return the compiled :py:class:`CompoundTarget` of a compound target
+        expression, or ``None`` if the expression is invalid. Compiled
+        expressions are kept for the lifetime of this object.
+        """
+        try:
+            return self._compound_plans[expr]
+        except KeyError:
+            pass
+        plan = CompoundTarget.compile(expr, self.opts.get("nodegroups", {}))
+        if len(self._compound_plans) >= self.COMPOUND_CACHE_SIZE:
+            self._compound_plans.clear()
+        self._compound_plans[expr] = plan
+        return plan
 
     def connected_ids(self, subset=None, show_ip=False):
         """
@@ -501,6 +501,8 @@ class ProcessManager:
             self.name = self.__class__.__name__
 
         self.wait_for_kill = wait_for_kill
+        # seconds between two checks of the children in run()
+        self.check_interval = 10
 
         # store some pointers for the SIGTERM handler
         self._pid = os.getpid()
@@ -575,6 +577,13 @@ class ProcessManager:
     def stop_restarting(self):
         self._restart_processes = False
 
+    def retire_process(self, pid):
+        """
+        Stop restarting the given process, it is removed from the process map
+        once it exits by itself
+        """
+        self._process_map[pid]["retired"] = True
+
     def send_signal_to_processes(self, signal_):
         if salt.utils.platform.is_windows() and signal_ in (
             signal.SIGTERM,
@@ -628,9 +637,9 @@ class ProcessManager:
                 # because os.wait() conflicts with the subprocesses management logic
                 # implemented in `multiprocessing` package. See #35480 for details.
                 if asynchronous:
-                    yield gen.sleep(10)
+                    yield gen.sleep(self.check_interval)
                 else:
-                    time.sleep(10)
+                    time.sleep(self.check_interval)
                 if not self._process_map:
                     break
             # OSError is raised if a signal handler is called (SIGTERM) during os.wait
@@ -650,6 +659,11 @@ class ProcessManager:
         if self._restart_processes is True:
             for pid, mapping in self._process_map.copy().items():
                 if not mapping["Process"].is_alive():
+                    if mapping.get("retired"):
+                        log.debug("Retired process %s exited", pid)
+                        mapping["Process"].join(0)
+                        del self._process_map[pid]
+                        continue
                     log.trace("Process restart of %s", pid)
                     self.restart_process(pid)
 
@@ -0,0 +1,213 @@
+"""
+Requisite graph of the low chunks of a state run.
+
+Resolving the requisites of every low chunk by scanning all the chunks makes
+the state runs with thousands of states and many requisites quadratic.
+:py:class:`RequisiteGraph` indexes the chunks once by ID, name and SLS, so that
+the requisites are looked up instead, and finds the requisite cycles before any
+state is run. The concurrent state runs, see ``state_concurrency``, use it to
+tell which states have to wait for each other.
+
+.. versionadded:: 3008.0
+"""
+
+import fnmatch
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+GLOB_CHARS = ("*", "?", "[")
+
+# The requisites whose targets must all run before the state. The ``_any``
+# and ``onfail`` requisites are left out, the state may still run if one of
+# their targets is part of a cycle.
+CYCLE_REQUISITES = ("require", "watch", "onchanges", "onfail_all")
+
+# The requisites whose targets are checked before running the state
+RUN_REQUISITES = (
+    "require",
+    "require_any",
+    "watch",
+    "watch_any",
+    "prereq",
+    "prerequired",
+    "onfail",
+    "onfail_any",
+    "onfail_all",
+    "onchanges",
+    "onchanges_any",
+)
+
+# The orders given to the states without one by ``state_auto_order`` start at
+# AUTO_ORDER_START, ``last`` and the negative orders are above AUTO_ORDER_END
+AUTO_ORDER_START = 10000
+AUTO_ORDER_END = 1000000
+
+
+def _is_glob(value):
+    return any(char in value for char in GLOB_CHARS)
+
+
+def is_order_barrier(chunk, auto_order=True):
+    """
+    Return True if the states of a lower order must have run before the given
+    chunk, and the chunk must have run before the states of a higher order.
+
+    With ``state_auto_order``, only the orders which were not given
+    automatically are barriers: ``first``, ``last`` and the explicit orders
+    below the automatic ones.
+    """
+    order = chunk.get("order")
+    if not isinstance(order, (int, float)):
+        return False
+    if not auto_order:
+        return True
+    return order < AUTO_ORDER_START or order >= AUTO_ORDER_END
+
+
+class RequisiteGraph:
+    """
+    The requisites of a list of low chunks.
+
+    The chunks are indexed by the normalized case of their ``__id__``, ``name``
+    and ``__sls__``, the way ``fnmatch`` compares them, and by the SLS files
+    including them. The targets of a requisite are returned in the order of
+    the chunks, like a scan of the chunks would.
+    """
+
+    def __init__(self, chunks, disabled_requisites=()):
+        self.chunks = chunks
+        self.disabled_requisites = set(disabled_requisites or ())
+        self.positions = {}
+        self.ids = {}
+        self.names = {}
+        self.sls = {}
+        self.included_from = {}
+        self._found = {}
+        for pos, chunk in enumerate(chunks):
+            self.positions[id(chunk)] = pos
+            for index, key in ((self.ids, "__id__"), (self.names, "name")):
+                index.setdefault(os.path.normcase(chunk[key]), []).append(chunk)
+            self.sls.setdefault(os.path.normcase(chunk["__sls__"]), []).append(chunk)
+            for sls in chunk.get("__sls_included_from__", ()):
+                self.included_from.setdefault(sls, []).append(chunk)
+
+    @classmethod
+    def build(cls, chunks, disabled_requisites=()):
+        """
+        Return the graph of the given chunks, or None if they can not be
+        indexed, for instance when their ID or name is not a string
+        """
+        try:
+            return cls(chunks, disabled_requisites)
+        except (KeyError, TypeError, AttributeError) as exc:
+            log.debug("Unable to index the requisites of the chunks: %s", exc)
+            return None
+
+    def _sorted(self, found):
+        unique = {id(chunk): chunk for chunk in found}
+        return [unique[key] for key in sorted(unique, key=self.positions.__getitem__)]
+
+    def _match(self, index, pattern):
+        if not _is_glob(pattern):
+            return index.get(os.path.normcase(pattern), [])
+        found = []
+        for key, chunks in index.items():
+            if fnmatch.fnmatch(key, pattern):
+                found.extend(chunks)
+        return found
+
+    def find(self, req_key, req_val):
+        """
+        Return the chunks targeted by a requisite, or None if the requisite can
+        not be looked up in the graph
+        """
+        if not isinstance(req_val, str):
+            return None
+        try:
+            return self._found[(req_key, req_val)]
+        except KeyError:
+            pass
+        if req_key == "sls":
+            found = self._match(self.sls, req_val) + self.included_from.get(req_val, [])
+        else:
+            found = self._match(self.names, req_val) + self._match(self.ids, req_val)
+            if req_key != "id":
+                found = [chunk for chunk in found if chunk["state"] == req_key]
+        found = self._found[(req_key, req_val)] = self._sorted(found)
+        return found
+
+    def requisites(self, chunk, keys=CYCLE_REQUISITES):
+        """
+        Return the chunks targeted by the given requisites of a chunk
+        """
+        found = []
+        for key in keys:
+            if key in self.disabled_requisites:
+                continue
+            for req in chunk.get(key) or ():
+                if isinstance(req, str):
+                    req = {"id": req}
+                if not isinstance(req, dict) or not req:
+                    continue
+                req_key = next(iter(req)).split(".")[0]
+                targets = self.find(req_key, req[next(iter(req))])
+                if targets:
+                    found.extend(targets)
+        return found
+
+    def cycles(self):
+        """
+        Return the requisite cycles, as lists of chunks, found with an
+        iterative version of Tarjan's strongly connected components algorithm
+        """
+        edges = [
+            [self.positions[id(target)] for target in self.requisites(chunk)]
+            for chunk in self.chunks
+        ]
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        cycles = []
+        counter = 0
+        for root in range(len(self.chunks)):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge = work.pop()
+                if edge == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack.add(node)
+                recurse = False
+                for pos in range(edge, len(edges[node])):
+                    target = edges[node][pos]
+                    if target not in index:
+                        work.append((node, pos + 1))
+                        work.append((target, 0))
+                        recurse = True
+                        break
+                    if target in on_stack:
+                        lowlink[node] = min(lowlink[node], index[target])
+                if recurse:
+                    continue
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in edges[node]:
+                        cycles.append(
+                            [self.chunks[member] for member in sorted(component)]
+                        )
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+        return cycles
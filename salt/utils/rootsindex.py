@@ -0,0 +1,618 @@
+"""
+Incremental index of the files served by the ``roots`` fileserver backend.
+
+Without the index, the file lists of the ``roots`` backend are rebuilt by
+walking all the ``file_roots`` whenever their cache, see
+:conf_master:`fileserver_list_cache_time`, expires, and the mtime map of
+``roots.update`` walks them again. With :conf_master:`fileserver_roots_index`
+the ``FileserverUpdate`` process walks them once, then keeps the file lists
+current: on Linux with ``pyinotify`` only the directories in which something
+changed are listed again, elsewhere, or when the changes can not be watched,
+the roots are scanned every :conf_master:`fileserver_list_cache_time` seconds.
+
+The file lists are written to the file list cache as they change, and the
+index touches a heartbeat file while it runs. The MWorkers serve the file lists
+from memory, and load them again only when the cache file was written, for as
+long as the heartbeat is fresh.
+
+.. versionadded:: 3008.0
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import salt.fileserver
+import salt.payload
+import salt.utils.atomicfile
+import salt.utils.data
+import salt.utils.files
+import salt.utils.path
+import salt.utils.platform
+
+try:
+    import pyinotify
+
+    HAS_PYINOTIFY = True
+    WATCH_MASK = (
+        pyinotify.IN_CREATE
+        | pyinotify.IN_DELETE
+        | pyinotify.IN_MOVED_FROM
+        | pyinotify.IN_MOVED_TO
+        | pyinotify.IN_MODIFY
+        | pyinotify.IN_CLOSE_WRITE
+        | pyinotify.IN_ATTRIB
+        | pyinotify.IN_DELETE_SELF
+        | pyinotify.IN_MOVE_SELF
+        | pyinotify.IN_ONLYDIR
+    )
+    # The events which add or remove an entry of the watched directory
+    ENTRY_MASK = (
+        pyinotify.IN_CREATE
+        | pyinotify.IN_DELETE
+        | pyinotify.IN_MOVED_FROM
+        | pyinotify.IN_MOVED_TO
+    )
+    SELF_MASK = pyinotify.IN_DELETE_SELF | pyinotify.IN_MOVE_SELF
+except ImportError:
+    HAS_PYINOTIFY = False
+
+log = logging.getLogger(__name__)
+
+# The heartbeat is touched every HEARTBEAT_INTERVAL seconds, the file lists
+# are not trusted once it is older than HEARTBEAT_TTL seconds
+HEARTBEAT = ".roots_index"
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TTL = 30
+
+# The changes are applied once no event was received for SETTLE_TIME seconds,
+# or at the latest after MAX_SETTLE_TIME seconds
+SETTLE_TIME = 0.2
+MAX_SETTLE_TIME = 2
+
+_INDEXES = {}
+
+# The file lists loaded by this process, by cache file
+_FILE_LISTS = {}
+
+
+def _translate_sep(path):
+    """
+    Translate path separators for Windows masterless minions
+    """
+    return path.replace("\\", "/") if os.path.sep == "\\" else path
+
+
+def _list_entries(path):
+    """
+    Return the names of the directories and of the other entries of a
+    directory, the way ``os.walk`` splits them
+    """
+    dirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            (dirs if is_dir else files).append(entry.name)
+    return dirs, files
+
+
+def list_item(opts, fs_root, parent_dir, item):
+    """
+    Return how an item of a directory of the given root is listed by the
+    ``roots`` backend: a tuple of its relative path, whether it is an empty
+    directory and its symlink destination, if it is listed as a symlink. None
+    is returned if the item is not listed.
+    """
+    abs_path = os.path.join(parent_dir, item)
+    log.trace("roots: Processing %s", abs_path)
+    is_link = salt.utils.path.islink(abs_path)
+    log.trace("roots: %s is %sa link", abs_path, "not " if not is_link else "")
+    if is_link and opts["fileserver_ignoresymlinks"]:
+        return None
+    rel_path = _translate_sep(os.path.relpath(abs_path, fs_root))
+    log.trace("roots: %s relative path is %s", abs_path, rel_path)
+    if salt.fileserver.is_file_ignored(opts, rel_path):
+        return None
+    empty = False
+    if os.path.isdir(abs_path):
+        try:
+            empty = not os.listdir(abs_path)
+        except OSError:
+            log.debug("Unable to list dir: %s", abs_path)
+    link_dest = None
+    if is_link:
+        link_dest = salt.utils.path.readlink(abs_path)
+        log.trace("roots: %s symlink destination is %s", abs_path, link_dest)
+        if salt.utils.platform.is_windows() and link_dest.startswith("\\\\"):
+            # Symlink points to a network path. Since you can't join UNC and
+            # non-UNC paths, just assume the original path.
+            log.trace("roots: %s is a UNC path, using %s instead", link_dest, abs_path)
+            link_dest = abs_path
+        if link_dest.startswith(".."):
+            joined = os.path.join(abs_path, link_dest)
+        else:
+            joined = os.path.join(os.path.dirname(abs_path), link_dest)
+        rel_dest = _translate_sep(
+            os.path.relpath(
+                os.path.realpath(os.path.normpath(joined)),
+                os.path.realpath(fs_root),
+            )
+        )
+        log.trace("roots: %s relative path is %s", abs_path, rel_dest)
+        # Only count the link if it does not point outside of the root dir of
+        # the fileserver, unless the symlinks are not followed
+        if rel_dest.startswith("..") and opts["fileserver_followsymlinks"]:
+            link_dest = None
+    return rel_path, empty, link_dest
+
+
+def _list_cachedir(opts):
+    return os.path.join(opts["cachedir"], "file_lists", "roots")
+
+
+def _list_cache(list_cachedir, saltenv):
+    return os.path.join(
+        list_cachedir, f"{salt.utils.files.safe_filename_leaf(saltenv)}.p"
+    )
+
+
+def list_cache_path(opts, saltenv):
+    """
+    Return the path of the file list cache of a saltenv
+    """
+    return _list_cache(_list_cachedir(opts), saltenv)
+
+
+def get_file_lists(opts, saltenv):
+    """
+    Return the file lists of a saltenv kept by the index, or None if the index
+    is not running or has not written them
+    """
+    list_cache = list_cache_path(opts, saltenv)
+    try:
+        heartbeat = os.stat(os.path.join(_list_cachedir(opts), HEARTBEAT))
+        if not 0 <= time.time() - heartbeat.st_mtime < HEARTBEAT_TTL:
+            return None
+        cache_stat = os.stat(list_cache)
+    except OSError:
+        return None
+    key = (cache_stat.st_mtime_ns, cache_stat.st_size, cache_stat.st_ino)
+    cached = _FILE_LISTS.get(list_cache)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    try:
+        with salt.utils.files.fopen(list_cache, "rb") as fp_:
+            file_lists = salt.utils.data.decode(salt.payload.load(fp_))
+    except Exception as exc:  # pylint: disable=broad-except
+        log.debug("Unable to load the file lists from %s: %s", list_cache, exc)
+        return None
+    _FILE_LISTS[list_cache] = (key, file_lists)
+    return file_lists
+
+
+def get_index(opts):
+    """
+    Return the running index of the ``file_roots``, starting it if needed, or
+    None if :conf_master:`fileserver_roots_index` is disabled
+    """
+    if not opts.get("fileserver_roots_index", False):
+        return None
+    index = _INDEXES.get(opts["cachedir"])
+    if index is None:
+        index = _INDEXES[opts["cachedir"]] = RootsIndex(opts)
+    if not index.is_alive():
+        index.start()
+    return index
+
+
+class RootsIndex:
+    """
+    The entries of the ``file_roots`` of the static saltenvs, kept current by
+    a thread.
+
+    Each root is indexed by relative directory, with the entries listed by the
+    ``roots`` backend in each directory and the subdirectories walked into.
+    The entries are tuples of whether they are a directory, whether they are an
+    empty directory, their symlink destination and, for the files, their
+    mtime.
+    """
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.saltenvs = {
+            saltenv: list(paths)
+            for saltenv, paths in opts["file_roots"].items()
+            if saltenv != "__env__"
+        }
+        self.tree = {path: {} for paths in self.saltenvs.values() for path in paths}
+        self.cachedir = _list_cachedir(opts)
+        self.heartbeat = os.path.join(self.cachedir, HEARTBEAT)
+        self.followlinks = opts["fileserver_followsymlinks"]
+        self.rescan_interval = opts.get("fileserver_roots_index_rescan", 3600)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._written = {}
+        self._pending = {}
+        self._overflow = False
+        self._watches = None
+        self._notifier = None
+        self._dir_wd = {}
+        self._wd_dirs = {}
+
+    @property
+    def watching(self):
+        """
+        True if the changes of the roots are watched
+        """
+        return self._notifier is not None
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Scan the roots, write the file lists and start the thread keeping them
+        current
+        """
+        self._stop.clear()
+        self._stop_watching()
+        if HAS_PYINOTIFY and salt.utils.platform.is_linux():
+            self._watches = pyinotify.WatchManager()
+            self._notifier = pyinotify.Notifier(self._watches, self._queue_event)
+        else:
+            log.info(
+                "pyinotify is not available, the file_roots are scanned every %s "
+                "seconds",
+                self.opts.get("fileserver_list_cache_time", 20),
+            )
+        self.rescan()
+        self._thread = threading.Thread(
+            target=self._run, name="RootsIndex", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the thread and the watches
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop_watching()
+
+    def _stop_watching(self):
+        if self._notifier is not None:
+            self._notifier.stop()
+        self._notifier = self._watches = None
+        self._dir_wd = {}
+        self._wd_dirs = {}
+        self._pending = {}
+
+    def _run(self):
+        last_heartbeat = 0
+        last_rescan = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self.watching:
+                    if self._wait_events(1000):
+                        self._apply_events()
+                    interval = self.rescan_interval
+                else:
+                    self._stop.wait(1)
+                    interval = self.opts.get("fileserver_list_cache_time", 20)
+                now = time.monotonic()
+                if now - last_rescan >= interval:
+                    last_rescan = now
+                    self.rescan()
+                else:
+                    self._check_roots()
+                if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    last_heartbeat = now
+                    self.write_file_lists(roots=())
+                    self._touch_heartbeat()
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Error while updating the file_roots index")
+                self._stop.wait(1)
+                last_rescan = 0
+
+    def _wait_events(self, timeout):
+        """
+        Wait up to timeout milliseconds for events, then read them until they
+        settle
+        """
+        if not self._notifier.check_events(timeout):
+            return False
+        start = time.monotonic()
+        while True:
+            self._notifier.read_events()
+            self._notifier.process_events()
+            if time.monotonic() - start >= MAX_SETTLE_TIME:
+                break
+            if not self._notifier.check_events(int(SETTLE_TIME * 1000)):
+                break
+        return True
+
+    def _queue_event(self, event):
+        """
+        Record the directories of the roots changed by an event
+        """
+        if event.mask & pyinotify.IN_Q_OVERFLOW:
+            self._overflow = True
+            return
+        keys = self._wd_dirs.get(event.wd)
+        if not keys:
+            return
+        if event.mask & pyinotify.IN_IGNORED:
+            # The directory is gone, and so is its watch
+            for key in self._wd_dirs.pop(event.wd):
+                self._dir_wd.pop(key, None)
+            return
+        for key in keys:
+            if event.mask & SELF_MASK:
+                # The event of the parent directory is enough, but the roots
+                # have no parent
+                if not key[1]:
+                    self._pending.setdefault(key, set())
+                continue
+            names = self._pending.setdefault(key, set())
+            if event.mask & ENTRY_MASK and event.name:
+                names.add(event.name)
+
+    def _apply_events(self):
+        if self._overflow:
+            log.warning("Missed the changes of the file_roots, scanning them")
+            self._overflow = False
+            self._pending = {}
+            self.rescan()
+            return
+        pending, self._pending = self._pending, {}
+        with self._lock:
+            for (root, rel_dir), names in pending.items():
+                self._rescan_dir(root, rel_dir, names)
+        self.write_file_lists(roots={root for root, _ in pending})
+
+    def _abs_path(self, root, rel_dir):
+        return os.path.join(root, rel_dir) if rel_dir else root
+
+    def _watch(self, root, rel_dir, abs_dir):
+        if not self.watching or (root, rel_dir) in self._dir_wd:
+            return
+        path = os.path.realpath(abs_dir)
+        wd = self._watches.add_watch(path, WATCH_MASK).get(path, -1)
+        if wd < 0:
+            log.warning(
+                "Unable to watch %s, the file_roots are scanned every %s seconds "
+                "instead. The fs.inotify.max_user_watches sysctl may need to be "
+                "raised.",
+                path,
+                self.opts.get("fileserver_list_cache_time", 20),
+            )
+            self._stop_watching()
+            return
+        self._dir_wd[(root, rel_dir)] = wd
+        self._wd_dirs.setdefault(wd, set()).add((root, rel_dir))
+
+    def _unwatch(self, root, rel_dir):
+        wd = self._dir_wd.pop((root, rel_dir), None)
+        if wd is None:
+            return
+        keys = self._wd_dirs.get(wd, set())
+        keys.discard((root, rel_dir))
+        if not keys:
+            self._wd_dirs.pop(wd, None)
+            self._watches.rm_watch(wd)
+
+    def _list_dir(self, root, abs_dir, dirs, files):
+        """
+        Return the index of a directory listed by ``os.walk``
+        """
+        entries = {}
+        for names, is_dir in ((dirs, True), (files, False)):
+            for name in names:
+                listed = list_item(self.opts, root, abs_dir, name)
+                if listed is None:
+                    continue
+                mtime = None
+                if not is_dir:
+                    try:
+                        mtime = os.path.getmtime(os.path.join(abs_dir, name))
+                    except OSError:
+                        # Dangling symlink
+                        pass
+                entries[name] = (is_dir, listed[1], listed[2], mtime)
+        if self.followlinks:
+            subdirs = set(dirs)
+        else:
+            subdirs = {
+                name
+                for name in dirs
+                if not salt.utils.path.islink(os.path.join(abs_dir, name))
+            }
+        return {
+            "entries": entries,
+            "subdirs": subdirs,
+            "empty": not dirs and not files,
+            "linked": False,
+        }
+
+    def _scan(self, root, rel_top, tree):
+        """
+        Walk a directory of a root into the given tree, like ``os.walk`` does.
+        The directories are watched before they are listed, so that no change
+        is missed.
+        """
+        stack = [rel_top]
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = self._abs_path(root, rel_dir)
+            self._watch(root, rel_dir, abs_dir)
+            try:
+                dirs, files = _list_entries(abs_dir)
+            except OSError as exc:
+                log.debug("Unable to list dir: %s", exc)
+                self._unwatch(root, rel_dir)
+                continue
+            listed = tree[rel_dir] = self._list_dir(root, abs_dir, dirs, files)
+            if rel_dir:
+                parent = tree.get(rel_dir.rpartition("/")[0], {})
+                listed["linked"] = parent.get(
+                    "linked", False
+                ) or salt.utils.path.islink(abs_dir)
+            stack.extend(
+                f"{rel_dir}/{name}" if rel_dir else name for name in listed["subdirs"]
+            )
+
+    def _drop(self, root, rel_dir):
+        """
+        Remove a directory and its subdirectories from the index
+        """
+        tree = self.tree[root]
+        prefix = f"{rel_dir}/"
+        for key in [
+            key
+            for key in tree
+            if not rel_dir or key == rel_dir or key.startswith(prefix)
+        ]:
+            del tree[key]
+            self._unwatch(root, key)
+
+    def _rescan_dir(self, root, rel_dir, names):
+        """
+        List again a directory of a root in which the given entries were
+        added or removed
+        """
+        tree = self.tree[root]
+        old = tree.get(rel_dir)
+        if old is None:
+            if rel_dir:
+                # Removed along with its parent
+                return
+            old = {"entries": {}, "subdirs": set(), "empty": True, "linked": False}
+        abs_dir = self._abs_path(root, rel_dir)
+        self._watch(root, rel_dir, abs_dir)
+        try:
+            dirs, files = _list_entries(abs_dir)
+        except OSError:
+            self._drop(root, rel_dir)
+            return
+        new = self._list_dir(root, abs_dir, dirs, files)
+        new["linked"] = old["linked"]
+        for name in old["subdirs"]:
+            if name not in new["subdirs"] or name in names:
+                self._drop(root, f"{rel_dir}/{name}" if rel_dir else name)
+        tree[rel_dir] = new
+        for name in new["subdirs"]:
+            if name not in old["subdirs"] or name in names:
+                self._scan(root, f"{rel_dir}/{name}" if rel_dir else name, tree)
+        if rel_dir and new["empty"] != old["empty"]:
+            # The directory is listed as empty by its parent
+            parent, _, name = rel_dir.rpartition("/")
+            entry = tree.get(parent, {}).get("entries", {}).get(name)
+            if entry is not None:
+                tree[parent]["entries"][name] = (
+                    entry[0],
+                    new["empty"],
+                    entry[2],
+                    entry[3],
+                )
+
+    def _check_roots(self):
+        """
+        Scan the roots which were created, and drop the ones which were
+        removed, since they were last scanned
+        """
+        with self._lock:
+            for root, tree in self.tree.items():
+                if bool(tree) != os.path.isdir(root):
+                    self._rescan_dir(root, "", set())
+
+    def rescan(self):
+        """
+        Scan all the roots again, and write the file lists which changed
+        """
+        with self._lock:
+            for root in self.tree:
+                tree = {}
+                if os.path.isdir(root):
+                    self._scan(root, "", tree)
+                for rel_dir in set(self.tree[root]) - set(tree):
+                    self._unwatch(root, rel_dir)
+                self.tree[root] = tree
+        self.write_file_lists()
+        self._touch_heartbeat()
+
+    def file_lists(self, saltenv):
+        """
+        Return the file lists of a saltenv, like ``roots._file_lists`` builds
+        them
+        """
+        ret = {"files": set(), "dirs": set(), "empty_dirs": set(), "links": {}}
+        with self._lock:
+            for root in self.saltenvs[saltenv]:
+                for rel_dir, listed in self.tree[root].items():
+                    for name, entry in listed["entries"].items():
+                        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                        ret["dirs" if entry[0] else "files"].add(rel_path)
+                        if entry[1]:
+                            ret["empty_dirs"].add(rel_path)
+                        if entry[2] is not None:
+                            ret["links"][rel_path] = entry[2]
+        ret["files"] = sorted(ret["files"])
+        ret["dirs"] = sorted(ret["dirs"])
+        ret["empty_dirs"] = sorted(ret["empty_dirs"])
+        return ret
+
+    def write_file_lists(self, roots=None):
+        """
+        Write the file lists of the saltenvs which changed, or whose cache was
+        removed, to the file list cache. Only the saltenvs of the given roots
+        are checked for changes, all of them by default.
+        """
+        os.makedirs(self.cachedir, exist_ok=True)
+        for saltenv, paths in self.saltenvs.items():
+            list_cache = _list_cache(self.cachedir, saltenv)
+            exists = os.path.isfile(list_cache)
+            if exists and roots is not None and not set(roots).intersection(paths):
+                continue
+            payload = salt.payload.dumps(self.file_lists(saltenv))
+            digest = hashlib.sha1(payload).digest()
+            if exists and self._written.get(saltenv) == digest:
+                continue
+            with salt.utils.atomicfile.atomic_open(list_cache, "wb") as fp_:
+                fp_.write(payload)
+            self._written[saltenv] = digest
+            log.debug("Wrote the file lists of the %s saltenv", saltenv)
+
+    def _touch_heartbeat(self):
+        with salt.utils.files.fopen(self.heartbeat, "w") as fp_:
+            fp_.write(str(os.getpid()))
+
+    def mtime_map(self):
+        """
+        Return the mtimes of the files of the roots, like
+        ``salt.fileserver.generate_mtime_map`` does, which does not follow the
+        symlinks to directories
+        """
+        file_map = {}
+        with self._lock:
+            for root, tree in self.tree.items():
+                for rel_dir, listed in tree.items():
+                    if listed["linked"]:
+                        continue
+                    directory = self._abs_path(root, rel_dir)
+                    for name, entry in listed["entries"].items():
+                        if entry[0] or entry[3] is None:
+                            continue
+                        file_path = os.path.join(directory, name)
+                        if salt.fileserver.is_file_ignored(self.opts, file_path):
+                            continue
+                        file_map[file_path] = entry[3]
+        return file_map
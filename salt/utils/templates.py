@@ -367,7 +367,11 @@ def render_jinja_tmpl(tmplstr, context, tmplpath=None):
                 _file_client=context.get("fileclient", __file_client__.value()),
             )
 
-        env_args = {"extensions": [], "loader": loader}
+        env_args = {
+            "extensions": [],
+            "loader": loader,
+            "bytecode_cache": salt.utils.jinja.get_bytecode_cache(opts),
+        }
 
         if hasattr(jinja2.ext, "with_"):
             env_args["extensions"].append("jinja2.ext.with_")
@@ -465,7 +469,9 @@ def render_jinja_tmpl(tmplstr, context, tmplpath=None):
 
         jinja_env.globals.update(decoded_context)
         try:
-            template = jinja_env.from_string(tmplstr)
+            template = salt.utils.jinja.template_from_string(
+                jinja_env, tmplstr, tmplpath
+            )
             output = template.render(**decoded_context)
         except jinja2.exceptions.UndefinedError as exc:
             trace = traceback.extract_tb(sys.exc_info()[2])
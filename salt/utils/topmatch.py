@@ -0,0 +1,264 @@
+"""
+Match index of the pillar and state top files.
+
+Matching the targets of a top file against a minion goes through the matcher
+loader for every target. With the ``top_match_index`` option, the targets which
+are plain minion ids, globs, lists of minion ids or grain matches are instead
+compiled into an index, and looked up with the id and grains of the minion.
+The other targets are still checked with the matchers.
+
+The index of a top file is kept in memory, keyed by a digest of its targets, so
+it is only compiled again when the targets change.
+
+.. versionadded:: 3008.0
+"""
+
+import collections
+import fnmatch
+import hashlib
+import logging
+import os
+
+import salt.utils.data
+import salt.utils.json
+import salt.utils.minions
+from salt.defaults import DEFAULT_TARGET_DELIM
+
+log = logging.getLogger(__name__)
+
+GLOB_CHARS = ("*", "?", "[")
+
+# The count of indexes kept in memory
+MAX_INDEXES = 16
+
+_INDEXES = collections.OrderedDict()
+
+
+def _matcher(data):
+    """
+    Return the matcher of a top file target, like ``confirm_top`` does
+    """
+    matcher = "compound"
+    for item in data:
+        if isinstance(item, dict):
+            if "match" in item:
+                matcher = item["match"]
+    return matcher
+
+
+def _literal_prefix(pattern):
+    """
+    Return the part of a glob before its first wildcard
+    """
+    end = len(pattern)
+    for char in GLOB_CHARS:
+        pos = pattern.find(char)
+        if pos != -1:
+            end = min(end, pos)
+    return pattern[:end]
+
+
+class GlobIndex:
+    """
+    Globs matched against a minion id, the exact ones in a dict, the others
+    bucketed by the literal prefix of the pattern
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}
+
+    def add(self, pattern, entry):
+        pattern = os.path.normcase(pattern)
+        prefix = _literal_prefix(pattern)
+        if prefix == pattern:
+            self.exact.setdefault(pattern, []).append(entry)
+        else:
+            self.prefixes.setdefault(prefix, []).append((pattern, entry))
+
+    def lookup(self, minion_id, matched):
+        minion_id = os.path.normcase(minion_id)
+        matched.update(self.exact.get(minion_id, ()))
+        for end in range(len(minion_id) + 1):
+            for pattern, entry in self.prefixes.get(minion_id[:end], ()):
+                if fnmatch.fnmatchcase(minion_id, pattern):
+                    matched.add(entry)
+
+
+class GrainIndex:
+    """
+    Grain matches, keyed by their top level grain
+    """
+
+    def __init__(self):
+        # {<grain>: {<lowercase value>: [<entry>]}}
+        self.exact = {}
+        # {<grain>: [(<expr>, <delimiter>, <entry>)]}
+        self.exprs = {}
+
+    def add(self, expr, delimiter, entry):
+        splits = expr.split(delimiter)
+        if len(splits) == 2 and splits[0] != "*":
+            value = splits[1]
+            if not any(char in value for char in GLOB_CHARS):
+                self.exact.setdefault(splits[0], {}).setdefault(
+                    value.lower(), []
+                ).append((expr, delimiter, entry))
+                return
+        self.exprs.setdefault(splits[0], []).append((expr, delimiter, entry))
+
+    def lookup(self, grains, matched):
+        for grain, values in self.exact.items():
+            if grain not in grains:
+                continue
+            value = grains[grain]
+            if isinstance(value, (dict, list, tuple)):
+                for entries in values.values():
+                    for expr, delimiter, entry in entries:
+                        if salt.utils.data.subdict_match(
+                            grains, expr, delimiter=delimiter
+                        ):
+                            matched.add(entry)
+            else:
+                for _, _, entry in values.get(str(value).lower(), ()):
+                    matched.add(entry)
+        for grain, exprs in self.exprs.items():
+            # Every key matched by subdict_match starts with the top level
+            # grain, unless it is a wildcard
+            if grain != "*" and grain not in grains:
+                continue
+            for expr, delimiter, entry in exprs:
+                if salt.utils.data.subdict_match(grains, expr, delimiter=delimiter):
+                    matched.add(entry)
+
+
+class TopMatchIndex:
+    """
+    The index of the targets of a top file, as ``(<saltenv>, <target>)``
+    entries
+    """
+
+    def __init__(self, top):
+        # The entries decided by the index
+        self.entries = set()
+        # Globs matched against the ``minion_id`` option by the glob matcher,
+        # and against the ``id`` option by the compound matcher
+        self.globs = GlobIndex()
+        self.id_globs = GlobIndex()
+        # Lists of minion ids, which can not be told apart from ids holding a
+        # comma
+        self.lists = {}
+        self.grains = GrainIndex()
+        for saltenv, body in top.items():
+            if not isinstance(body, dict):
+                continue
+            for tgt, data in body.items():
+                if isinstance(tgt, str) and isinstance(data, (str, list)):
+                    self.add(saltenv, tgt, data)
+
+    def add(self, saltenv, tgt, data):
+        entry = (saltenv, tgt)
+        matcher = _matcher(data)
+        if matcher == "glob":
+            self.globs.add(tgt, entry)
+        elif matcher == "list":
+            self._add_list(tgt, entry)
+        elif matcher == "grain":
+            if DEFAULT_TARGET_DELIM not in tgt:
+                # The grain matcher never matches such a target
+                self.entries.add(entry)
+                return
+            self.grains.add(tgt, DEFAULT_TARGET_DELIM, entry)
+        elif matcher == "compound":
+            words = tgt.split()
+            if len(words) != 1 or words[0] in ("and", "or", "not", "(", ")"):
+                return
+            target_info = salt.utils.minions.parse_target(words[0])
+            engine = target_info["engine"]
+            if not engine:
+                self.id_globs.add(target_info["pattern"], entry)
+            elif engine == "L":
+                self._add_list(target_info["pattern"], entry)
+            elif engine == "G":
+                delimiter = target_info["delimiter"] or DEFAULT_TARGET_DELIM
+                if delimiter not in target_info["pattern"]:
+                    self.entries.add(entry)
+                    return
+                self.grains.add(target_info["pattern"], delimiter, entry)
+            else:
+                return
+        else:
+            return
+        self.entries.add(entry)
+
+    def _add_list(self, tgt, entry):
+        for minion_id in tgt.split(","):
+            self.lists.setdefault(minion_id, []).append(entry)
+
+    def lookup(self, opts):
+        """
+        Return ``{(<saltenv>, <target>): <matched>}`` for the targets decided by
+        the index
+        """
+        minion_id = opts.get("id")
+        matched = set()
+        self.globs.lookup(opts.get("minion_id", minion_id), matched)
+        self.id_globs.lookup(minion_id, matched)
+        self.grains.lookup(opts.get("grains") or {}, matched)
+        ret = dict.fromkeys(self.entries, False)
+        if "," in minion_id:
+            for entries in self.lists.values():
+                for entry in entries:
+                    ret.pop(entry, None)
+        else:
+            matched.update(self.lists.get(minion_id, ()))
+        for entry in matched:
+            if entry in ret:
+                ret[entry] = True
+        return ret
+
+
+def _digest(top):
+    targets = []
+    for saltenv, body in top.items():
+        if not isinstance(body, dict):
+            continue
+        for tgt, data in body.items():
+            if isinstance(tgt, str) and isinstance(data, (str, list)):
+                targets.append([saltenv, tgt, _matcher(data)])
+    return hashlib.sha256(
+        salt.utils.json.dumps(targets, default=repr).encode()
+    ).hexdigest()
+
+
+def get_index(top):
+    """
+    Return the index of the given top file, compiling it if its targets are not
+    indexed yet
+    """
+    digest = _digest(top)
+    try:
+        _INDEXES.move_to_end(digest)
+        return _INDEXES[digest]
+    except KeyError:
+        pass
+    log.debug("Compiling the match index of a top file")
+    index = _INDEXES[digest] = TopMatchIndex(top)
+    while len(_INDEXES) > MAX_INDEXES:
+        _INDEXES.popitem(last=False)
+    return index
+
+
+def lookup(opts, top):
+    """
+    Return ``{(<saltenv>, <target>): <matched>}`` for the targets of the top
+    file decided by its match index, or an empty dict if ``top_match_index`` is
+    not enabled
+    """
+    if not opts.get("top_match_index", False):
+        return {}
+    try:
+        return get_index(top).lookup(opts)
+    except Exception as exc:  # pylint: disable=broad-except
+        log.error("Unable to use the match index of the top file: %s", exc)
+        return {}
@@ -230,3 +230,28 @@ def run_common_cache_tests(subtests, cache):
         assert cache_result == fetch_result
         assert fetch_result == expected_result
         assert cache_result == fetch_result == expected_result
+
+    with subtests.test("store_many values should be fetchable with fetch_many"):
+        cache.store_many(
+            {
+                (f"{bank}/alpha", good_key): "alpha data",
+                (f"{bank}/beta", good_key): {"beta": "data"},
+            }
+        )
+        assert cache.fetch_many(
+            [
+                (f"{bank}/alpha", good_key),
+                (f"{bank}/beta", good_key),
+                (f"{bank}/beta", bad_key),
+            ]
+        ) == {
+            (f"{bank}/alpha", good_key): "alpha data",
+            (f"{bank}/beta", good_key): {"beta": "data"},
+            (f"{bank}/beta", bad_key): {},
+        }
+
+    with subtests.test("list_with_data should fetch the key from every sub-bank"):
+        result = cache.list_with_data(bank, good_key)
+        assert result["alpha"] == "alpha data"
+        assert result["beta"] == {"beta": "data"}
+        assert cache.list_with_data("nonexistent", good_key) == {}
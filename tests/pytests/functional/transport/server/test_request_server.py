@@ -2,6 +2,7 @@ import asyncio
 
 import salt.transport
 import salt.utils.process
+from tests.support.mock import MagicMock, patch
 
 
 async def test_request_server(
@@ -39,3 +40,51 @@ async def test_request_server(
 
     # Yield to loop in order to allow background close methods to finish.
     await asyncio.sleep(0.3)
+
+
+async def test_request_server_lanes(io_loop, minion_opts, master_opts, process_manager):
+    """
+    With request_lanes, the requests reach the workers through the lanes
+    scheduler of the MWorkerQueue process
+    """
+    minion_opts["transport"] = master_opts["transport"] = "zeromq"
+    master_opts["worker_threads"] = 1
+    master_opts["request_lanes"] = {"auth": {"cmds": ["_auth"], "weight": 2}}
+    minion_opts["master_uri"] = (
+        f"tcp://{master_opts['interface']}:{master_opts['ret_port']}"
+    )
+
+    req_server = salt.transport.request_server(master_opts)
+    req_server.pre_fork(process_manager)
+
+    requests = []
+
+    async def handler(message):
+        requests.append(message)
+        return {"result": len(requests)}
+
+    worker = MagicMock()
+    worker.name = "MWorker-0"
+    with patch("multiprocessing.current_process", return_value=worker):
+        req_server.post_fork(handler, io_loop)
+    req_client = salt.transport.request_client(minion_opts, io_loop)
+    try:
+        ret = await req_client.send({"enc": "clear", "load": {"cmd": "_auth"}})
+        assert ret == {"result": 1}
+        ret = await req_client.send({"enc": "aes", "load": b"x", "cmd": "_return"})
+        assert ret == {"result": 2}
+        assert requests[1]["cmd"] == "_return"
+        # Draining, the scheduler acknowledges it won't send more requests
+        assert not req_server.drained()
+        req_server.stop_accepting()
+        for _ in range(50):
+            if req_server.drained():
+                break
+            await asyncio.sleep(0.1)
+        assert req_server.drained()
+    finally:
+        req_client.close()
+        req_server.close()
+
+    # Yield to loop in order to allow background close methods to finish.
+    await asyncio.sleep(0.3)
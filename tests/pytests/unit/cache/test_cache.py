@@ -5,8 +5,9 @@ Validate the cache package functions.
 import pytest
 
 import salt.cache
+import salt.config
 import salt.payload
-from tests.support.mock import patch
+from tests.support.mock import MagicMock, patch
 
 
 @pytest.fixture
@@ -29,3 +30,71 @@ def test_factory_memcache(opts):
     with patch.dict(opts, {"memcache_expire_seconds": 10}):
         ret = salt.cache.factory(opts)
         assert isinstance(ret, salt.cache.MemCache)
+
+
+def test_fetch_many_fallback(opts):
+    """
+    Drivers without a fetch_many function are queried one key at a time
+    """
+    cache = salt.cache.factory(opts)
+    fetch = MagicMock(side_effect=lambda bank, key, **kwargs: {"bank": bank})
+    with patch.object(cache, "_modules", {"fake.fetch": fetch}), patch.object(
+        cache, "driver", "fake"
+    ):
+        ret = cache.fetch_many([("minions/a", "data"), ("minions/b", "data")])
+    assert ret == {
+        ("minions/a", "data"): {"bank": "minions/a"},
+        ("minions/b", "data"): {"bank": "minions/b"},
+    }
+    assert fetch.call_count == 2
+
+
+def test_fetch_many_native(opts):
+    """
+    Drivers providing a fetch_many function are queried once
+    """
+    cache = salt.cache.factory(opts)
+    fetch = MagicMock()
+    fetch_many = MagicMock(return_value={})
+    modules = {"fake.fetch": fetch, "fake.fetch_many": fetch_many}
+    with patch.object(cache, "_modules", modules), patch.object(
+        cache, "driver", "fake"
+    ):
+        cache.fetch_many([("minions/a", "data"), ("minions/b", "data")])
+    fetch.assert_not_called()
+    fetch_many.assert_called_once_with(
+        [("minions/a", "data"), ("minions/b", "data")], **cache._kwargs
+    )
+
+
+def test_store_many_fallback(opts):
+    cache = salt.cache.factory(opts)
+    store = MagicMock()
+    with patch.object(cache, "_modules", {"fake.store": store}), patch.object(
+        cache, "driver", "fake"
+    ):
+        cache.store_many({("minions/a", "data"): 1, ("minions/b", "data"): 2})
+    assert store.call_count == 2
+
+
+def test_bulk_api_localfs(tmp_path):
+    opts = salt.config.DEFAULT_MASTER_OPTS.copy()
+    opts["cachedir"] = str(tmp_path)
+    cache = salt.cache.factory(opts)
+    cache.store_many(
+        {("minions/a", "data"): {"id": "a"}, ("minions/b", "data"): {"id": "b"}}
+    )
+    cache.store("minions/c", "mine", {"fun": "ret"})
+    assert cache.fetch_many(
+        [("minions/a", "data"), ("minions/c", "data"), ("minions/c", "mine")]
+    ) == {
+        ("minions/a", "data"): {"id": "a"},
+        ("minions/c", "data"): {},
+        ("minions/c", "mine"): {"fun": "ret"},
+    }
+    assert cache.list_with_data("minions", "data") == {
+        "a": {"id": "a"},
+        "b": {"id": "b"},
+        "c": {},
+    }
+    assert cache.list_with_data("nonexistent", "data") == {}
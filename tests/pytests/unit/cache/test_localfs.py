@@ -3,6 +3,7 @@ Validate the functions in the localfs cache
 """
 
 import errno
+import os
 import shutil
 
 import pytest
@@ -10,7 +11,7 @@ import pytest
 import salt.cache.localfs as localfs
 import salt.payload
 import salt.utils.files
-from salt.exceptions import SaltCacheError
+from salt.exceptions import SaltCacheError, SaltDeserializationError
 from tests.support.mock import MagicMock, patch
 
 
@@ -261,3 +262,111 @@ def test_mix_of_utf8_and_non_utf8_can_be_round_tripped(tmp_cache_file):
     actual = localfs.fetch(bank, key, tmp_cache_file)
 
     assert data == actual
+
+
+def test_fetch_many(tmp_cache_file):
+    """
+    Tests that fetch_many returns every requested key, with an empty dict for
+    the missing ones.
+    """
+    localfs.store(bank="bank2", key="key", data="more data", cachedir=tmp_cache_file)
+    assert localfs.fetch_many(
+        [("bank", "key"), ("bank2", "key"), ("bank", "missing")],
+        cachedir=tmp_cache_file,
+    ) == {
+        ("bank", "key"): "payload data",
+        ("bank2", "key"): "more data",
+        ("bank", "missing"): {},
+    }
+
+
+def test_list_with_data(tmp_cache_file):
+    """
+    Tests that list_with_data fetches the key from every sub-bank.
+    """
+    localfs.store(bank="bank/a", key="data", data="a", cachedir=tmp_cache_file)
+    localfs.store(bank="bank/b", key="mine", data="b", cachedir=tmp_cache_file)
+    assert localfs.list_with_data(bank="bank", key="data", cachedir=tmp_cache_file) == {
+        "a": "a",
+        "b": {},
+    }
+
+
+def test_fetch_mmap(tmp_cache_file):
+    """
+    Tests that cache files larger than mmap_min_size are memory-mapped.
+    """
+    data = {"grains": {"os": "Fedora", "blob": "x" * 1024}}
+    localfs.store(bank="bank", key="key", data=data, cachedir=tmp_cache_file)
+    with patch.dict(localfs.__opts__, {"cache.localfs.mmap_min_size": 1024}):
+        with patch("mmap.mmap", wraps=localfs.mmap.mmap) as mmap_mock:
+            assert localfs.fetch("bank", "key", tmp_cache_file) == data
+        mmap_mock.assert_called_once()
+
+
+def test_fetch_decode_cache(tmp_cache_file):
+    """
+    Tests that the data decoded from an unchanged cache file is reused.
+    """
+    localfs._DECODE_CACHE.clear()
+    localfs._decode_cache_bytes = 0
+    opts = {
+        "cache.localfs.decode_cache_size": 4096,
+        "cache.localfs.decode_cache_match": ["bank/*"],
+    }
+    with patch.dict(localfs.__opts__, opts):
+        localfs.store(bank="bank", key="key", data={"a": 1}, cachedir=tmp_cache_file)
+        first = localfs.fetch("bank", "key", tmp_cache_file)
+        with patch("salt.payload.loads") as loads_mock:
+            assert localfs.fetch("bank", "key", tmp_cache_file) is first
+        loads_mock.assert_not_called()
+
+        # A new store replaces the file and invalidates the decoded data
+        localfs.store(bank="bank", key="key", data={"a": 2}, cachedir=tmp_cache_file)
+        assert localfs.fetch("bank", "key", tmp_cache_file) == {"a": 2}
+        assert len(localfs._DECODE_CACHE) == 1
+
+        # The least recently used data is dropped above decode_cache_size
+        localfs.store(bank="bank", key="big", data="x" * 4090, cachedir=tmp_cache_file)
+        localfs.fetch("bank", "big", tmp_cache_file)
+        assert list(localfs._DECODE_CACHE) == [
+            os.path.join(tmp_cache_file, "bank", "big.p")
+        ]
+
+
+def test_fetch_decode_cache_match(tmp_cache_file):
+    """
+    Tests that only the data of the keys matching decode_cache_match is
+    reused, the data of the other ones may be modified by the caller.
+    """
+    localfs._DECODE_CACHE.clear()
+    localfs._decode_cache_bytes = 0
+    opts = {
+        "cache.localfs.decode_cache_size": 4096,
+        "cache.localfs.decode_cache_match": ["minions/*/data"],
+    }
+    with patch.dict(localfs.__opts__, opts):
+        for key in ("data", "mine"):
+            localfs.store(
+                bank="minions/minion", key=key, data={"a": 1}, cachedir=tmp_cache_file
+            )
+        mine = localfs.fetch("minions/minion", "mine", tmp_cache_file)
+        mine["b"] = 2
+        assert localfs.fetch("minions/minion", "mine", tmp_cache_file) == {"a": 1}
+        assert localfs.list_with_data("minions", "data", tmp_cache_file) == {
+            "minion": {"a": 1}
+        }
+        assert list(localfs._DECODE_CACHE) == [
+            os.path.join(tmp_cache_file, "minions", "minion", "data.p")
+        ]
+
+
+def test_fetch_empty_file(tmp_cache_file):
+    """
+    Tests that an empty cache file fails to decode.
+    """
+    with salt.utils.files.fopen(os.path.join(tmp_cache_file, "bank", "key.p"), "wb"):
+        pass
+    with patch.dict(localfs.__opts__, {"cache.localfs.mmap_min_size": 0}):
+        with pytest.raises(SaltDeserializationError):
+            localfs.fetch("bank", "key", tmp_cache_file)
@@ -190,3 +190,103 @@ def test_fetch_debug(cache, opts):
             # Check debug data
             assert cache.call == 6
             assert cache.hit == 3
+
+
+def test_fetch_many(cache):
+    with patch(
+        "salt.cache.Cache.fetch_many",
+        side_effect=lambda items: {item: f"{item[0]}/{item[1]}" for item in items},
+    ) as cache_fetch_many_mock:
+        with patch("salt.loader.cache", return_value={}):
+            with patch("time.time", return_value=0):
+                cache.fetch_many([("bank", "key1")])
+                cache_fetch_many_mock.reset_mock()
+
+            # Only the keys missing from memory are fetched from the driver
+            with patch("time.time", return_value=1):
+                ret = cache.fetch_many([("bank", "key1"), ("bank", "key2")])
+            assert ret == {("bank", "key1"): "bank/key1", ("bank", "key2"): "bank/key2"}
+            cache_fetch_many_mock.assert_called_once_with([("bank", "key2")])
+            assert salt.cache.MemCache.data["fake_driver"] == {
+                ("bank", "key1"): [1, "bank/key1"],
+                ("bank", "key2"): [1, "bank/key2"],
+            }
+
+
+def test_store_many(cache):
+    with patch("salt.cache.Cache.store_many") as cache_store_many_mock:
+        with patch("salt.loader.cache", return_value={}):
+            with patch("time.time", return_value=0):
+                cache.store_many({("bank", "key1"): "data1", ("bank", "key2"): "data2"})
+            cache_store_many_mock.assert_called_once_with(
+                {("bank", "key1"): "data1", ("bank", "key2"): "data2"}
+            )
+            assert salt.cache.MemCache.data["fake_driver"] == {
+                ("bank", "key1"): [0, "data1"],
+                ("bank", "key2"): [0, "data2"],
+            }
+
+
+def test_max_bytes(cache):
+    cache.max_bytes = len(salt.payload.dumps("fake_data11")) * 2
+    with patch("salt.cache.Cache.store"):
+        with patch("salt.loader.cache", return_value={}):
+            with patch("time.time", return_value=0):
+                cache.store("bank1", "key1", "fake_data11")
+            with patch("time.time", return_value=1):
+                cache.store("bank1", "key2", "fake_data12")
+            # Reading key1 makes key2 the least recently used one
+            with patch("time.time", return_value=2):
+                assert cache.fetch("bank1", "key1") == "fake_data11"
+            with patch("time.time", return_value=3):
+                cache.store("bank2", "key1", "fake_data21")
+            assert salt.cache.MemCache.data["fake_driver"] == {
+                ("bank1", "key1"): [2, "fake_data11"],
+                ("bank2", "key1"): [3, "fake_data21"],
+            }
+            assert cache.stats() == {
+                "hits": 1,
+                "misses": 0,
+                "evictions": 1,
+                "items": 2,
+                "bytes": cache.max_bytes,
+            }
+            # Values larger than the limit are never kept in memory
+            cache.store("bank3", "key1", "x" * cache.max_bytes)
+            assert ("bank3", "key1") not in salt.cache.MemCache.data["fake_driver"]
+
+
+def test_negative_expire(cache):
+    with patch("salt.cache.Cache.fetch", return_value={}) as cache_fetch_mock:
+        with patch("salt.loader.cache", return_value={}):
+            cache.negative_expire = 2
+            with patch("time.time", return_value=0):
+                assert cache.fetch("bank", "missing") == {}
+            with patch("time.time", return_value=2):
+                assert cache.fetch("bank", "missing") == {}
+            assert cache_fetch_mock.call_count == 1
+            # Missing keys expire sooner than the other ones
+            with patch("time.time", return_value=5):
+                assert cache.fetch("bank", "missing") == {}
+            assert cache_fetch_mock.call_count == 2
+
+            # Missing keys are not cached at all
+            cache.negative_expire = 0
+            salt.cache.MemCache.data["fake_driver"].clear()
+            cache.fetch("bank", "missing")
+            cache.fetch("bank", "missing")
+            assert cache_fetch_mock.call_count == 4
+            assert salt.cache.MemCache.data["fake_driver"] == {}
+            assert cache.stats()["misses"] == 4
+
+
+def test_flush_sub_banks(cache):
+    with patch("salt.cache.Cache.store"), patch("salt.cache.Cache.flush"):
+        with patch("salt.loader.cache", return_value={}):
+            cache.store("minions/a", "data", 1)
+            cache.store("minions/a/sub", "data", 2)
+            cache.store("minions/ab", "data", 3)
+            cache.flush("minions/a")
+            assert list(salt.cache.MemCache.data["fake_driver"]) == [
+                ("minions/ab", "data")
+            ]
@@ -229,3 +229,65 @@ def test_create_table():
             except SaltCacheError:
                 pytest.fail("This test should not raise an exception")
             mock_run_query.assert_has_calls(expected_calls, True)
+
+
+def test_fetch_many():
+    """
+    Tests that fetch_many reads all the keys with a single query.
+    """
+    mock_connect_client = MagicMock()
+    with patch.object(mysql_cache, "_init_client"):
+        with patch.dict(
+            mysql_cache.__context__,
+            {
+                "mysql_table_name": "salt",
+                "mysql_client": mock_connect_client,
+            },
+        ):
+            with patch.object(mysql_cache, "run_query") as mock_run_query:
+                cursor = MagicMock()
+                cursor.fetchall.return_value = [("minions/a", "data", b"\xa5hello")]
+                mock_run_query.return_value = (cursor, 1)
+
+                ret = mysql_cache.fetch_many(
+                    [("minions/a", "data"), ("minions/b", "data")]
+                )
+                assert ret == {
+                    ("minions/a", "data"): "hello",
+                    ("minions/b", "data"): {},
+                }
+                mock_run_query.assert_called_once_with(
+                    mock_connect_client,
+                    "SELECT bank, etcd_key, data FROM salt WHERE "
+                    "(bank=%s AND etcd_key=%s) OR (bank=%s AND etcd_key=%s)",
+                    args=("minions/a", "data", "minions/b", "data"),
+                )
+
+
+def test_list_with_data():
+    """
+    Tests that list_with_data only returns the direct sub-banks of the bank.
+    """
+    mock_connect_client = MagicMock()
+    with patch.object(mysql_cache, "_init_client"):
+        with patch.dict(
+            mysql_cache.__context__,
+            {
+                "mysql_table_name": "salt",
+                "mysql_client": mock_connect_client,
+            },
+        ):
+            with patch.object(mysql_cache, "run_query") as mock_run_query:
+                cursor = MagicMock()
+                cursor.fetchall.return_value = [
+                    ("minions/a", b"\xa5hello"),
+                    ("minions/a/nested", b"\xa5hello"),
+                ]
+                mock_run_query.return_value = (cursor, 2)
+
+                assert mysql_cache.list_with_data("minions", "data") == {"a": "hello"}
+                mock_run_query.assert_called_once_with(
+                    mock_connect_client,
+                    "SELECT bank, data FROM salt WHERE bank LIKE %s AND etcd_key=%s",
+                    args=("minions/%", "data"),
+                )
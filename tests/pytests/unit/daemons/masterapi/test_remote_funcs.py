@@ -20,6 +20,9 @@ class FakeCache:
     def fetch(self, bank, key):
         return self.data[bank, key]
 
+    def fetch_many(self, items):
+        return {item: self.data[item] for item in items}
+
 
 @pytest.fixture
 def funcs(temp_salt_master):
@@ -1,11 +1,13 @@
 import errno
 import logging
 import os
+import random
 import shutil
 
 import pytest
 
 import salt.utils.files
+import salt.utils.hashutils
 from salt import fileclient
 from tests.support.mock import patch
 
@@ -336,3 +338,329 @@ def test_cache_dest(mocked_opts, minion_opts):
         _check(client.cache_dest(f"salt://{relpath}?saltenv=dev"), _salt("dev"))
 
         _check("/foo/bar", "/foo/bar")
+
+
+def test_get_file_large_chunks_compressed(mocked_opts, minion_opts, fs_root):
+    """
+    Ensure files are downloaded in chunks of file_client_chunk_size bytes,
+    compressed with the negotiated codec
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_buffer_size"] = 16
+    patched_opts["file_client_chunk_size"] = 4096
+    content = "".join(f"line {num}\n" for num in range(1000))
+    with salt.utils.files.fopen(os.path.join(fs_root, "base", "big.txt"), "w") as fp_:
+        fp_.write(content)
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        with patch.object(
+            client, "_channel_send", side_effect=client._channel_send
+        ) as channel_send:
+            dest = client.get_file("salt://big.txt", saltenv="base", gzip=5)
+        with salt.utils.files.fopen(dest) as fp_:
+            assert fp_.read() == content
+        loads = [
+            call.args[0]
+            for call in channel_send.call_args_list
+            if call.args[0]["cmd"] == "_serve_file"
+        ]
+        # Three chunks and the empty reply marking the end of the file
+        assert len(loads) == 4
+        load = loads[-1]
+        assert load["chunk_size"] == 4096
+        assert "gzip" in load["codecs"]
+
+
+def _cmds(channel_send):
+    return [call.args[0]["cmd"] for call in channel_send.call_args_list]
+
+
+def test_cache_dir_concurrent(mocked_opts, minion_opts, fs_root):
+    """
+    Ensure the files are checked in a single request and only the changed
+    ones are downloaded, when downloading several files at once
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_concurrency"] = 2
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        with patch.object(
+            client.channel, "send", side_effect=client.channel.send
+        ) as channel_send:
+            ret = client.cache_dir(f"salt://{SUBDIR}", "dev", cachedir=None)
+        expected = [
+            os.path.join(
+                fileclient.__opts__["cachedir"], "files", "dev", SUBDIR, subdir_file
+            )
+            for subdir_file in sorted(_subdir_files())
+        ]
+        assert sorted(ret) == expected
+        for path in expected:
+            with salt.utils.files.fopen(path) as fp_:
+                assert "'dev'" in fp_.read()
+        cmds = _cmds(channel_send)
+        assert cmds.count("_file_hashes") == 1
+        assert cmds.count("_serve_file") == 6
+        assert "_file_hash" not in cmds
+
+        with salt.utils.files.fopen(
+            os.path.join(fs_root, "dev", SUBDIR, "bar.txt"), "w"
+        ) as fp_:
+            fp_.write("changed")
+        with patch.object(
+            client.channel, "send", side_effect=client.channel.send
+        ) as channel_send:
+            assert sorted(
+                client.cache_dir(f"salt://{SUBDIR}", "dev", cachedir=None)
+            ) == sorted(ret)
+        # Only bar.txt is downloaded again
+        assert _cmds(channel_send).count("_serve_file") == 2
+        with salt.utils.files.fopen(expected[0]) as fp_:
+            assert fp_.read() == "changed"
+
+
+def test_cache_files_concurrent_old_master(mocked_opts, minion_opts):
+    """
+    Ensure the files are checked one by one when the master does not support
+    _file_hashes
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_concurrency"] = 4
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        send = client.channel.send
+
+        def _send(load, **kwargs):
+            if load["cmd"] == "_file_hashes":
+                return False
+            return send(load, **kwargs)
+
+        with patch.object(client.channel, "send", side_effect=_send):
+            ret = client.cache_files(
+                ["salt://foo.txt", "salt://missing.txt", "salt://foo.txt?saltenv=dev"]
+            )
+        assert ret == [
+            os.path.join(fileclient.__opts__["cachedir"], "files", "base", "foo.txt"),
+            False,
+            os.path.join(fileclient.__opts__["cachedir"], "files", "dev", "foo.txt"),
+        ]
+        with salt.utils.files.fopen(ret[2]) as fp_:
+            assert "'dev'" in fp_.read()
+
+
+@pytest.mark.parametrize(
+    "paths,expected",
+    [
+        ([], ""),
+        (["top.sls"], ""),
+        (["web/init.sls", "web/files/nginx.conf"], "web/"),
+        (["web/files/a.conf", "web/files/b.conf"], "web/files/"),
+        (["web/init.sls", "db/init.sls"], ""),
+    ],
+)
+def test_common_dir(paths, expected):
+    assert fileclient._common_dir(paths) == expected
+
+
+def test_file_manifest(mocked_opts, minion_opts, fs_root):
+    """
+    Ensure the manifest holds the hashes, sizes and modes of the files under
+    the prefix
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        manifest = client.file_manifest("dev", f"{SUBDIR}/")
+        assert sorted(manifest) == sorted(
+            f"{SUBDIR}/{subdir_file}" for subdir_file in _subdir_files()
+        )
+        path = os.path.join(fs_root, "dev", SUBDIR, "foo.txt")
+        assert manifest[f"{SUBDIR}/foo.txt"] == {
+            "hsum": salt.utils.hashutils.get_hash(
+                path, fileclient.__opts__["hash_type"]
+            ),
+            "hash_type": fileclient.__opts__["hash_type"],
+            "mode": os.stat(path).st_mode,
+            "size": os.stat(path).st_size,
+        }
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_cache_dir_manifest(mocked_opts, minion_opts, concurrency):
+    """
+    Ensure the hashes of the files are looked up in the manifest of their
+    directory
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_concurrency"] = concurrency
+    patched_opts["file_client_manifest_ttl"] = 60
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        with patch.object(
+            client.channel, "send", side_effect=client.channel.send
+        ) as channel_send:
+            assert len(client.cache_dir(f"salt://{SUBDIR}", "base")) == 3
+            assert client.cache_dir(f"salt://{SUBDIR}", "base")
+            assert client.hash_file(f"salt://{SUBDIR}/missing.txt", "base") == ""
+        cmds = _cmds(channel_send)
+        assert cmds.count("_file_manifest") == 1
+        assert "_file_hash" not in cmds
+        assert "_file_hashes" not in cmds
+        assert cmds.count("_serve_file") == 6
+
+
+def test_get_file_manifest_old_master(mocked_opts, minion_opts):
+    """
+    Ensure the hashes are asked for one by one when the master does not serve
+    manifests
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_manifest_ttl"] = 60
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        send = client.channel.send
+
+        def _send(load, **kwargs):
+            if load["cmd"] == "_file_manifest":
+                return False
+            return send(load, **kwargs)
+
+        with patch.object(client.channel, "send", side_effect=_send) as channel_send:
+            for _ in range(2):
+                assert client.cache_file(f"salt://{SUBDIR}/foo.txt", "base")
+        cmds = _cmds(channel_send)
+        assert cmds.count("_file_manifest") == 1
+        assert cmds.count("_file_hash") == 2
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_get_file_delta(mocked_opts, minion_opts, fs_root, concurrency):
+    """
+    Ensure only the blocks of a file which changed are downloaded
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_concurrency"] = concurrency
+    patched_opts["file_client_delta_min_size"] = 1
+    patched_opts["file_client_delta_block_size"] = 1024
+    content = random.Random(0).randbytes(1024 * 64)
+    path = os.path.join(fs_root, "base", SUBDIR, "image.bin")
+    with salt.utils.files.fopen(path, "wb") as fp_:
+        fp_.write(content)
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        dest = client.cache_file(f"salt://{SUBDIR}/image.bin", "base")
+
+        content = content[:10000] + b"inserted" + content[10000:]
+        with salt.utils.files.fopen(path, "wb") as fp_:
+            fp_.write(content)
+        with patch.object(
+            client.channel, "send", side_effect=client.channel.send
+        ) as channel_send:
+            assert client.cache_dir(f"salt://{SUBDIR}", "base")
+        with salt.utils.files.fopen(dest, "rb") as fp_:
+            assert fp_.read() == content
+        loads = [
+            call.args[0]
+            for call in channel_send.call_args_list
+            if call.args[0]["cmd"] == "_serve_file"
+            and call.args[0]["path"] == f"{SUBDIR}/image.bin"
+        ]
+        # Only the block holding the inserted bytes is downloaded
+        assert len(loads) == 1
+        assert loads[0]["loc"] == 9216
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_cache_dir_track_deps(mocked_opts, minion_opts, concurrency):
+    """
+    Ensure the files downloaded at once are tracked like the ones downloaded
+    one by one, by URL
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_concurrency"] = concurrency
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        client.track_deps()
+        assert client.cache_dir(f"salt://{SUBDIR}", "base")
+        files = {
+            key: hsum
+            for key, hsum in client.deps["files"].items()
+            if key[1].endswith(".txt")
+        }
+        assert sorted(files) == [
+            ("base", f"salt://{SUBDIR}/{subdir_file}")
+            for subdir_file in sorted(_subdir_files())
+        ]
+        for (saltenv, path), hsum in files.items():
+            assert client.hash_file(path, saltenv) == hsum
+
+
+def test_get_file_delta_mostly_changed(mocked_opts, minion_opts, fs_root, caplog):
+    """
+    Ensure a file whose cached copy shares few blocks with it is downloaded
+    whole
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_delta_min_size"] = 1
+    patched_opts["file_client_delta_block_size"] = 1024
+    rand = random.Random(3)
+    content = rand.randbytes(1024 * 64)
+    path = os.path.join(fs_root, "base", "image.bin")
+    with salt.utils.files.fopen(path, "wb") as fp_:
+        fp_.write(content)
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        dest = client.cache_file("salt://image.bin", "base")
+        # A single block left unchanged
+        content = content[:1024] + rand.randbytes(1024 * 63)
+        with salt.utils.files.fopen(path, "wb") as fp_:
+            fp_.write(content)
+        with caplog.at_level(logging.DEBUG, logger="salt.fileclient"):
+            assert client.cache_file("salt://image.bin", "base") == dest
+        assert "Only 1 of the 64 blocks of 'image.bin'" in caplog.text
+        with salt.utils.files.fopen(dest, "rb") as fp_:
+            assert fp_.read() == content
+
+
+def test_get_file_delta_hash_mismatch(mocked_opts, minion_opts, fs_root):
+    """
+    Ensure the file is downloaded whole when it can not be rebuilt from the
+    blocks
+    """
+    patched_opts = minion_opts.copy()
+    patched_opts.update(mocked_opts)
+    patched_opts["file_client_delta_min_size"] = 1
+    patched_opts["file_client_delta_block_size"] = 1024
+    path = os.path.join(fs_root, "base", "image.bin")
+    with salt.utils.files.fopen(path, "wb") as fp_:
+        fp_.write(b"\0" * 4096)
+
+    with patch.dict(fileclient.__opts__, patched_opts):
+        client = fileclient.get_file_client(fileclient.__opts__, pillar=False)
+        dest = client.cache_file("salt://image.bin", "base")
+        with salt.utils.files.fopen(path, "wb") as fp_:
+            fp_.write(b"\1" * 4096)
+        with patch(
+            "salt.utils.blockdelta.match_blocks", return_value={0: 0, 1: 0, 2: 0}
+        ):
+            assert client.cache_file("salt://image.bin", "base") == dest
+        with salt.utils.files.fopen(dest, "rb") as fp_:
+            assert fp_.read() == b"\1" * 4096
@@ -13,6 +13,7 @@ import pytest
 import salt.fileclient
 import salt.fileserver.roots as roots
 import salt.utils.files
+import salt.utils.gzip_util
 import salt.utils.hashutils
 import salt.utils.platform
 import salt.utils.stringutils
@@ -96,6 +97,68 @@ def test_serve_file(testfilepath):
         assert ret == {"data": data, "dest": "testfile"}
 
 
+def test_serve_file_chunk_size(testfilepath):
+    load = {
+        "saltenv": "base",
+        "path": str(testfilepath),
+        "loc": 5,
+        "chunk_size": 7,
+    }
+    fnd = {"path": str(testfilepath), "rel": "testfile"}
+    with patch.dict(roots.__opts__, {"file_buffer_size": 2}):
+        ret = roots.serve_file(load, fnd)
+        assert ret == {"data": b"is a te", "dest": "testfile"}
+        with patch.dict(roots.__opts__, {"file_buffer_max_size": 4}):
+            assert roots.serve_file(load, fnd)["data"] == b"is a"
+
+
+def test_serve_file_compressed(testfilepath):
+    load = {
+        "saltenv": "base",
+        "path": str(testfilepath),
+        "loc": 0,
+        "gzip": 5,
+        "codecs": ["brotli", "gzip"],
+    }
+    fnd = {"path": str(testfilepath), "rel": "testfile"}
+    ret = roots.serve_file(load, fnd)
+    assert ret["codec"] == "gzip"
+    assert ret["gzip"] == 5
+    assert salt.utils.gzip_util.uncompress(ret["data"]) == testfilepath.read_bytes()
+
+
+def test_serve_file_chunk_cache(testfilepath):
+    load = {
+        "saltenv": "base",
+        "path": str(testfilepath),
+        "loc": 0,
+        "gzip": 5,
+    }
+    fnd = {"path": str(testfilepath), "rel": "testfile"}
+    with patch.dict(roots.__opts__, {"fileserver_chunk_cache_size": 1024}):
+        expected = roots.serve_file(dict(load), fnd)
+        with patch("salt.utils.compression.compress") as compress:
+            assert roots.serve_file(dict(load), fnd) == expected
+        compress.assert_not_called()
+        testfilepath.write_text("This file changed")
+        ret = roots.serve_file(dict(load), fnd)
+        assert salt.utils.gzip_util.uncompress(ret["data"]) == b"This file changed"
+
+
+def test_file_blocks(testfilepath, testfile):
+    load = {"saltenv": "base", "path": str(testfilepath), "block_size": 1}
+    fnd = {"path": str(testfilepath), "rel": "testfile"}
+    ret = roots.file_blocks(load, fnd)
+    assert ret["hsum"] == roots.file_hash(load, fnd)["hsum"]
+    assert ret["size"] == 18
+    # The blocks are 1024 bytes at least
+    assert ret["block_size"] == 1024
+    assert len(ret["weak"]) == len(ret["strong"]) == 1
+    # Files outside of the file_roots are not served
+    fnd = {"path": str(testfile), "rel": "testfile"}
+    assert roots.file_blocks(load, fnd) == {}
+
+
 def test_envs(unicode_dirname):
     opts = {"file_roots": copy.copy(roots.__opts__["file_roots"])}
     opts["file_roots"][unicode_dirname] = opts["file_roots"]["base"]
@@ -158,3 +158,32 @@ def test_file_tree_bytes(pillar_path, minion_id, base_pillar_content):
     with patch.dict(file_tree.__opts__, {"pillarenv": "dev"}):
         mypillar = file_tree.ext_pillar(minion_id, None, absolute_path)
         assert mypillar["files"]["groupfile"] == b"base"
+
+
+def test_fingerprint(minion_id, pillar_path):
+    """
+    check the fingerprint changes with the files of the minion only
+    """
+    root_dir = str(pillar_path / "base")
+    fingerprint = file_tree.fingerprint(minion_id, root_dir=root_dir)
+    assert fingerprint == file_tree.fingerprint(minion_id, root_dir=root_dir)
+
+    hostfile = pillar_path / "base" / "hosts" / minion_id / "files" / "hostfile"
+    hostfile.write_text("changed!")
+    changed = file_tree.fingerprint(minion_id, root_dir=root_dir)
+    assert changed != fingerprint
+
+    other = pillar_path / "base" / "hosts" / "other-host" / "files" / "hostfile"
+    other.parent.mkdir(parents=True)
+    other.write_text("other")
+    assert file_tree.fingerprint(minion_id, root_dir=root_dir) == changed
+
+    groupfile = pillar_path / "base" / "nodegroups" / "test-group" / "files" / "new"
+    groupfile.write_text("new")
+    assert file_tree.fingerprint(minion_id, root_dir=root_dir) != changed
+
+    # Relative to the pillar_roots of the pillarenv
+    with patch.dict(file_tree.__opts__, {"pillarenv": "dev"}):
+        assert file_tree.fingerprint(minion_id, root_dir=".") != file_tree.fingerprint(
+            minion_id, root_dir=root_dir
+        )
@@ -193,3 +193,98 @@ def test_clean_old_jobs_jid_file_is_cleaned(make_tmp_jid_dirs, tmp_jid_dir):
     assert os.path.isdir(jid_dir) is True
     # while the 'jid' dir inside it should be gone
     assert os.path.exists(jid_dir_name) is False
+
+
+@pytest.fixture
+def bucketed_jobs(tmp_cache_dir):
+    """
+    Create jobs in the job cache, half of them recorded in a bucket which is
+    expired two hours from now.
+    """
+    opts = {"hash_type": "sha256", "job_cache_clean_budget": 0}
+    now = time.time()
+    jids = [f"2024010100000000000{idx}" for idx in range(6)]
+    with patch.dict(local_cache.__opts__, opts):
+        for idx, jid in enumerate(jids):
+            created = now - 7200 if idx < 3 else now + 7200
+            with patch("time.time", return_value=created):
+                local_cache.prep_jid(passed_jid=jid)
+        # Mark the jobs created before the buckets as already walked
+        (tmp_cache_dir / "job_buckets" / local_cache.BUCKETS_COMPLETE).touch()
+        yield jids
+
+
+def _jid_exists(jid):
+    return os.path.isdir(salt.utils.jid.jid_dir(jid, local_cache._job_dir(), "sha256"))
+
+
+def _clean_old_jobs_later():
+    with patch("time.time", return_value=time.time() + 7200):
+        local_cache.clean_old_jobs()
+
+
+def test_clean_old_jobs_expires_buckets(bucketed_jobs, tmp_cache_dir):
+    """
+    Test that the jobs of an expired bucket are removed without walking the
+    whole job cache.
+    """
+    with patch.object(local_cache, "_clean_old_jobs_walk") as walk:
+        _clean_old_jobs_later()
+    walk.assert_not_called()
+    assert [_jid_exists(jid) for jid in bucketed_jobs] == [False] * 3 + [True] * 3
+    assert len(os.listdir(tmp_cache_dir / "job_buckets")) == 2
+
+
+def test_clean_old_jobs_keeps_recent_jobs_of_expired_buckets(bucketed_jobs):
+    """
+    Test that a job recorded in an expired bucket whose jid file is recent is
+    kept and removed once it is old enough.
+    """
+    local_cache.clean_old_jobs()
+    assert all(_jid_exists(jid) for jid in bucketed_jobs)
+    _clean_old_jobs_later()
+    assert [_jid_exists(jid) for jid in bucketed_jobs] == [False] * 3 + [True] * 3
+
+
+def test_clean_old_jobs_budget(bucketed_jobs):
+    """
+    Test that no more than job_cache_clean_budget jobs are removed per call.
+    """
+    with patch.dict(local_cache.__opts__, {"job_cache_clean_budget": 2}):
+        _clean_old_jobs_later()
+        assert [_jid_exists(jid) for jid in bucketed_jobs[:3]] == [False, False, True]
+        _clean_old_jobs_later()
+        assert [_jid_exists(jid) for jid in bucketed_jobs[:3]] == [False] * 3
+    assert all(_jid_exists(jid) for jid in bucketed_jobs[3:])
+
+
+def test_clean_old_jobs_walks_unbucketed_cache_once(make_tmp_jid_dirs, tmp_cache_dir):
+    """
+    Test that the whole job cache is only walked until it has been cleaned
+    once with buckets enabled.
+    """
+    make_tmp_jid_dirs()
+    with patch.object(
+        local_cache, "_clean_old_jobs_walk", wraps=local_cache._clean_old_jobs_walk
+    ) as walk:
+        local_cache.clean_old_jobs()
+        local_cache.clean_old_jobs()
+    walk.assert_called_once()
+    assert (tmp_cache_dir / "job_buckets" / local_cache.BUCKETS_COMPLETE).exists()
+
+
+def test_clean_old_jobs_buckets_jobs_kept_by_the_walk(tmp_cache_dir):
+    """
+    Test that the recent jobs created before the buckets are recorded in
+    their bucket by the walk, and removed once they expire.
+    """
+    jid = "20240101000000000000"
+    with patch.dict(local_cache.__opts__, {"hash_type": "sha256"}):
+        local_cache.prep_jid(passed_jid=jid)
+        # The job was created before the buckets were introduced
+        salt.utils.files.rm_rf(str(tmp_cache_dir / "job_buckets"))
+        local_cache.clean_old_jobs()
+        assert _jid_exists(jid)
+        assert (tmp_cache_dir / "job_buckets" / local_cache.BUCKETS_COMPLETE).exists()
+        _clean_old_jobs_later()
+        assert not _jid_exists(jid)
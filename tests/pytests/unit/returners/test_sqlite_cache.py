@@ -0,0 +1,126 @@
+"""
+Unit tests for the SQLite job cache (sqlite_cache).
+"""
+
+import time
+
+import pytest
+
+import salt.returners.sqlite_cache as sqlite_cache
+import salt.utils.jid
+from tests.support.mock import patch
+
+
+@pytest.fixture
+def configure_loader_modules(tmp_path):
+    return {
+        sqlite_cache: {
+            "__opts__": {
+                "cachedir": str(tmp_path),
+                "hash_type": "sha256",
+                "keep_jobs_seconds": 3600,
+                "job_cache_store_endtime": True,
+                "master_job_cache.sqlite.clean_batch_size": 2,
+            }
+        }
+    }
+
+
+@pytest.fixture
+def load():
+    return {
+        "fun": "test.ping",
+        "arg": [],
+        "tgt": "minion*",
+        "tgt_type": "glob",
+        "user": "root",
+    }
+
+
+def _store_job(jid, load, minions=("minion1", "minion2")):
+    sqlite_cache.prep_jid(passed_jid=jid)
+    sqlite_cache.save_load(jid, dict(load, jid=jid), minions=list(minions))
+    for minion in minions:
+        sqlite_cache.returner(
+            {"jid": jid, "id": minion, "return": True, "retcode": 0, "success": True}
+        )
+
+
+def test_store_and_lookup_job(load):
+    jid = salt.utils.jid.gen_jid({})
+    _store_job(jid, load)
+    sqlite_cache.save_minions(jid, ["minion3"], syndic_id="syndic")
+    ret = sqlite_cache.get_load(jid)
+    assert ret["fun"] == "test.ping"
+    assert ret["Minions"] == ["minion1", "minion2", "minion3"]
+    assert sqlite_cache.get_jid(jid) == {
+        "minion1": {"return": True, "retcode": 0, "success": True},
+        "minion2": {"return": True, "retcode": 0, "success": True},
+    }
+    assert sqlite_cache.get_load("20000101000000000000") == {}
+    assert sqlite_cache.get_jid("20000101000000000000") == {}
+
+
+def test_duplicate_return_is_dropped(load):
+    jid = salt.utils.jid.gen_jid({})
+    _store_job(jid, load, minions=["minion1"])
+    assert sqlite_cache.returner({"jid": jid, "id": "minion1", "return": 1}) is False
+    assert sqlite_cache.get_jid(jid)["minion1"]["return"] is True
+
+
+def test_nocache_job_is_not_stored():
+    jid = sqlite_cache.prep_jid(nocache=True)
+    sqlite_cache.returner({"jid": jid, "id": "minion1", "return": True})
+    assert sqlite_cache.get_jid(jid) == {}
+
+
+def test_prep_jid_does_not_reuse_jids():
+    jid = "20240101000000000000"
+    with patch("salt.utils.jid.gen_jid", side_effect=[jid, jid, jid + "1"]):
+        assert sqlite_cache.prep_jid() == jid
+        assert sqlite_cache.prep_jid() == jid + "1"
+
+
+def test_get_jids_and_endtime(load):
+    jid = salt.utils.jid.gen_jid({})
+    _store_job(jid, load)
+    assert sqlite_cache.get_endtime(jid) is False
+    sqlite_cache.update_endtime(jid, "2024, Jan 01 00:00:00.000000")
+    assert sqlite_cache.get_endtime(jid) == "2024, Jan 01 00:00:00.000000"
+    ret = sqlite_cache.get_jids()
+    assert list(ret) == [jid]
+    assert ret[jid]["Function"] == "test.ping"
+    assert ret[jid]["EndTime"] == "2024, Jan 01 00:00:00.000000"
+
+
+def test_save_and_load_reg():
+    assert sqlite_cache.load_reg() == {}
+    sqlite_cache.save_reg({"counter": {"val": 1}})
+    sqlite_cache.save_reg({"counter": {"val": 2}})
+    assert sqlite_cache.load_reg() == {"counter": {"val": 2}}
+
+
+def test_get_jids_filter(load):
+    jids = [f"2024010100000000000{idx}" for idx in range(5)]
+    for jid in jids:
+        _store_job(jid, load)
+    find_job = "20240101000000000009"
+    _store_job(find_job, dict(load, fun="saltutil.find_job"))
+    ret = sqlite_cache.get_jids_filter(3)
+    assert [job["JID"] for job in ret] == jids[2:]
+    ret = sqlite_cache.get_jids_filter(2, filter_find_job=False)
+    assert [job["JID"] for job in ret] == [jids[-1], find_job]
+
+
+def test_clean_old_jobs(load):
+    old_jids = [f"2024010100000000000{idx}" for idx in range(5)]
+    with patch("time.time", return_value=time.time() - 7200):
+        for jid in old_jids:
+            _store_job(jid, load)
+    jid = salt.utils.jid.gen_jid({})
+    _store_job(jid, load)
+    sqlite_cache.clean_old_jobs()
+    assert list(sqlite_cache.get_jids()) == [jid]
+    for old_jid in old_jids:
+        assert sqlite_cache.get_jid(old_jid) == {}
+        assert sqlite_cache.get_load(old_jid) == {}
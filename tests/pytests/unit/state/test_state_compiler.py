@@ -1353,3 +1353,41 @@ def test_module_refresh_typeerror(minion_opts, caplog):
             "Error encountered during module reload. Modules were not reloaded."
             in caplog.text
         )
+
+
+def test_call_high_requisite_cycle_between_sls(minion_opts):
+    """
+    Test that a requisite cycle through sls requisites is reported up front,
+    failing the states of the cycle without running them
+    """
+    with patch("salt.state.State._gather_pillar"):
+        high_data = {
+            "step_one": {
+                "test": [{"require": [{"sls": "two"}]}, "succeed_with_changes"],
+                "__env__": "base",
+                "__sls__": "one",
+            },
+            "step_two": {
+                "test": [{"require": [{"sls": "one"}]}, "succeed_with_changes"],
+                "__env__": "base",
+                "__sls__": "two",
+            },
+            "step_three": {
+                "test": ["succeed_with_changes"],
+                "__env__": "base",
+                "__sls__": "three",
+            },
+        }
+        state_obj = salt.state.State(minion_opts)
+        ret = state_obj.call_high(high_data)
+        for id_ in ("step_one", "step_two"):
+            result = ret[f"test_|-{id_}_|-{id_}_|-succeed_with_changes"]
+            assert result["result"] is False
+            assert result["changes"] == {}
+            assert result["comment"] == (
+                "Recursive requisite found between the states: "
+                "one.step_one, two.step_two"
+            )
+        result = ret["test_|-step_three_|-step_three_|-succeed_with_changes"]
+        assert result["result"] is True
+        assert state_obj.requisite_graph is None
@@ -0,0 +1,221 @@
+"""
+Tests of the concurrent state runs, see the ``state_concurrency`` option
+"""
+
+import threading
+
+import pytest
+
+import salt.state
+from salt.state import _gen_tag
+from tests.support.mock import MagicMock, patch
+
+pytestmark = [
+    pytest.mark.core_test,
+]
+
+
+def _state(state, fun, sls="concurrency", **kwargs):
+    return {
+        state: [fun] + [{key: val} for key, val in kwargs.items()],
+        "__env__": "base",
+        "__sls__": sls,
+    }
+
+
+def _rendezvous(tmp_path, name, other):
+    """
+    A command which only succeeds if the command of the other state runs at
+    the same time
+    """
+    return (
+        f"touch {tmp_path / name}; for i in $(seq 100); do "
+        f"[ -e {tmp_path / other} ] && exit 0; sleep 0.1; done; exit 1"
+    )
+
+
+@pytest.fixture
+def minion_opts(minion_opts):
+    minion_opts["file_client"] = "local"
+    minion_opts["state_concurrency"] = 4
+    return minion_opts
+
+
+def _call_high(minion_opts, high):
+    with patch("salt.state.State._gather_pillar", return_value={}):
+        state_obj = salt.state.State(minion_opts)
+        state_obj.event = MagicMock()
+        ret = state_obj.call_high(high)
+    return state_obj, ret
+
+
+def _run_order(ret):
+    return [
+        tag.split("_|-")[1]
+        for tag, _ in sorted(ret.items(), key=lambda item: item[1]["__run_num__"])
+    ]
+
+
+@pytest.mark.skip_on_windows
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_independent_states_run_concurrently(minion_opts, tmp_path, mode):
+    minion_opts["state_concurrency_mode"] = mode
+    high = {
+        "one": _state(
+            "cmd",
+            "run",
+            name=_rendezvous(tmp_path, "one", "two"),
+            shell="/bin/sh",
+            order=10000,
+        ),
+        "two": _state(
+            "cmd",
+            "run",
+            name=_rendezvous(tmp_path, "two", "one"),
+            shell="/bin/sh",
+            order=10001,
+        ),
+        "three": _state(
+            "test",
+            "succeed_with_changes",
+            require=[{"cmd": "one"}, {"cmd": "two"}],
+            order=10002,
+        ),
+    }
+    state_obj, ret = _call_high(minion_opts, high)
+    assert len(ret) == 3
+    for result in ret.values():
+        assert result["result"] is True, result["comment"]
+    assert _run_order(ret)[2] == "three"
+    # The events are fired once per state, with the final results
+    assert state_obj.event.call_count == 3
+    fired = [call.args[0] for call in state_obj.event.call_args_list]
+    assert sorted(result["__run_num__"] for result in fired) == [0, 1, 2]
+    for result in fired:
+        assert result["result"] is True
+
+
+def test_requisites_and_order_barriers(minion_opts):
+    high = {
+        "last": _state("test", "succeed_with_changes", order="last"),
+        "setup": _state("test", "succeed_with_changes", order="first"),
+        "a": _state("test", "succeed_with_changes", order=10000),
+        "b": _state("test", "succeed_without_changes", order=10001),
+        "c": _state(
+            "test",
+            "succeed_with_changes",
+            watch=[{"test": "a"}],
+            onchanges=[{"test": "b"}],
+            order=10002,
+        ),
+        "d": _state("test", "succeed_with_changes", onfail=["b"], order=10003),
+    }
+    _, ret = _call_high(minion_opts, high)
+    order = _run_order(ret)
+    assert order[0] == "setup"
+    assert order[-1] == "last"
+    assert order.index("c") > order.index("a")
+    assert order.index("c") > order.index("b")
+    assert sorted(result["__run_num__"] for result in ret.values()) == list(range(6))
+    assert ret["test_|-c_|-c_|-succeed_with_changes"]["comment"] == (
+        "State was not run because none of the onchanges reqs changed"
+    )
+    assert ret["test_|-d_|-d_|-succeed_with_changes"]["comment"] == (
+        "State was not run because onfail req did not change"
+    )
+
+
+def test_failhard_stops_the_run(minion_opts):
+    high = {
+        "fail": _state("test", "fail_without_changes", failhard=True, order=1),
+        "other": _state("test", "succeed_with_changes", order=10000),
+    }
+    _, ret = _call_high(minion_opts, high)
+    assert list(ret) == ["test_|-fail_|-fail_|-fail_without_changes"]
+
+
+def test_exclusive_states(minion_opts):
+    state_obj = salt.state.State(minion_opts, initial_pillar={})
+    low = {"state": "test", "fun": "nop", "name": "a", "__id__": "a"}
+    assert not state_obj._concurrent_exclusive(low, False)
+    assert state_obj._concurrent_exclusive(dict(low, prereq=["b"]), False)
+    assert state_obj._concurrent_exclusive(dict(low, reload_modules=True), False)
+    assert state_obj._concurrent_exclusive(low, True)
+    assert state_obj._concurrent_exclusive(low, ["test"])
+    assert not state_obj._concurrent_exclusive(low, ["pkg"])
+    assert state_obj._concurrent_exclusive(dict(low, state="pkg"), False)
+    low = dict(low, state="file", fun="managed")
+    assert not state_obj._concurrent_exclusive(low, False)
+    assert state_obj._concurrent_exclusive(dict(low, name="mod.py"), False)
+
+
+def test_workers_share_the_context(minion_opts):
+    """
+    A value invalidated by a state in a worker is not seen by the other
+    workers nor by the states instance which started them
+    """
+    minion_opts["state_concurrency_mode"] = "thread"
+    started = threading.Barrier(2, timeout=30)
+    popped = threading.Event()
+    seen = {}
+
+    def _call_chunk_isolated(self, low, running, chunks):
+        started.wait()
+        if low["__id__"] == "a":
+            self.state_con.pop("pkg.list_pkgs")
+            self.state_con["retcode"] = 2
+            popped.set()
+        else:
+            popped.wait(30)
+            seen["pkg.list_pkgs"] = self.state_con.get("pkg.list_pkgs")
+            seen["retcode"] = self.state_con.get("retcode")
+        seen.setdefault("workers", set()).add(id(self))
+        return {_gen_tag(low): {"result": True, "changes": {}, "comment": ""}}
+
+    high = {
+        "a": _state("test", "nop", order=10000),
+        "b": _state("test", "nop", order=10001),
+    }
+    with patch("salt.state.State._gather_pillar", return_value={}):
+        state_obj = salt.state.State(minion_opts)
+    state_obj.event = MagicMock()
+    state_obj.state_con["pkg.list_pkgs"] = {"foo": "1.0"}
+    with patch.object(salt.state.State, "_call_chunk_isolated", _call_chunk_isolated):
+        ret = state_obj.call_high(high)
+    assert len(ret) == 2
+    assert len(seen["workers"]) == 2
+    assert seen["pkg.list_pkgs"] is None
+    # The retcode of a state is not seen by the others
+    assert seen["retcode"] is None
+    assert "pkg.list_pkgs" not in state_obj.state_con
+    assert state_obj.state_con["retcode"] == 2
+    assert state_obj.state_con["fileclient"] is state_obj.file_client
+
+
+@pytest.mark.skip_on_windows
+def test_process_changes_to_the_context(minion_opts):
+    minion_opts["state_concurrency_mode"] = "process"
+
+    def _call_chunk_isolated(self, low, running, chunks):
+        self.state_con.pop("pkg.list_pkgs")
+        self.state_con["service.list"] = ["foo"]
+        self.state_con["retcode"] = 2
+        return {_gen_tag(low): {"result": True, "changes": {}, "comment": ""}}
+
+    high = {
+        "a": _state("test", "nop", order=10000),
+        "b": _state("test", "nop", order=10001),
+    }
+    with patch("salt.state.State._gather_pillar", return_value={}):
+        state_obj = salt.state.State(minion_opts)
+    state_obj.event = MagicMock()
+    state_obj.state_con["pkg.list_pkgs"] = {"foo": "1.0"}
+    state_obj.state_con["service.list"] = ["bar"]
+    state_obj.state_con["other"] = True
+    with patch.object(salt.state.State, "_call_chunk_isolated", _call_chunk_isolated):
+        ret = state_obj.call_high(high)
+    assert len(ret) == 2
+    assert "pkg.list_pkgs" not in state_obj.state_con
+    assert "service.list" not in state_obj.state_con
+    assert state_obj.state_con["other"] is True
+    assert state_obj.state_con["retcode"] == 2
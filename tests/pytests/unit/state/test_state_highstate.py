@@ -9,6 +9,7 @@ import pytest  # pylint: disable=unused-import
 
 import salt.state
 from salt.utils.odict import DefaultOrderedDict, OrderedDict
+from tests.support.mock import patch
 
 log = logging.getLogger(__name__)
 
@@ -418,3 +419,43 @@ def test_verify_tops_match_none(highstate):
     tops["base"] = OrderedDict([("*", [OrderedDict([("match", "")]), "test", "test2"])])
     matches = highstate.verify_tops(tops)
     assert "Improperly formatted top file matcher in saltenv" in matches[0]
+
+
+def test_call_highstate_compile_cache(highstate, state_tree_dir):
+    opts = highstate.opts
+    opts["state_compile_cache"] = True
+    opts["autoload_dynamic_modules"] = False
+    state_tree_dir.mkdir(parents=True, exist_ok=True)
+    (state_tree_dir / "top.sls").write_text("base: {'*': [foo]}")
+    (state_tree_dir / "foo.sls").write_text(
+        '{% from "map.jinja" import value %}\nfoo:\n  test.succeed_without_changes:\n'
+        "    - name: {{ value }}\n"
+    )
+    (state_tree_dir / "map.jinja").write_text("{% set value = 'one' %}\n")
+
+    def call_highstate():
+        # Every state run compiles the highstate with a new HighState
+        _highstate = salt.state.HighState(opts)
+        render_highstate = _highstate.render_highstate
+        with patch.object(
+            _highstate, "render_highstate", side_effect=render_highstate
+        ) as render, patch.object(
+            _highstate.state, "call_high", side_effect=lambda high, *args: high
+        ):
+            high = _highstate.call_highstate(exclude="bar")
+        assert high["__exclude__"] == ["bar"]
+        return high["foo"]["test"][0]["name"], render.call_count
+
+    assert call_highstate() == ("one", 1)
+    assert call_highstate() == ("one", 0)
+    # An imported file changed
+    (state_tree_dir / "map.jinja").write_text("{% set value = 'three' %}\n")
+    assert call_highstate() == ("three", 1)
+    assert call_highstate() == ("three", 0)
+    # The grains changed
+    opts["grains"] = dict(opts["grains"], new_grain=True)
+    assert call_highstate() == ("three", 1)
+    opts["state_compile_cache_grains"] = ["os"]
+    assert call_highstate() == ("three", 1)
+    opts["grains"] = dict(opts["grains"], new_grain=False)
+    assert call_highstate() == ("three", 0)
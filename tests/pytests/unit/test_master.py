@@ -7,7 +7,9 @@ import time
 import pytest
 
 import salt.master
+import salt.utils.metrics
 import salt.utils.platform
+import salt.utils.process
 from tests.support.mock import MagicMock, patch
 
 
@@ -1053,3 +1055,221 @@ def test_syndic_return_cache_dir_creation_traversal(encrypted_requests):
     )
     assert not (cachedir / "syndics").exists()
     assert not (cachedir / "mamajama").exists()
+
+
+async def test_mworker_metrics(master_opts, tmp_path):
+    """
+    The master worker records the count, latency and errors of the requests
+    """
+    mworker = salt.master.MWorker(master_opts, {}, {}, [])
+    mworker.metrics = salt.utils.metrics.Registry("MWorker-0", path=str(tmp_path))
+    mworker.clear_funcs = MagicMock(expose_methods=("publish",))
+    mworker.aes_funcs = MagicMock(expose_methods=("_return",))
+    with patch.object(mworker, "_handle_aes", return_value=({}, {"fun": "send"})):
+        await mworker._handle_payload({"enc": "aes", "load": {"cmd": "_return"}})
+        await mworker._handle_payload({"enc": "aes", "load": {"cmd": "bogus"}})
+    with patch.object(mworker, "_handle_aes", side_effect=ValueError):
+        with pytest.raises(ValueError):
+            await mworker._handle_payload({"enc": "aes", "load": {"cmd": "_return"}})
+
+    series = mworker.metrics.series
+    assert (
+        series[("salt_master_requests_total", (("cmd", "_return"), ("enc", "aes")))]
+        == 2
+    )
+    assert (
+        series[("salt_master_requests_total", (("cmd", "unknown"), ("enc", "aes")))]
+        == 1
+    )
+    assert series[("salt_master_request_errors_total", (("cmd", "_return"),))] == 1
+    assert (
+        series[("salt_master_request_duration_seconds", (("cmd", "_return"),))][-2] == 2
+    )
+    assert ("salt_master_worker_busy_seconds_total", ()) in series
+
+
+def test_metrics_server_render(master_opts, tmp_path):
+    opts = dict(master_opts, sock_dir=str(tmp_path))
+    registry = salt.utils.metrics.Registry(
+        "MWorker-0", path=salt.utils.metrics.metrics_dir(opts)
+    )
+    registry.inc("salt_master_auth_total")
+    registry.flush()
+    text = salt.master.MetricsServer(opts).render()
+    assert "salt_master_auth_total 1" in text.splitlines()
+
+
+async def test_mworker_pool_slot(master_opts):
+    """
+    The master worker reports its busy time and handled requests to its pool
+    slot
+    """
+    state = [0.0] * (2 * salt.master.MWorkerPool.SLOT_SIZE)
+    mworker = salt.master.MWorker(
+        master_opts, {}, {}, [], pool_state=state, pool_slot=1
+    )
+    mworker.clear_funcs = MagicMock(expose_methods=("publish",))
+    mworker.aes_funcs = MagicMock(expose_methods=("_return",))
+    with patch.object(mworker, "_handle_aes", return_value=({}, {"fun": "send"})):
+        await mworker._handle_payload({"enc": "aes", "load": {"cmd": "_return"}})
+    with patch.object(mworker, "_handle_aes", side_effect=ValueError):
+        with pytest.raises(ValueError):
+            await mworker._handle_payload({"enc": "aes", "load": {"cmd": "_return"}})
+    assert state[:4] == [0.0] * 4
+    busy_since, busy_total, requests, drain = state[4:]
+    assert busy_since == 0
+    assert busy_total >= 0
+    assert requests == 2
+    assert drain == 0
+
+
+def test_mworker_check_drain(master_opts):
+    """
+    A draining worker first stops receiving requests, then exits once done
+    with the ones it received
+    """
+    state = [0.0] * salt.master.MWorkerPool.SLOT_SIZE
+    req_channel = MagicMock(**{"drained.return_value": False})
+    mworker = salt.master.MWorker(
+        master_opts, {}, {}, [req_channel], pool_state=state, pool_slot=0
+    )
+    mworker.io_loop = MagicMock()
+    mworker._check_drain()
+    req_channel.stop_accepting.assert_not_called()
+
+    state[3] = time.time() + 60
+    mworker._check_drain()
+    req_channel.stop_accepting.assert_called_once()
+    # Requests may still be received
+    mworker._check_drain()
+    mworker.io_loop.stop.assert_not_called()
+    # A request is being handled
+    req_channel.drained.return_value = True
+    state[0] = time.time()
+    mworker.in_progress = 1
+    mworker._check_drain()
+    mworker.io_loop.stop.assert_not_called()
+    state[0] = 0
+    mworker.in_progress = 0
+    mworker._check_drain()
+    mworker.io_loop.stop.assert_called_once()
+    req_channel.stop_accepting.assert_called_once()
+
+
+@pytest.fixture
+def mworker_pool(master_opts):
+    opts = dict(
+        master_opts,
+        worker_threads=2,
+        worker_threads_min=2,
+        worker_threads_max=4,
+        worker_threads_target_busy=0.5,
+        worker_threads_max_latency=0,
+        worker_threads_scale_down_delay=20,
+        worker_threads_drain_timeout=30,
+    )
+    pool = salt.master.MWorkerPool(opts, (opts, {}, {}, []))
+    pids = iter(range(1000, 2000))
+
+    def add_process(tgt, args=None, kwargs=None, name=None):
+        pid = next(pids)
+        pool._process_map[pid] = {
+            "tgt": tgt,
+            "args": args,
+            "kwargs": kwargs,
+            "Process": MagicMock(pid=pid, **{"is_alive.return_value": True}),
+        }
+
+    with patch.object(pool, "add_process", side_effect=add_process):
+        yield pool
+
+
+def _set_busy(pool, slot, busy_total, requests=1):
+    offset = slot * pool.SLOT_SIZE
+    pool.state[offset + 1] = busy_total
+    pool.state[offset + 2] = requests
+
+
+def test_mworker_pool_scale(mworker_pool):
+    mworker_pool.start_workers()
+    assert mworker_pool.workers() == {0: 1000, 1: 1001}
+
+    # The first check only samples the counters
+    mworker_pool.scale(now=100)
+    assert len(mworker_pool.workers()) == 2
+
+    # Both workers were busy all the time, 4 workers are needed
+    _set_busy(mworker_pool, 0, 10)
+    _set_busy(mworker_pool, 1, 10)
+    mworker_pool.scale(now=110)
+    assert mworker_pool.workers() == {0: 1000, 1: 1001, 2: 1002, 3: 1003}
+
+    # Never above worker_threads_max
+    for slot in range(4):
+        _set_busy(mworker_pool, slot, 20 + slot)
+    mworker_pool.scale(now=120)
+    assert len(mworker_pool.workers()) == 4
+
+    # No load, a worker is drained once the load has been low long enough
+    mworker_pool.scale(now=130)
+    mworker_pool.scale(now=140)
+    assert len(mworker_pool.workers()) == 4
+    mworker_pool.scale(now=150)
+    assert mworker_pool.workers() == {0: 1000, 1: 1001, 2: 1002}
+    assert mworker_pool._process_map[1003]["retired"]
+    assert mworker_pool.state[3 * mworker_pool.SLOT_SIZE + 3] > 0
+
+    # The draining worker is neither restarted nor its slot reused
+    mworker_pool.start_workers(1)
+    assert 1004 not in mworker_pool._process_map
+    mworker_pool._process_map[1003]["Process"].is_alive.return_value = False
+    with patch.object(mworker_pool, "restart_process") as restart_process:
+        salt.utils.process.ProcessManager.check_children(mworker_pool)
+    restart_process.assert_not_called()
+    assert 1003 not in mworker_pool._process_map
+
+    # Never below worker_threads_min
+    for now in range(160, 300, 10):
+        mworker_pool.scale(now=now)
+    assert mworker_pool.workers() == {0: 1000, 1: 1001}
+
+
+def test_mworker_pool_scale_latency(mworker_pool):
+    mworker_pool.opts["worker_threads_max_latency"] = 1
+    mworker_pool.max_latency = 1
+    mworker_pool.start_workers()
+    mworker_pool.scale(now=100)
+    # Low busy ratio but slow requests
+    _set_busy(mworker_pool, 0, 4, requests=2)
+    mworker_pool.scale(now=110)
+    assert len(mworker_pool.workers()) == 3
+
+
+def test_mworker_pool_drain_timeout(mworker_pool):
+    mworker_pool.start_workers()
+    mworker_pool.drain_worker(mworker_pool.workers())
+    process = mworker_pool._process_map[1001]["Process"]
+    mworker_pool.scale(now=time.time() + 10)
+    process.terminate.assert_not_called()
+    mworker_pool.scale(now=time.time() + 60)
+    process.terminate.assert_called_once()
+
+
+def test_aes_funcs_pillar_coalesce(master_opts, tmp_path):
+    """
+    With pillar_coalesce, a pillar requested again while still fresh is not
+    compiled nor stored in the minion data cache twice
+    """
+    opts = dict(master_opts, cachedir=str(tmp_path), pillar_coalesce=True)
+    aes_funcs = salt.master.AESFuncs(opts)
+    aes_funcs.masterapi = MagicMock()
+    pillar = MagicMock()
+    pillar.compile_pillar.return_value = {"foo": "bar"}
+    load = {"id": "minion", "grains": {"os": "Debian"}, "saltenv": "base"}
+    with patch("salt.pillar.get_pillar", return_value=pillar) as get_pillar:
+        assert aes_funcs._pillar(dict(load)) == {"foo": "bar"}
+        assert aes_funcs._pillar(dict(load)) == {"foo": "bar"}
+        assert get_pillar.call_count == 1
+        assert aes_funcs.masterapi.cache.store.call_count == 1
+        assert aes_funcs._pillar(dict(load, clean_cache=True)) == {"foo": "bar"}
+        assert get_pillar.call_count == 2
@@ -11,6 +11,8 @@ import os
 import shutil
 import tempfile
 import textwrap
+import threading
+import time
 
 import pytest
 
@@ -1259,3 +1261,239 @@ def test_compile_pillar_disk_cache(master_opts, grains):
                 "mocked_minion": {"base": {"foo": "bar"}, "dev": {"foo": "baz"}}
             }
             assert pillar.cache._dict == expected_cache
+
+
+def test_compile_pillar_track_deps(master_opts, tmp_path):
+    roots = [tmp_path / "roots1", tmp_path / "roots2"]
+    for root in roots:
+        root.mkdir()
+    (roots[1] / "top.sls").write_text("base:\n  '*':\n    - foo\n")
+    (roots[1] / "foo.sls").write_text(
+        '{% from "map.jinja" import value %}\nfoo: {{ value }}\n'
+    )
+    (roots[1] / "map.jinja").write_text("{% set value = 1 %}\n")
+    master_opts.update(
+        {
+            "cachedir": str(tmp_path / "cache"),
+            "pillar_roots": {"base": [str(root) for root in roots]},
+            "pillar_cache_backend": "disk",
+            "pillar_cache_ttl": 3600,
+            "pillar_cache_track_deps": True,
+            "ext_pillar": [],
+        }
+    )
+    os.makedirs(os.path.join(master_opts["cachedir"], "pillar_cache"))
+
+    def compile_pillar(grains):
+        return salt.pillar.PillarCache(
+            master_opts, grains, "minion", "base"
+        ).compile_pillar()
+
+    def touch(path, text):
+        # Make sure the modification time changes
+        mtime = path.stat().st_mtime_ns if path.exists() else 0
+        path.write_text(text)
+        os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+    fetch_pillar = salt.pillar.PillarCache.fetch_pillar
+    with patch(
+        "salt.pillar.PillarCache.fetch_pillar", autospec=True, side_effect=fetch_pillar
+    ) as fetch:
+        assert compile_pillar({"os": "Debian"}) == {"foo": 1}
+        assert compile_pillar({"os": "Debian"}) == {"foo": 1}
+        assert fetch.call_count == 1
+
+        # An imported template changed
+        touch(roots[1] / "map.jinja", "{% set value = 2 %}\n")
+        assert compile_pillar({"os": "Debian"}) == {"foo": 2}
+        assert fetch.call_count == 2
+
+        # A file shadowing the one used before appeared
+        touch(roots[0] / "foo.sls", "foo: 3\n")
+        assert compile_pillar({"os": "Debian"}) == {"foo": 3}
+        assert compile_pillar({"os": "Debian"}) == {"foo": 3}
+        assert fetch.call_count == 3
+
+        # The grains changed
+        assert compile_pillar({"os": "Fedora"}) == {"foo": 3}
+        assert fetch.call_count == 4
+
+        # The configuration changed
+        master_opts["pillar_merge_lists"] = True
+        assert compile_pillar({"os": "Fedora"}) == {"foo": 3}
+        assert fetch.call_count == 5
+
+        # External pillars without fingerprint are left to the TTL
+        master_opts["ext_pillar"] = [{"cmd_json": "echo {}"}]
+        assert compile_pillar({"os": "Fedora"}) == {"foo": 3}
+        touch(roots[1] / "top.sls", "base:\n  '*':\n    - foo\n")
+        assert compile_pillar({"os": "Fedora"}) == {"foo": 3}
+        assert compile_pillar({"os": "Fedora"}) == {"foo": 3}
+        assert fetch.call_count == 7
+
+
+def test_pillar_cache_ext_fingerprints_loader(master_opts, tmp_path):
+    master_opts.update(
+        {
+            "cachedir": str(tmp_path),
+            "pillar_roots": {"base": []},
+            "pillar_cache_backend": "disk",
+            "pillar_cache_track_deps": True,
+            "ext_pillar": [{"source": "a"}],
+        }
+    )
+    os.makedirs(os.path.join(master_opts["cachedir"], "pillar_cache"))
+    loader = MagicMock(_dict={"source.fingerprint": lambda minion_id, val: val})
+
+    def fingerprints():
+        return salt.pillar.PillarCache(
+            master_opts, {}, "minion", "base"
+        )._ext_fingerprints()
+
+    with patch.dict(salt.pillar._EXT_PILLAR_LOADERS, clear=True), patch(
+        "salt.loader.pillars", MagicMock(return_value=loader)
+    ) as pillars:
+        assert fingerprints() == [["source", "a"]]
+        assert fingerprints() == [["source", "a"]]
+        assert pillars.call_count == 1
+
+        # The loader is built again once the configuration changed
+        master_opts["ext_pillar"] = [{"source": "b"}]
+        assert fingerprints() == [["source", "b"]]
+        assert pillars.call_count == 2
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_ext_pillar_parallel(master_opts, tmp_path, parallel):
+    # Both sources only return once the other one is running as well
+    barrier = threading.Barrier(2, timeout=10)
+
+    def first(minion_id, pillar, *args, **kwargs):
+        if parallel:
+            barrier.wait()
+        return {"shared": {"a": 1}, "value": "first", "seen": sorted(pillar)}
+
+    def second(minion_id, pillar, *args, **kwargs):
+        if parallel:
+            barrier.wait()
+        return {"shared": {"b": 2}, "value": "second", "seen": sorted(pillar)}
+
+    def broken(minion_id, pillar, *args, **kwargs):
+        raise RuntimeError("broken")
+
+    def last(minion_id, pillar, *args, **kwargs):
+        return {"last": sorted(pillar)}
+
+    master_opts.update(
+        {
+            "cachedir": str(tmp_path),
+            "pillar_roots": {"base": []},
+            "ext_pillar_parallel": parallel,
+            "ext_pillar_sequential": ["last"],
+            "ext_pillar": [
+                {"first": None},
+                {"broken": None},
+                {"second": None},
+                {"last": None},
+            ],
+        }
+    )
+    ext_pillars = {"first": first, "second": second, "broken": broken, "last": last}
+    with patch("salt.loader.pillars", MagicMock(return_value=ext_pillars)):
+        pillar = salt.pillar.Pillar(master_opts, {}, "minion", "base")
+    ret, errors = pillar.ext_pillar({"base": True})
+    assert ret == {
+        "base": True,
+        "shared": {"a": 1, "b": 2},
+        "value": "second",
+        # The second source sees the first one only when they run one after
+        # the other
+        "seen": ["base"] if parallel else ["base", "seen", "shared", "value"],
+        "last": ["base", "seen", "shared", "value"],
+    }
+    assert errors == ["Failed to load ext_pillar broken: broken"]
+    assert [key for key, _ in pillar.ext_pillar_timings] == [
+        "first",
+        "broken",
+        "second",
+        "last",
+    ]
+
+
+def test_ext_pillar_cache(master_opts, tmp_path):
+    calls = []
+
+    def source(minion_id, pillar, *args, **kwargs):
+        calls.append((minion_id, args))
+        return {"source": {"minion": minion_id, "args": list(args)}}
+
+    master_opts.update(
+        {
+            "cachedir": str(tmp_path),
+            "pillar_roots": {"base": []},
+            "ext_pillar": [{"source": "arg"}],
+        }
+    )
+
+    def ext_pillar(minion_id, grains, cache):
+        opts = dict(master_opts, ext_pillar_cache={"source": cache})
+        with patch("salt.loader.pillars", MagicMock(return_value={"source": source})):
+            pillar = salt.pillar.Pillar(opts, grains, minion_id, "base")
+        return pillar.ext_pillar({})[0]["source"]["minion"]
+
+    minion = {"ttl": 60}
+    assert ext_pillar("minion1", {}, minion) == "minion1"
+    assert ext_pillar("minion1", {}, minion) == "minion1"
+    assert ext_pillar("minion2", {}, minion) == "minion2"
+    assert len(calls) == 2
+
+    calls.clear()
+    glob = {"ttl": 60, "key": "global"}
+    assert ext_pillar("minion1", {}, glob) == "minion1"
+    assert ext_pillar("minion2", {}, glob) == "minion1"
+    assert len(calls) == 1
+
+    calls.clear()
+    grains = {"ttl": 60, "key": "grains", "grains": ["os", "roles:web"]}
+    debian = {"os": "Debian", "roles": {"web": True}, "id": "minion1"}
+    assert ext_pillar("minion1", debian, grains) == "minion1"
+    assert ext_pillar("minion2", dict(debian, id="minion2"), grains) == "minion1"
+    assert ext_pillar("minion3", dict(debian, os="Fedora"), grains) == "minion3"
+    assert len(calls) == 2
+
+    # Expired data is rendered again
+    calls.clear()
+    with patch("time.time", MagicMock(return_value=time.time() + 120)):
+        assert ext_pillar("minion2", {}, glob) == "minion2"
+    assert len(calls) == 1
+
+    # Malformed configurations disable the cache of the source
+    calls.clear()
+    assert ext_pillar("minion1", {}, {"ttl": 60, "key": "unknown"}) == "minion1"
+    assert ext_pillar("minion1", {}, {"ttl": 60, "key": "unknown"}) == "minion1"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("top_match_index", [False, True])
+def test_top_matches_index(master_opts, tmp_path, top_match_index):
+    master_opts.update(
+        {
+            "cachedir": str(tmp_path),
+            "pillar_roots": {"base": []},
+            "top_match_index": top_match_index,
+        }
+    )
+    top = {
+        "base": {
+            "*": ["common"],
+            "minion*": ["glob"],
+            "G@os:Debian": ["debian"],
+            "G@os:Fedora": ["fedora"],
+            "minion or other": ["compound"],
+        }
+    }
+    pillar = salt.pillar.Pillar(master_opts, {"os": "Debian"}, "minion", "base")
+    confirm_top = MagicMock(side_effect=pillar.matchers["confirm_top.confirm_top"])
+    pillar.matchers = {"confirm_top.confirm_top": confirm_top}
+    assert pillar.top_matches(top) == {"base": ["common", "glob", "debian", "compound"]}
+    assert confirm_top.call_count == (1 if top_match_index else 5)
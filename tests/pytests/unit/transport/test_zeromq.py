@@ -1,3 +1,4 @@
+import errno
 import logging
 
 import msgpack
@@ -7,6 +8,7 @@ import zmq.eventloop.future
 import salt.config
 import salt.transport.base
 import salt.transport.zeromq
+import salt.utils.lanes
 import salt.utils.platform
 import salt.utils.process
 import salt.utils.stringutils
@@ -131,3 +133,30 @@ async def test_unclosed_publish_client(minion_opts, io_loop):
             client.__del__()  # pylint: disable=unnecessary-dunder-call
     finally:
         client.close()
+
+
+def test_lanes_dispatch_worker_exited(master_opts):
+    """
+    A request sent to a worker which exited reaches a running worker without
+    waiting for the next poll
+    """
+    lanes = salt.utils.lanes.parse_lanes(master_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, {"MWorker-0": None, "MWorker-1": None, "MWorker-2": None}
+    )
+    for worker in (b"MWorker-0", b"MWorker-1", b"MWorker-2"):
+        scheduler.available(worker)
+    sent = []
+
+    def send_multipart(frames):
+        if frames[0] != b"MWorker-2":
+            raise zmq.ZMQError(errno.EHOSTUNREACH)
+        sent.append(frames)
+
+    server = salt.transport.zeromq.RequestServer(master_opts)
+    server.workers = MagicMock(**{"send_multipart.side_effect": send_multipart})
+    scheduler.submit([b"client", b"", b"request"], "_return")
+    server._lanes_dispatch(scheduler)
+    assert sent == [[b"MWorker-2", b"client", b"", b"request"]]
+    assert server.workers.send_multipart.call_count == 3
+    assert list(scheduler.idle) == []
@@ -0,0 +1,105 @@
+"""
+Tests for the Jinja bytecode cache of salt.utils.jinja
+"""
+
+import jinja2
+import pytest
+
+import salt.utils.jinja
+from salt.utils.templates import render_jinja_tmpl
+from tests.support.mock import patch
+
+
+@pytest.fixture
+def cachedir(tmp_path):
+    cachedir = tmp_path / "cache"
+    yield cachedir
+    salt.utils.jinja._BYTECODE_CACHES.pop(str(cachedir / "jinja"), None)
+
+
+@pytest.fixture
+def render_context(cachedir):
+    return {
+        "opts": {"cachedir": str(cachedir), "jinja_bytecode_cache": True},
+        "saltenv": None,
+    }
+
+
+@pytest.fixture
+def templates(tmp_path):
+    tmpldir = tmp_path / "templates"
+    tmpldir.mkdir()
+    (tmpldir / "map.jinja").write_text(
+        "{% macro greet(name) %}hello {{ name }}{% endmacro %}"
+    )
+    sls = tmpldir / "init.sls"
+    sls.write_text("{% from 'map.jinja' import greet %}{{ greet(who) }}")
+    return tmpldir
+
+
+@pytest.fixture
+def compile_spy():
+    with patch.object(
+        jinja2.Environment,
+        "compile",
+        autospec=True,
+        side_effect=jinja2.Environment.compile,
+    ) as spy:
+        yield spy
+
+
+def _render(render_context, tmplpath, **context):
+    render_context = dict(render_context, **context)
+    with open(tmplpath) as fp_:
+        return render_jinja_tmpl(fp_.read(), render_context, tmplpath=str(tmplpath))
+
+
+def test_templates_compiled_once(render_context, templates, compile_spy):
+    sls = templates / "init.sls"
+    assert _render(render_context, sls, who="world") == "hello world"
+    assert compile_spy.call_count == 2
+    assert _render(render_context, sls, who="salt") == "hello salt"
+    assert compile_spy.call_count == 2
+    # Both templates are kept on disk
+    cached = list((templates.parent / "cache" / "jinja").iterdir())
+    assert len(cached) == 2
+
+
+def test_source_change_recompiles(render_context, templates, compile_spy):
+    sls = templates / "init.sls"
+    assert _render(render_context, sls, who="world") == "hello world"
+    sls.write_text("{% from 'map.jinja' import greet %}{{ greet(who) }}!")
+    assert _render(render_context, sls, who="world") == "hello world!"
+    assert compile_spy.call_count == 3
+
+
+def test_cache_loaded_from_disk(render_context, cachedir, templates, compile_spy):
+    sls = templates / "init.sls"
+    assert _render(render_context, sls, who="world") == "hello world"
+    # A new process only has the cache on disk
+    salt.utils.jinja._BYTECODE_CACHES.clear()
+    assert _render(render_context, sls, who="world") == "hello world"
+    assert compile_spy.call_count == 2
+
+
+def test_environment_options_key_the_cache(render_context, templates, compile_spy):
+    sls = templates / "init.sls"
+    sls.write_text("{% if who %}\nhello {{ who }}{% endif %}")
+    assert _render(render_context, sls, who="world") == "\nhello world"
+    render_context["opts"]["jinja_env"] = {"trim_blocks": True}
+    assert _render(render_context, sls, who="world") == "hello world"
+    assert compile_spy.call_count == 2
+
+
+def test_string_templates_kept_in_memory(render_context, cachedir, compile_spy):
+    assert render_jinja_tmpl("{{ 1 + 1 }}", dict(render_context)) == "2"
+    assert render_jinja_tmpl("{{ 2 + 2 }}", dict(render_context)) == "4"
+    assert render_jinja_tmpl("{{ 1 + 1 }}", dict(render_context)) == "2"
+    assert compile_spy.call_count == 2
+    assert list((cachedir / "jinja").iterdir()) == []
+
+
+def test_disabled(render_context):
+    render_context["opts"]["jinja_bytecode_cache"] = False
+    assert salt.utils.jinja.get_bytecode_cache(render_context["opts"]) is None
+    assert render_jinja_tmpl("{{ 1 + 1 }}", render_context) == "2"
@@ -0,0 +1,137 @@
+"""
+Tests for salt.utils.blockdelta
+"""
+
+import os
+import random
+import zlib
+
+import pytest
+
+import salt.utils.blockdelta
+from tests.support.mock import patch
+
+BLOCK_SIZE = 1024
+
+
+@pytest.fixture
+def content():
+    return random.Random(0).randbytes(BLOCK_SIZE * 20 + 100)
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_roll():
+    data = random.Random(1).randbytes(300)
+    weak = salt.utils.blockdelta.weak_checksum(data[:100])
+    for pos in range(200):
+        weak = salt.utils.blockdelta.roll(weak, data[pos], data[pos + 100], 100)
+        assert weak == zlib.adler32(data[pos + 1 : pos + 101])
+
+
+@pytest.mark.parametrize(
+    "change,missing",
+    [
+        # Unchanged
+        (lambda data: data, set()),
+        # Bytes inserted in the 3rd block, the blocks after it are shifted
+        (lambda data: data[:2500] + b"inserted" + data[2500:], {2}),
+        # A byte changed in the 6th block
+        (lambda data: data[:5000] + b"x" + data[5001:], {4}),
+        # The file grew at its end, the short last block moved
+        (lambda data: data[: BLOCK_SIZE * 20] + b"appended", {20}),
+        # The file was truncated
+        (lambda data: data[: BLOCK_SIZE * 10], set(range(10, 21))),
+        # The first blocks were dropped
+        (lambda data: data[BLOCK_SIZE * 2 :], {0, 1}),
+    ],
+)
+def test_match_blocks(tmp_path, content, change, missing):
+    new = _write(tmp_path, "new", content)
+    old = _write(tmp_path, "old", change(content))
+    sigs = salt.utils.blockdelta.signatures(new, BLOCK_SIZE, "sha256")
+    assert len(sigs["strong"]) == 21
+    found = salt.utils.blockdelta.match_blocks(old, sigs)
+    assert set(range(21)) - set(found) == missing
+    with open(old, "rb") as fp_:
+        for ind, offset in found.items():
+            fp_.seek(offset)
+            block = content[ind * BLOCK_SIZE : (ind + 1) * BLOCK_SIZE]
+            assert fp_.read(len(block)) == block
+
+
+def test_match_blocks_empty(tmp_path, content):
+    sigs = salt.utils.blockdelta.signatures(
+        _write(tmp_path, "new", content), BLOCK_SIZE, "sha256"
+    )
+    assert salt.utils.blockdelta.match_blocks(_write(tmp_path, "old", b""), sigs) == {}
+
+
+def test_match_blocks_mostly_changed(tmp_path):
+    """
+    The bytes of a copy which mostly changed are not all rolled, only the
+    blocks aligned on the block size are compared after a while
+    """
+    rand = random.Random(2)
+    content = rand.randbytes(BLOCK_SIZE * 8192)
+    changed = bytearray(rand.randbytes(len(content)))
+    # An unchanged block, and a block which moved by a few bytes
+    changed[BLOCK_SIZE * 5000 : BLOCK_SIZE * 5001] = content[
+        BLOCK_SIZE * 5000 : BLOCK_SIZE * 5001
+    ]
+    changed[BLOCK_SIZE * 6000 + 3 : BLOCK_SIZE * 6001 + 3] = content[
+        BLOCK_SIZE * 6000 : BLOCK_SIZE * 6001
+    ]
+    sigs = salt.utils.blockdelta.signatures(
+        _write(tmp_path, "new", content), BLOCK_SIZE, "sha256"
+    )
+    old = _write(tmp_path, "old", bytes(changed))
+    with patch(
+        "salt.utils.blockdelta.roll", side_effect=salt.utils.blockdelta.roll
+    ) as roll:
+        found = salt.utils.blockdelta.match_blocks(old, sigs)
+    assert found == {5000: BLOCK_SIZE * 5000}
+    assert roll.call_count <= salt.utils.blockdelta.MAX_UNMATCHED_BLOCKS * BLOCK_SIZE
+
+
+def test_get_signatures_cached(tmp_path, content):
+    opts = {"cachedir": str(tmp_path / "cache")}
+    path = _write(tmp_path, "new", content)
+    sigs = salt.utils.blockdelta.signatures(path, BLOCK_SIZE, "sha256")
+    assert (
+        salt.utils.blockdelta.get_signatures(
+            opts, path, sigs["hsum"], "sha256", BLOCK_SIZE
+        )
+        == sigs
+    )
+    with patch("salt.utils.blockdelta.signatures") as signatures:
+        assert (
+            salt.utils.blockdelta.get_signatures(
+                opts, path, sigs["hsum"], "sha256", BLOCK_SIZE
+            )
+            == sigs
+        )
+    signatures.assert_not_called()
+    # The file changed since it was hashed, the signatures are cached under
+    # the hash of the new content
+    _write(tmp_path, "new", b"changed")
+    sigs = salt.utils.blockdelta.get_signatures(
+        opts, path, "outdated", "sha256", BLOCK_SIZE
+    )
+    assert sigs["size"] == 7
+    assert sorted(os.listdir(os.path.join(opts["cachedir"], "file_blocks", "sha256")))
+
+
+def test_get_signatures_pruned(tmp_path):
+    opts = {"cachedir": str(tmp_path / "cache")}
+    with patch("salt.utils.blockdelta.MAX_CACHED", 2):
+        for ind in range(4):
+            path = _write(tmp_path, "file", str(ind).encode())
+            salt.utils.blockdelta.get_signatures(
+                opts, path, str(ind), "sha256", BLOCK_SIZE
+            )
+    assert len(os.listdir(os.path.join(opts["cachedir"], "file_blocks", "sha256"))) == 2
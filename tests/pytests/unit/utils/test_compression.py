@@ -0,0 +1,41 @@
+"""
+Tests for salt.utils.compression
+"""
+
+import pytest
+
+import salt.utils.compression
+from tests.support.mock import patch
+
+
+@pytest.mark.parametrize(
+    "offered,expected",
+    [
+        (["zstd", "lz4", "gzip"], "gzip"),
+        ([b"lz4", b"gzip"], "gzip"),
+        (["brotli"], "gzip"),
+        (None, "gzip"),
+    ],
+)
+def test_negotiate(offered, expected):
+    with patch("salt.utils.compression.HAS_ZSTD", False), patch(
+        "salt.utils.compression.HAS_LZ4", False
+    ):
+        assert salt.utils.compression.available_codecs() == ["gzip"]
+        assert salt.utils.compression.negotiate(offered) == expected
+
+
+def test_negotiate_preference():
+    with patch("salt.utils.compression.HAS_ZSTD", True), patch(
+        "salt.utils.compression.HAS_LZ4", True
+    ):
+        assert salt.utils.compression.available_codecs() == ["zstd", "lz4", "gzip"]
+        assert salt.utils.compression.negotiate(["lz4", "zstd"]) == "lz4"
+
+
+@pytest.mark.parametrize("codec", salt.utils.compression.available_codecs())
+def test_roundtrip(codec):
+    data = b"salt" * 10000
+    compressed = salt.utils.compression.compress(data, codec, 5)
+    assert len(compressed) < len(data)
+    assert salt.utils.compression.uncompress(compressed, codec) == data
@@ -0,0 +1,107 @@
+"""
+Tests for salt.utils.hashindex
+"""
+
+import os
+
+import pytest
+
+import salt.fileserver.roots as roots
+import salt.utils.hashindex
+import salt.utils.hashutils
+from tests.support.mock import patch
+
+
+@pytest.fixture
+def state_tree(tmp_path):
+    tree = tmp_path / "state_tree"
+    tree.mkdir()
+    (tree / "top.sls").write_text("top")
+    (tree / "init.sls").write_text("init")
+    return tree
+
+
+@pytest.fixture
+def master_opts(master_opts, state_tree, tmp_path):
+    master_opts["file_roots"] = {"base": [str(state_tree)]}
+    master_opts["fileserver_hash_index"] = True
+    master_opts["cachedir"] = str(tmp_path / "cache")
+    yield master_opts
+    salt.utils.hashindex._HASH_INDEXES.clear()
+
+
+@pytest.fixture
+def configure_loader_modules(master_opts):
+    return {roots: {"__opts__": master_opts}}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    return str(tmp_path / "hash_index.sha256.p")
+
+
+def test_refresh_hashes_changed_files(state_tree, snapshot):
+    index = salt.utils.hashindex.HashIndex("sha256", snapshot)
+    paths = [str(state_tree / "top.sls"), str(state_tree / "init.sls")]
+    assert index.refresh(paths) == 2
+    assert index.refresh(paths) == 0
+    (state_tree / "top.sls").write_text("changed")
+    assert index.refresh(paths) == 1
+    top_sls = str(state_tree / "top.sls")
+    assert index.lookup(top_sls, os.stat(top_sls)) == salt.utils.hashutils.get_hash(
+        top_sls
+    )
+    (state_tree / "init.sls").unlink()
+    assert index.refresh(paths) == 0
+    assert list(index.files) == [top_sls]
+
+
+def test_lookup_checks_the_stat(state_tree, snapshot):
+    index = salt.utils.hashindex.HashIndex("sha256", snapshot)
+    top_sls = str(state_tree / "top.sls")
+    index.refresh([top_sls])
+    path_stat = os.stat(top_sls)
+    assert index.lookup(top_sls, path_stat) is not None
+    os.utime(top_sls, ns=(path_stat.st_atime_ns, path_stat.st_mtime_ns + 1))
+    assert index.lookup(top_sls, os.stat(top_sls)) is None
+
+
+def test_snapshot_shared(state_tree, snapshot):
+    top_sls = str(state_tree / "top.sls")
+    salt.utils.hashindex.HashIndex("sha256", snapshot).refresh([top_sls])
+    # Another process only has the snapshot
+    index = salt.utils.hashindex.HashIndex("sha256", snapshot)
+    with patch("salt.utils.hashutils.get_hash") as get_hash:
+        assert index.lookup(top_sls, os.stat(top_sls)) is not None
+        assert index.refresh([top_sls]) == 0
+    get_hash.assert_not_called()
+    # The snapshots of another hash type are ignored
+    index = salt.utils.hashindex.HashIndex("md5", snapshot)
+    assert index.lookup(top_sls, os.stat(top_sls)) is None
+
+
+def test_roots_file_hash(master_opts, state_tree):
+    roots.update()
+    load = {"saltenv": "base", "path": "top.sls"}
+    fnd = roots.find_file("top.sls")
+    expected = {
+        "hash_type": master_opts["hash_type"],
+        "hsum": salt.utils.hashutils.get_hash(
+            str(state_tree / "top.sls"), master_opts["hash_type"]
+        ),
+    }
+    with patch("salt.utils.hashutils.get_hash") as get_hash, patch(
+        "salt.utils.files.fopen"
+    ) as fopen:
+        assert roots.file_hash(load, fnd) == expected
+    get_hash.assert_not_called()
+    fopen.assert_not_called()
+
+    (state_tree / "top.sls").write_text("changed")
+    expected["hsum"] = salt.utils.hashutils.get_hash(
+        str(state_tree / "top.sls"), master_opts["hash_type"]
+    )
+    assert roots.file_hash(load, fnd) == expected
+    with patch("salt.utils.hashutils.get_hash") as get_hash:
+        assert roots.file_hash(load, fnd) == expected
+    get_hash.assert_not_called()
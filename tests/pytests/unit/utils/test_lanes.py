@@ -0,0 +1,236 @@
+import pytest
+
+import salt.exceptions
+import salt.payload
+import salt.utils.lanes
+import salt.utils.metrics
+
+
+@pytest.fixture
+def lanes_opts(master_opts):
+    return dict(
+        master_opts,
+        transport="zeromq",
+        worker_threads=2,
+        request_lanes={
+            "auth": {"cmds": ["_auth"], "workers": 1, "weight": 4},
+            "files": {"cmds": ["_serve_file", "_file_hash"], "weight": 1},
+        },
+    )
+
+
+def test_parse_lanes(lanes_opts):
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    assert list(lanes) == ["auth", "files", "default"]
+    assert lanes["auth"].cmds == {"_auth"}
+    assert lanes["auth"].workers == 1
+    assert lanes["auth"].weight == 4
+    assert lanes["default"].weight == 1
+    assert salt.utils.lanes.worker_names(lanes_opts, lanes) == {
+        "MWorker-0": None,
+        "MWorker-1": None,
+        "MWorker-auth-0": "auth",
+    }
+
+
+@pytest.mark.parametrize(
+    "request_lanes",
+    [
+        {"auth": ["_auth"]},
+        {"auth": {"weight": 0}},
+        {"auth": {"workers": "many"}},
+        {"a": {"cmds": ["_auth"]}, "b": {"cmds": ["_auth"]}},
+    ],
+)
+def test_parse_lanes_invalid(lanes_opts, request_lanes):
+    lanes_opts["request_lanes"] = request_lanes
+    with pytest.raises(salt.exceptions.SaltConfigurationError):
+        salt.utils.lanes.parse_lanes(lanes_opts)
+
+
+def test_enabled(lanes_opts):
+    assert salt.utils.lanes.enabled(lanes_opts)
+    assert not salt.utils.lanes.enabled(dict(lanes_opts, transport="tcp"))
+    assert not salt.utils.lanes.enabled(dict(lanes_opts, request_lanes={}))
+    assert salt.utils.lanes.enabled(
+        dict(lanes_opts, request_lanes={}, worker_threads_autoscale=True)
+    )
+
+
+def test_classify():
+    assert (
+        salt.utils.lanes.classify(
+            salt.payload.dumps({"enc": "clear", "load": {"cmd": "_auth"}})
+        )
+        == "_auth"
+    )
+    assert (
+        salt.utils.lanes.classify(
+            salt.payload.dumps({"enc": "aes", "load": b"...", "cmd": "_return"})
+        )
+        == "_return"
+    )
+    assert (
+        salt.utils.lanes.classify(salt.payload.dumps({"enc": "aes", "load": b"..."}))
+        is None
+    )
+    assert salt.utils.lanes.classify(b"\xc1garbage") is None
+
+
+def _frames(name):
+    return [b"client", b"", name.encode()]
+
+
+def test_scheduler_reserved_workers(lanes_opts):
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, salt.utils.lanes.worker_names(lanes_opts, lanes)
+    )
+    for worker in (b"MWorker-0", b"MWorker-1", b"MWorker-auth-0"):
+        scheduler.ready(worker)
+    # A flood of file requests takes the common workers only
+    for ind in range(5):
+        scheduler.submit(_frames(f"file{ind}"), "_serve_file", now=0)
+    sent = scheduler.dispatch(now=1)
+    assert [worker for worker, _ in sent] == [b"MWorker-0", b"MWorker-1"]
+    assert len(lanes["files"].queue) == 3
+
+    # The auth requests still get the reserved worker right away
+    scheduler.submit(_frames("auth"), "_auth", now=1)
+    assert scheduler.dispatch(now=1) == [(b"MWorker-auth-0", _frames("auth"))]
+
+    # Once done the reserved worker only serves its own lane
+    scheduler.done(b"MWorker-auth-0")
+    assert scheduler.dispatch(now=2) == []
+    scheduler.done(b"MWorker-0")
+    assert scheduler.dispatch(now=2) == [(b"MWorker-0", _frames("file2"))]
+
+
+def test_scheduler_weights(lanes_opts):
+    lanes_opts["request_lanes"]["auth"]["workers"] = 0
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(lanes, {"MWorker-0": None})
+    scheduler.ready(b"MWorker-0")
+    for ind in range(10):
+        scheduler.submit(_frames(f"auth{ind}"), "_auth", now=0)
+        scheduler.submit(_frames(f"file{ind}"), "_file_hash", now=0)
+        scheduler.submit(_frames(f"other{ind}"), "_return", now=0)
+    served = []
+    for _ in range(12):
+        ((worker, frames),) = scheduler.dispatch(now=0)
+        served.append(frames[-1].decode().rstrip("0123456789"))
+        scheduler.done(worker)
+    assert served.count("auth") == 8
+    assert served.count("file") == 2
+    assert served.count("other") == 2
+
+
+def test_scheduler_workers_not_started(lanes_opts):
+    """
+    The registered workers which never started are not sent requests
+    """
+    lanes_opts.update(request_lanes={}, worker_threads=5, worker_threads_max=32)
+    lanes_opts["worker_threads_autoscale"] = True
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, salt.utils.lanes.worker_names(lanes_opts, lanes)
+    )
+    assert len(scheduler.workers) == 32
+    assert scheduler.dispatch(now=0) == []
+    scheduler.ready(b"MWorker-3")
+    for ind in range(3):
+        scheduler.submit(_frames(f"req{ind}"), "_return", now=ind)
+        ((worker, frames),) = scheduler.dispatch(now=ind)
+        assert worker == b"MWorker-3"
+        assert frames == _frames(f"req{ind}")
+        scheduler.done(worker)
+
+
+def test_scheduler_unreachable_and_stale(lanes_opts):
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, {"MWorker-0": None, "MWorker-1": None}, stale_after=10
+    )
+    scheduler.ready(b"MWorker-0")
+    scheduler.ready(b"MWorker-1")
+    scheduler.submit(_frames("a"), "_return", now=0)
+    scheduler.submit(_frames("b"), "_return", now=0)
+    sent = scheduler.dispatch(now=0)
+    assert len(sent) == 2
+    # MWorker-1 exited, its request is queued again first
+    scheduler.unreachable(b"MWorker-1")
+    assert list(lanes["default"].queue) == [(0, _frames("b"))]
+    assert scheduler.dispatch(now=1) == []
+    # Until it reports itself available again
+    scheduler.available(b"MWorker-1")
+    scheduler.available(b"MWorker-1")
+    assert scheduler.dispatch(now=1) == [(b"MWorker-1", _frames("b"))]
+    # A worker in flight is not made available
+    scheduler.available(b"MWorker-1")
+    assert list(scheduler.idle) == []
+    # MWorker-0 is busy with a long request, the next one waits for a free
+    # worker instead of being queued behind it
+    scheduler.submit(_frames("c"), "_return", now=5)
+    assert scheduler.dispatch(now=5) == []
+    assert scheduler.dispatch(now=11) == []
+    assert scheduler.stale == {b"MWorker-0"}
+    scheduler.done(b"MWorker-1")
+    assert scheduler.dispatch(now=12) == [(b"MWorker-1", _frames("c"))]
+    scheduler.done(b"MWorker-0")
+    assert scheduler.stale == set()
+    assert list(scheduler.idle) == [b"MWorker-0"]
+    # A new process of a worker gives up on the request of the previous one
+    scheduler.submit(_frames("d"), "_return", now=13)
+    assert scheduler.dispatch(now=13) == [(b"MWorker-0", _frames("d"))]
+    scheduler.ready(b"MWorker-0")
+    assert lanes["default"].busy == 1
+    assert list(scheduler.idle) == [b"MWorker-0"]
+
+
+def test_scheduler_drain_and_ready(lanes_opts):
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, {"MWorker-0": None, "MWorker-1": None}
+    )
+    scheduler.ready(b"MWorker-0")
+    scheduler.ready(b"MWorker-1")
+    scheduler.submit(_frames("a"), "_return", now=0)
+    assert scheduler.dispatch(now=0) == [(b"MWorker-0", _frames("a"))]
+    # Both workers drain, the reply of the busy one is still waited for
+    scheduler.drain(b"MWorker-0")
+    scheduler.drain(b"MWorker-1")
+    scheduler.submit(_frames("b"), "_return", now=1)
+    assert scheduler.dispatch(now=1) == []
+    scheduler.done(b"MWorker-0")
+    assert scheduler.dispatch(now=2) == []
+    # Not even sent requests once stale, nor when reported available
+    assert scheduler.dispatch(now=1000) == []
+    scheduler.available(b"MWorker-1")
+    assert scheduler.dispatch(now=1000) == []
+    # A new worker of the same name takes the queued requests
+    scheduler.ready(b"MWorker-1")
+    scheduler.ready(b"MWorker-1")
+    assert scheduler.dispatch(now=1001) == [(b"MWorker-1", _frames("b"))]
+    assert list(scheduler.idle) == []
+
+
+def test_scheduler_metrics(lanes_opts):
+    lanes = salt.utils.lanes.parse_lanes(lanes_opts)
+    metrics = salt.utils.metrics.Registry("MWorkerQueue")
+    scheduler = salt.utils.lanes.LaneScheduler(
+        lanes, {"MWorker-0": None}, metrics=metrics
+    )
+    scheduler.ready(b"MWorker-0")
+    scheduler.submit(_frames("a"), "_serve_file", now=0)
+    scheduler.submit(_frames("b"), "_serve_file", now=0)
+    scheduler.dispatch(now=0.2)
+    scheduler.update_metrics()
+    series = metrics.series
+    assert series[("salt_master_lane_requests_total", (("lane", "files"),))] == 1
+    assert series[("salt_master_lane_queue_depth", (("lane", "files"),))] == 1
+    assert series[("salt_master_lane_busy_workers", (("lane", "files"),))] == 1
+    assert series[("salt_master_lane_queue_depth", (("lane", "auth"),))] == 0
+    wait = series[("salt_master_lane_wait_seconds", (("lane", "files"),))]
+    assert wait[-2] == 1
+    text = salt.utils.metrics.render(salt.utils.metrics.merge([metrics.snapshot()]))
+    assert 'salt_master_lane_queue_depth{lane="files"} 1' in text.splitlines()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+import pytest
+
+import salt.utils.files
+import salt.utils.master
+
+
+@pytest.fixture
+def pillar_flight(master_opts, tmp_path):
+    opts = dict(
+        master_opts,
+        cachedir=str(tmp_path),
+        pillar_coalesce_ttl=10,
+        pillar_coalesce_wait=30,
+    )
+    return salt.utils.master.PillarFlight(opts)
+
+
+@pytest.fixture
+def load():
+    return {
+        "id": "minion",
+        "grains": {"os": "Debian", "id": "minion"},
+        "saltenv": "base",
+        "pillarenv": None,
+        "pillar_override": {},
+    }
+
+
+def test_pillar_flight_key(load):
+    key = salt.utils.master.PillarFlight.key(load)
+    assert key == salt.utils.master.PillarFlight.key(dict(load))
+    for update in (
+        {"id": "other"},
+        {"saltenv": "dev"},
+        {"pillarenv": "dev"},
+        {"pillar_override": {"foo": "bar"}},
+        {"extra_minion_data": {"foo": "bar"}},
+        {"grains": {"os": "Fedora", "id": "minion"}},
+    ):
+        assert salt.utils.master.PillarFlight.key(dict(load, **update)) != key
+
+
+def test_pillar_flight_get(pillar_flight, load):
+    key = pillar_flight.key(load)
+    compiled = []
+
+    def compile_pillar():
+        compiled.append(1)
+        return {"count": len(compiled)}
+
+    assert pillar_flight.get(key, compile_pillar) == ({"count": 1}, False)
+    assert pillar_flight.get(key, compile_pillar) == ({"count": 1}, True)
+    # A refresh compiles the pillar again
+    time.sleep(0.01)
+    assert pillar_flight.get(key, compile_pillar, refresh=True) == (
+        {"count": 2},
+        False,
+    )
+    # Expired
+    pillar_flight.ttl = 0
+    time.sleep(0.01)
+    assert pillar_flight.get(key, compile_pillar) == ({"count": 3}, False)
+
+
+def test_pillar_flight_coalesce(pillar_flight, load):
+    """
+    Concurrent requests of the same pillar compile it once
+    """
+    key = pillar_flight.key(load)
+    compiled = []
+    results = []
+
+    def compile_pillar():
+        compiled.append(1)
+        time.sleep(0.5)
+        return {"foo": "bar"}
+
+    def request():
+        results.append(pillar_flight.get(key, compile_pillar, refresh=True))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(compiled) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(data == {"foo": "bar"} for data, _ in results)
+
+
+def test_pillar_flight_wait_timeout(pillar_flight, load):
+    key = pillar_flight.key(load)
+    pillar_flight.wait = 0
+    started = threading.Event()
+
+    def slow_compile():
+        started.set()
+        time.sleep(0.5)
+        return {"slow": True}
+
+    thread = threading.Thread(target=pillar_flight.get, args=(key, slow_compile))
+    thread.start()
+    started.wait()
+    try:
+        # Does not wait for the other compilation
+        assert pillar_flight.get(key, lambda: {"fast": True}) == (
+            {"fast": True},
+            False,
+        )
+    finally:
+        thread.join()
+
+
+def test_pillar_flight_distinct_keys(pillar_flight, load):
+    """
+    The compilations of different pillars do not wait for each other, and
+    leave no lock file behind
+    """
+    key = pillar_flight.key(load)
+    other_key = pillar_flight.key(dict(load, id="other"))
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_compile():
+        started.set()
+        release.wait(5)
+        return {"slow": True}
+
+    thread = threading.Thread(target=pillar_flight.get, args=(key, slow_compile))
+    thread.start()
+    started.wait()
+    try:
+        start = time.monotonic()
+        assert pillar_flight.get(other_key, lambda: {"fast": True}) == (
+            {"fast": True},
+            False,
+        )
+        assert time.monotonic() - start < 1
+    finally:
+        release.set()
+        thread.join()
+    assert not [
+        name for name in os.listdir(pillar_flight.path) if name.endswith(".lock")
+    ]
+
+
+def test_pillar_flight_sweeps_stale_locks(pillar_flight, load):
+    key = pillar_flight.key(load)
+    os.makedirs(pillar_flight.path)
+    lock_file = os.path.join(pillar_flight.path, f"{key}.lock")
+    with salt.utils.files.fopen(lock_file, "w"):
+        pass
+    stale = time.time() - pillar_flight.ttl - pillar_flight.wait - 1
+    os.utime(lock_file, (stale, stale))
+    pillar_flight._sweep(time.time())
+    assert not os.path.exists(lock_file)
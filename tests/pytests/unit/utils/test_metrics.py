@@ -0,0 +1,97 @@
+"""
+Tests for salt.utils.metrics
+"""
+
+import os
+import time
+
+import pytest
+
+import salt.utils.metrics
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return salt.utils.metrics.Registry("MWorker-0", path=str(tmp_path))
+
+
+def test_init_registry(tmp_path):
+    opts = {"sock_dir": str(tmp_path), "master_metrics": False}
+    assert salt.utils.metrics.init_registry(opts, "MWorker-0") is None
+    assert salt.utils.metrics.registry() is None
+    opts["master_metrics"] = True
+    registry = salt.utils.metrics.init_registry(opts, "MWorker-0")
+    try:
+        assert salt.utils.metrics.registry() is registry
+        assert registry.path == os.path.join(str(tmp_path), "metrics")
+    finally:
+        salt.utils.metrics.init_registry({}, None)
+
+
+def test_observe(registry):
+    for value in (0.001, 0.005, 0.2, 100):
+        registry.observe("salt_master_request_duration_seconds", value, cmd="_pillar")
+    series = registry.series[
+        ("salt_master_request_duration_seconds", (("cmd", "_pillar"),))
+    ]
+    # 0.001 and 0.005 fall in the first bucket, 100 only in +Inf
+    assert series[0] == 2
+    assert series[5] == 1
+    assert sum(series[:-2]) == 3
+    assert series[-2] == 4
+    assert series[-1] == pytest.approx(100.206)
+
+
+def test_flush_load_and_merge(registry, tmp_path):
+    registry.inc("salt_master_requests_total", cmd="_return", enc="aes")
+    registry.inc("salt_master_worker_busy_seconds_total", 1.5)
+    registry.observe("salt_master_request_bytes", 300)
+    registry.flush()
+    other = salt.utils.metrics.Registry("MWorker-1", path=str(tmp_path))
+    other.inc("salt_master_requests_total", 2, cmd="_return", enc="aes")
+    other.inc("salt_master_worker_busy_seconds_total", 0.5)
+    other.observe("salt_master_request_bytes", 100)
+    other.flush()
+
+    snapshots = salt.utils.metrics.load_snapshots(str(tmp_path), 60)
+    assert len(snapshots) == 2
+    series = salt.utils.metrics.merge(snapshots)
+    assert (
+        series[("salt_master_requests_total", (("cmd", "_return"), ("enc", "aes")))]
+        == 3
+    )
+    assert series[
+        ("salt_master_worker_busy_seconds_total", (("worker", "MWorker-0"),))
+    ] == pytest.approx(1.5)
+    assert series[("salt_master_request_bytes", ())][:2] == [1, 1]
+    assert series[("salt_master_metrics_processes", ())] == 2
+
+    # Snapshots of processes which stopped reporting are ignored
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(time, "time", lambda: snapshots[0]["time"] + 120)
+        assert salt.utils.metrics.load_snapshots(str(tmp_path), 60) == []
+
+
+def test_render(registry):
+    registry.inc("salt_master_requests_total", cmd='we"ird', enc="clear")
+    registry.observe("salt_master_request_duration_seconds", 0.02, cmd="publish")
+    text = salt.utils.metrics.render(salt.utils.metrics.merge([registry.snapshot()]))
+    lines = text.splitlines()
+    assert "# TYPE salt_master_requests_total counter" in lines
+    assert 'salt_master_requests_total{cmd="we\\"ird",enc="clear"} 1' in lines
+    assert "# TYPE salt_master_request_duration_seconds histogram" in lines
+    assert (
+        'salt_master_request_duration_seconds_bucket{cmd="publish",le="0.01"} 0'
+        in lines
+    )
+    assert (
+        'salt_master_request_duration_seconds_bucket{cmd="publish",le="0.025"} 1'
+        in lines
+    )
+    assert (
+        'salt_master_request_duration_seconds_bucket{cmd="publish",le="+Inf"} 1'
+        in lines
+    )
+    assert 'salt_master_request_duration_seconds_count{cmd="publish"} 1' in lines
+    assert 'salt_master_request_duration_seconds_sum{cmd="publish"} 0.02' in lines
+    assert "salt_master_metrics_processes 1" in lines
@@ -1,5 +1,9 @@
+import time
+
 import pytest
 
+import salt.cache
+import salt.config
 import salt.utils.minions
 import salt.utils.network
 from tests.support.mock import patch
@@ -116,3 +120,166 @@ def test_validate_tgt_should_return_true_when_all_minions_are_found_in_valid_min
             "fnord", "fnord", "fnord", minions=target_minions
         )
         assert result is True
+
+
+@pytest.fixture
+def index_opts(tmp_path):
+    opts = salt.config.DEFAULT_MASTER_OPTS.copy()
+    opts.update(
+        {
+            "cachedir": str(tmp_path / "cache"),
+            "pki_dir": str(tmp_path / "pki"),
+            "minion_data_cache": True,
+            "minion_data_index": True,
+        }
+    )
+    (tmp_path / "pki" / "minions").mkdir(parents=True)
+    for minion_id in ("alpha", "beta", "gamma", "delta"):
+        (tmp_path / "pki" / "minions" / minion_id).touch()
+    cache = salt.cache.factory(opts)
+    cache.store(
+        "minions/alpha",
+        "data",
+        {"grains": {"os": "Ubuntu", "roles": ["web", "db"]}, "pillar": {"env": "prd"}},
+    )
+    cache.store(
+        "minions/beta",
+        "data",
+        {"grains": {"os": "Ubuntu", "roles": ["web"]}, "pillar": {"env": "dev"}},
+    )
+    cache.store(
+        "minions/gamma",
+        "data",
+        {"grains": {"os": "CentOS", "roles": []}, "pillar": {"env": "prd"}},
+    )
+    yield opts
+    salt.utils.minions.MinionDataIndex.instances.clear()
+
+
+@pytest.mark.parametrize(
+    "tgt_type, expr, expected",
+    [
+        ("grain", "os:ubuntu", {"alpha", "beta"}),
+        ("grain", "os:*OS", {"gamma"}),
+        ("grain", "roles:db", {"alpha"}),
+        ("grain", "os:Debian", set()),
+        ("grain_pcre", "os:(Ubuntu|CentOS)", {"alpha", "beta", "gamma"}),
+        ("pillar", "env:p*", {"alpha", "gamma"}),
+        ("pillar_exact", "env:dev", {"beta"}),
+    ],
+)
+def test_minion_data_index_matches_cache_scan(index_opts, tgt_type, expr, expected):
+    """
+    The minion data index must return the same minions as scanning the cache
+    """
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    ret = ckminions.check_minions(expr, tgt_type, greedy=False)
+    assert set(ret["minions"]) == expected
+    with patch.dict(index_opts, {"minion_data_index": False}):
+        ret = ckminions.check_minions(expr, tgt_type, greedy=False)
+        assert set(ret["minions"]) == expected
+
+
+def test_minion_data_index_greedy_keeps_uncached_minions(index_opts):
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    ret = ckminions.check_minions("os:Ubuntu", "grain", greedy=True)
+    assert set(ret["minions"]) == {"alpha", "beta", "delta"}
+
+
+def test_minion_data_index_applies_journal(index_opts):
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    index = salt.utils.minions.MinionDataIndex.instance(index_opts)
+    assert ckminions.check_minions("os:CentOS", "grain", greedy=False)["minions"] == [
+        "gamma"
+    ]
+    with patch.object(index, "rebuild", wraps=index.rebuild) as rebuild:
+        ckminions.cache.store(
+            "minions/delta", "data", {"grains": {"os": "CentOS"}, "pillar": {}}
+        )
+        salt.utils.minions.minion_data_updated(index_opts, "delta")
+        ckminions.cache.flush("minions/gamma")
+        salt.utils.minions.minion_data_updated(index_opts, "gamma")
+        ret = ckminions.check_minions("os:CentOS", "grain", greedy=False)
+        assert ret["minions"] == ["delta"]
+        rebuild.assert_not_called()
+    assert index.minions() == {"alpha", "beta", "delta"}
+
+
+def test_minion_data_index_wildcard_key_is_not_indexed(index_opts):
+    index = salt.utils.minions.MinionDataIndex.instance(index_opts)
+    assert index.match("grains", "*:Ubuntu") is None
+
+
+@pytest.mark.parametrize("expr", ["a:b:c", "a:b:*", "a:*"])
+def test_minion_data_index_key_holding_delimiter(index_opts, expr):
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    ckminions.cache.store(
+        "minions/delta", "data", {"grains": {"a:b": "c", "a": {"b": "d"}}}
+    )
+    index = salt.utils.minions.MinionDataIndex.instance(index_opts)
+    assert index.match("grains", expr) is None
+    assert index.match("grains", "os:ubuntu") == {"alpha", "beta"}
+    expected = ckminions.check_minions(expr, "grain", greedy=False)["minions"]
+    with patch.dict(index_opts, {"minion_data_index": False}):
+        ret = ckminions.check_minions(expr, "grain", greedy=False)
+        assert ret["minions"] == expected
+
+
+def test_compound_target_is_compiled_once(index_opts):
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    with patch.object(
+        salt.utils.minions.CompoundTarget,
+        "compile",
+        wraps=salt.utils.minions.CompoundTarget.compile,
+    ) as compile_:
+        for _ in range(3):
+            ret = ckminions.check_minions(
+                "G@os:Ubuntu and not beta", "compound", greedy=False
+            )
+            assert ret["minions"] == ["alpha"]
+        compile_.assert_called_once()
+
+
+def test_compound_target_cache(index_opts):
+    index_opts["compound_target_cache"] = True
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    with patch.object(ckminions, "_compound_generation", return_value=(1,)):
+        ret = ckminions.check_minions("G@os:Ubuntu or gamma", "compound", greedy=False)
+        assert set(ret["minions"]) == {"alpha", "beta", "gamma"}
+        with patch.object(ckminions, "_check_grain_minions") as grain:
+            ret = ckminions.check_minions(
+                "G@os:Ubuntu or gamma", "compound", greedy=False
+            )
+            assert set(ret["minions"]) == {"alpha", "beta", "gamma"}
+            grain.assert_not_called()
+    with patch.object(ckminions, "_compound_generation", return_value=(2,)):
+        with patch.object(
+            ckminions,
+            "_check_grain_minions",
+            return_value={"minions": ["alpha"], "missing": []},
+        ) as grain:
+            ret = ckminions.check_minions(
+                "G@os:Ubuntu or gamma", "compound", greedy=False
+            )
+            assert set(ret["minions"]) == {"alpha", "gamma"}
+            grain.assert_called_once()
+
+
+def test_compound_generation_follows_journal(index_opts):
+    index_opts["compound_target_cache"] = True
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    with patch("time.time", return_value=time.time() + 5):
+        generation = ckminions._compound_generation()
+        assert generation == ckminions._compound_generation()
+        salt.utils.minions.minion_data_updated(index_opts, "alpha")
+        assert generation != ckminions._compound_generation()
+
+
+@pytest.mark.parametrize("expr", ["and alpha", ") alpha", "alpha beta", "alpha or"])
+def test_compound_target_invalid(index_opts, expr):
+    ckminions = salt.utils.minions.CkMinions(index_opts)
+    assert ckminions.check_minions(expr, "compound") == {
+        "minions": [],
+        "missing": [],
+        "ssh_minions": False,
+    }
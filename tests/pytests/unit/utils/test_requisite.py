@@ -0,0 +1,129 @@
+import fnmatch
+
+import pytest
+
+import salt.utils.requisite
+
+
+def _chunk(id_, sls="base", state="file", name=None, **kwargs):
+    chunk = {
+        "__id__": id_,
+        "__sls__": sls,
+        "state": state,
+        "name": name or id_,
+        "fun": "managed",
+    }
+    chunk.update(kwargs)
+    return chunk
+
+
+@pytest.fixture
+def chunks():
+    return [
+        _chunk("nginx", sls="web", state="pkg", name="nginx-full"),
+        _chunk("/etc/nginx.conf", sls="web.config", require=[{"pkg": "nginx"}]),
+        _chunk("web-svc", sls="web", state="service", name="nginx"),
+        _chunk(
+            "db",
+            sls="db",
+            state="pkg",
+            __sls_included_from__=["top"],
+            watch=["nginx"],
+        ),
+        _chunk("db-conf", sls="db.config", name="/etc/db.conf"),
+    ]
+
+
+def _scan(chunks, req_key, req_val):
+    """
+    The matching done by the state compiler when scanning the chunks
+    """
+    found = []
+    for chunk in chunks:
+        if req_key == "sls":
+            if fnmatch.fnmatch(chunk["__sls__"], req_val) or req_val in chunk.get(
+                "__sls_included_from__", []
+            ):
+                found.append(chunk)
+            continue
+        if fnmatch.fnmatch(chunk["name"], req_val) or fnmatch.fnmatch(
+            chunk["__id__"], req_val
+        ):
+            if req_key == "id" or chunk["state"] == req_key:
+                found.append(chunk)
+    return found
+
+
+@pytest.mark.parametrize(
+    "req_key,req_val",
+    [
+        ("pkg", "nginx"),
+        ("service", "nginx"),
+        ("id", "nginx"),
+        ("file", "/etc/*"),
+        ("id", "*"),
+        ("pkg", "n?inx*"),
+        ("sls", "web"),
+        ("sls", "web*"),
+        ("sls", "top"),
+        ("file", "missing"),
+    ],
+)
+def test_find_matches_scan(chunks, req_key, req_val):
+    graph = salt.utils.requisite.RequisiteGraph(chunks)
+    found = graph.find(req_key, req_val)
+    assert found == _scan(chunks, req_key, req_val)
+    assert graph.find(req_key, req_val) is found
+
+
+def test_find_not_a_string(chunks):
+    graph = salt.utils.requisite.RequisiteGraph(chunks)
+    assert graph.find("id", 1) is None
+
+
+def test_build_invalid_chunks():
+    assert salt.utils.requisite.RequisiteGraph.build([{"__id__": "a"}]) is None
+
+
+def test_no_cycles(chunks):
+    graph = salt.utils.requisite.RequisiteGraph(chunks)
+    assert graph.requisites(chunks[3]) == [chunks[0], chunks[2]]
+    assert graph.cycles() == []
+
+
+def test_cycles():
+    chunks = [
+        _chunk("a", sls="one", require=[{"sls": "two"}]),
+        _chunk("b", sls="two", watch=[{"file": "c"}]),
+        _chunk("c", sls="three", onchanges=[{"id": "a"}]),
+        _chunk("d", sls="four", require=["d"]),
+        _chunk("e", sls="five", require_any=[{"file": "e"}], require=["a"]),
+    ]
+    graph = salt.utils.requisite.RequisiteGraph(chunks)
+    assert graph.cycles() == [chunks[:3], [chunks[3]]]
+
+
+def test_cycles_disabled_requisites():
+    chunks = [
+        _chunk("a", require=["b"]),
+        _chunk("b", require=["a"]),
+    ]
+    graph = salt.utils.requisite.RequisiteGraph(chunks, ["require"])
+    assert graph.cycles() == []
+
+
+@pytest.mark.parametrize(
+    "order,auto_order,expected",
+    [
+        (0, True, True),
+        (5, True, True),
+        (10000, True, False),
+        (10042.5, True, False),
+        (1010100, True, True),
+        (10000, False, True),
+        ("first", True, False),
+    ],
+)
+def test_is_order_barrier(order, auto_order, expected):
+    chunk = _chunk("a", order=order)
+    assert salt.utils.requisite.is_order_barrier(chunk, auto_order) is expected
@@ -0,0 +1,163 @@
+"""
+Tests for salt.utils.rootsindex
+"""
+
+import os
+import time
+
+import pytest
+
+import salt.fileserver
+import salt.fileserver.roots as roots
+import salt.utils.rootsindex
+from tests.support.mock import MagicMock, patch
+
+FORMS = ("files", "dirs", "empty_dirs", "links")
+
+
+@pytest.fixture
+def state_tree(tmp_path):
+    tree = tmp_path / "state_tree"
+    (tree / "web" / "files").mkdir(parents=True)
+    (tree / "web" / "init.sls").write_text("web")
+    (tree / "web" / "files" / "nginx.conf").write_text("conf")
+    (tree / "web" / "files" / "nginx.conf.swp").write_text("ignored")
+    (tree / "empty").mkdir()
+    (tree / "top.sls").write_text("top")
+    (tree / "top-link.sls").symlink_to("top.sls")
+    (tree / "web-link").symlink_to("web")
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "file").write_text("outside")
+    (tree / "outside-link").symlink_to(outside)
+    return tree
+
+
+@pytest.fixture
+def master_opts(master_opts, state_tree, tmp_path):
+    master_opts["file_roots"] = {"base": [str(state_tree)]}
+    master_opts["file_ignore_glob"] = ["*.swp"]
+    master_opts["fileserver_roots_index"] = True
+    master_opts["cachedir"] = str(tmp_path / "cache")
+    return master_opts
+
+
+@pytest.fixture
+def configure_loader_modules(master_opts):
+    return {roots: {"__opts__": master_opts}}
+
+
+@pytest.fixture
+def index(master_opts):
+    index = salt.utils.rootsindex.RootsIndex(master_opts)
+    yield index
+    index.stop()
+
+
+def _walk(master_opts):
+    """
+    The file lists built by walking the file_roots
+    """
+    with patch.dict(
+        master_opts,
+        {
+            "cachedir": master_opts["cachedir"] + "-walk",
+            "fileserver_roots_index": False,
+            "fileserver_list_cache_time": 0,
+        },
+    ):
+        return {form: roots._file_lists({"saltenv": "base"}, form) for form in FORMS}
+
+
+def _wait_for(func, timeout=10):
+    start = time.time()
+    while time.time() - start < timeout:
+        if func():
+            return True
+        time.sleep(0.1)
+    return func()
+
+
+@pytest.mark.parametrize("followsymlinks", [True, False])
+def test_file_lists_match_walk(master_opts, index, followsymlinks):
+    master_opts["fileserver_followsymlinks"] = followsymlinks
+    index.followlinks = followsymlinks
+    index.rescan()
+    file_lists = index.file_lists("base")
+    assert file_lists == _walk(master_opts)
+    assert "web/files/nginx.conf.swp" not in file_lists["files"]
+    assert file_lists["empty_dirs"] == ["empty"]
+    assert file_lists["links"]["top-link.sls"] == "top.sls"
+
+
+def test_mtime_map(master_opts, index):
+    index.rescan()
+    assert index.mtime_map() == salt.fileserver.generate_mtime_map(
+        master_opts, {"base": [str(master_opts["file_roots"]["base"][0])]}
+    )
+
+
+def test_scanned_without_pyinotify(master_opts, index, state_tree):
+    master_opts["fileserver_list_cache_time"] = 1
+    with patch("salt.utils.rootsindex.HAS_PYINOTIFY", False):
+        index.start()
+    assert not index.watching
+    (state_tree / "web" / "new.sls").write_text("new")
+    assert _wait_for(
+        lambda: salt.utils.rootsindex.get_file_lists(master_opts, "base")
+        == _walk(master_opts)
+    )
+
+
+@pytest.mark.skipif(
+    not salt.utils.rootsindex.HAS_PYINOTIFY, reason="pyinotify is not installed"
+)
+@pytest.mark.skip_unless_on_linux
+def test_watched_changes(master_opts, index, state_tree):
+    index.start()
+    assert index.watching
+    # Only the changed directories are listed again
+    index.rescan = MagicMock()
+
+    (state_tree / "web" / "files" / "new.conf").write_text("new")
+    (state_tree / "db" / "files").mkdir(parents=True)
+    (state_tree / "db" / "files" / "db.conf").write_text("db")
+    (state_tree / "empty" / "file").write_text("file")
+    (state_tree / "top.sls").unlink()
+    os.rename(state_tree / "web" / "files", state_tree / "web" / "conf")
+    assert _wait_for(
+        lambda: salt.utils.rootsindex.get_file_lists(master_opts, "base")
+        == _walk(master_opts)
+    )
+    file_lists = salt.utils.rootsindex.get_file_lists(master_opts, "base")
+    assert "web/conf/new.conf" in file_lists["files"]
+    assert "web-link/conf/new.conf" in file_lists["files"]
+    assert "db/files/db.conf" in file_lists["files"]
+    assert file_lists["empty_dirs"] == []
+
+    mtime = time.time() + 60
+    os.utime(state_tree / "db" / "files" / "db.conf", (mtime, mtime))
+    assert _wait_for(
+        lambda: index.mtime_map().get(str(state_tree / "db" / "files" / "db.conf"))
+        == mtime
+    )
+    index.rescan.assert_not_called()
+
+
+def test_roots_serves_the_index(master_opts, state_tree):
+    master_opts["fileserver_list_cache_time"] = 1
+    try:
+        roots.update()
+        (state_tree / "new.sls").write_text("new")
+        assert _wait_for(lambda: "new.sls" in roots.file_list({"saltenv": "base"}))
+        assert roots.dir_list({"saltenv": "base"}) == _walk(master_opts)["dirs"]
+    finally:
+        salt.utils.rootsindex._INDEXES.pop(master_opts["cachedir"]).stop()
+
+
+def test_stale_heartbeat(master_opts, index):
+    index.rescan()
+    assert salt.utils.rootsindex.get_file_lists(master_opts, "base") is not None
+    stale = time.time() - salt.utils.rootsindex.HEARTBEAT_TTL
+    os.utime(index.heartbeat, (stale, stale))
+    assert salt.utils.rootsindex.get_file_lists(master_opts, "base") is None
@@ -0,0 +1,76 @@
+import pytest
+
+import salt.loader
+import salt.utils.topmatch
+
+TOP = {
+    "base": {
+        "*": ["common"],
+        "web1": ["exact"],
+        "web*": ["glob"],
+        "web[12]": ["brackets"],
+        "*db*": ["contains"],
+        "L@web1,db1": ["compound_list"],
+        "G@os:Debian": ["compound_grain"],
+        "G@roles:web": ["grain_list"],
+        "G@nested:key:value": ["nested_grain"],
+        "G@os:Deb*": ["grain_glob"],
+        "G@nodelimiter": ["grain_invalid"],
+        "web1 or db1": ["compound_expression"],
+        "db1,web2": [{"match": "list"}, "list"],
+        "os:debian": [{"match": "grain"}, "grain"],
+        "web?": [{"match": "glob"}, "explicit_glob"],
+        "E@web\\d": ["pcre"],
+        "I@role:web": ["pillar_target"],
+    },
+    "dev": {"web1": "string_data"},
+}
+
+MINIONS = {
+    "web1": {"os": "Debian", "roles": ["web", "db"], "nested": {"key": "value"}},
+    "web2": {"os": "debian", "roles": "web"},
+    "db1": {"os": "Fedora", "roles": ["db"]},
+    "other": {},
+}
+
+
+@pytest.mark.parametrize("minion_id", list(MINIONS))
+def test_lookup_matches_the_matchers(minion_opts, minion_id):
+    minion_opts.update(
+        {"id": minion_id, "grains": MINIONS[minion_id], "top_match_index": True}
+    )
+    matchers = salt.loader.matchers(minion_opts)
+    indexed = salt.utils.topmatch.lookup(minion_opts, TOP)
+    # Compound expressions, pcre and pillar targets are left to the matchers
+    assert ("base", "web1 or db1") not in indexed
+    assert ("base", "E@web\\d") not in indexed
+    assert ("base", "I@role:web") not in indexed
+    assert len(indexed) == 15
+    assert any(indexed.values())
+    for (saltenv, tgt), matched in indexed.items():
+        data = TOP[saltenv][tgt]
+        if isinstance(data, str):
+            data = [data]
+        assert matched == matchers["confirm_top.confirm_top"](tgt, data, {}), tgt
+
+
+def test_lookup_disabled(minion_opts):
+    minion_opts["top_match_index"] = False
+    assert salt.utils.topmatch.lookup(minion_opts, TOP) == {}
+
+
+def test_get_index_cached():
+    index = salt.utils.topmatch.get_index(TOP)
+    assert salt.utils.topmatch.get_index(dict(TOP)) is index
+    # The index only depends on the targets
+    top = {"base": dict(TOP["base"], web1=["other"]), "dev": TOP["dev"]}
+    assert salt.utils.topmatch.get_index(top) is index
+    top["base"]["new*"] = ["new"]
+    assert salt.utils.topmatch.get_index(top) is not index
+
+
+def test_lookup_comma_in_minion_id(minion_opts):
+    minion_opts.update({"id": "web1,db1", "grains": {}, "top_match_index": True})
+    indexed = salt.utils.topmatch.lookup(minion_opts, TOP)
+    assert ("base", "db1,web2") not in indexed
+    assert ("base", "L@web1,db1") not in indexed